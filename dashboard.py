@@ -1,11 +1,16 @@
 # dashboard.py
 
+import os
+
 import streamlit as st
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # Importa as classes do seu projeto
 from irrigation_system.database import AgriculturalDatabase
+from irrigation_system.memory import backend_no_ambiente, criar_banco
+from irrigation_system.sharding import ARQUIVO_CATALOGO, DIRETORIO_PADRAO, ShardedDatabase
+from irrigation_system.snapshot import ARQUIVO_SNAPSHOT_PADRAO, data_do_snapshot
 # A classe de inteligência não é mais necessária para este dashboard simplificado
 
 # Configuração da página do Streamlit
@@ -20,45 +25,72 @@ st.set_page_config(
 def load_db_service():
     """
     Carrega e retorna uma instância da base de dados.
-    Fica em cache para performance.
+    Fica em cache para performance. Usa o modo pooled (uma conexão por thread,
+    em WAL) porque a instância é compartilhada entre todas as sessões.
+    Se existir um catálogo de shards (data/shards), usa o roteador por fazenda,
+    que consulta todos os shards em paralelo.
+    Se houver um snapshot publicado (python -m irrigation_system.snapshot), lê o
+    snapshot em modo imutável: as consultas não disputam locks com a ingestão e
+    veem sempre um único ponto no tempo.
+    Com IRRIGACAO_BACKEND=sqlite_memoria ou memoria, carrega o banco principal em
+    memória uma única vez e atende as consultas sem tocar o disco.
     """
-    db = AgriculturalDatabase(db_name="data/agricultural_system.db")
+    backend = backend_no_ambiente()
+    if backend != 'arquivo':
+        return criar_banco(backend, semente="data/agricultural_system.db", pooled=True)
+    if os.path.exists(os.path.join(DIRETORIO_PADRAO, ARQUIVO_CATALOGO)):
+        return ShardedDatabase(DIRETORIO_PADRAO)
+    if os.path.exists(ARQUIVO_SNAPSHOT_PADRAO):
+        return AgriculturalDatabase(db_name=ARQUIVO_SNAPSHOT_PADRAO, pooled=True, somente_leitura=True)
+    db = AgriculturalDatabase(db_name="data/agricultural_system.db", pooled=True)
     return db
 
+# Janela de tempo (em dias) exibida no gráfico de umidade
+DIAS_GRAFICO_UMIDADE = 30
+
 # --- Função de busca de dados (com cache) ---
 @st.cache_data(ttl=60) # Cache de dados por 60 segundos
 def get_dashboard_data(_db):
     """
     Busca dados agregados para a página principal.
+    O gráfico usa as médias horárias já agregadas (TABELA_MEDICOES_HORA),
+    lidas apenas na janela exibida, sem carregar as medições brutas.
     """
     setores = _db.consultar_setores()
     sensores = _db.consultar_sensores()
-    irrigacoes = _db.consultar_irrigacoes()
-    medicoes = _db.consultar_medicoes()
-    return setores, sensores, irrigacoes, medicoes
+    irrigacoes_recentes = list(_db.iterar_irrigacoes(ordem='desc', limite=10))
+    # Últimos valores mantidos a cada inserção: busca direta, sem ordenar as tabelas
+    ultima_irrigacao = _db.ultimos.ultima_irrigacao()
+    ultima_medicao = _db.ultimos.ultima_medicao()
+    inicio = (datetime.now() - timedelta(days=DIAS_GRAFICO_UMIDADE)).strftime("%Y-%m-%d %H:%M:%S")
+    medicoes_umidade = _db.rollups.consultar_horario(tipo_sensor='umidade', inicio=inicio)
+    return setores, sensores, irrigacoes_recentes, ultima_irrigacao, ultima_medicao, medicoes_umidade
 
 # --- Função de Renderização da Página Principal ---
 def render_overview_page(db):
     """Renderiza a página de Visão Geral."""
     st.title("💧 Dashboard de Monitoramento de Irrigação")
     st.markdown("Status em tempo real da sua plantação e últimas atividades.")
+    publicado_em = data_do_snapshot(db.db_name) if getattr(db, 'somente_leitura', False) else None
+    if publicado_em:
+        st.caption(f"Dados do snapshot publicado em {publicado_em:%d/%m/%Y %H:%M:%S}.")
     
     # Busca os dados mais recentes
-    setores, sensores, irrigacoes, medicoes = get_dashboard_data(db)
+    setores, sensores, irrigacoes, ultima_irrigacao, ultima_medicao, medicoes_umidade = get_dashboard_data(db)
 
     # Métricas principais na parte superior
     col1, col2, col3, col4 = st.columns(4)
     col1.metric("Setores Ativos", f"{len(setores)}")
     col2.metric("Sensores Monitorando", f"{len(sensores)}")
     
-    if irrigacoes:
-        ultima_irrigacao_dt = max([datetime.fromisoformat(i['data_irrigacao']) for i in irrigacoes])
+    if ultima_irrigacao:
+        ultima_irrigacao_dt = datetime.fromisoformat(ultima_irrigacao['data_irrigacao'])
         col3.metric("Última Irrigação", ultima_irrigacao_dt.strftime("%d/%m/%Y %H:%M"))
     else:
         col3.metric("Última Irrigação", "N/A")
 
-    if medicoes:
-        ultima_medicao_dt = max([datetime.fromisoformat(m['data_medicao']) for m in medicoes])
+    if ultima_medicao:
+        ultima_medicao_dt = datetime.fromisoformat(ultima_medicao['data_medicao'])
         col4.metric("Última Medição", ultima_medicao_dt.strftime("%d/%m/%Y %H:%M"))
     else:
         col4.metric("Última Medição", "N/A")
@@ -66,24 +98,20 @@ def render_overview_page(db):
     st.divider()
 
     # Gráfico de umidade de todos os sensores
-    st.subheader("Variação da Umidade ao Longo do Tempo (Todos os Setores)")
-    if medicoes:
-        df_medicoes = pd.DataFrame(medicoes)
-        # Filtra apenas por sensores de 'umidade'
-        df_umidade = df_medicoes[df_medicoes['tipo_sensor'] == 'umidade'].copy()
+    st.subheader(f"Umidade Média por Hora nos Últimos {DIAS_GRAFICO_UMIDADE} Dias (Todos os Setores)")
+    if medicoes_umidade:
+        df_umidade = pd.DataFrame(medicoes_umidade)
+        df_umidade['hora'] = pd.to_datetime(df_umidade['hora'])
         
-        if not df_umidade.empty:
-            df_umidade['data_medicao'] = pd.to_datetime(df_umidade['data_medicao'])
-            
-            # Cria uma tabela pivot para ter um sensor por coluna
-            chart_data = df_umidade.pivot_table(
-                index='data_medicao', 
-                columns='id_sensor', 
-                values='valor_medicao'
-            )
-            st.line_chart(chart_data)
-        else:
-            st.warning("Nenhum dado do sensor de 'umidade' encontrado no banco de dados.")
+        # Cria uma tabela pivot para ter um sensor por coluna
+        chart_data = df_umidade.pivot_table(
+            index='hora', 
+            columns='id_sensor', 
+            values='valor_medio'
+        )
+        st.line_chart(chart_data)
+    elif ultima_medicao:
+        st.warning("Nenhum dado do sensor de 'umidade' encontrado no período.")
     else:
         st.info("Aguardando dados de medições para exibir gráficos.")
         
@@ -95,7 +123,7 @@ def render_overview_page(db):
         df_irrigacoes = pd.DataFrame(irrigacoes)
         df_irrigacoes['data_irrigacao'] = pd.to_datetime(df_irrigacoes['data_irrigacao']).dt.strftime('%d/%m/%Y %H:%M')
         st.dataframe(
-            df_irrigacoes[['id_setor', 'volume_irrigacao', 'data_irrigacao']].sort_values(by='data_irrigacao', ascending=False).head(10),
+            df_irrigacoes[['id_setor', 'volume_irrigacao', 'data_irrigacao']],
             use_container_width=True
         )
     else:
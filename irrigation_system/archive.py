@@ -0,0 +1,261 @@
+# archive.py
+
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+
+# Diretório padrão do arquivo histórico (fora do banco SQLite)
+DIRETORIO_PADRAO = "data/arquivo"
+
+# Formato dos arquivos de cada sensor: timestamps em segundos desde a época
+# (int64) e valores em float32, ambos little-endian e sem cabeçalho
+DTYPE_TIMESTAMP = np.dtype('<i8')
+DTYPE_VALOR = np.dtype('<f4')
+ARQUIVO_TIMESTAMPS = "timestamps.i64"
+ARQUIVO_VALORES = "valores.f32"
+ARQUIVO_METADADOS = "metadados.json"
+
+# Linhas de TABELA_MEDICOES_COMPACTA lidas por bloco durante a sincronização
+LINHAS_POR_BLOCO = 50_000
+
+Instante = Union[str, datetime, int, None]
+
+
+def para_epoch(instante: Instante) -> Optional[int]:
+    """Converte "YYYY-MM-DD HH:MM:SS", datetime ou inteiro em segundos desde a época.
+
+    Datas sem fuso são tratadas como UTC, igual ao strftime('%s') do SQLite, de modo
+    que os valores batem com os gravados pela sincronização.
+    """
+    if instante is None or isinstance(instante, (int, np.integer)):
+        return instante
+    if isinstance(instante, str):
+        instante = datetime.fromisoformat(instante)
+    if instante.tzinfo is None:
+        instante = instante.replace(tzinfo=timezone.utc)
+    return int(instante.timestamp())
+
+
+class ColumnarArchive:
+    """
+    Arquivo frio das medições: um par de arquivos colunares append-only por sensor,
+    lidos com np.memmap.
+
+    A sincronização copia de TABELA_MEDICOES_COMPACTA apenas as linhas com id_registro
+    acima da marca d'água guardada em metadados.json. O id_registro é AUTOINCREMENT
+    (migração 9) e o arquivo mantém a sequência da tabela pelo menos na sua marca
+    d'água, que fica fora do banco, então uma medição nova nunca recebe um id já
+    coberto por ela. Os metadados registram também o
+    número de linhas válidas de cada sensor e só são gravados (de forma atômica)
+    depois dos dados, então uma gravação interrompida é descartada na próxima abertura.
+    Cada série é mantida ordenada por tempo para permitir recortes por intervalo
+    sem cópia (np.searchsorted sobre o memmap).
+    """
+
+    def __init__(self, db_manager, diretorio: str = DIRETORIO_PADRAO, somente_leitura: bool = False):
+        """
+        Args:
+            db_manager: Uma instância da classe AgriculturalDatabase.
+            diretorio (str): Pasta onde os arquivos por sensor são gravados.
+            somente_leitura (bool): Se True, apenas lê as séries confirmadas: sincronizar()
+                                    não copia nada (ex.: nos processos de treino paralelo,
+                                    com a sincronização feita pelo processo principal).
+        """
+        self.db = db_manager
+        self.diretorio = diretorio
+        self.somente_leitura = somente_leitura
+        if not somente_leitura:
+            os.makedirs(self.diretorio, exist_ok=True)
+        self.metadados = self._carregar_metadados()
+        if not somente_leitura:
+            self._reservar_ids_arquivados()
+
+    # ---------- Metadados ----------
+
+    def _carregar_metadados(self) -> Dict:
+        caminho = os.path.join(self.diretorio, ARQUIVO_METADADOS)
+        if not os.path.exists(caminho):
+            return {'watermark': 0, 'sensores': {}}
+        with open(caminho, encoding='utf-8') as f:
+            metadados = json.load(f)
+        # Descarta bytes de gravações que não chegaram a ser confirmadas (a leitura
+        # já se limita às linhas confirmadas, então o modo somente leitura não precisa)
+        if not self.somente_leitura:
+            for id_sensor, info in metadados['sensores'].items():
+                self._truncar(id_sensor, info['linhas'])
+        return metadados
+
+    def _salvar_metadados(self):
+        caminho = os.path.join(self.diretorio, ARQUIVO_METADADOS)
+        temporario = caminho + ".tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(self.metadados, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, caminho)
+
+    def obter_watermark(self) -> int:
+        """Último id_registro de TABELA_MEDICOES_COMPACTA já copiado para o arquivo."""
+        return self.metadados['watermark']
+
+    def _reservar_ids_arquivados(self):
+        """
+        Leva a sequência AUTOINCREMENT de TABELA_MEDICOES_COMPACTA até a marca d'água do
+        arquivo. A migração 9 só conhece as marcas gravadas no banco: se a última medição
+        arquivada já tinha sido removida, as próximas receberiam ids abaixo da marca e
+        nunca seriam copiadas.
+        """
+        conexao = self.db.connection
+        try:
+            cursor = conexao.execute(
+                "UPDATE sqlite_sequence SET seq = ? WHERE name = 'TABELA_MEDICOES_COMPACTA' AND seq < ?",
+                (self.obter_watermark(), self.obter_watermark()))
+            if cursor.rowcount:
+                conexao.commit()
+        except sqlite3.Error as e:
+            conexao.rollback()
+            print(f"Erro ao reservar os ids já arquivados: {e}")
+
+    def definir_watermark(self, watermark: int):
+        """Reposiciona a marca d'água (ex.: após um VACUUM que renumerou os rowids)."""
+        self.metadados['watermark'] = watermark
+        self._salvar_metadados()
+
+    def sensores(self):
+        """IDs dos sensores presentes no arquivo."""
+        return list(self.metadados['sensores'])
+
+    # ---------- Arquivos por sensor ----------
+
+    def _pasta_sensor(self, id_sensor: str) -> str:
+        # Mantém o ID legível, mas sem caracteres que não podem ir em nomes de pasta
+        seguro = ''.join(c if c.isalnum() or c in '-_' else f"%{ord(c):02x}" for c in str(id_sensor))
+        return os.path.join(self.diretorio, seguro or "%00")
+
+    def _caminhos(self, id_sensor: str) -> Tuple[str, str]:
+        pasta = self._pasta_sensor(id_sensor)
+        return os.path.join(pasta, ARQUIVO_TIMESTAMPS), os.path.join(pasta, ARQUIVO_VALORES)
+
+    def _truncar(self, id_sensor: str, linhas: int):
+        for caminho, dtype in zip(self._caminhos(id_sensor), (DTYPE_TIMESTAMP, DTYPE_VALOR)):
+            tamanho = linhas * dtype.itemsize
+            if os.path.exists(caminho) and os.path.getsize(caminho) > tamanho:
+                with open(caminho, 'r+b') as f:
+                    f.truncate(tamanho)
+
+    def ler_serie(self, id_sensor: str, inicio: Instante = None,
+                  fim: Instante = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Retorna (timestamps, valores) do sensor no intervalo [inicio, fim) como
+        visões do memmap, sem copiar os dados.
+        """
+        info = self.metadados['sensores'].get(id_sensor)
+        if not info or not info['linhas']:
+            return np.empty(0, DTYPE_TIMESTAMP), np.empty(0, DTYPE_VALOR)
+        caminho_ts, caminho_valores = self._caminhos(id_sensor)
+        linhas = info['linhas']
+        timestamps = np.memmap(caminho_ts, dtype=DTYPE_TIMESTAMP, mode='r', shape=(linhas,))
+        valores = np.memmap(caminho_valores, dtype=DTYPE_VALOR, mode='r', shape=(linhas,))
+        de = 0 if inicio is None else int(np.searchsorted(timestamps, para_epoch(inicio), side='left'))
+        ate = linhas if fim is None else int(np.searchsorted(timestamps, para_epoch(fim), side='left'))
+        return timestamps[de:ate], valores[de:ate]
+
+    def medias_horarias(self, id_sensor: str, inicio: Instante = None,
+                        fim: Instante = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Agrega a série do sensor por hora diretamente sobre o memmap.
+
+        Returns:
+            Tuple: (início de cada hora em segundos desde a época, soma, quantidade)
+        """
+        timestamps, valores = self.ler_serie(id_sensor, inicio, fim)
+        if not len(timestamps):
+            vazio = np.empty(0, np.int64)
+            return vazio, np.empty(0, np.float64), vazio
+        horas = timestamps // 3600
+        # A série está ordenada, então cada hora é um trecho contíguo
+        inicios = np.concatenate(([0], np.flatnonzero(np.diff(horas)) + 1))
+        somas = np.add.reduceat(valores, inicios, dtype=np.float64)
+        quantidades = np.diff(np.append(inicios, len(horas)))
+        return horas[inicios] * 3600, somas, quantidades
+
+    def _anexar(self, id_sensor: str, timestamps: np.ndarray, valores: np.ndarray):
+        """Acrescenta um bloco à série do sensor, mantendo a ordem por tempo."""
+        ordem = np.argsort(timestamps, kind='stable')
+        timestamps, valores = timestamps[ordem], valores[ordem]
+        info = self.metadados['sensores'].setdefault(id_sensor, {'linhas': 0, 'ultimo_timestamp': None})
+        caminho_ts, caminho_valores = self._caminhos(id_sensor)
+        os.makedirs(os.path.dirname(caminho_ts), exist_ok=True)
+
+        if info['ultimo_timestamp'] is not None and timestamps[0] < info['ultimo_timestamp']:
+            # Dado atrasado: reescreve a série do sensor já mesclada (raro)
+            antigos_ts, antigos_valores = self.ler_serie(id_sensor)
+            todos_ts = np.concatenate((antigos_ts, timestamps))
+            ordem = np.argsort(todos_ts, kind='stable')
+            for caminho, dados in ((caminho_ts, todos_ts[ordem]),
+                                   (caminho_valores, np.concatenate((antigos_valores, valores))[ordem])):
+                temporario = caminho + ".tmp"
+                dados.tofile(temporario)
+                os.replace(temporario, caminho)
+        else:
+            for caminho, dados in ((caminho_ts, timestamps), (caminho_valores, valores)):
+                with open(caminho, 'ab') as f:
+                    dados.tofile(f)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+        info['linhas'] += len(timestamps)
+        ultimo = int(timestamps[-1])
+        if info['ultimo_timestamp'] is None or ultimo > info['ultimo_timestamp']:
+            info['ultimo_timestamp'] = ultimo
+
+    # ---------- Sincronização ----------
+
+    def sincronizar(self, linhas_por_bloco: int = LINHAS_POR_BLOCO) -> int:
+        """
+        Copia para o arquivo as medições com id_registro acima da marca d'água.
+
+        Returns:
+            int: Número de medições arquivadas.
+        """
+        if self.somente_leitura:
+            return 0
+        self._reservar_ids_arquivados()
+        cursor = self.db.connection.cursor()
+        arquivadas = 0
+        try:
+            # O instante e o valor já estão gravados como inteiro e REAL: nada a converter
+            cursor.execute('''
+                SELECT m.id_registro, k.id_sensor, m.instante, m.valor
+                FROM TABELA_MEDICOES_COMPACTA m
+                LEFT JOIN TABELA_CHAVES_SENSORES k ON k.chave_sensor = m.chave_sensor
+                WHERE m.id_registro > ?
+                ORDER BY m.id_registro
+            ''', (self.obter_watermark(),))
+            while True:
+                linhas = cursor.fetchmany(linhas_por_bloco)
+                if not linhas:
+                    break
+                por_sensor: Dict[str, Tuple[list, list]] = {}
+                for _, id_sensor, timestamp, valor in linhas:
+                    if id_sensor is None or timestamp is None or valor is None:
+                        continue
+                    timestamps, valores = por_sensor.setdefault(id_sensor, ([], []))
+                    timestamps.append(timestamp)
+                    valores.append(valor)
+                for id_sensor, (timestamps, valores) in por_sensor.items():
+                    self._anexar(id_sensor, np.asarray(timestamps, DTYPE_TIMESTAMP),
+                                 np.asarray(valores, DTYPE_VALOR))
+                    arquivadas += len(timestamps)
+                # Dados já estão no disco: confirma o bloco avançando a marca d'água
+                self.metadados['watermark'] = linhas[-1][0]
+                self._salvar_metadados()
+        except sqlite3.Error as e:
+            print(f"Erro ao sincronizar o arquivo de medições: {e}")
+        finally:
+            cursor.close()
+        return arquivadas
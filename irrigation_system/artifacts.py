@@ -0,0 +1,143 @@
+# artifacts.py
+
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+
+from .engine import MotorFloresta, compilar
+
+# Formato em que a floresta compilada (engine.compilar) fica em arrays NumPy sem
+# compressão, que joblib.load(..., mmap_mode='r') mapeia direto do arquivo em vez de copiar
+FORMATO_FLORESTA = "floresta-mmap"
+# Modelo inteiro serializado com pickle (formato original de save_model)
+FORMATO_PICKLE = "joblib"
+# 2: nós no layout compacto de engine.compilar
+VERSAO_FORMATO = 2
+# Cabeçalho JSON gravado ao lado do artefato (<arquivo>.json)
+EXTENSAO_CABECALHO = ".json"
+
+
+def _eh_floresta(modelo) -> bool:
+    """Florestas de classificação com uma saída (ex.: RandomForestClassifier) podem ser mapeadas."""
+    return (hasattr(modelo, 'estimators_') and getattr(modelo, 'n_outputs_', None) == 1
+            and all(hasattr(arvore, 'tree_') for arvore in modelo.estimators_))
+
+
+def _gravar_atomico(caminho: str, gravar):
+    gravar(caminho + ".tmp")
+    os.replace(caminho + ".tmp", caminho)
+
+
+def salvar_modelo(modelo: Any, features: List[str], caminho: str, **cabecalho) -> str:
+    """
+    Grava o modelo e os nomes das features em `caminho`, com um cabeçalho JSON ao lado.
+
+    Florestas são gravadas no formato FORMATO_FLORESTA (a floresta compilada por
+    engine.compilar, em arrays sem compressão); outros modelos, como pickle.
+
+    Args:
+        cabecalho: Campos extras do cabeçalho (ex.: janela de treino, métricas).
+
+    Returns:
+        str: Formato gravado.
+    """
+    if _eh_floresta(modelo) or isinstance(modelo, MotorFloresta):
+        compilado = modelo.compilado if isinstance(modelo, MotorFloresta) else compilar(modelo)
+        payload = dict(compilado, formato=FORMATO_FLORESTA, versao=VERSAO_FORMATO, features=list(features))
+        formato = FORMATO_FLORESTA
+        cabecalho = dict(cabecalho, arvores=len(compilado['raiz']), internos=len(compilado['feature']),
+                         folhas=len(compilado['folhas']))
+    else:
+        payload = {'model': modelo, 'features': list(features)}
+        formato = FORMATO_PICKLE
+
+    os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+    # Sem compressão: é o que permite o mapeamento na carga
+    _gravar_atomico(caminho, lambda destino: joblib.dump(payload, destino))
+    # O cabeçalho vem depois do artefato, para nunca descrever um arquivo que ainda não existe
+    info = dict(cabecalho, formato=formato, versao=VERSAO_FORMATO, features=list(features),
+                classes=[c.item() if hasattr(c, 'item') else c for c in getattr(modelo, 'classes_', [])],
+                bytes=os.path.getsize(caminho))
+
+    def gravar_cabecalho(destino):
+        with open(destino, 'w', encoding='utf-8') as f:
+            json.dump(info, f, ensure_ascii=False, indent=2)
+
+    _gravar_atomico(caminho + EXTENSAO_CABECALHO, gravar_cabecalho)
+    return formato
+
+
+def ler_cabecalho(caminho: str) -> Optional[Dict]:
+    """Cabeçalho do artefato (formato, features, classes, ...) sem carregar o modelo, ou None."""
+    caminho += EXTENSAO_CABECALHO
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def carregar_modelo(caminho: str, mapear: bool = True) -> Tuple[Any, List[str]]:
+    """
+    Carrega (modelo, features) de um artefato em qualquer dos formatos.
+
+    Args:
+        mapear (bool): Mapeia os arrays do arquivo na memória (mmap_mode='r'); as páginas
+                       são compartilhadas entre os processos que abrem o mesmo artefato.
+    """
+    payload = joblib.load(caminho, mmap_mode='r' if mapear else None)
+    if isinstance(payload, dict) and payload.get('formato') == FORMATO_FLORESTA:
+        if payload['versao'] == 1:
+            payload = _da_versao_1(payload)
+        elif payload['versao'] != VERSAO_FORMATO:
+            raise ValueError(f"versão {payload['versao']} do formato {FORMATO_FLORESTA} não suportada")
+        return MotorFloresta(payload, payload['features']), payload['features']
+    return payload['model'], payload['features']
+
+
+def _da_versao_1(payload: Dict) -> Dict:
+    """
+    Converte na memória um artefato da versão 1 (todos os nós, filhos com a posição
+    global e -1 nas folhas) para o layout compacto de engine.compilar.
+    """
+    esquerdo = np.asarray(payload['esquerdo'])
+    interno = esquerdo != -1
+    ref = np.where(interno, np.cumsum(interno) - 1, ~(np.cumsum(~interno) - 1))
+    return {
+        'raiz': ref[np.asarray(payload['inicio'])[:-1]].astype(np.int32),
+        'feature': np.asarray(payload['feature'])[interno].astype(np.int32),
+        'limiar': np.asarray(payload['limiar'])[interno],
+        'ausente_a_esquerda': np.asarray(payload['ausente_a_esquerda'])[interno],
+        'filhos': np.column_stack([ref[esquerdo[interno]], ref[np.asarray(payload['direito'])[interno]]]).astype(np.int32),
+        'folhas': np.ascontiguousarray(np.asarray(payload['valores'])[~interno]),
+        'classes': np.asarray(payload['classes'], dtype=np.float64),
+        'features': payload['features'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=f"Converte um modelo salvo com pickle para o formato mapeável ({FORMATO_FLORESTA}).")
+    parser.add_argument("entrada", help="Artefato joblib existente (ex.: data/irrigation_model.joblib)")
+    parser.add_argument("--saida", help="Arquivo convertido (padrão: substitui a entrada)")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    modelo, features = carregar_modelo(args.entrada, mapear=False)
+    lido = time.perf_counter() - inicio
+    saida = args.saida or args.entrada
+    formato = salvar_modelo(modelo, features, saida)
+    inicio = time.perf_counter()
+    carregar_modelo(saida)
+    mapeado = time.perf_counter() - inicio
+    print(f"'{args.entrada}' -> '{saida}' ({formato}, {os.path.getsize(saida) / 1024:.0f} KB)")
+    print(f"Carga: {lido * 1000:.1f} ms antes, {mapeado * 1000:.1f} ms depois.")
+    print(json.dumps(ler_cabecalho(saida), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+# bulk.py
+
+import argparse
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import time
+from operator import itemgetter
+from typing import Dict, IO, Iterator, List, Optional, Tuple
+
+from .database import COLUNAS_INSTANTE, COLUNAS_LOTE, AgriculturalDatabase, normalizar_data
+
+# Nome curto aceito na linha de comando -> tabela
+TABELAS = {
+    'culturas': 'TABELA_CULTURAS',
+    'setores': 'TABELA_SETORES',
+    'sensores': 'TABELA_SENSORES',
+    'medicoes': 'TABELA_MEDICOES',
+    'irrigacoes': 'TABELA_IRRIGACOES',
+    'aplicacoes_nutrientes': 'TABELA_APLICACOES_NUTRIENTES',
+    'correcoes_ph': 'TABELA_CORRECOES_PH',
+}
+
+# Coluna de cada tabela que referencia outra tabela (com o mesmo nome de coluna)
+CHAVES_ESTRANGEIRAS = {
+    'TABELA_SETORES': ('id_cultura', 'TABELA_CULTURAS'),
+    'TABELA_SENSORES': ('id_setor', 'TABELA_SETORES'),
+    'TABELA_MEDICOES': ('id_sensor', 'TABELA_SENSORES'),
+    'TABELA_IRRIGACOES': ('id_setor', 'TABELA_SETORES'),
+    'TABELA_APLICACOES_NUTRIENTES': ('id_setor', 'TABELA_SETORES'),
+    'TABELA_CORRECOES_PH': ('id_setor', 'TABELA_SETORES'),
+}
+
+# Tabelas expostas como visão: os índices e o rowid ficam na tabela física
+TABELAS_FISICAS = {
+    'TABELA_MEDICOES': 'TABELA_MEDICOES_COMPACTA',
+}
+
+FORMATOS = ('csv', 'ndjson')
+# Linhas por transação na importação e por fetchmany na exportação
+TAMANHO_BLOCO_PADRAO = 50_000
+# Erros guardados no resultado (os demais são apenas contados)
+MAX_ERROS_GUARDADOS = 1000
+# Cache de páginas usado durante a importação (KiB, valor negativo do PRAGMA cache_size)
+CACHE_IMPORTACAO_KB = 256 * 1024
+# Tamanho médio estimado de uma linha no arquivo, para decidir se vale adiar os índices
+BYTES_POR_LINHA_ESTIMADOS = 60
+
+
+def _abrir(caminho: str, modo: str, comprimido: Optional[bool] = None) -> IO[str]:
+    """Abre o arquivo em modo texto, com compressão gzip quando termina em .gz."""
+    if comprimido is None:
+        comprimido = caminho.endswith('.gz')
+    if comprimido:
+        return gzip.open(caminho, modo + 't', encoding='utf-8', newline='')
+    return open(caminho, modo, encoding='utf-8', newline='', buffering=1024 * 1024)
+
+
+def _detectar_formato(caminho: str, formato: Optional[str]) -> str:
+    if formato is None:
+        nome = caminho[:-3] if caminho.endswith('.gz') else caminho
+        formato = 'ndjson' if nome.endswith(('.ndjson', '.jsonl', '.json')) else 'csv'
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato '{formato}' inválido. Use um de {FORMATOS}.")
+    return formato
+
+
+class BulkTransfer:
+    """
+    Importação e exportação em streaming das tabelas (CSV ou JSON por linha, com ou sem gzip).
+
+    A importação lê o arquivo em blocos de `tamanho_bloco` linhas, converte os campos
+    numéricos e as datas das medições (normalizar_data; inválidas são rejeitadas),
+    confere as chaves estrangeiras contra os IDs cadastrados (carregados uma vez em
+    conjuntos na memória) e grava cada bloco em uma única transação com o
+    `_gravar_lote` do AgriculturalDatabase, que isola as linhas rejeitadas pelo banco.
+    Em cargas grandes os índices secundários da tabela são removidos e recriados ao
+    final, o que é bem mais rápido do que mantê-los linha a linha. Os gatilhos de
+    últimos valores continuam ativos e os agregados são atualizados ao final.
+
+    A exportação percorre a tabela com fetchmany, sem carregá-la inteira na memória.
+    """
+
+    def __init__(self, db_manager):
+        """
+        Args:
+            db_manager: Uma instância da classe AgriculturalDatabase.
+        """
+        self.db = db_manager
+
+    @staticmethod
+    def resolver_tabela(tabela: str) -> str:
+        """Aceita o nome curto ('medicoes') ou o nome da tabela ('TABELA_MEDICOES')."""
+        nome = TABELAS.get(tabela.lower(), tabela.upper())
+        if nome not in TABELAS.values():
+            raise ValueError(f"Tabela '{tabela}' inválida. Use uma de {', '.join(TABELAS)}.")
+        return nome
+
+    def colunas(self, tabela: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+        """Colunas da tabela e, entre elas, as numéricas."""
+        if tabela in COLUNAS_LOTE:
+            return COLUNAS_LOTE[tabela]
+        info = self.db.connection.execute(f"PRAGMA table_info({tabela})").fetchall()
+        colunas = tuple(linha[1] for linha in info)
+        numericas = tuple(linha[1] for linha in info
+                          if any(tipo in linha[2].upper() for tipo in ('DECIMAL', 'REAL', 'FLOAT', 'INT', 'NUMERIC')))
+        return colunas, numericas
+
+    # ---------- Importação ----------
+
+    def importar(self, tabela: str, caminho: str, formato: Optional[str] = None,
+                 tamanho_bloco: int = TAMANHO_BLOCO_PADRAO, adiar_indices: Optional[bool] = None,
+                 validar_fk: bool = True, exibir_resumo: bool = True) -> Dict:
+        """
+        Importa um arquivo CSV (com cabeçalho) ou NDJSON para a tabela.
+
+        Args:
+            tabela (str): Nome curto ou nome da tabela.
+            caminho (str): Arquivo de origem (.csv, .ndjson/.jsonl, opcionalmente .gz).
+            formato (str): 'csv' ou 'ndjson'; se omitido, deduzido pela extensão.
+            tamanho_bloco (int): Linhas gravadas por transação.
+            adiar_indices (bool): Remove os índices secundários durante a carga e os
+                                  recria no final. Se None, adia quando o arquivo tem
+                                  (estimativa) tantas linhas quanto a tabela.
+            validar_fk (bool): Rejeita linhas cujo sensor/setor/cultura não existe.
+
+        Returns:
+            Dict: 'inseridos', 'duplicados' (medições já gravadas, ignoradas),
+                  'rejeitados', 'erros' (até MAX_ERROS_GUARDADOS pares
+                  (linha do arquivo, mensagem)) e 'segundos'.
+        """
+        tabela = self.resolver_tabela(tabela)
+        formato = _detectar_formato(caminho, formato)
+        colunas, numericas = self.colunas(tabela)
+        posicoes_numericas = [posicao for posicao, coluna in enumerate(colunas) if coluna in numericas]
+        posicoes_instante = [posicao for posicao, coluna in enumerate(colunas) if coluna in COLUNAS_INSTANTE]
+        if tamanho_bloco < 1:
+            tamanho_bloco = TAMANHO_BLOCO_PADRAO
+
+        posicao_fk, validos = None, None
+        if validar_fk and tabela in CHAVES_ESTRANGEIRAS:
+            coluna_fk, tabela_fk = CHAVES_ESTRANGEIRAS[tabela]
+            posicao_fk = colunas.index(coluna_fk)
+            validos = self._ids_cadastrados(tabela_fk, coluna_fk)
+
+        if adiar_indices is None:
+            adiar_indices = self._vale_adiar_indices(TABELAS_FISICAS.get(tabela, tabela), caminho)
+
+        resultado = {'inseridos': 0, 'duplicados': 0, 'rejeitados': 0, 'erros': [], 'segundos': 0.0}
+        inicio = time.perf_counter()
+        conexao = self.db.connection
+        cache_anterior = conexao.execute("PRAGMA cache_size").fetchone()[0]
+        indices = self._remover_indices(TABELAS_FISICAS.get(tabela, tabela)) if adiar_indices else []
+        try:
+            conexao.execute(f"PRAGMA cache_size = {-CACHE_IMPORTACAO_KB}")
+            with _abrir(caminho, 'r') as arquivo:
+                lote = []
+                for numero, valores in self._ler(arquivo, formato, colunas, numericas):
+                    if valores is None:
+                        self._registrar_erro(resultado, numero, "Registro inválido: linha incompleta ou malformada")
+                        continue
+                    try:
+                        for posicao in posicoes_numericas:
+                            if valores[posicao] is not None:
+                                valores[posicao] = float(valores[posicao])
+                        for posicao in posicoes_instante:
+                            valores[posicao] = normalizar_data(valores[posicao])
+                    except (TypeError, ValueError) as e:
+                        self._registrar_erro(resultado, numero, f"Registro inválido: {e}")
+                        continue
+                    if posicao_fk is not None and valores[posicao_fk] is not None \
+                            and valores[posicao_fk] not in validos:
+                        self._registrar_erro(resultado, numero,
+                                             f"{colunas[posicao_fk]} '{valores[posicao_fk]}' não cadastrado")
+                        continue
+                    lote.append((numero, valores))
+                    if len(lote) >= tamanho_bloco:
+                        self._gravar(tabela, colunas, lote, resultado)
+                        lote = []
+                if lote:
+                    self._gravar(tabela, colunas, lote, resultado)
+        except (OSError, csv.Error, ValueError) as e:
+            print(f"Erro ao ler '{caminho}': {e}")
+        finally:
+            conexao.execute(f"PRAGMA cache_size = {cache_anterior}")
+            if indices:
+                self._recriar_indices(indices)
+
+        if tabela == 'TABELA_MEDICOES' and resultado['inseridos']:
+            self.db._apos_inserir_medicoes()
+        resultado['segundos'] = time.perf_counter() - inicio
+        if exibir_resumo:
+            print(f"{tabela}: {resultado['inseridos']} registros importados, {resultado['duplicados']} duplicados, "
+                  f"{resultado['rejeitados']} rejeitados "
+                  f"em {resultado['segundos']:.1f}s ({self._taxa(resultado['inseridos'], resultado['segundos'])}).")
+        return resultado
+
+    @staticmethod
+    def _ler(arquivo: IO[str], formato: str, colunas: Tuple[str, ...],
+             numericas: Tuple[str, ...]) -> Iterator[Tuple[int, Optional[list]]]:
+        """
+        Gera (número da linha no arquivo, valores na ordem de `colunas`), com campos
+        vazios como None e os IDs como texto. Linhas malformadas geram valores None.
+        """
+        if formato == 'csv':
+            leitor = csv.reader(arquivo)
+            cabecalho = [nome.strip().lower() for nome in next(leitor, [])]
+            faltando = [coluna for coluna in colunas if coluna not in cabecalho]
+            if faltando:
+                raise ValueError(f"colunas ausentes no cabeçalho: {', '.join(faltando)}")
+            extrair = itemgetter(*[cabecalho.index(coluna) for coluna in colunas])
+            for numero, linha in enumerate(leitor, start=2):
+                if not linha:
+                    continue
+                try:
+                    valores = list(extrair(linha))
+                except IndexError:
+                    yield numero, None
+                    continue
+                if '' in valores:
+                    valores = [valor or None for valor in valores]
+                yield numero, valores
+        else:
+            posicoes_texto = [posicao for posicao, coluna in enumerate(colunas) if coluna not in numericas]
+            for numero, linha in enumerate(arquivo, start=1):
+                if not linha.strip():
+                    continue
+                try:
+                    registro = json.loads(linha)
+                    valores = [registro.get(coluna) for coluna in colunas]
+                except (ValueError, AttributeError):
+                    yield numero, None
+                    continue
+                for posicao in posicoes_texto:
+                    valor = valores[posicao]
+                    if valor == '':
+                        valores[posicao] = None
+                    elif valor is not None and not isinstance(valor, str):
+                        valores[posicao] = str(valor)
+                yield numero, valores
+
+    def _gravar(self, tabela: str, colunas: Tuple[str, ...], lote: List[Tuple[int, list]], resultado: Dict):
+        erros_antes = len(resultado['erros'])
+        self.db._gravar_lote(tabela, lote, resultado, colunas)
+        resultado['rejeitados'] += len(resultado['erros']) - erros_antes
+        if len(resultado['erros']) > MAX_ERROS_GUARDADOS:
+            del resultado['erros'][MAX_ERROS_GUARDADOS:]
+
+    @staticmethod
+    def _registrar_erro(resultado: Dict, numero: int, mensagem: str):
+        resultado['rejeitados'] += 1
+        if len(resultado['erros']) < MAX_ERROS_GUARDADOS:
+            resultado['erros'].append((numero, mensagem))
+
+    def _ids_cadastrados(self, tabela: str, coluna: str) -> set:
+        return {linha[0] for linha in self.db.connection.execute(f"SELECT {coluna} FROM {tabela}")}
+
+    def _vale_adiar_indices(self, tabela: str, caminho: str) -> bool:
+        try:
+            linhas_estimadas = os.path.getsize(caminho) // BYTES_POR_LINHA_ESTIMADOS
+        except OSError:
+            return False
+        if caminho.endswith('.gz'):
+            linhas_estimadas *= 4  # razão de compressão típica de CSV
+        linhas_atuais = self.db.connection.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {tabela}").fetchone()[0]
+        return linhas_estimadas >= linhas_atuais
+
+    def _remover_indices(self, tabela: str) -> List[Tuple[str, str]]:
+        """
+        Remove os índices secundários e devolve seus DDLs. Os índices UNIQUE (e os de
+        chave primária) são mantidos, pois deles depende a detecção de duplicadas.
+        """
+        conexao = self.db.connection
+        indices = conexao.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL "
+            "AND sql NOT LIKE 'CREATE UNIQUE%'",
+            (tabela,)).fetchall()
+        try:
+            for nome, _ in indices:
+                conexao.execute(f"DROP INDEX IF EXISTS {nome}")
+            conexao.commit()
+        except sqlite3.Error as e:
+            conexao.rollback()
+            print(f"Erro ao adiar índices de {tabela}: {e}")
+            return []
+        return indices
+
+    def _recriar_indices(self, indices: List[Tuple[str, str]]):
+        conexao = self.db.connection
+        try:
+            for nome, sql in indices:
+                conexao.execute(sql.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS", 1))
+            conexao.commit()
+            conexao.execute("PRAGMA optimize")
+        except sqlite3.Error as e:
+            conexao.rollback()
+            print(f"Erro ao recriar índices: {e}. DDLs pendentes: {[sql for _, sql in indices]}")
+
+    @staticmethod
+    def _taxa(linhas: int, segundos: float) -> str:
+        return f"{linhas / segundos:,.0f} linhas/s" if segundos > 0 else "-"
+
+    # ---------- Exportação ----------
+
+    def exportar(self, tabela: str, caminho: str, formato: Optional[str] = None,
+                 tamanho_bloco: int = TAMANHO_BLOCO_PADRAO, exibir_resumo: bool = True) -> int:
+        """
+        Exporta a tabela inteira para CSV (com cabeçalho) ou NDJSON, em blocos.
+
+        O arquivo é escrito com um nome temporário e renomeado ao final, então
+        uma exportação interrompida não deixa um arquivo parcial no destino.
+
+        Returns:
+            int: Número de linhas exportadas (-1 em caso de erro).
+        """
+        tabela = self.resolver_tabela(tabela)
+        formato = _detectar_formato(caminho, formato)
+        colunas, _ = self.colunas(tabela)
+        temporario = caminho + ".parcial"
+        inicio = time.perf_counter()
+        total = 0
+        try:
+            cursor = self.db.connection.cursor()
+            cursor.execute(f"SELECT {', '.join(colunas)} FROM {tabela}")
+            with _abrir(temporario, 'w', comprimido=caminho.endswith('.gz')) as arquivo:
+                if formato == 'csv':
+                    escritor = csv.writer(arquivo, lineterminator='\n')
+                    escritor.writerow(colunas)
+                while True:
+                    bloco = cursor.fetchmany(tamanho_bloco)
+                    if not bloco:
+                        break
+                    if formato == 'csv':
+                        escritor.writerows(bloco)
+                    else:
+                        arquivo.writelines(json.dumps(dict(zip(colunas, linha)), ensure_ascii=False) + '\n'
+                                           for linha in bloco)
+                    total += len(bloco)
+            os.replace(temporario, caminho)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Erro ao exportar {tabela}: {e}")
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            return -1
+
+        if exibir_resumo:
+            segundos = time.perf_counter() - inicio
+            print(f"{tabela}: {total} registros exportados para '{caminho}' "
+                  f"em {segundos:.1f}s ({self._taxa(total, segundos)}).")
+        return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importação e exportação em massa das tabelas (CSV/NDJSON).")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+    for nome, ajuda in (("importar", "Importa um arquivo para a tabela"),
+                        ("exportar", "Exporta a tabela para um arquivo")):
+        comando = subcomandos.add_parser(nome, help=ajuda)
+        comando.add_argument("tabela", help=f"Uma de: {', '.join(TABELAS)}")
+        comando.add_argument("arquivo", help="Arquivo .csv ou .ndjson (opcionalmente .gz)")
+        comando.add_argument("--db", default="data/agricultural_system.db")
+        comando.add_argument("--formato", choices=FORMATOS, help="Padrão: deduzido pela extensão")
+        comando.add_argument("--bloco", type=int, default=TAMANHO_BLOCO_PADRAO, help="Linhas por transação/leitura")
+    importar = subcomandos.choices["importar"]
+    importar.add_argument("--adiar-indices", choices=("auto", "sim", "nao"), default="auto",
+                          help="Remove e recria os índices secundários em torno da carga")
+    importar.add_argument("--sem-validar-fk", action="store_true",
+                          help="Não confere sensores/setores/culturas antes de gravar")
+    args = parser.parse_args()
+
+    db = AgriculturalDatabase(db_name=args.db)
+    try:
+        transferencia = BulkTransfer(db)
+        if args.comando == "importar":
+            adiar = {"auto": None, "sim": True, "nao": False}[args.adiar_indices]
+            resultado = transferencia.importar(args.tabela, args.arquivo, formato=args.formato,
+                                               tamanho_bloco=args.bloco, adiar_indices=adiar,
+                                               validar_fk=not args.sem_validar_fk)
+            for numero, mensagem in resultado['erros'][:20]:
+                print(f"  linha {numero}: {mensagem}")
+        else:
+            transferencia.exportar(args.tabela, args.arquivo, formato=args.formato, tamanho_bloco=args.bloco)
+    except ValueError as e:
+        print(f"Erro: {e}")
+    finally:
+        db.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,139 @@
 import sqlite3
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Iterable, Iterator, Sequence, Union, Any
 import os # Garanta que 'os' está importado no topo do arquivo
+import uuid
+
+from .instrumentation import (ConexaoComRetryInstrumentada, ConexaoInstrumentada,
+                              QueryInstrumentation, instrumentacao_no_ambiente)
+from .latest import LatestValues
+from .migrations import aplicar_migracoes
+from .pool import BUSY_TIMEOUT_PADRAO, ConnectionPool
+from .rollups import SensorRollups
+
+# Tamanho padrão de cada lote gravado em uma única transação
+TAMANHO_LOTE_PADRAO = 1000
+
+# db_name que cria um banco SQLite em memória (ver AgriculturalDatabase.__init__)
+BANCO_EM_MEMORIA = ":memory:"
+
+# Colunas (na ordem posicional aceita pelos métodos de lote) e colunas numéricas de cada tabela
+COLUNAS_LOTE = {
+    'TABELA_MEDICOES': (
+        ('id_medicao', 'valor_medicao', 'data_medicao', 'id_sensor'),
+        ('valor_medicao',),
+    ),
+    'TABELA_IRRIGACOES': (
+        ('id_irrigacao', 'volume_irrigacao', 'data_irrigacao', 'id_setor'),
+        ('volume_irrigacao',),
+    ),
+    'TABELA_APLICACOES_NUTRIENTES': (
+        ('id_aplicacao_nutriente', 'tipo_aplicacao', 'volume_aplicacao', 'data_aplicacao', 'id_setor'),
+        ('volume_aplicacao',),
+    ),
+    'TABELA_CORRECOES_PH': (
+        ('id_correcao_ph', 'tipo_correcao', 'volume_correcao', 'data_correcao', 'id_setor'),
+        ('volume_correcao',),
+    ),
+}
+
+# Colunas gravadas como instante inteiro na tabela compacta (migração 7). Nos caminhos
+# em lote a data é validada e normalizada antes do INSERT (ver normalizar_data): uma
+# data inválida vira erro da linha, como no backend em memória, e não instante NULL.
+COLUNAS_INSTANTE = ('data_medicao',)
+
+# INSERTs dos caminhos em lote que diferem do INSERT simples na tabela. As medições
+# vão direto para a tabela compacta (migração 7), sem passar pelo gatilho da visão,
+# convertendo a data e o sensor no próprio SQLite. Uma medição repetida (mesmo
+# id_medicao, ou mesmo sensor e instante) é descartada pelo índice e contada como
+# duplicada, sem consulta prévia; reenvios dos gateways são idempotentes.
+SQL_INSERCAO_LOTE = {
+    'TABELA_MEDICOES': '''
+        INSERT INTO TABELA_MEDICOES_COMPACTA (id_medicao, valor, instante, chave_sensor)
+        VALUES (?, ?, CAST(strftime('%s', ?) AS INTEGER),
+                (SELECT chave_sensor FROM TABELA_CHAVES_SENSORES WHERE id_sensor = ?))
+        ON CONFLICT DO NOTHING
+    ''',
+}
+
+Registro = Union[Sequence, Dict]
+
+
+def normalizar_data(data: Any) -> str:
+    """
+    Converte uma data (datetime ou texto ISO 8601, com espaço ou 'T') para o texto
+    "YYYY-MM-DD HH:MM:SS" que a visão TABELA_MEDICOES devolve. Datas com fuso horário
+    são levadas ao horário local do banco; as frações de segundo são descartadas, pois
+    o instante é gravado em segundos (duas leituras no mesmo segundo são a mesma).
+
+    Raises:
+        ValueError: Data ausente ou em formato não reconhecido.
+    """
+    if isinstance(data, datetime):
+        convertida = data
+    else:
+        texto = str(data).strip() if data is not None else ''
+        if texto.endswith(('Z', 'z')):
+            texto = texto[:-1] + '+00:00'
+        try:
+            convertida = datetime.fromisoformat(texto)
+        except ValueError:
+            raise ValueError(f"data_medicao inválida: {data!r}") from None
+    if convertida.tzinfo is not None:
+        convertida = convertida.astimezone().replace(tzinfo=None)
+    return convertida.strftime("%Y-%m-%d %H:%M:%S")
+
+
+# Formatos aceitos pelos iteradores de consulta: um dict por linha, uma tupla
+# por linha, ou um dict de listas (uma por coluna) para cada bloco de linhas
+FORMATOS_ITERACAO = ('dict', 'tupla', 'colunas')
 
 class AgriculturalDatabase:
-    def __init__(self, db_name: str = "data/agricultural_system.db"):
+    def __init__(self, db_name: str = "data/agricultural_system.db",
+                 pooled: bool = False, busy_timeout: float = BUSY_TIMEOUT_PADRAO,
+                 agregados_automaticos: bool = True, instrumentar: Optional[bool] = None,
+                 somente_leitura: bool = False, verboso: bool = True):
         """
         Inicializa o banco de dados agrícola
+
+        Args:
+            db_name (str): Caminho do arquivo SQLite. Com ":memory:" o banco fica em memória
+                           (cache compartilhado entre as conexões do pool) e deixa de existir
+                           em disconnect(); use carregar_de_arquivo() para semeá-lo.
+            pooled (bool): Se True, usa uma conexão por thread em modo WAL, permitindo
+                           que vários leitores (ex.: sessões do dashboard) consultem
+                           enquanto um escritor grava.
+            busy_timeout (float): Segundos de espera por um lock no modo pooled.
+            agregados_automaticos (bool): Se True, atualiza os agregados horários e
+                                          diários (SensorRollups) após cada inserção de medições.
+            instrumentar (bool): Se True, mede a latência de cada comando SQL e grava as
+                                 consultas lentas com o plano (ver instrumentation.py).
+                                 Se None, segue a variável de ambiente IRRIGACAO_INSTRUMENTAR.
+            somente_leitura (bool): Se True, abre o arquivo como imutável e somente leitura
+                                    (ex.: o snapshot publicado por snapshot.py), sem locks
+                                    e sem aplicar migrações.
+            verboso (bool): Se False, omite as mensagens de conexão e de migração
+                            (ex.: em testes e benchmarks).
         """
         self.db_name = db_name
-        self.connection = None
-        self.cursor = None
+        self.pooled = pooled
+        self.somente_leitura = somente_leitura
+        self.verboso = verboso
+        self.em_memoria = db_name == BANCO_EM_MEMORIA
+        # Nome único: cada instância tem o seu banco, visto por todas as conexões dela
+        self._uri_memoria = f"file:agro_{uuid.uuid4().hex}?mode=memory&cache=shared" if self.em_memoria else None
+        self.busy_timeout = busy_timeout
+        self.agregados_automaticos = agregados_automaticos
+        self.rollups = SensorRollups(self)
+        self.ultimos = LatestValues(self)
+        if instrumentar is None:
+            instrumentar = instrumentacao_no_ambiente()
+        self.instrumentacao = QueryInstrumentation() if instrumentar else None
+        if self.instrumentacao is not None:
+            self.instrumentacao.registrar_ao_sair()
+        self.pool = None
+        self._connection = None
+        self._cursor = None
 
         # --- INÍCIO DA MODIFICAÇÃO ---
         # Garante que o diretório do banco de dados exista antes de conectar.
@@ -21,138 +144,119 @@ class AgriculturalDatabase:
         # --- FIM DA MODIFICAÇÃO ---
         
         self.connect()
-        # Apenas crie tabelas se a conexão for bem-sucedida
-        if self.connection:
+        # Apenas crie tabelas se a conexão for bem-sucedida (um snapshot já vem migrado)
+        if self.connection and not self.somente_leitura:
             self.create_tables()
+
+    @property
+    def connection(self) -> Optional[sqlite3.Connection]:
+        """Conexão em uso pela thread atual (a única conexão, fora do modo pooled)"""
+        if self.pool is not None:
+            return self.pool.obter_conexao()
+        return self._connection
+
+    @property
+    def cursor(self) -> Optional[sqlite3.Cursor]:
+        """
+        Cursor compartilhado mantido por compatibilidade. Os métodos da classe
+        criam um cursor próprio a cada chamada.
+        """
+        if self.pool is not None:
+            return self.pool.obter_cursor()
+        return self._cursor
     
     def connect(self):
         """Conecta ao banco de dados SQLite"""
         try:
-            self.connection = sqlite3.connect(self.db_name)
-            self.cursor = self.connection.cursor()
-            print(f"Conectado ao banco de dados: {self.db_name}")
-        except sqlite3.Error as e:
+            if self.pooled:
+                alvo = self._uri_memoria or self.db_name
+                if self.instrumentacao is not None:
+                    self.pool = ConnectionPool(alvo, busy_timeout=self.busy_timeout,
+                                               fabrica=ConexaoComRetryInstrumentada,
+                                               instrumentacao=self.instrumentacao,
+                                               somente_leitura=self.somente_leitura, uri=self.em_memoria)
+                else:
+                    self.pool = ConnectionPool(alvo, busy_timeout=self.busy_timeout,
+                                               somente_leitura=self.somente_leitura, uri=self.em_memoria)
+                # A conexão desta thread também mantém vivo o banco em memória
+                self.pool.obter_conexao()
+                if self.verboso:
+                    print(f"Conectado ao banco de dados (pool WAL): {self.db_name}")
+            else:
+                caminho, uri = self.db_name, False
+                if self.em_memoria:
+                    caminho, uri = self._uri_memoria, True
+                elif self.somente_leitura:
+                    caminho, uri = f"file:{self.db_name}?mode=ro&immutable=1", True
+                if self.instrumentacao is not None:
+                    self._connection = sqlite3.connect(caminho, factory=ConexaoInstrumentada, uri=uri)
+                    self._connection.instrumentacao = self.instrumentacao
+                else:
+                    self._connection = sqlite3.connect(caminho, uri=uri)
+                self._cursor = self._connection.cursor()
+                if self.verboso:
+                    print(f"Conectado ao banco de dados: {self.db_name}")
+        except (sqlite3.Error, OSError) as e:
             print(f"Erro ao conectar ao banco de dados: {e}")
             # Importante: garantir que fiquem como None se a conexão falhar
-            self.connection = None
-            self.cursor = None
+            self.pool = None
+            self._connection = None
+            self._cursor = None
     
     def disconnect(self):
         """Desconecta do banco de dados"""
-        if self.connection:
-            self.connection.close()
-            print("Desconectado do banco de dados")
+        if self.instrumentacao is not None:
+            self.instrumentacao.salvar()
+        if self.pool is not None:
+            self.pool.fechar_todas()
+            self.pool = None
+            if self.verboso:
+                print("Desconectado do banco de dados")
+        elif self._connection:
+            self._connection.close()
+            self._connection = None
+            self._cursor = None
+            if self.verboso:
+                print("Desconectado do banco de dados")
     
     def create_tables(self):
-        """Cria todas as tabelas do sistema"""
+        """
+        Cria todas as tabelas do sistema aplicando as migrações de esquema pendentes.
+        Se o banco já estiver na versão mais recente, nada é executado.
+        """
         try:
-            # Tabela Sensores
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS TABELA_SENSORES (
-                    id_sensor VARCHAR(10) PRIMARY KEY,
-                    tipo_sensor VARCHAR(10),
-                    id_setor VARCHAR(10)
-                )
-            ''')
-            
-            # Tabela Setores
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS TABELA_SETORES (
-                    id_setor VARCHAR(10) PRIMARY KEY,
-                    area_setor DECIMAL(9,2),
-                    id_cultura VARCHAR(10)
-                )
-            ''')
-            
-            # Tabela Culturas
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS TABELA_CULTURAS (
-                    id_cultura VARCHAR(10) PRIMARY KEY,
-                    nome_cultura VARCHAR(50),
-                    ph_minimo_ideal DECIMAL(10,5),
-                    ph_maximo_ideal DECIMAL(10,5),
-                    fosforo_minimo_ideal DECIMAL(10,5),
-                    fosforo_maximo_ideal DECIMAL(10,5),
-                    potassio_minimo_ideal DECIMAL(10,5),
-                    potassio_maximo_ideal DECIMAL(10,5),
-                    umidade_minima_ideal DECIMAL(10,5),
-                    umidade_maxima_ideal DECIMAL(10,5)
-                )
-            ''')
-            
-            # Tabela Medicoes
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS TABELA_MEDICOES (
-                    id_medicao VARCHAR(10) PRIMARY KEY,
-                    valor_medicao DECIMAL(10,5),
-                    data_medicao DATETIME,
-                    id_sensor VARCHAR(10),
-                    FOREIGN KEY (id_sensor) REFERENCES TABELA_SENSORES(id_sensor)
-                )
-            ''')
-            
-            # Tabela Aplicacoes Nutrientes
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS TABELA_APLICACOES_NUTRIENTES (
-                    id_aplicacao_nutriente VARCHAR(10) PRIMARY KEY,
-                    tipo_aplicacao VARCHAR(50),
-                    volume_aplicacao DECIMAL(10,2),
-                    data_aplicacao DATETIME,
-                    id_setor VARCHAR(10),
-                    FOREIGN KEY (id_setor) REFERENCES TABELA_SETORES(id_setor)
-                )
-            ''')
-            
-            # Tabela Correcoes PH
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS TABELA_CORRECOES_PH (
-                    id_correcao_ph VARCHAR(10) PRIMARY KEY,
-                    tipo_correcao VARCHAR(50),
-                    volume_correcao DECIMAL(10,2),
-                    data_correcao DATETIME,
-                    id_setor VARCHAR(10),
-                    FOREIGN KEY (id_setor) REFERENCES TABELA_SETORES(id_setor)
-                )
-            ''')
-            
-            # Tabela Irrigacoes
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS TABELA_IRRIGACOES (
-                    id_irrigacao VARCHAR(10) PRIMARY KEY,
-                    volume_irrigacao DECIMAL(10,2),
-                    data_irrigacao DATETIME,
-                    id_setor VARCHAR(10),
-                    FOREIGN KEY (id_setor) REFERENCES TABELA_SETORES(id_setor)
-                )
-            ''')
-            
-            # Adicionar foreign keys que não foram criadas inicialmente
-            try:
-                self.cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS TABELA_SENSORES_NEW (
-                        id_sensor VARCHAR(10) PRIMARY KEY,
-                        tipo_sensor VARCHAR(10),
-                        id_setor VARCHAR(10),
-                        FOREIGN KEY (id_setor) REFERENCES TABELA_SETORES(id_setor)
-                    )
-                ''')
-                
-                self.cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS TABELA_SETORES_NEW (
-                        id_setor VARCHAR(10) PRIMARY KEY,
-                        area_setor DECIMAL(9,2),
-                        id_cultura VARCHAR(10),
-                        FOREIGN KEY (id_cultura) REFERENCES TABELA_CULTURAS(id_cultura)
-                    )
-                ''')
-            except:
-                pass
-            
-            self.connection.commit()
-            print("Tabelas criadas com sucesso!")
-            
+            avisos = []
+            aplicadas = aplicar_migracoes(self.connection, avisos)
+            if aplicadas:
+                if self.verboso:
+                    for aviso in avisos:
+                        print(aviso)
+                    print(f"Tabelas criadas com sucesso! Esquema na versão {aplicadas[-1]}.")
+                # Uma migração pode ter zerado os agregados (ex.: remoção de duplicadas)
+                if self.agregados_automaticos:
+                    self.rollups.atualizar()
         except sqlite3.Error as e:
             print(f"Erro ao criar tabelas: {e}")
+
+    def carregar_de_arquivo(self, caminho: str) -> bool:
+        """
+        Substitui o conteúdo do banco por uma cópia do arquivo `caminho`, feita em uma
+        única operação pela API de backup do SQLite (ex.: semear um banco ":memory:").
+        As migrações pendentes da cópia são aplicadas em seguida.
+        """
+        try:
+            origem = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True)
+            try:
+                origem.backup(self.connection)
+            finally:
+                origem.close()
+        except sqlite3.Error as e:
+            print(f"Erro ao carregar o banco de '{caminho}': {e}")
+            return False
+        self.create_tables()
+        if self.verboso:
+            print(f"Banco carregado de '{caminho}'.")
+        return True
     
     # ========== CRUD PARA CULTURAS ==========
     
@@ -162,7 +266,8 @@ class AgriculturalDatabase:
                        umidade_min: float, umidade_max: float) -> bool:
         """Insere uma nova cultura"""
         try:
-            self.cursor.execute('''
+            cursor = self.connection.cursor()
+            cursor.execute('''
                 INSERT INTO TABELA_CULTURAS 
                 (id_cultura, nome_cultura, ph_minimo_ideal, ph_maximo_ideal,
                  fosforo_minimo_ideal, fosforo_maximo_ideal, potassio_minimo_ideal,
@@ -180,9 +285,10 @@ class AgriculturalDatabase:
     def consultar_culturas(self) -> List[Dict]:
         """Consulta todas as culturas"""
         try:
-            self.cursor.execute("SELECT * FROM TABELA_CULTURAS")
-            culturas = self.cursor.fetchall()
-            colunas = [desc[0] for desc in self.cursor.description]
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT * FROM TABELA_CULTURAS")
+            culturas = cursor.fetchall()
+            colunas = [desc[0] for desc in cursor.description]
             return [dict(zip(colunas, cultura)) for cultura in culturas]
         except sqlite3.Error as e:
             print(f"Erro ao consultar culturas: {e}")
@@ -191,6 +297,7 @@ class AgriculturalDatabase:
     def atualizar_cultura(self, id_cultura: str, **kwargs) -> bool:
         """Atualiza uma cultura existente"""
         try:
+            cursor = self.connection.cursor()
             campos = []
             valores = []
             for campo, valor in kwargs.items():
@@ -200,7 +307,7 @@ class AgriculturalDatabase:
             valores.append(id_cultura)
             query = f"UPDATE TABELA_CULTURAS SET {', '.join(campos)} WHERE id_cultura = ?"
             
-            self.cursor.execute(query, valores)
+            cursor.execute(query, valores)
             self.connection.commit()
             print(f"Cultura {id_cultura} atualizada com sucesso!")
             return True
@@ -211,7 +318,8 @@ class AgriculturalDatabase:
     def remover_cultura(self, id_cultura: str) -> bool:
         """Remove uma cultura"""
         try:
-            self.cursor.execute("DELETE FROM TABELA_CULTURAS WHERE id_cultura = ?", (id_cultura,))
+            cursor = self.connection.cursor()
+            cursor.execute("DELETE FROM TABELA_CULTURAS WHERE id_cultura = ?", (id_cultura,))
             self.connection.commit()
             print(f"Cultura {id_cultura} removida com sucesso!")
             return True
@@ -224,7 +332,8 @@ class AgriculturalDatabase:
     def inserir_setor(self, id_setor: str, area_setor: float, id_cultura: str) -> bool:
         """Insere um novo setor"""
         try:
-            self.cursor.execute('''
+            cursor = self.connection.cursor()
+            cursor.execute('''
                 INSERT INTO TABELA_SETORES (id_setor, area_setor, id_cultura)
                 VALUES (?, ?, ?)
             ''', (id_setor, area_setor, id_cultura))
@@ -238,13 +347,14 @@ class AgriculturalDatabase:
     def consultar_setores(self) -> List[Dict]:
         """Consulta todos os setores"""
         try:
-            self.cursor.execute('''
+            cursor = self.connection.cursor()
+            cursor.execute('''
                 SELECT s.*, c.nome_cultura 
                 FROM TABELA_SETORES s 
                 LEFT JOIN TABELA_CULTURAS c ON s.id_cultura = c.id_cultura
             ''')
-            setores = self.cursor.fetchall()
-            colunas = [desc[0] for desc in self.cursor.description]
+            setores = cursor.fetchall()
+            colunas = [desc[0] for desc in cursor.description]
             return [dict(zip(colunas, setor)) for setor in setores]
         except sqlite3.Error as e:
             print(f"Erro ao consultar setores: {e}")
@@ -253,6 +363,7 @@ class AgriculturalDatabase:
     def atualizar_setor(self, id_setor: str, **kwargs) -> bool:
         """Atualiza um setor existente"""
         try:
+            cursor = self.connection.cursor()
             campos = []
             valores = []
             for campo, valor in kwargs.items():
@@ -262,7 +373,7 @@ class AgriculturalDatabase:
             valores.append(id_setor)
             query = f"UPDATE TABELA_SETORES SET {', '.join(campos)} WHERE id_setor = ?"
             
-            self.cursor.execute(query, valores)
+            cursor.execute(query, valores)
             self.connection.commit()
             print(f"Setor {id_setor} atualizado com sucesso!")
             return True
@@ -273,7 +384,8 @@ class AgriculturalDatabase:
     def remover_setor(self, id_setor: str) -> bool:
         """Remove um setor"""
         try:
-            self.cursor.execute("DELETE FROM TABELA_SETORES WHERE id_setor = ?", (id_setor,))
+            cursor = self.connection.cursor()
+            cursor.execute("DELETE FROM TABELA_SETORES WHERE id_setor = ?", (id_setor,))
             self.connection.commit()
             print(f"Setor {id_setor} removido com sucesso!")
             return True
@@ -286,7 +398,8 @@ class AgriculturalDatabase:
     def inserir_sensor(self, id_sensor: str, tipo_sensor: str, id_setor: str) -> bool:
         """Insere um novo sensor"""
         try:
-            self.cursor.execute('''
+            cursor = self.connection.cursor()
+            cursor.execute('''
                 INSERT INTO TABELA_SENSORES (id_sensor, tipo_sensor, id_setor)
                 VALUES (?, ?, ?)
             ''', (id_sensor, tipo_sensor, id_setor))
@@ -300,13 +413,14 @@ class AgriculturalDatabase:
     def consultar_sensores(self) -> List[Dict]:
         """Consulta todos os sensores"""
         try:
-            self.cursor.execute('''
+            cursor = self.connection.cursor()
+            cursor.execute('''
                 SELECT s.*, st.area_setor 
                 FROM TABELA_SENSORES s 
                 LEFT JOIN TABELA_SETORES st ON s.id_setor = st.id_setor
             ''')
-            sensores = self.cursor.fetchall()
-            colunas = [desc[0] for desc in self.cursor.description]
+            sensores = cursor.fetchall()
+            colunas = [desc[0] for desc in cursor.description]
             return [dict(zip(colunas, sensor)) for sensor in sensores]
         except sqlite3.Error as e:
             print(f"Erro ao consultar sensores: {e}")
@@ -315,6 +429,7 @@ class AgriculturalDatabase:
     def atualizar_sensor(self, id_sensor: str, **kwargs) -> bool:
         """Atualiza um sensor existente"""
         try:
+            cursor = self.connection.cursor()
             campos = []
             valores = []
             for campo, valor in kwargs.items():
@@ -324,7 +439,7 @@ class AgriculturalDatabase:
             valores.append(id_sensor)
             query = f"UPDATE TABELA_SENSORES SET {', '.join(campos)} WHERE id_sensor = ?"
             
-            self.cursor.execute(query, valores)
+            cursor.execute(query, valores)
             self.connection.commit()
             print(f"Sensor {id_sensor} atualizado com sucesso!")
             return True
@@ -335,7 +450,8 @@ class AgriculturalDatabase:
     def remover_sensor(self, id_sensor: str) -> bool:
         """Remove um sensor"""
         try:
-            self.cursor.execute("DELETE FROM TABELA_SENSORES WHERE id_sensor = ?", (id_sensor,))
+            cursor = self.connection.cursor()
+            cursor.execute("DELETE FROM TABELA_SENSORES WHERE id_sensor = ?", (id_sensor,))
             self.connection.commit()
             print(f"Sensor {id_sensor} removido com sucesso!")
             return True
@@ -349,12 +465,14 @@ class AgriculturalDatabase:
                        data_medicao: str, id_sensor: str) -> bool:
         """Insere uma nova medição"""
         try:
-            self.cursor.execute('''
+            cursor = self.connection.cursor()
+            cursor.execute('''
                 INSERT INTO TABELA_MEDICOES (id_medicao, valor_medicao, data_medicao, id_sensor)
                 VALUES (?, ?, ?, ?)
             ''', (id_medicao, valor_medicao, data_medicao, id_sensor))
             self.connection.commit()
             print(f"Medição {id_medicao} inserida com sucesso!")
+            self._apos_inserir_medicoes()
             return True
         except sqlite3.Error as e:
             print(f"Erro ao inserir medição: {e}")
@@ -363,13 +481,14 @@ class AgriculturalDatabase:
     def consultar_medicoes(self) -> List[Dict]:
         """Consulta todas as medições"""
         try:
-            self.cursor.execute('''
+            cursor = self.connection.cursor()
+            cursor.execute('''
                 SELECT m.*, s.tipo_sensor, s.id_setor 
                 FROM TABELA_MEDICOES m 
                 LEFT JOIN TABELA_SENSORES s ON m.id_sensor = s.id_sensor
             ''')
-            medicoes = self.cursor.fetchall()
-            colunas = [desc[0] for desc in self.cursor.description]
+            medicoes = cursor.fetchall()
+            colunas = [desc[0] for desc in cursor.description]
             return [dict(zip(colunas, medicao)) for medicao in medicoes]
         except sqlite3.Error as e:
             print(f"Erro ao consultar medições: {e}")
@@ -378,6 +497,7 @@ class AgriculturalDatabase:
     def atualizar_medicao(self, id_medicao: str, **kwargs) -> bool:
         """Atualiza uma medição existente"""
         try:
+            cursor = self.connection.cursor()
             campos = []
             valores = []
             for campo, valor in kwargs.items():
@@ -387,7 +507,7 @@ class AgriculturalDatabase:
             valores.append(id_medicao)
             query = f"UPDATE TABELA_MEDICOES SET {', '.join(campos)} WHERE id_medicao = ?"
             
-            self.cursor.execute(query, valores)
+            cursor.execute(query, valores)
             self.connection.commit()
             print(f"Medição {id_medicao} atualizada com sucesso!")
             return True
@@ -398,7 +518,8 @@ class AgriculturalDatabase:
     def remover_medicao(self, id_medicao: str) -> bool:
         """Remove uma medição"""
         try:
-            self.cursor.execute("DELETE FROM TABELA_MEDICOES WHERE id_medicao = ?", (id_medicao,))
+            cursor = self.connection.cursor()
+            cursor.execute("DELETE FROM TABELA_MEDICOES WHERE id_medicao = ?", (id_medicao,))
             self.connection.commit()
             print(f"Medição {id_medicao} removida com sucesso!")
             return True
@@ -413,7 +534,8 @@ class AgriculturalDatabase:
                                    id_setor: str) -> bool:
         """Insere uma nova aplicação de nutriente"""
         try:
-            self.cursor.execute('''
+            cursor = self.connection.cursor()
+            cursor.execute('''
                 INSERT INTO TABELA_APLICACOES_NUTRIENTES 
                 (id_aplicacao_nutriente, tipo_aplicacao, volume_aplicacao, data_aplicacao, id_setor)
                 VALUES (?, ?, ?, ?, ?)
@@ -428,13 +550,14 @@ class AgriculturalDatabase:
     def consultar_aplicacoes_nutrientes(self) -> List[Dict]:
         """Consulta todas as aplicações de nutrientes"""
         try:
-            self.cursor.execute('''
+            cursor = self.connection.cursor()
+            cursor.execute('''
                 SELECT a.*, s.area_setor 
                 FROM TABELA_APLICACOES_NUTRIENTES a 
                 LEFT JOIN TABELA_SETORES s ON a.id_setor = s.id_setor
             ''')
-            aplicacoes = self.cursor.fetchall()
-            colunas = [desc[0] for desc in self.cursor.description]
+            aplicacoes = cursor.fetchall()
+            colunas = [desc[0] for desc in cursor.description]
             return [dict(zip(colunas, aplicacao)) for aplicacao in aplicacoes]
         except sqlite3.Error as e:
             print(f"Erro ao consultar aplicações de nutrientes: {e}")
@@ -443,6 +566,7 @@ class AgriculturalDatabase:
     def atualizar_aplicacao_nutriente(self, id_aplicacao: str, **kwargs) -> bool:
         """Atualiza uma aplicação de nutriente existente"""
         try:
+            cursor = self.connection.cursor()
             campos = []
             valores = []
             for campo, valor in kwargs.items():
@@ -452,7 +576,7 @@ class AgriculturalDatabase:
             valores.append(id_aplicacao)
             query = f"UPDATE TABELA_APLICACOES_NUTRIENTES SET {', '.join(campos)} WHERE id_aplicacao_nutriente = ?"
             
-            self.cursor.execute(query, valores)
+            cursor.execute(query, valores)
             self.connection.commit()
             print(f"Aplicação de nutriente {id_aplicacao} atualizada com sucesso!")
             return True
@@ -463,7 +587,8 @@ class AgriculturalDatabase:
     def remover_aplicacao_nutriente(self, id_aplicacao: str) -> bool:
         """Remove uma aplicação de nutriente"""
         try:
-            self.cursor.execute("DELETE FROM TABELA_APLICACOES_NUTRIENTES WHERE id_aplicacao_nutriente = ?", (id_aplicacao,))
+            cursor = self.connection.cursor()
+            cursor.execute("DELETE FROM TABELA_APLICACOES_NUTRIENTES WHERE id_aplicacao_nutriente = ?", (id_aplicacao,))
             self.connection.commit()
             print(f"Aplicação de nutriente {id_aplicacao} removida com sucesso!")
             return True
@@ -478,7 +603,8 @@ class AgriculturalDatabase:
                            id_setor: str) -> bool:
         """Insere uma nova correção de pH"""
         try:
-            self.cursor.execute('''
+            cursor = self.connection.cursor()
+            cursor.execute('''
                 INSERT INTO TABELA_CORRECOES_PH 
                 (id_correcao_ph, tipo_correcao, volume_correcao, data_correcao, id_setor)
                 VALUES (?, ?, ?, ?, ?)
@@ -493,13 +619,14 @@ class AgriculturalDatabase:
     def consultar_correcoes_ph(self) -> List[Dict]:
         """Consulta todas as correções de pH"""
         try:
-            self.cursor.execute('''
+            cursor = self.connection.cursor()
+            cursor.execute('''
                 SELECT c.*, s.area_setor 
                 FROM TABELA_CORRECOES_PH c 
                 LEFT JOIN TABELA_SETORES s ON c.id_setor = s.id_setor
             ''')
-            correcoes = self.cursor.fetchall()
-            colunas = [desc[0] for desc in self.cursor.description]
+            correcoes = cursor.fetchall()
+            colunas = [desc[0] for desc in cursor.description]
             return [dict(zip(colunas, correcao)) for correcao in correcoes]
         except sqlite3.Error as e:
             print(f"Erro ao consultar correções de pH: {e}")
@@ -508,6 +635,7 @@ class AgriculturalDatabase:
     def atualizar_correcao_ph(self, id_correcao: str, **kwargs) -> bool:
         """Atualiza uma correção de pH existente"""
         try:
+            cursor = self.connection.cursor()
             campos = []
             valores = []
             for campo, valor in kwargs.items():
@@ -517,7 +645,7 @@ class AgriculturalDatabase:
             valores.append(id_correcao)
             query = f"UPDATE TABELA_CORRECOES_PH SET {', '.join(campos)} WHERE id_correcao_ph = ?"
             
-            self.cursor.execute(query, valores)
+            cursor.execute(query, valores)
             self.connection.commit()
             print(f"Correção de pH {id_correcao} atualizada com sucesso!")
             return True
@@ -528,7 +656,8 @@ class AgriculturalDatabase:
     def remover_correcao_ph(self, id_correcao: str) -> bool:
         """Remove uma correção de pH"""
         try:
-            self.cursor.execute("DELETE FROM TABELA_CORRECOES_PH WHERE id_correcao_ph = ?", (id_correcao,))
+            cursor = self.connection.cursor()
+            cursor.execute("DELETE FROM TABELA_CORRECOES_PH WHERE id_correcao_ph = ?", (id_correcao,))
             self.connection.commit()
             print(f"Correção de pH {id_correcao} removida com sucesso!")
             return True
@@ -542,7 +671,8 @@ class AgriculturalDatabase:
                          data_irrigacao: str, id_setor: str) -> bool:
         """Insere uma nova irrigação"""
         try:
-            self.cursor.execute('''
+            cursor = self.connection.cursor()
+            cursor.execute('''
                 INSERT INTO TABELA_IRRIGACOES 
                 (id_irrigacao, volume_irrigacao, data_irrigacao, id_setor)
                 VALUES (?, ?, ?, ?)
@@ -557,13 +687,14 @@ class AgriculturalDatabase:
     def consultar_irrigacoes(self) -> List[Dict]:
         """Consulta todas as irrigações"""
         try:
-            self.cursor.execute('''
+            cursor = self.connection.cursor()
+            cursor.execute('''
                 SELECT i.*, s.area_setor 
                 FROM TABELA_IRRIGACOES i 
                 LEFT JOIN TABELA_SETORES s ON i.id_setor = s.id_setor
             ''')
-            irrigacoes = self.cursor.fetchall()
-            colunas = [desc[0] for desc in self.cursor.description]
+            irrigacoes = cursor.fetchall()
+            colunas = [desc[0] for desc in cursor.description]
             return [dict(zip(colunas, irrigacao)) for irrigacao in irrigacoes]
         except sqlite3.Error as e:
             print(f"Erro ao consultar irrigações: {e}")
@@ -572,6 +703,7 @@ class AgriculturalDatabase:
     def atualizar_irrigacao(self, id_irrigacao: str, **kwargs) -> bool:
         """Atualiza uma irrigação existente"""
         try:
+            cursor = self.connection.cursor()
             campos = []
             valores = []
             for campo, valor in kwargs.items():
@@ -581,7 +713,7 @@ class AgriculturalDatabase:
             valores.append(id_irrigacao)
             query = f"UPDATE TABELA_IRRIGACOES SET {', '.join(campos)} WHERE id_irrigacao = ?"
             
-            self.cursor.execute(query, valores)
+            cursor.execute(query, valores)
             self.connection.commit()
             print(f"Irrigação {id_irrigacao} atualizada com sucesso!")
             return True
@@ -592,7 +724,8 @@ class AgriculturalDatabase:
     def remover_irrigacao(self, id_irrigacao: str) -> bool:
         """Remove uma irrigação"""
         try:
-            self.cursor.execute("DELETE FROM TABELA_IRRIGACOES WHERE id_irrigacao = ?", (id_irrigacao,))
+            cursor = self.connection.cursor()
+            cursor.execute("DELETE FROM TABELA_IRRIGACOES WHERE id_irrigacao = ?", (id_irrigacao,))
             self.connection.commit()
             print(f"Irrigação {id_irrigacao} removida com sucesso!")
             return True
@@ -600,48 +733,385 @@ class AgriculturalDatabase:
             print(f"Erro ao remover irrigação: {e}")
             return False
     
+    # ========== INGESTÃO EM LOTE ==========
+
+    def inserir_medicoes_em_lote(self, medicoes: Iterable[Registro],
+                                 tamanho_lote: int = TAMANHO_LOTE_PADRAO,
+                                 exibir_resumo: bool = True) -> Dict:
+        """
+        Insere muitas medições usando executemany, com uma transação por lote.
+
+        Cada medição pode ser uma tupla (id_medicao, valor_medicao, data_medicao, id_sensor)
+        ou um dicionário com essas chaves. Aceita qualquer iterável, inclusive geradores.
+        Medições já gravadas (mesmo id ou mesmo sensor e instante) são ignoradas e
+        contadas em resultado['duplicados'].
+        """
+        resultado = self._inserir_em_lote('TABELA_MEDICOES', medicoes, tamanho_lote, exibir_resumo)
+        if resultado['inseridos']:
+            self._apos_inserir_medicoes()
+        return resultado
+
+    def inserir_irrigacoes_em_lote(self, irrigacoes: Iterable[Registro],
+                                   tamanho_lote: int = TAMANHO_LOTE_PADRAO,
+                                   exibir_resumo: bool = True) -> Dict:
+        """Insere muitas irrigações (id_irrigacao, volume_irrigacao, data_irrigacao, id_setor)"""
+        return self._inserir_em_lote('TABELA_IRRIGACOES', irrigacoes, tamanho_lote, exibir_resumo)
+
+    def inserir_aplicacoes_nutrientes_em_lote(self, aplicacoes: Iterable[Registro],
+                                              tamanho_lote: int = TAMANHO_LOTE_PADRAO,
+                                              exibir_resumo: bool = True) -> Dict:
+        """Insere muitas aplicações (id_aplicacao, tipo_aplicacao, volume_aplicacao, data_aplicacao, id_setor)"""
+        return self._inserir_em_lote('TABELA_APLICACOES_NUTRIENTES', aplicacoes, tamanho_lote, exibir_resumo)
+
+    def inserir_correcoes_ph_em_lote(self, correcoes: Iterable[Registro],
+                                     tamanho_lote: int = TAMANHO_LOTE_PADRAO,
+                                     exibir_resumo: bool = True) -> Dict:
+        """Insere muitas correções de pH (id_correcao, tipo_correcao, volume_correcao, data_correcao, id_setor)"""
+        return self._inserir_em_lote('TABELA_CORRECOES_PH', correcoes, tamanho_lote, exibir_resumo)
+
+    def _apos_inserir_medicoes(self):
+        """Propaga novas medições para as estruturas derivadas (agregados)"""
+        if self.agregados_automaticos:
+            self.rollups.atualizar()
+
+    def _inserir_em_lote(self, tabela: str, registros: Iterable[Registro],
+                         tamanho_lote: int, exibir_resumo: bool) -> Dict:
+        """
+        Grava os registros em lotes de `tamanho_lote`, cada um em uma única transação.
+
+        Retorna um dicionário com o total inserido, o total de duplicados ignorados
+        e a lista de erros por linha no formato (índice do registro, mensagem), em
+        vez de abortar tudo.
+        """
+        colunas, numericas = COLUNAS_LOTE[tabela]
+        resultado = {'inseridos': 0, 'duplicados': 0, 'erros': []}
+        if tamanho_lote < 1:
+            tamanho_lote = TAMANHO_LOTE_PADRAO
+
+        lote = []
+        for indice, registro in enumerate(registros):
+            try:
+                lote.append((indice, self._normalizar_registro(registro, colunas, numericas)))
+            except (TypeError, ValueError, KeyError) as e:
+                resultado['erros'].append((indice, f"Registro inválido: {e}"))
+                continue
+            if len(lote) >= tamanho_lote:
+                self._gravar_lote(tabela, lote, resultado)
+                lote = []
+        if lote:
+            self._gravar_lote(tabela, lote, resultado)
+
+        if exibir_resumo:
+            print(f"{tabela}: {resultado['inseridos']} registros inseridos, {resultado['duplicados']} duplicados, "
+                  f"{len(resultado['erros'])} com erro.")
+        return resultado
+
+    @staticmethod
+    def _sql_insercao_lote(tabela: str, colunas: Tuple[str, ...]) -> str:
+        """INSERT usado pelos caminhos em lote, com os valores na ordem de `colunas`"""
+        if tabela in SQL_INSERCAO_LOTE:
+            return SQL_INSERCAO_LOTE[tabela]
+        return f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({', '.join('?' * len(colunas))})"
+
+    def _registrar_chaves_sensores(self, ids_sensores: Iterable[Optional[str]]):
+        """Garante a chave inteira de cada sensor em TABELA_CHAVES_SENSORES (transação própria)"""
+        novos = [(id_sensor,) for id_sensor in set(ids_sensores) if id_sensor is not None]
+        self.connection.cursor().executemany(
+            "INSERT OR IGNORE INTO TABELA_CHAVES_SENSORES (id_sensor) VALUES (?)", novos)
+        self.connection.commit()
+
+    @staticmethod
+    def _normalizar_registro(registro: Registro, colunas: Tuple[str, ...],
+                             numericas: Tuple[str, ...]) -> tuple:
+        """Converte um registro (tupla ou dicionário) na tupla de parâmetros do INSERT"""
+        if isinstance(registro, dict):
+            valores = [registro[coluna] for coluna in colunas]
+        else:
+            valores = list(registro)
+            if len(valores) != len(colunas):
+                raise ValueError(f"esperados {len(colunas)} campos, recebidos {len(valores)}")
+        for posicao, coluna in enumerate(colunas):
+            if coluna in numericas:
+                valores[posicao] = float(valores[posicao])
+            elif coluna in COLUNAS_INSTANTE:
+                valores[posicao] = normalizar_data(valores[posicao])
+        return tuple(valores)
+
+    def _gravar_lote(self, tabela: str, lote: List[Tuple[int, tuple]], resultado: Dict,
+                     colunas: Optional[Tuple[str, ...]] = None):
+        """
+        Grava um lote inteiro com executemany. Se alguma linha violar uma restrição,
+        desfaz o lote e regrava linha a linha na mesma transação para isolar os erros.
+        Linhas descartadas pela cláusula de conflito (rowcount 0) somam em 'duplicados'.
+        Os valores seguem a ordem de `colunas` (padrão: COLUNAS_LOTE da tabela).
+        """
+        sql = self._sql_insercao_lote(tabela, colunas or COLUNAS_LOTE[tabela][0])
+        cursor = self.connection.cursor()
+        try:
+            if tabela == 'TABELA_MEDICOES':
+                self._registrar_chaves_sensores(valores[-1] for _, valores in lote)
+            cursor.executemany(sql, [valores for _, valores in lote])
+            self.connection.commit()
+            resultado['inseridos'] += cursor.rowcount
+            resultado['duplicados'] += len(lote) - cursor.rowcount
+            return
+        except sqlite3.IntegrityError:
+            self.connection.rollback()
+        except sqlite3.Error as e:
+            self.connection.rollback()
+            resultado['erros'].extend((indice, str(e)) for indice, _ in lote)
+            return
+
+        inseridos, duplicados, erros = 0, 0, []
+        try:
+            for indice, valores in lote:
+                try:
+                    cursor.execute(sql, valores)
+                    if cursor.rowcount:
+                        inseridos += 1
+                    else:
+                        duplicados += 1
+                except sqlite3.IntegrityError as e:
+                    erros.append((indice, str(e)))
+            self.connection.commit()
+            resultado['inseridos'] += inseridos
+            resultado['duplicados'] += duplicados
+            resultado['erros'].extend(erros)
+        except sqlite3.Error as e:
+            self.connection.rollback()
+            resultado['erros'].extend((indice, str(e)) for indice, _ in lote)
+
+    # ========== CONSULTAS EM STREAMING ==========
+
+    def iterar_medicoes(self, id_sensor: Optional[str] = None, id_setor: Optional[str] = None,
+                        inicio: Optional[str] = None, fim: Optional[str] = None,
+                        tipo_sensor: Optional[str] = None, ordem: Optional[str] = None,
+                        limite: Optional[int] = None, formato: str = 'dict',
+                        tamanho_lote: int = TAMANHO_LOTE_PADRAO) -> Iterator[Any]:
+        """
+        Itera sobre as medições sem carregar a tabela inteira na memória.
+
+        Lê direto da tabela compacta: os filtros de sensor e de data usam os índices
+        inteiros e cada linha traz, além de data_medicao em texto, o `instante` em
+        segundos desde a época (UTC), que dispensa o parse da data
+        (ex.: pd.to_datetime(colunas['instante'], unit='s')).
+
+        Args:
+            id_sensor, id_setor, tipo_sensor: Filtros opcionais.
+            inicio, fim (str): Intervalo de data_medicao ("YYYY-MM-DD HH:MM:SS"), fechado em inicio e aberto em fim.
+            ordem (str): 'asc' ou 'desc' por data_medicao; None mantém a ordem do banco.
+            limite (int): Número máximo de linhas.
+            formato (str): 'dict', 'tupla' ou 'colunas' (ver FORMATOS_ITERACAO).
+            tamanho_lote (int): Linhas buscadas por fetchmany.
+        """
+        filtros = [('m.chave_sensor = (SELECT chave_sensor FROM TABELA_CHAVES_SENSORES WHERE id_sensor = ?)', id_sensor),
+                   ('s.id_setor = ?', id_setor), ('s.tipo_sensor = ?', tipo_sensor),
+                   ("m.instante >= CAST(strftime('%s', ?) AS INTEGER)", inicio),
+                   ("m.instante < CAST(strftime('%s', ?) AS INTEGER)", fim)]
+        sql = '''
+            SELECT m.id_medicao, m.valor AS valor_medicao, datetime(m.instante, 'unixepoch') AS data_medicao,
+                   k.id_sensor, s.tipo_sensor, s.id_setor, m.instante
+            FROM TABELA_MEDICOES_COMPACTA m
+            LEFT JOIN TABELA_CHAVES_SENSORES k ON k.chave_sensor = m.chave_sensor
+            LEFT JOIN TABELA_SENSORES s ON k.id_sensor = s.id_sensor
+        '''
+        return self._iterar_consulta(sql, filtros, 'm.instante', ordem, limite, formato, tamanho_lote)
+
+    def iterar_irrigacoes(self, id_setor: Optional[str] = None,
+                          inicio: Optional[str] = None, fim: Optional[str] = None,
+                          ordem: Optional[str] = None, limite: Optional[int] = None,
+                          formato: str = 'dict',
+                          tamanho_lote: int = TAMANHO_LOTE_PADRAO) -> Iterator[Any]:
+        """Itera sobre as irrigações, com os mesmos filtros de tempo de iterar_medicoes"""
+        filtros = [('i.id_setor = ?', id_setor),
+                   ('i.data_irrigacao >= ?', inicio), ('i.data_irrigacao < ?', fim)]
+        sql = '''
+            SELECT i.*, s.area_setor
+            FROM TABELA_IRRIGACOES i
+            LEFT JOIN TABELA_SETORES s ON i.id_setor = s.id_setor
+        '''
+        return self._iterar_consulta(sql, filtros, 'i.data_irrigacao', ordem, limite, formato, tamanho_lote)
+
+    def iterar_aplicacoes_nutrientes(self, id_setor: Optional[str] = None,
+                                     inicio: Optional[str] = None, fim: Optional[str] = None,
+                                     ordem: Optional[str] = None, limite: Optional[int] = None,
+                                     formato: str = 'dict',
+                                     tamanho_lote: int = TAMANHO_LOTE_PADRAO) -> Iterator[Any]:
+        """Itera sobre as aplicações de nutrientes, filtrando por setor e data_aplicacao"""
+        filtros = [('a.id_setor = ?', id_setor),
+                   ('a.data_aplicacao >= ?', inicio), ('a.data_aplicacao < ?', fim)]
+        sql = '''
+            SELECT a.*, s.area_setor
+            FROM TABELA_APLICACOES_NUTRIENTES a
+            LEFT JOIN TABELA_SETORES s ON a.id_setor = s.id_setor
+        '''
+        return self._iterar_consulta(sql, filtros, 'a.data_aplicacao', ordem, limite, formato, tamanho_lote)
+
+    def iterar_correcoes_ph(self, id_setor: Optional[str] = None,
+                            inicio: Optional[str] = None, fim: Optional[str] = None,
+                            ordem: Optional[str] = None, limite: Optional[int] = None,
+                            formato: str = 'dict',
+                            tamanho_lote: int = TAMANHO_LOTE_PADRAO) -> Iterator[Any]:
+        """Itera sobre as correções de pH, filtrando por setor e data_correcao"""
+        filtros = [('c.id_setor = ?', id_setor),
+                   ('c.data_correcao >= ?', inicio), ('c.data_correcao < ?', fim)]
+        sql = '''
+            SELECT c.*, s.area_setor
+            FROM TABELA_CORRECOES_PH c
+            LEFT JOIN TABELA_SETORES s ON c.id_setor = s.id_setor
+        '''
+        return self._iterar_consulta(sql, filtros, 'c.data_correcao', ordem, limite, formato, tamanho_lote)
+
+    def consultar_medicoes_colunas(self, **filtros) -> Dict[str, list]:
+        """
+        Retorna as medições filtradas como um dict de listas (uma por coluna),
+        pronto para pd.DataFrame, sem criar um dict por linha.
+        Aceita os mesmos argumentos de iterar_medicoes.
+        """
+        filtros['formato'] = 'colunas'
+        colunas: Dict[str, list] = {}
+        for bloco in self.iterar_medicoes(**filtros):
+            for nome, valores in bloco.items():
+                colunas.setdefault(nome, []).extend(valores)
+        return colunas
+
+    def alteracoes_do_setor(self, id_setor: str,
+                            marcas: Optional[Dict[str, int]] = None) -> Tuple[Dict[str, int], Optional[str]]:
+        """
+        Marcas d'água das medições (último id_registro, que com AUTOINCREMENT nunca é
+        reaproveitado) e das irrigações (última sequência de TABELA_ALTERACOES_IRRIGACOES)
+        e a data mais antiga entre as linhas do setor gravadas depois de `marcas`.
+
+        Usado por FeatureStore para reprocessar só as horas afetadas, inclusive por
+        dados atrasados. Nas irrigações, as alterações e remoções também contam (pela
+        data antiga e pela nova); nas medições, só as inserções.
+
+        Returns:
+            Tuple: (marcas atuais, "YYYY-MM-DD HH:MM:SS" ou None se nada mudou no setor)
+        """
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute('''
+                SELECT (SELECT COALESCE(MAX(id_registro), 0) FROM TABELA_MEDICOES_COMPACTA),
+                       (SELECT COALESCE(MAX(sequencia), 0) FROM TABELA_ALTERACOES_IRRIGACOES)
+            ''')
+            medicoes, irrigacoes = cursor.fetchone()
+            atuais = {'medicoes': medicoes, 'irrigacoes': irrigacoes}
+            if marcas is None:
+                return atuais, None
+            cursor.execute('''
+                SELECT MIN(data) FROM (
+                    SELECT datetime(MIN(m.instante), 'unixepoch') AS data
+                    FROM TABELA_MEDICOES_COMPACTA m
+                    JOIN TABELA_CHAVES_SENSORES k ON k.chave_sensor = m.chave_sensor
+                    JOIN TABELA_SENSORES s ON s.id_sensor = k.id_sensor
+                    WHERE m.id_registro > ? AND m.id_registro <= ? AND s.id_setor = ?
+                    UNION ALL
+                    SELECT MIN(data_irrigacao)
+                    FROM TABELA_ALTERACOES_IRRIGACOES
+                    WHERE sequencia > ? AND sequencia <= ? AND id_setor = ?
+                )
+            ''', (marcas.get('medicoes', 0), medicoes, id_setor,
+                  marcas.get('irrigacoes', 0), irrigacoes, id_setor))
+            return atuais, cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Erro ao consultar alterações do setor: {e}")
+            return {}, None
+        finally:
+            cursor.close()
+
+    def _iterar_consulta(self, sql: str, filtros: List[Tuple[str, Any]], coluna_data: str,
+                         ordem: Optional[str], limite: Optional[int], formato: str,
+                         tamanho_lote: int) -> Iterator[Any]:
+        """Monta o WHERE/ORDER BY/LIMIT a partir dos filtros informados e devolve o gerador"""
+        if formato not in FORMATOS_ITERACAO:
+            raise ValueError(f"Formato inválido: {formato}. Use um de {FORMATOS_ITERACAO}.")
+        condicoes = [condicao for condicao, valor in filtros if valor is not None]
+        parametros = [valor for _, valor in filtros if valor is not None]
+        if condicoes:
+            sql += " WHERE " + " AND ".join(condicoes)
+        if ordem:
+            if ordem.lower() not in ('asc', 'desc'):
+                raise ValueError(f"Ordem inválida: {ordem}. Use 'asc' ou 'desc'.")
+            sql += f" ORDER BY {coluna_data} {ordem.upper()}"
+        if limite is not None:
+            sql += " LIMIT ?"
+            parametros.append(int(limite))
+        return self._gerar_linhas(sql, parametros, formato, max(1, tamanho_lote))
+
+    def _gerar_linhas(self, sql: str, parametros: List[Any], formato: str,
+                      tamanho_lote: int) -> Iterator[Any]:
+        """Busca as linhas em blocos com fetchmany usando um cursor exclusivo do gerador"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(sql, parametros)
+            colunas = [desc[0] for desc in cursor.description]
+            while True:
+                linhas = cursor.fetchmany(tamanho_lote)
+                if not linhas:
+                    break
+                if formato == 'tupla':
+                    yield from linhas
+                elif formato == 'dict':
+                    for linha in linhas:
+                        yield dict(zip(colunas, linha))
+                else:
+                    yield dict(zip(colunas, (list(valores) for valores in zip(*linhas))))
+        except sqlite3.Error as e:
+            print(f"Erro ao iterar consulta: {e}")
+        finally:
+            cursor.close()
+
     # ========== MÉTODOS AUXILIARES ==========
     
     def obter_relatorio_setor(self, id_setor: str) -> Dict:
         """Obtém um relatório completo de um setor"""
         try:
+            cursor = self.connection.cursor()
             # Informações do setor
-            self.cursor.execute('''
+            cursor.execute('''
                 SELECT s.*, c.nome_cultura 
                 FROM TABELA_SETORES s 
                 LEFT JOIN TABELA_CULTURAS c ON s.id_cultura = c.id_cultura 
                 WHERE s.id_setor = ?
             ''', (id_setor,))
-            setor_info = self.cursor.fetchone()
+            setor_info = cursor.fetchone()
             
             if not setor_info:
                 return {}
             
             # Sensores do setor
-            self.cursor.execute('''
+            cursor.execute('''
                 SELECT * FROM TABELA_SENSORES WHERE id_setor = ?
             ''', (id_setor,))
-            sensores = self.cursor.fetchall()
+            sensores = cursor.fetchall()
             
-            # Últimas medições
-            self.cursor.execute('''
-                SELECT m.*, s.tipo_sensor 
-                FROM TABELA_MEDICOES m 
-                JOIN TABELA_SENSORES s ON m.id_sensor = s.id_sensor 
-                WHERE s.id_setor = ? 
-                ORDER BY m.data_medicao DESC 
+            # Últimas 10 medições do setor. Para cada sensor, o índice (chave_sensor, instante)
+            # dá o instante da sua 10ª medição mais recente e só as posteriores são lidas,
+            # sem percorrer o histórico do setor
+            cursor.execute('''
+                SELECT m.id_medicao, m.valor AS valor_medicao, datetime(m.instante, 'unixepoch') AS data_medicao,
+                       s.id_sensor, s.tipo_sensor
+                FROM TABELA_SENSORES s
+                JOIN TABELA_CHAVES_SENSORES k ON k.id_sensor = s.id_sensor
+                JOIN TABELA_MEDICOES_COMPACTA m ON m.chave_sensor = k.chave_sensor
+                 AND m.instante >= COALESCE((SELECT r.instante FROM TABELA_MEDICOES_COMPACTA r
+                                             WHERE r.chave_sensor = k.chave_sensor
+                                             ORDER BY r.instante DESC LIMIT 1 OFFSET 9), -9223372036854775808)
+                WHERE s.id_setor = ?
+                ORDER BY m.instante DESC
                 LIMIT 10
             ''', (id_setor,))
-            medicoes = self.cursor.fetchall()
+            medicoes = cursor.fetchall()
             
             # Irrigações recentes
-            self.cursor.execute('''
+            cursor.execute('''
                 SELECT * FROM TABELA_IRRIGACOES 
                 WHERE id_setor = ? 
                 ORDER BY data_irrigacao DESC 
                 LIMIT 5
             ''', (id_setor,))
-            irrigacoes = self.cursor.fetchall()
+            irrigacoes = cursor.fetchall()
             
             return {
                 'setor': setor_info,
@@ -669,10 +1139,11 @@ class AgriculturalDatabase:
         for tabela in tabelas:
             print(f"\n=== {tabela} ===")
             try:
-                self.cursor.execute(f"SELECT * FROM {tabela}")
-                registros = self.cursor.fetchall()
+                cursor = self.connection.cursor()
+                cursor.execute(f"SELECT * FROM {tabela}")
+                registros = cursor.fetchall()
                 if registros:
-                    colunas = [desc[0] for desc in self.cursor.description]
+                    colunas = [desc[0] for desc in cursor.description]
                     print(f"Colunas: {', '.join(colunas)}")
                     for registro in registros:
                         print(registro)
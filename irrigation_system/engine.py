@@ -0,0 +1,228 @@
+# engine.py
+
+# Só NumPy e a biblioteca padrão: este módulo roda previsões em gateways e chamadas
+# rápidas de linha de comando sem importar pandas, scikit-learn ou joblib.
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+# Arquivos da floresta compilada: um .npy por array e o cabeçalho
+ARRAYS_COMPILADOS = ('raiz', 'feature', 'limiar', 'ausente_a_esquerda', 'filhos', 'folhas', 'classes')
+ARQUIVO_CABECALHO = "cabecalho.json"
+FORMATO_COMPILADO = "floresta-compilada"
+# Valor de left_child nas folhas das árvores do scikit-learn
+FOLHA_SKLEARN = -1
+# Linhas avaliadas por vez: os arrays de (linha, árvore) de cada bloco cabem no cache
+LINHAS_POR_BLOCO = 4096
+
+
+def compilar(modelo) -> Dict[str, np.ndarray]:
+    """
+    Achata uma floresta de classificação treinada (ex.: RandomForestClassifier) em
+    arrays compactos.
+
+    Os nós internos de todas as árvores ficam lado a lado em feature, limiar,
+    ausente_a_esquerda e filhos (n_internos, 2: esquerdo e direito); as folhas só
+    guardam a probabilidade de cada classe, em folhas (n_folhas, n_classes). Uma
+    referência >= 0 aponta para um nó interno e uma negativa para a folha ~ref;
+    raiz tem a referência da raiz de cada árvore.
+    """
+    if getattr(modelo, 'n_outputs_', 1) != 1:
+        raise ValueError("Apenas florestas com uma saída podem ser compiladas.")
+    n_classes = len(modelo.classes_)
+    raizes, features, limiares, ausentes, filhos, folhas = [], [], [], [], [], []
+    internos = folhas_total = 0
+    for arvore in modelo.estimators_:
+        estado = arvore.tree_.__getstate__()
+        nos = estado['nodes']
+        interno = nos['left_child'] != FOLHA_SKLEARN
+        # Nova referência de cada nó da árvore: posição entre os internos, ou ~posição entre as folhas
+        ref = np.where(interno, internos + np.cumsum(interno) - 1, ~(folhas_total + np.cumsum(~interno) - 1))
+        raizes.append(ref[0])
+        features.append(nos['feature'][interno])
+        limiares.append(nos['threshold'][interno])
+        ausentes.append(nos['missing_go_to_left'][interno])
+        filhos.append(np.column_stack([ref[nos['left_child'][interno]], ref[nos['right_child'][interno]]]))
+        # O que o predict_proba da árvore devolve para a folha (sem renormalizar)
+        folhas.append(estado['values'][~interno, 0, :n_classes])
+        internos += int(interno.sum())
+        folhas_total += int((~interno).sum())
+    return {
+        'raiz': np.asarray(raizes, dtype=np.int32),
+        'feature': np.concatenate(features).astype(np.int32),
+        'limiar': np.concatenate(limiares).astype(np.float64),
+        'ausente_a_esquerda': np.concatenate(ausentes).astype(np.bool_),
+        'filhos': np.concatenate(filhos).astype(np.int32),
+        'folhas': np.ascontiguousarray(np.concatenate(folhas), dtype=np.float64),
+        'classes': np.asarray(modelo.classes_, dtype=np.float64),
+    }
+
+
+def salvar(compilado: Dict[str, np.ndarray], features: List[str], diretorio: str, **cabecalho):
+    """Grava a floresta compilada em `diretorio` (um .npy por array e o cabeçalho JSON)."""
+    os.makedirs(diretorio, exist_ok=True)
+    for nome in ARRAYS_COMPILADOS:
+        np.save(os.path.join(diretorio, f"{nome}.npy"), compilado[nome])
+    info = dict(cabecalho, formato=FORMATO_COMPILADO, features=list(features),
+                classes=compilado['classes'].tolist(), arvores=len(compilado['raiz']),
+                internos=len(compilado['feature']), folhas=len(compilado['folhas']))
+    # O cabeçalho vai por último: sem ele a pasta não é lida
+    with open(os.path.join(diretorio, ARQUIVO_CABECALHO + ".tmp"), 'w', encoding='utf-8') as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+    os.replace(os.path.join(diretorio, ARQUIVO_CABECALHO + ".tmp"), os.path.join(diretorio, ARQUIVO_CABECALHO))
+
+
+def carregar(diretorio: str, mapear: bool = True) -> "MotorFloresta":
+    """Abre uma floresta gravada por salvar(); com mapear=True os arrays ficam no arquivo (mmap)."""
+    with open(os.path.join(diretorio, ARQUIVO_CABECALHO), encoding='utf-8') as f:
+        info = json.load(f)
+    arrays = {nome: np.load(os.path.join(diretorio, f"{nome}.npy"), mmap_mode='r' if mapear else None)
+              for nome in ARRAYS_COMPILADOS}
+    return MotorFloresta(arrays, info['features'])
+
+
+class MotorFloresta:
+    """
+    Avalia em lote uma floresta compilada (ver compilar), só com NumPy.
+
+    Todas as árvores descem ao mesmo tempo para todas as linhas, um nível por passo,
+    com as regras do scikit-learn (entrada em float32 comparada ao limiar em float64,
+    valores ausentes seguindo o lado aprendido no treino). As probabilidades das folhas
+    são somadas árvore a árvore, na mesma ordem do RandomForestClassifier, então
+    predict_proba devolve exatamente os mesmos números.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], features: List[str]):
+        self.feature_names_in_ = np.asarray(features, dtype=object)
+        self.classes_ = np.asarray(arrays['classes'])
+        self.n_classes_ = len(self.classes_)
+        self.n_features_in_ = len(features)
+        # Arrays como vieram (para regravar a floresta sem recompilar)
+        self.compilado = {nome: arrays[nome] for nome in ARRAYS_COMPILADOS}
+        self._raiz = np.asarray(arrays['raiz'], dtype=np.intp)
+        self._feature = arrays['feature']
+        self._limiar = arrays['limiar']
+        self._ausente_a_esquerda = arrays['ausente_a_esquerda']
+        # (esquerdo, direito) de cada nó lado a lado: o filho escolhido sai de um único acesso
+        self._filhos = arrays['filhos'].reshape(-1)
+        self._folhas = arrays['folhas']
+
+    @property
+    def n_estimators(self) -> int:
+        return len(self._raiz)
+
+    def _matriz(self, X) -> np.ndarray:
+        if hasattr(X, 'columns'):
+            X = X[list(self.feature_names_in_)]
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X tem {X.shape[-1]} features, mas a floresta foi treinada com {self.n_features_in_}.")
+        return X
+
+    def folhas(self, X) -> np.ndarray:
+        """(linhas, árvores): índice em `folhas` a que cada linha chega em cada árvore."""
+        X = self._matriz(X)
+        if len(X) <= LINHAS_POR_BLOCO:
+            return self._folhas_do_bloco(X)
+        return np.concatenate([self._folhas_do_bloco(X[inicio:inicio + LINHAS_POR_BLOCO])
+                               for inicio in range(0, len(X), LINHAS_POR_BLOCO)])
+
+    def _folhas_do_bloco(self, X: np.ndarray) -> np.ndarray:
+        n, k = X.shape
+        valores = X.reshape(-1)
+        ref = np.tile(self._raiz, n)
+        # Início da linha de cada par (linha, árvore) em X achatado
+        base = np.repeat(np.arange(n, dtype=np.intp) * k, self.n_estimators)
+        ativos = np.flatnonzero(ref >= 0)
+        while ativos.size:
+            no = ref[ativos]
+            x = valores[base[ativos] + self._feature[no]]
+            # float32 <= float64 promove o valor, como a comparação em C do scikit-learn
+            direita = ~(x <= self._limiar[no])
+            ausente = np.isnan(x)
+            if ausente.any():
+                direita[ausente] = ~self._ausente_a_esquerda[no[ausente]]
+            proximo = self._filhos[2 * no + direita]
+            ref[ativos] = proximo
+            ativos = ativos[proximo >= 0]
+        return (~ref).reshape(n, self.n_estimators)
+
+    def predict_proba(self, X) -> np.ndarray:
+        folhas = self.folhas(X)
+        proba = np.zeros((len(folhas), self.n_classes_))
+        # Uma árvore por vez, como o scikit-learn acumula (a ordem da soma muda o último bit)
+        for arvore in range(self.n_estimators):
+            proba += self._folhas[folhas[:, arvore]]
+        proba /= self.n_estimators
+        return proba
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+    def matriz_de(self, registros: Iterable[Dict[str, Any]], horarios: Iterable[datetime]) -> np.ndarray:
+        """
+        Monta a entrada de predict_proba a partir de dicts de medições (ex.:
+        {'Umidade': 55.0}) e do horário de cada previsão, como predict_batch faz.
+        Features ausentes viram NaN.
+        """
+        linhas = []
+        for registro, horario in zip(registros, horarios):
+            tempo = {'hora_do_dia': horario.hour, 'dia_da_semana': horario.weekday()}
+            linhas.append([tempo[nome] if nome in tempo else registro.get(nome, np.nan)
+                           for nome in self.feature_names_in_])
+        return np.asarray(linhas, dtype=np.float64).reshape(-1, self.n_features_in_)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta e avalia florestas compiladas (só NumPy na previsão).")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    exportar = comandos.add_parser("exportar", help="Compila um modelo salvo (pickle ou formato mapeável)")
+    exportar.add_argument("modelo", help="Artefato do modelo (ex.: data/modelos/setor_01/v0003.joblib)")
+    exportar.add_argument("pasta", help="Pasta de saída")
+    prever = comandos.add_parser("prever", help="Probabilidade de irrigar na próxima hora")
+    prever.add_argument("pasta", help="Pasta gravada por 'exportar'")
+    prever.add_argument("medicoes", nargs="*", help="Medições no formato Nome=valor (ex.: Umidade=42.5)")
+    prever.add_argument("--horario", help="Horário da previsão, AAAA-MM-DD HH:MM (padrão: a próxima hora)")
+    args = parser.parse_args()
+
+    if args.comando == "exportar":
+        # Só a exportação lê o artefato original (e importa joblib)
+        from .artifacts import carregar_modelo
+        try:
+            modelo, features = carregar_modelo(args.modelo, mapear=False)
+        except (OSError, EOFError, KeyError, ValueError) as e:
+            print(f"Erro ao carregar o modelo de '{args.modelo}': {e}")
+            sys.exit(1)
+        # Artefatos no formato mapeável já vêm compilados
+        compilado = getattr(modelo, 'compilado', None)
+        if compilado is None and not hasattr(modelo, 'estimators_'):
+            print(f"O modelo de '{args.modelo}' não é uma floresta e não pode ser compilado.")
+            sys.exit(1)
+        compilado = compilado or compilar(modelo)
+        salvar(compilado, features, args.pasta, origem=os.path.abspath(args.modelo))
+        print(f"Floresta compilada em '{args.pasta}': {len(compilado['raiz'])} árvores, "
+              f"{len(compilado['feature'])} nós internos, {len(compilado['folhas'])} folhas.")
+        return
+
+    try:
+        motor = carregar(args.pasta)
+    except OSError as e:
+        print(f"Erro ao abrir a floresta compilada em '{args.pasta}': {e}")
+        sys.exit(1)
+    try:
+        medicoes = {nome: float(valor) for nome, valor in (item.split('=', 1) for item in args.medicoes)}
+        horario = datetime.strptime(args.horario, "%Y-%m-%d %H:%M") if args.horario else datetime.now() + timedelta(hours=1)
+    except ValueError as e:
+        print(f"Entrada inválida: {e}")
+        sys.exit(2)
+    probabilidade = motor.predict_proba(motor.matriz_de([medicoes], [horario]))[0, 1]
+    print(f"Probabilidade de irrigar às {horario:%Y-%m-%d %H:%M}: {probabilidade * 100:.2f}%")
+
+
+if __name__ == "__main__":
+    main()
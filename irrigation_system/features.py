@@ -0,0 +1,162 @@
+# features.py
+
+import json
+import os
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+# Diretório padrão dos quadros de treino por setor
+DIRETORIO_PADRAO = "data/features"
+# Cada setor tem o quadro (.pkl) e seus metadados (.json) em arquivos próprios, então
+# processos que treinam setores diferentes nunca regravam o mesmo arquivo
+EXTENSAO_METADADOS = ".json"
+# Quadros gravados com outra versão do formato são montados de novo (a versão 2 mudou a
+# marca das irrigações do rowid para a sequência de TABELA_ALTERACOES_IRRIGACOES)
+VERSAO_FORMATO = 2
+
+# construir(id_setor, inicio) -> quadro horário sem preenchimento (IrrigationIntelligence._frame_horario)
+Construtor = Callable[..., pd.DataFrame]
+
+
+class FeatureStore:
+    """
+    Cache persistente dos quadros horários de treino de cada setor (um pickle por
+    setor e um JSON com as marcas d'água das medições e irrigações já incluídas).
+
+    A cada obter(), o banco informa (alteracoes_do_setor) a data mais antiga entre as
+    linhas do setor inseridas desde a última montagem. Só as horas a partir dela são
+    recalculadas e substituem as do quadro salvo, o que cobre tanto as horas novas
+    quanto os dados atrasados. O quadro guardado ainda não tem as lacunas preenchidas
+    (ffill/bfill), que é uma operação barata refeita a cada treino. As horas já
+    consolidadas continuam no quadro mesmo depois que a retenção remove os agregados
+    antigos. Irrigações alteradas ou removidas também recalculam as horas afetadas;
+    alterações e remoções de medições não são detectadas, nesse caso use invalidar().
+    """
+
+    def __init__(self, db_manager, diretorio: str = DIRETORIO_PADRAO):
+        """
+        Args:
+            db_manager: Uma instância da classe AgriculturalDatabase (ou outro backend com
+                        alteracoes_do_setor, ex.: MemoryDatabase ou ShardedDatabase).
+            diretorio (str): Pasta onde os quadros e os metadados são gravados.
+        """
+        self.db = db_manager
+        self.diretorio = diretorio
+        os.makedirs(self.diretorio, exist_ok=True)
+
+    # ---------- Quadros por setor ----------
+
+    def _caminho(self, id_setor: str, extensao: str = ".pkl") -> str:
+        # Mantém o ID legível, mas sem caracteres que não podem ir em nomes de arquivo
+        seguro = ''.join(c if c.isalnum() or c in '-_' else f"%{ord(c):02x}" for c in str(id_setor))
+        return os.path.join(self.diretorio, f"{seguro or '%00'}{extensao}")
+
+    def metadados(self, id_setor: str) -> Optional[Dict]:
+        """Metadados do quadro do setor (fonte, marcas d'água, horas, última hora) ou None."""
+        caminho = self._caminho(id_setor, EXTENSAO_METADADOS)
+        if not os.path.exists(caminho):
+            return None
+        with open(caminho, encoding='utf-8') as f:
+            return json.load(f)
+
+    def setores(self) -> List[str]:
+        """IDs dos setores com quadro em cache."""
+        setores = []
+        for nome in sorted(os.listdir(self.diretorio)):
+            if nome.endswith(EXTENSAO_METADADOS):
+                with open(os.path.join(self.diretorio, nome), encoding='utf-8') as f:
+                    setores.append(json.load(f)['id_setor'])
+        return setores
+
+    def _ler_quadro(self, id_setor: str, fonte: str) -> Tuple[Optional[pd.DataFrame], Optional[Dict]]:
+        """
+        Quadro salvo do setor e seus metadados, ou (None, None) se não existir ou tiver
+        sido montado com outra fonte/versão.
+        """
+        info = self.metadados(id_setor)
+        if not info or info['fonte'] != fonte or info['versao'] != VERSAO_FORMATO:
+            return None, None
+        try:
+            quadro = pd.read_pickle(self._caminho(id_setor))
+        except (OSError, EOFError, ValueError) as e:
+            print(f"Quadro de features do setor '{id_setor}' ilegível ({e}); montando de novo.")
+            return None, None
+        # Um quadro vazio não tem horas para servir de base à atualização incremental
+        return (quadro, info) if not quadro.empty else (None, None)
+
+    def _salvar_quadro(self, id_setor: str, quadro: pd.DataFrame, fonte: str, marcas: Dict[str, int]):
+        # O quadro é gravado antes dos metadados: se a gravação for interrompida, as
+        # marcas antigas fazem a próxima atualização recalcular as mesmas horas
+        info = {
+            'id_setor': id_setor, 'versao': VERSAO_FORMATO, 'fonte': fonte, 'marcas': marcas,
+            'horas': len(quadro), 'ultima_hora': str(quadro.index[-1]) if len(quadro) else None,
+            'atualizado_em': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        caminho = self._caminho(id_setor)
+        quadro.to_pickle(caminho + ".tmp")
+        os.replace(caminho + ".tmp", caminho)
+        caminho = self._caminho(id_setor, EXTENSAO_METADADOS)
+        with open(caminho + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(info, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(caminho + ".tmp", caminho)
+
+    @staticmethod
+    def _juntar(anterior: pd.DataFrame, recalculado: pd.DataFrame) -> pd.DataFrame:
+        """Concatena as horas mantidas e as recalculadas, com as colunas na ordem do pivot."""
+        partes = [parte for parte in (anterior, recalculado) if not parte.empty]
+        if not partes:
+            return anterior
+        quadro = pd.concat(partes)
+        medidas = sorted(coluna for coluna in quadro.columns if coluna != 'irrigou')
+        quadro = quadro[medidas + (['irrigou'] if 'irrigou' in quadro else [])]
+        quadro.index.name = 'data_medicao'
+        return quadro
+
+    # ---------- Atualização ----------
+
+    def obter(self, id_setor: str, fonte: str, construir: Construtor) -> pd.DataFrame:
+        """
+        Retorna o quadro horário do setor, recalculando só as horas alteradas desde a
+        última chamada.
+
+        Args:
+            id_setor (str): Setor do quadro.
+            fonte (str): Origem das medições ('agregados', 'brutas' ou 'arquivo'); quadros
+                         montados com outra fonte são descartados.
+            construir: Monta o quadro horário do setor a partir de `inicio` (ou de todo o
+                       histórico se None), ex.: IrrigationIntelligence._frame_horario.
+        """
+        quadro, info = self._ler_quadro(id_setor, fonte)
+        anteriores = info['marcas'] if info else None
+        # As marcas são lidas antes dos dados: o que for inserido durante a montagem
+        # fica acima delas e é recalculado na próxima vez
+        marcas, alterado_em = self.db.alteracoes_do_setor(id_setor, anteriores)
+
+        if quadro is not None and marcas:
+            if alterado_em is None:
+                print(f"[DEBUG] Features do setor '{id_setor}' em dia ({len(quadro)} horas em cache).")
+                return quadro
+            inicio = pd.Timestamp(alterado_em).floor('H')
+            mantidas = quadro[quadro.index < inicio]
+            print(f"[DEBUG] Recalculando features do setor '{id_setor}' a partir de {inicio} "
+                  f"({len(mantidas)} horas mantidas do cache).")
+            quadro = self._juntar(mantidas, construir(id_setor, inicio.strftime("%Y-%m-%d %H:%M:%S")))
+        else:
+            quadro = construir(id_setor)
+
+        # Sem marcas (erro ao consultá-las) o quadro não pode ser atualizado depois: não grava
+        if marcas:
+            self._salvar_quadro(id_setor, quadro, fonte, marcas)
+        return quadro
+
+    def invalidar(self, id_setor: Optional[str] = None):
+        """Descarta o quadro do setor (ou de todos); ele é montado de novo no próximo obter()."""
+        for setor in ([id_setor] if id_setor is not None else self.setores()):
+            # Os metadados saem primeiro: sem eles o quadro já não é usado
+            for caminho in (self._caminho(setor, EXTENSAO_METADADOS), self._caminho(setor)):
+                if os.path.exists(caminho):
+                    os.remove(caminho)
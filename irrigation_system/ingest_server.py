@@ -0,0 +1,312 @@
+# ingest_server.py
+
+import argparse
+import asyncio
+import json
+import math
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from .database import AgriculturalDatabase, normalizar_data
+
+# Padrões do serviço (podem ser alterados na linha de comando)
+HOST_PADRAO = "127.0.0.1"
+PORTA_TCP_PADRAO = 9500
+PORTA_UDP_PADRAO = 9501
+TAMANHO_FILA_PADRAO = 100_000     # leituras aguardando gravação (limite de memória)
+TAMANHO_LOTE_PADRAO = 5000        # leituras por transação
+INTERVALO_FLUSH_PADRAO = 0.5      # segundos máximos que uma leitura espera na fila
+INTERVALO_ESTATISTICAS_PADRAO = 10.0
+INTERVALO_RECARGA_CADASTRO = 60.0  # segundos entre recargas dos sensores/setores válidos
+TAMANHO_MAXIMO_LINHA = 64 * 1024
+
+
+class TelemetryIngestServer:
+    """
+    Serviço asyncio que recebe leituras dos controladores de campo e as grava no banco.
+
+    Protocolo: cada mensagem é um objeto JSON por linha (TCP) ou por datagrama/linha (UDP).
+      Medição:   {"id_sensor": "02", "valor": 55.3, "data": "2025-06-19 20:10:43", "id_medicao": "..."}
+      Irrigação: {"tipo": "irrigacao", "id_setor": "01", "volume": 500.0, "data": "..."}
+    "data" e os IDs das mensagens são opcionais (padrão: agora e um UUID). Datas com fuso
+    horário (ex.: "2025-08-01T00:00:00+03:00" ou "...Z") são convertidas para o horário
+    local do servidor, a convenção das datas gravadas no banco.
+
+    As mensagens válidas entram em uma fila limitada. No TCP a fila cheia suspende
+    a leitura do socket (o controle de fluxo do TCP segura o dispositivo); no UDP a
+    leitura é descartada e contabilizada. Uma única tarefa escritora esvazia a fila
+    em lotes grandes, gravados por uma thread dedicada com inserir_*_em_lote.
+    """
+
+    def __init__(self, db_name: str = "data/agricultural_system.db", host: str = HOST_PADRAO,
+                 porta_tcp: Optional[int] = PORTA_TCP_PADRAO, porta_udp: Optional[int] = PORTA_UDP_PADRAO,
+                 tamanho_fila: int = TAMANHO_FILA_PADRAO, tamanho_lote: int = TAMANHO_LOTE_PADRAO,
+                 intervalo_flush: float = INTERVALO_FLUSH_PADRAO,
+                 intervalo_estatisticas: float = INTERVALO_ESTATISTICAS_PADRAO):
+        self.db_name = db_name
+        self.host = host
+        self.porta_tcp = porta_tcp
+        self.porta_udp = porta_udp
+        self.tamanho_lote = tamanho_lote
+        self.intervalo_flush = intervalo_flush
+        self.intervalo_estatisticas = intervalo_estatisticas
+        self.fila: asyncio.Queue = asyncio.Queue(maxsize=tamanho_fila)
+
+        # Todo acesso ao SQLite acontece nesta thread (um único escritor)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-writer")
+        self._db: Optional[AgriculturalDatabase] = None
+        self._sensores: set = set()
+        self._setores: set = set()
+        self._cadastro_carregado_em = 0.0
+
+        self._servidores = []
+        self._tarefas: List[asyncio.Task] = []
+        self._contadores = {
+            'recebidas': 0, 'aceitas': 0, 'rejeitadas': 0, 'descartadas': 0,
+            'gravadas': 0, 'duplicadas': 0, 'erros_gravacao': 0, 'lotes': 0, 'conexoes_ativas': 0,
+        }
+        self._inicio = time.monotonic()
+        self._ultimo_relatorio = (self._inicio, 0)
+
+    # ---------- Ciclo de vida ----------
+
+    async def iniciar(self):
+        """Abre o banco, carrega o cadastro e começa a escutar nas portas configuradas."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._abrir_banco)
+        if self.porta_tcp is not None:
+            servidor = await asyncio.start_server(self._atender_tcp, self.host, self.porta_tcp,
+                                                  limit=TAMANHO_MAXIMO_LINHA, backlog=4096)
+            self.porta_tcp = servidor.sockets[0].getsockname()[1]
+            self._servidores.append(servidor)
+        if self.porta_udp is not None:
+            transporte, _ = await loop.create_datagram_endpoint(
+                lambda: _ProtocoloUDP(self), local_addr=(self.host, self.porta_udp))
+            self.porta_udp = transporte.get_extra_info('sockname')[1]
+            self._servidores.append(transporte)
+        self._tarefas.append(asyncio.create_task(self._escritor()))
+        if self.intervalo_estatisticas:
+            self._tarefas.append(asyncio.create_task(self._relatar_periodicamente()))
+        print(f"Servidor de ingestão em {self.host} (TCP {self.porta_tcp}, UDP {self.porta_udp})")
+
+    async def parar(self):
+        """Para de aceitar leituras, grava o que restou na fila e fecha o banco."""
+        for servidor in self._servidores:
+            servidor.close()
+        self._servidores = []
+        # Sinaliza fim para o escritor, que esvazia a fila antes de sair
+        await self.fila.put(None)
+        for tarefa in self._tarefas:
+            if tarefa.get_name() != 'escritor':
+                tarefa.cancel()
+        await asyncio.gather(*self._tarefas, return_exceptions=True)
+        self._tarefas = []
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._fechar_banco)
+        self._executor.shutdown(wait=True)
+        print(self.formatar_estatisticas())
+
+    async def executar(self):
+        """Inicia o serviço e o mantém ativo até ser cancelado (Ctrl+C)."""
+        await self.iniciar()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.parar()
+
+    # ---------- Banco (thread do escritor) ----------
+
+    def _abrir_banco(self):
+        self._db = AgriculturalDatabase(db_name=self.db_name)
+        self._carregar_cadastro()
+
+    def _fechar_banco(self):
+        if self._db is not None:
+            self._db.disconnect()
+            self._db = None
+
+    def _carregar_cadastro(self):
+        self._sensores = {s['id_sensor'] for s in self._db.consultar_sensores()}
+        self._setores = {s['id_setor'] for s in self._db.consultar_setores()}
+        self._cadastro_carregado_em = time.monotonic()
+
+    def _gravar(self, lote: List[Tuple[str, tuple]]) -> Tuple[int, int, int]:
+        """Grava um lote misto de medições e irrigações, uma transação por tabela."""
+        if time.monotonic() - self._cadastro_carregado_em > INTERVALO_RECARGA_CADASTRO:
+            self._carregar_cadastro()
+        medicoes = [linha for tipo, linha in lote if tipo == 'medicao' and linha[3] in self._sensores]
+        irrigacoes = [linha for tipo, linha in lote if tipo == 'irrigacao' and linha[3] in self._setores]
+        desconhecidas = len(lote) - len(medicoes) - len(irrigacoes)
+        gravadas, duplicadas, erros = 0, 0, desconhecidas
+        for linhas, inserir in ((medicoes, self._db.inserir_medicoes_em_lote),
+                                (irrigacoes, self._db.inserir_irrigacoes_em_lote)):
+            if linhas:
+                resultado = inserir(linhas, tamanho_lote=self.tamanho_lote, exibir_resumo=False)
+                gravadas += resultado['inseridos']
+                duplicadas += resultado['duplicados']
+                erros += len(resultado['erros'])
+        return gravadas, duplicadas, erros
+
+    # ---------- Recepção ----------
+
+    def _validar(self, mensagem: Dict) -> Optional[Tuple[str, tuple]]:
+        """Converte uma mensagem JSON na linha do INSERT; None se for inválida."""
+        try:
+            data = mensagem.get('data')
+            data = normalizar_data(data) if data else datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            if mensagem.get('tipo', 'medicao') == 'irrigacao':
+                volume = float(mensagem['volume'])
+                if not math.isfinite(volume) or volume < 0:
+                    return None
+                id_irrigacao = str(mensagem.get('id_irrigacao') or uuid.uuid4().hex)
+                return 'irrigacao', (id_irrigacao, volume, data, str(mensagem['id_setor']))
+            valor = float(mensagem['valor'])
+            if not math.isfinite(valor):
+                return None
+            id_medicao = str(mensagem.get('id_medicao') or uuid.uuid4().hex)
+            return 'medicao', (id_medicao, valor, data, str(mensagem['id_sensor']))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return None
+
+    def _decodificar(self, linha: bytes) -> Optional[Tuple[str, tuple]]:
+        self._contadores['recebidas'] += 1
+        try:
+            item = self._validar(json.loads(linha))
+        except (ValueError, UnicodeDecodeError):
+            item = None
+        if item is None:
+            self._contadores['rejeitadas'] += 1
+        return item
+
+    async def _atender_tcp(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._contadores['conexoes_ativas'] += 1
+        try:
+            while True:
+                try:
+                    linha = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    self._contadores['rejeitadas'] += 1
+                    break
+                if not linha:
+                    break
+                if not linha.strip():
+                    continue
+                item = self._decodificar(linha)
+                if item is not None:
+                    # Espera por espaço na fila: aplica backpressure ao dispositivo
+                    await self.fila.put(item)
+                    self._contadores['aceitas'] += 1
+        except ConnectionError:
+            pass
+        finally:
+            self._contadores['conexoes_ativas'] -= 1
+            writer.close()
+
+    def _receber_datagrama(self, dados: bytes):
+        for linha in dados.splitlines():
+            if not linha.strip():
+                continue
+            item = self._decodificar(linha)
+            if item is None:
+                continue
+            try:
+                self.fila.put_nowait(item)
+                self._contadores['aceitas'] += 1
+            except asyncio.QueueFull:
+                self._contadores['descartadas'] += 1
+
+    # ---------- Escritor ----------
+
+    async def _escritor(self):
+        asyncio.current_task().set_name('escritor')
+        loop = asyncio.get_running_loop()
+        encerrar = False
+        while not encerrar:
+            item = await self.fila.get()
+            if item is None:
+                break
+            lote = [item]
+            prazo = loop.time() + self.intervalo_flush
+            # Junta o máximo possível até o tamanho do lote ou o prazo de flush
+            while len(lote) < self.tamanho_lote:
+                try:
+                    item = self.fila.get_nowait()
+                except asyncio.QueueEmpty:
+                    restante = prazo - loop.time()
+                    if restante <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self.fila.get(), restante)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    encerrar = True
+                    break
+                lote.append(item)
+            gravadas, duplicadas, erros = await loop.run_in_executor(self._executor, self._gravar, lote)
+            self._contadores['gravadas'] += gravadas
+            self._contadores['duplicadas'] += duplicadas
+            self._contadores['erros_gravacao'] += erros
+            self._contadores['lotes'] += 1
+
+    # ---------- Estatísticas ----------
+
+    def estatisticas(self) -> Dict:
+        """Contadores acumulados, profundidade da fila e vazão média de gravação."""
+        decorrido = max(time.monotonic() - self._inicio, 1e-9)
+        return dict(self._contadores,
+                    profundidade_fila=self.fila.qsize(),
+                    capacidade_fila=self.fila.maxsize,
+                    gravadas_por_segundo=self._contadores['gravadas'] / decorrido)
+
+    def formatar_estatisticas(self) -> str:
+        e = self.estatisticas()
+        return (f"[ingestão] recebidas={e['recebidas']} aceitas={e['aceitas']} rejeitadas={e['rejeitadas']} "
+                f"descartadas={e['descartadas']} gravadas={e['gravadas']} duplicadas={e['duplicadas']} "
+                f"erros={e['erros_gravacao']} "
+                f"fila={e['profundidade_fila']}/{e['capacidade_fila']} conexões={e['conexoes_ativas']} "
+                f"média={e['gravadas_por_segundo']:.0f}/s")
+
+    async def _relatar_periodicamente(self):
+        while True:
+            await asyncio.sleep(self.intervalo_estatisticas)
+            agora, gravadas = time.monotonic(), self._contadores['gravadas']
+            instante_anterior, gravadas_anterior = self._ultimo_relatorio
+            vazao = (gravadas - gravadas_anterior) / max(agora - instante_anterior, 1e-9)
+            self._ultimo_relatorio = (agora, gravadas)
+            print(f"{self.formatar_estatisticas()} atual={vazao:.0f}/s")
+
+
+class _ProtocoloUDP(asyncio.DatagramProtocol):
+    def __init__(self, servidor: TelemetryIngestServer):
+        self.servidor = servidor
+
+    def datagram_received(self, data, addr):
+        self.servidor._receber_datagrama(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de ingestão de telemetria dos controladores.")
+    parser.add_argument("--db", default="data/agricultural_system.db", help="Arquivo SQLite de destino")
+    parser.add_argument("--host", default=HOST_PADRAO)
+    parser.add_argument("--porta-tcp", type=int, default=PORTA_TCP_PADRAO)
+    parser.add_argument("--porta-udp", type=int, default=PORTA_UDP_PADRAO)
+    parser.add_argument("--fila", type=int, default=TAMANHO_FILA_PADRAO, help="Capacidade da fila")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE_PADRAO, help="Leituras por transação")
+    parser.add_argument("--flush", type=float, default=INTERVALO_FLUSH_PADRAO, help="Espera máxima (s) antes de gravar")
+    args = parser.parse_args()
+
+    servidor = TelemetryIngestServer(db_name=args.db, host=args.host, porta_tcp=args.porta_tcp,
+                                     porta_udp=args.porta_udp, tamanho_fila=args.fila,
+                                     tamanho_lote=args.lote, intervalo_flush=args.flush)
+    try:
+        asyncio.run(servidor.executar())
+    except KeyboardInterrupt:
+        print("Servidor de ingestão encerrado.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+# instrumentation.py
+
+import argparse
+import atexit
+import bisect
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from .pool import CursorComRetry
+
+# Comandos que levam mais que isso (em segundos) vão para o log de consultas lentas
+LIMITE_LENTA_PADRAO = 0.1
+ARQUIVO_LENTAS_PADRAO = "data/consultas_lentas.log"
+ARQUIVO_ESTATISTICAS_PADRAO = "data/estatisticas_consultas.json"
+# Variável de ambiente que liga a instrumentação sem alterar o código (ex.: no dashboard)
+VARIAVEL_AMBIENTE = "IRRIGACAO_INSTRUMENTAR"
+# Limite de consulta lenta em milissegundos, sobrepondo LIMITE_LENTA_PADRAO
+VARIAVEL_LIMITE_MS = "IRRIGACAO_LIMITE_LENTA_MS"
+
+# Limites superiores (ms) das faixas do histograma de latência; a última faixa é "acima de 5 s"
+FAIXAS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+@lru_cache(maxsize=1024)
+def normalizar_sql(sql: str) -> str:
+    """Chave do comando: espaços colapsados (os parâmetros já vêm separados)."""
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def instrumentacao_no_ambiente() -> bool:
+    """Indica se IRRIGACAO_INSTRUMENTAR está ligada (1, true, sim)."""
+    return os.environ.get(VARIAVEL_AMBIENTE, "").lower() in ("1", "true", "sim", "s")
+
+
+class QueryInstrumentation:
+    """
+    Coleta tempos e linhas de cada comando SQL executado pelas conexões instrumentadas.
+
+    Por comando (SQL normalizado) guarda número de execuções, histograma e tempo
+    total/máximo de execução, tempo gasto lendo resultados e linhas retornadas.
+    Execuções acima de `limite_lenta` são gravadas no log de consultas lentas com
+    o resultado de EXPLAIN QUERY PLAN. Quando a instrumentação está desligada as
+    conexões usam as classes padrão e nada disso é executado.
+    """
+
+    def __init__(self, limite_lenta: Optional[float] = None,
+                 arquivo_lentas: Optional[str] = ARQUIVO_LENTAS_PADRAO,
+                 arquivo_estatisticas: Optional[str] = ARQUIVO_ESTATISTICAS_PADRAO):
+        """
+        Args:
+            limite_lenta (float): Segundos a partir dos quais um comando é considerado lento
+                                  (padrão: IRRIGACAO_LIMITE_LENTA_MS ou LIMITE_LENTA_PADRAO).
+            arquivo_lentas (str): Log de consultas lentas (None = não grava).
+            arquivo_estatisticas (str): Arquivo JSON onde salvar() acumula os contadores
+                                        para o relatório de linha de comando (None = não grava).
+        """
+        if limite_lenta is None:
+            limite_ms = os.environ.get(VARIAVEL_LIMITE_MS)
+            limite_lenta = float(limite_ms) / 1000 if limite_ms else LIMITE_LENTA_PADRAO
+        self.limite_lenta = limite_lenta
+        self.arquivo_lentas = arquivo_lentas
+        self.arquivo_estatisticas = arquivo_estatisticas
+        self._lock = threading.Lock()
+        self._comandos: Dict[str, Dict] = {}
+        self._salvos: Dict[str, Dict] = {}
+
+    # ---------- Coleta ----------
+
+    def _entrada(self, chave: str) -> Dict:
+        entrada = self._comandos.get(chave)
+        if entrada is None:
+            entrada = self._comandos[chave] = {
+                'execucoes': 0, 'tempo_total': 0.0, 'tempo_maximo': 0.0, 'tempo_leitura': 0.0,
+                'linhas': 0, 'lentas': 0, 'histograma': [0] * (len(FAIXAS_MS) + 1),
+            }
+        return entrada
+
+    def registrar(self, conexao: sqlite3.Connection, sql: str, parametros, tempo_execucao: float,
+                  tempo_leitura: float, linhas: int):
+        """Contabiliza uma execução completa (execute + leitura de todas as linhas)."""
+        chave = normalizar_sql(sql)
+        duracao = tempo_execucao + tempo_leitura
+        lenta = duracao >= self.limite_lenta
+        with self._lock:
+            entrada = self._entrada(chave)
+            entrada['execucoes'] += 1
+            entrada['tempo_total'] += duracao
+            entrada['tempo_leitura'] += tempo_leitura
+            entrada['tempo_maximo'] = max(entrada['tempo_maximo'], duracao)
+            entrada['linhas'] += linhas
+            entrada['histograma'][bisect.bisect_left(FAIXAS_MS, duracao * 1000)] += 1
+            if lenta:
+                entrada['lentas'] += 1
+        if lenta and self.arquivo_lentas:
+            self._registrar_lenta(conexao, chave, sql, parametros, duracao, linhas)
+
+    def _registrar_lenta(self, conexao: sqlite3.Connection, chave: str, sql: str, parametros,
+                         duracao: float, linhas_retornadas: int):
+        plano = []
+        if chave.split(' ', 1)[0].upper() in ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE'):
+            try:
+                # Cursor comum: o EXPLAIN não entra nas estatísticas
+                explicacao = conexao.cursor(sqlite3.Cursor)
+                explicacao.execute("EXPLAIN QUERY PLAN " + sql, parametros or ())
+                # Linhas (id, pai, não usado, detalhe): indenta pela profundidade na árvore
+                niveis = {0: -1}
+                for id_passo, pai, _, detalhe in explicacao.fetchall():
+                    niveis[id_passo] = niveis.get(pai, -1) + 1
+                    plano.append('  ' * niveis[id_passo] + detalhe)
+            except sqlite3.Error as e:
+                plano = [f"(plano indisponível: {e})"]
+        linhas = [f"{datetime.now():%Y-%m-%d %H:%M:%S} | {duracao * 1000:.1f} ms | "
+                  f"{linhas_retornadas} linhas | {chave}",
+                  f"    parâmetros: {str(parametros)[:200]}"]
+        linhas += [f"    plano: {passo}" for passo in plano]
+        try:
+            with self._lock, open(self.arquivo_lentas, 'a', encoding='utf-8') as f:
+                f.write("\n".join(linhas) + "\n")
+        except OSError as e:
+            print(f"Erro ao gravar log de consultas lentas: {e}")
+
+    # ---------- Consulta ----------
+
+    def estatisticas(self) -> List[Dict]:
+        """Um dict por comando, ordenado pelo tempo total (execução + leitura)."""
+        with self._lock:
+            comandos = {chave: dict(entrada, histograma=list(entrada['histograma']))
+                        for chave, entrada in self._comandos.items()}
+        return _resumir(comandos)
+
+    def zerar(self):
+        """Descarta os contadores coletados até agora."""
+        with self._lock:
+            self._comandos = {}
+            self._salvos = {}
+
+    def relatorio(self, limite: int = 20) -> str:
+        return formatar_relatorio(self.estatisticas(), limite)
+
+    def salvar(self):
+        """
+        Soma ao arquivo de estatísticas o que foi coletado desde o último salvar(),
+        permitindo acumular dados de vários processos (dashboard, menu, servidores).
+        """
+        if not self.arquivo_estatisticas:
+            return
+        with self._lock:
+            delta = {}
+            for chave, entrada in self._comandos.items():
+                anterior = self._salvos.get(chave)
+                if anterior is None:
+                    delta[chave] = dict(entrada, histograma=list(entrada['histograma']))
+                elif entrada['execucoes'] != anterior['execucoes'] or entrada['linhas'] != anterior['linhas']:
+                    delta[chave] = _combinar(entrada, anterior, sinal=-1)
+                    delta[chave]['tempo_maximo'] = entrada['tempo_maximo']
+            self._salvos = {chave: dict(entrada, histograma=list(entrada['histograma']))
+                            for chave, entrada in self._comandos.items()}
+        if not delta:
+            return
+        acumulado = carregar_estatisticas(self.arquivo_estatisticas)
+        for chave, entrada in delta.items():
+            acumulado[chave] = _combinar(acumulado[chave], entrada) if chave in acumulado else entrada
+        try:
+            diretorio = os.path.dirname(self.arquivo_estatisticas)
+            if diretorio:
+                os.makedirs(diretorio, exist_ok=True)
+            temporario = self.arquivo_estatisticas + ".tmp"
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump(acumulado, f, ensure_ascii=False)
+            os.replace(temporario, self.arquivo_estatisticas)
+        except OSError as e:
+            print(f"Erro ao salvar estatísticas de consultas: {e}")
+
+    def registrar_ao_sair(self):
+        """Salva as estatísticas no encerramento do processo."""
+        atexit.register(self.salvar)
+
+
+def _combinar(a: Dict, b: Dict, sinal: int = 1) -> Dict:
+    resultado = {campo: a[campo] + sinal * b[campo]
+                 for campo in ('execucoes', 'tempo_total', 'tempo_leitura', 'linhas', 'lentas')}
+    resultado['tempo_maximo'] = max(a['tempo_maximo'], b['tempo_maximo'])
+    resultado['histograma'] = [x + sinal * y for x, y in zip(a['histograma'], b['histograma'])]
+    return resultado
+
+
+def _percentil(histograma: List[int], fracao: float) -> float:
+    """Estimativa do percentil (ms) pelo limite superior da faixa do histograma."""
+    total = sum(histograma)
+    if not total:
+        return 0.0
+    alvo, acumulado = fracao * total, 0
+    for indice, quantidade in enumerate(histograma):
+        acumulado += quantidade
+        if acumulado >= alvo:
+            return FAIXAS_MS[indice] if indice < len(FAIXAS_MS) else float('inf')
+    return float('inf')
+
+
+def _resumir(comandos: Dict[str, Dict]) -> List[Dict]:
+    resumo = []
+    for chave, entrada in comandos.items():
+        execucoes = entrada['execucoes']
+        resumo.append(dict(
+            entrada, sql=chave,
+            tempo_medio=entrada['tempo_total'] / execucoes if execucoes else 0.0,
+            p50_ms=_percentil(entrada['histograma'], 0.50),
+            p95_ms=_percentil(entrada['histograma'], 0.95),
+            p99_ms=_percentil(entrada['histograma'], 0.99),
+        ))
+    resumo.sort(key=lambda e: e['tempo_total'], reverse=True)
+    return resumo
+
+
+def carregar_estatisticas(caminho: str = ARQUIVO_ESTATISTICAS_PADRAO) -> Dict[str, Dict]:
+    """Lê o arquivo de estatísticas acumuladas (dict vazio se não existir)."""
+    if not os.path.exists(caminho):
+        return {}
+    try:
+        with open(caminho, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Erro ao ler estatísticas de consultas: {e}")
+        return {}
+
+
+def formatar_relatorio(estatisticas: List[Dict], limite: int = 20) -> str:
+    if not estatisticas:
+        return "Nenhuma consulta registrada."
+    linhas = [f"{'execuções':>9} {'total ms':>10} {'médio ms':>9} {'p95 ms':>7} {'máx ms':>9} "
+              f"{'leitura ms':>10} {'linhas':>9} {'lentas':>6}  comando"]
+    for e in estatisticas[:limite]:
+        linhas.append(f"{e['execucoes']:>9} {e['tempo_total'] * 1000:>10.1f} {e['tempo_medio'] * 1000:>9.2f} "
+                      f"{e['p95_ms']:>7} {e['tempo_maximo'] * 1000:>9.1f} {e['tempo_leitura'] * 1000:>10.1f} "
+                      f"{e['linhas']:>9} {e['lentas']:>6}  {e['sql'][:100]}")
+    return "\n".join(linhas)
+
+
+# ---------- Cursores e conexões instrumentados ----------
+
+class _CursorInstrumentadoMixin:
+    """
+    Mede cada comando do cursor do execute até a leitura da última linha.
+
+    A execução é contabilizada quando o resultado se esgota, quando o cursor
+    executa outro comando, é fechado ou coletado; comandos sem resultado
+    (INSERT, UPDATE, DDL) são contabilizados logo após o execute.
+    """
+
+    # [sql, parâmetros, tempo de execução, tempo de leitura, linhas]
+    _pendente = None
+
+    def execute(self, sql, parameters=()):
+        self._finalizar()
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._iniciar(sql, parameters, time.perf_counter() - inicio)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finalizar()
+        # Para o EXPLAIN do log de lentas basta a primeira linha de parâmetros
+        primeira = seq_of_parameters[0] if isinstance(seq_of_parameters, (list, tuple)) and seq_of_parameters else None
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._iniciar(sql, primeira, time.perf_counter() - inicio)
+
+    def _iniciar(self, sql, parametros, duracao: float):
+        self._pendente = [sql, parametros, duracao, 0.0, 0]
+        if self.description is None:
+            self._finalizar()
+
+    def _finalizar(self):
+        pendente, self._pendente = self._pendente, None
+        if pendente is not None:
+            self.connection.instrumentacao.registrar(self.connection, *pendente)
+
+    def _acumular(self, inicio: float, linhas: int):
+        pendente = self._pendente
+        if pendente is not None:
+            pendente[3] += time.perf_counter() - inicio
+            pendente[4] += linhas
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        linha = super().fetchone()
+        if linha is None:
+            self._finalizar()
+        else:
+            self._acumular(inicio, 1)
+        return linha
+
+    def fetchmany(self, size=None):
+        tamanho = self.arraysize if size is None else size
+        inicio = time.perf_counter()
+        linhas = super().fetchmany(tamanho)
+        self._acumular(inicio, len(linhas))
+        if len(linhas) < tamanho:
+            self._finalizar()
+        return linhas
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        linhas = super().fetchall()
+        self._acumular(inicio, len(linhas))
+        self._finalizar()
+        return linhas
+
+    def __next__(self):
+        inicio = time.perf_counter()
+        try:
+            linha = super().__next__()
+        except StopIteration:
+            self._finalizar()
+            raise
+        self._acumular(inicio, 1)
+        return linha
+
+    def close(self):
+        self._finalizar()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finalizar()
+        except Exception:
+            # Conexão já fechada ou interpretador encerrando: a execução é descartada
+            pass
+
+
+class CursorInstrumentado(_CursorInstrumentadoMixin, sqlite3.Cursor):
+    pass
+
+
+class CursorComRetryInstrumentado(_CursorInstrumentadoMixin, CursorComRetry):
+    pass
+
+
+class ConexaoInstrumentada(sqlite3.Connection):
+    """Conexão cujos cursores (inclusive os de connection.execute) são instrumentados."""
+
+    instrumentacao: QueryInstrumentation = None
+    fabrica_cursor = CursorInstrumentado
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or self.fabrica_cursor)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class ConexaoComRetryInstrumentada(ConexaoInstrumentada):
+    fabrica_cursor = CursorComRetryInstrumentado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Relatório de desempenho das consultas SQL.")
+    parser.add_argument("--arquivo", default=ARQUIVO_ESTATISTICAS_PADRAO, help="Estatísticas acumuladas (JSON)")
+    parser.add_argument("--lentas", default=ARQUIVO_LENTAS_PADRAO, help="Log de consultas lentas")
+    parser.add_argument("--top", type=int, default=20, help="Número de comandos exibidos")
+    parser.add_argument("--ultimas-lentas", type=int, default=5, help="Entradas finais do log de lentas exibidas")
+    parser.add_argument("--zerar", action="store_true", help="Apaga as estatísticas acumuladas e o log")
+    args = parser.parse_args()
+
+    if args.zerar:
+        for caminho in (args.arquivo, args.lentas):
+            if os.path.exists(caminho):
+                os.remove(caminho)
+        print("Estatísticas de consultas apagadas.")
+        return
+
+    print(formatar_relatorio(_resumir(carregar_estatisticas(args.arquivo)), args.top))
+    if args.ultimas_lentas and os.path.exists(args.lentas):
+        with open(args.lentas, encoding='utf-8') as f:
+            entradas = re.split(r"\n(?=\d{4}-\d\d-\d\d )", f.read().strip())
+        print(f"\nÚltimas consultas lentas ({len(entradas)} no total):")
+        for entrada in entradas[-args.ultimas_lentas:]:
+            print(entrada)
+
+
+if __name__ == "__main__":
+    main()
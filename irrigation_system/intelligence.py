@@ -1,115 +1,269 @@
 # intelligence.py
 
 # Standard Library Imports
+import argparse
+import contextlib
+import copy
+import io
+import multiprocessing
 import os
+import sys
+import time
 import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
 
 # Third-Party Library Imports
-import joblib
 import numpy as np
 import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score, classification_report
 from sklearn.model_selection import train_test_split
+from threadpoolctl import threadpool_limits
+
+from .archive import ColumnarArchive
+from .artifacts import carregar_modelo, salvar_modelo
+from .database import AgriculturalDatabase
+from .features import DIRETORIO_PADRAO as DIRETORIO_FEATURES, FeatureStore
+from .registry import ModelRegistry, chave_cultura, chave_setor
+from .sharding import ShardedDatabase
+
+try:
+    import resource  # limite de memória dos processos de treino (apenas Unix)
+except ImportError:
+    resource = None
 
 # Suprimir avisos futuros do pandas para uma saída mais limpa
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
+# Colunas do DataFrame de medições usado no pivot
+COLUNAS_MEDICOES = ['data_medicao', 'tipo_sensor', 'valor_medicao']
+# Linhas por bloco lidas dos iteradores do banco
+LINHAS_POR_BLOCO = 50_000
+# Pasta (ao lado de model_path) do registro de modelos por setor/cultura
+DIRETORIO_MODELOS = "modelos"
+# Fração da memória total repartida entre os processos de train_all
+FRACAO_MEMORIA_TREINO = 0.8
+# Hiperparâmetros da floresta dos setores sem configuração ajustada (ver tuning.py)
+PARAMETROS_PADRAO = {'n_estimators': 100, 'class_weight': 'balanced'}
+
 class IrrigationIntelligence:
     """
     Classe para gerenciar a inteligência preditiva do sistema de irrigação.
     """
-    def __init__(self, db_manager, model_path="irrigation_model.joblib"):
+    def __init__(self, db_manager, model_path="irrigation_model.joblib", usar_agregados=True,
+                 arquivo=None, feature_store=None, registro=None):
         """
         Inicializa a classe de inteligência.
 
         Args:
-            db_manager: Uma instância da classe AgriculturalDatabase.
-            model_path (str): Caminho para salvar/carregar o modelo treinado.
+            db_manager: Uma instância da classe AgriculturalDatabase (ou outro backend com a
+                        mesma interface de consulta, ex.: MemoryDatabase ou ShardedDatabase).
+            model_path (str): Caminho do modelo geral, usado pelos setores sem modelo próprio
+                              (ou da cultura) no registro.
+            usar_agregados (bool): Se True, lê as médias horárias de TABELA_MEDICOES_HORA
+                                   em vez de reprocessar todas as medições brutas.
+            arquivo (ColumnarArchive): Se informado, as médias horárias são calculadas
+                                       diretamente sobre as séries em memmap do arquivo.
+            feature_store (FeatureStore): Se informado, guarda o quadro horário de cada setor
+                                          e o atualiza de forma incremental a cada treino.
+            registro (ModelRegistry): Onde ficam os modelos de cada setor (padrão: a pasta
+                                      DIRETORIO_MODELOS ao lado de model_path).
         """
         self.db = db_manager
         self.model_path = model_path
-        self.model = self.load_model()
+        self.usar_agregados = usar_agregados
+        self.arquivo = arquivo
+        self.feature_store = feature_store
+        self.registro = registro if registro is not None else ModelRegistry(
+            os.path.join(os.path.dirname(model_path), DIRETORIO_MODELOS))
+        # Modelo geral (model_path): só é lido na primeira previsão que precisar dele
+        self.model = None
         self.feature_names = None # Para garantir consistência nas colunas
+        self._modelo_geral_lido = False
+        # id_setor -> id_cultura, para achar o modelo da cultura de um setor sem modelo próprio
+        self._culturas: Dict[str, Optional[str]] = {}
 
-    def _get_data_as_dataframe(self, id_setor: str) -> pd.DataFrame:
+    def _consultar_medicoes(self, id_setor: str, inicio=None, fim=None) -> pd.DataFrame:
         """
-        Busca e prepara os dados de um setor específico em um DataFrame do pandas.
+        Retorna as medições do setor no formato (data_medicao, tipo_sensor, valor_medicao),
+        lidas do arquivo colunar, dos agregados horários ou das medições brutas.
         """
-        print(f"\n[DEBUG] Iniciando busca de dados para o setor '{id_setor}'...")
+        if self.arquivo is not None:
+            return self._medicoes_do_arquivo(id_setor, inicio, fim)
 
-        # 1. Consultar medições do setor especificado
-        query_medicoes = f"""
-            SELECT
-                m.data_medicao,
-                -- Padroniza o tipo de sensor para minúsculas para consistência
-                LOWER(s.tipo_sensor) AS tipo_sensor,
-                m.valor_medicao
-            FROM TABELA_MEDICOES m
-            JOIN TABELA_SENSORES s ON m.id_sensor = s.id_sensor
-            WHERE s.id_setor = ?
+        inicio, fim = self._formatar_data(inicio), self._formatar_data(fim)
+        if self.usar_agregados:
+            # Garante que os agregados incluam as medições mais recentes (incremental)
+            self.db.rollups.atualizar()
+            horario = pd.DataFrame(self.db.rollups.consultar_horario(id_setor=id_setor, inicio=inicio, fim=fim))
+            if horario.empty:
+                return pd.DataFrame(columns=COLUNAS_MEDICOES)
+            # Já agregado por hora: a média ponderada pela quantidade combina todos os sensores do mesmo tipo
+            horario['tipo_sensor'] = horario['tipo_sensor'].str.lower()
+            horario['soma'] = horario['valor_medio'] * horario['quantidade']
+            df = horario.groupby(['hora', 'tipo_sensor'], as_index=False)[['soma', 'quantidade']].sum()
+            return pd.DataFrame({
+                'data_medicao': df['hora'],
+                'tipo_sensor': df['tipo_sensor'],
+                'valor_medicao': df['soma'] / df['quantidade'],
+            })
+
+        # Medições brutas em blocos colunares: o instante já vem em segundos desde a
+        # época e é convertido em bloco, sem parse de texto linha a linha
+        brutas = self._ler_colunas(self.db.iterar_medicoes(id_setor=id_setor, inicio=inicio, fim=fim,
+                                                           formato='colunas', tamanho_lote=LINHAS_POR_BLOCO))
+        if brutas.empty:
+            return pd.DataFrame(columns=COLUNAS_MEDICOES)
+        return pd.DataFrame({
+            'data_medicao': pd.to_datetime(brutas['instante'], unit='s'),
+            # Padroniza o tipo de sensor para minúsculas para consistência
+            'tipo_sensor': brutas['tipo_sensor'].str.lower(),
+            'valor_medicao': brutas['valor_medicao'],
+        })
+
+    @staticmethod
+    def _ler_colunas(blocos) -> pd.DataFrame:
+        """Junta os blocos {coluna: lista} de um iterador formato='colunas' em um DataFrame."""
+        partes = [pd.DataFrame(bloco) for bloco in blocos]
+        return pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+
+    @staticmethod
+    def _formatar_data(instante):
+        """Normaliza datetime/str para o formato de texto usado no banco."""
+        if instante is None or isinstance(instante, str):
+            return instante
+        return instante.strftime("%Y-%m-%d %H:%M:%S")
+
+    def _medicoes_do_arquivo(self, id_setor: str, inicio=None, fim=None) -> pd.DataFrame:
+        """
+        Calcula as médias horárias por tipo de sensor a partir das séries em memmap
+        do arquivo colunar, recortadas por intervalo sem copiar os dados brutos.
+        """
+        # Traz para o arquivo as medições gravadas desde a última sincronização
+        self.arquivo.sincronizar()
+        sensores = [(sensor['id_sensor'], (sensor['tipo_sensor'] or '').lower())
+                    for sensor in self.db.consultar_sensores() if sensor['id_setor'] == id_setor]
+        partes = []
+        for id_sensor, tipo_sensor in sensores:
+            horas, somas, quantidades = self.arquivo.medias_horarias(id_sensor, inicio, fim)
+            if len(horas):
+                partes.append(pd.DataFrame({'hora': horas, 'tipo_sensor': tipo_sensor,
+                                            'soma': somas, 'quantidade': quantidades}))
+        if not partes:
+            return pd.DataFrame(columns=COLUNAS_MEDICOES)
+
+        # Vários sensores do mesmo tipo no setor são combinados pela soma/quantidade
+        df = pd.concat(partes).groupby(['hora', 'tipo_sensor'], as_index=False)[['soma', 'quantidade']].sum()
+        return pd.DataFrame({
+            'data_medicao': pd.to_datetime(df['hora'], unit='s'),
+            'tipo_sensor': df['tipo_sensor'],
+            'valor_medicao': df['soma'] / df['quantidade'],
+        })
+
+    def _fonte(self) -> str:
+        """Origem das medições usada nos quadros de treino (identifica o cache do FeatureStore)."""
+        if self.arquivo is not None:
+            return 'arquivo'
+        return 'agregados' if self.usar_agregados else 'brutas'
+
+    def _get_data_as_dataframe(self, id_setor: str, inicio=None, fim=None) -> pd.DataFrame:
         """
+        Busca e prepara os dados de um setor específico em um DataFrame do pandas.
+        Com um FeatureStore (e sem intervalo), o quadro horário vem do cache e só as
+        horas alteradas desde a última montagem são recalculadas.
+
+        Args:
+            inicio, fim: Intervalo opcional [inicio, fim) de datas a considerar.
+        """
+        print(f"\n[DEBUG] Iniciando busca de dados para o setor '{id_setor}'...")
         try:
-            # Usar parâmetros na query é mais seguro
-            df_medicoes = pd.read_sql_query(query_medicoes, self.db.connection, params=(id_setor,))
-            print(f"[DEBUG] Encontradas {len(df_medicoes)} medições no banco de dados.")
-            if df_medicoes.empty:
-                return pd.DataFrame()
+            if self.feature_store is not None and inicio is None and fim is None:
+                horario = self.feature_store.obter(id_setor, self._fonte(), self._frame_horario)
+            else:
+                horario = self._frame_horario(id_setor, inicio, fim)
+        except MemoryError:
+            # Não é falta de dados: quem chamou decide (train_all registra como erro)
+            raise
         except Exception as e:
             print(f"[ERRO DEBUG] Falha ao consultar medições: {e}")
             return pd.DataFrame()
+        return self._preencher(horario)
 
-        # 2. Consultar irrigações do setor
-        query_irrigacoes = f"""
-            SELECT data_irrigacao, 1 AS irrigou
-            FROM TABELA_IRRIGACOES
-            WHERE id_setor = ?
+    def _frame_horario(self, id_setor: str, inicio=None, fim=None) -> pd.DataFrame:
+        """
+        Médias horárias por tipo de sensor (colunas capitalizadas, NaN nas horas sem
+        leitura) e número de irrigações por hora ('irrigou'), indexadas pela hora.
+        Inclui as horas que só têm irrigações e ainda não tem as lacunas preenchidas
+        (ver _preencher), então quadros de intervalos consecutivos podem ser concatenados.
         """
-        df_irrigacoes = pd.read_sql_query(query_irrigacoes, self.db.connection, params=(id_setor,))
-        print(f"[DEBUG] Encontradas {len(df_irrigacoes)} irrigações no banco de dados.")
+        # 1. Consultar medições do setor especificado
+        df_medicoes = self._consultar_medicoes(id_setor, inicio, fim)
+        print(f"[DEBUG] Encontradas {len(df_medicoes)} medições no banco de dados.")
 
-        # 3. Processar medições
-        df_medicoes['data_medicao'] = pd.to_datetime(df_medicoes['data_medicao'])
-        
-        # Pivotar a tabela de medições para ter sensores como colunas
-        print("[DEBUG] Pivotando dados de medição (linhas -> colunas)...")
-        df_pivot = df_medicoes.pivot_table(
-            index='data_medicao',
-            columns='tipo_sensor',
-            values='valor_medicao'
-        )
-        print(f"[DEBUG] DataFrame após pivotar tem {df_pivot.shape[0]} linhas e {df_pivot.shape[1]} colunas.")
-        print(f"[DEBUG] Colunas criadas: {list(df_pivot.columns)}")
-        
-        if df_pivot.empty:
+        # 2. Consultar irrigações do setor
+        irrigacoes = self._ler_colunas(self.db.iterar_irrigacoes(
+            id_setor=id_setor, inicio=self._formatar_data(inicio), fim=self._formatar_data(fim),
+            formato='colunas', tamanho_lote=LINHAS_POR_BLOCO))
+        print(f"[DEBUG] Encontradas {len(irrigacoes)} irrigações no banco de dados.")
+
+        partes = []
+        # 3. Pivotar a tabela de medições para ter sensores como colunas
+        if not df_medicoes.empty:
+            df_medicoes['data_medicao'] = pd.to_datetime(df_medicoes['data_medicao'])
+            print("[DEBUG] Pivotando dados de medição (linhas -> colunas)...")
+            df_pivot = df_medicoes.pivot_table(
+                index='data_medicao',
+                columns='tipo_sensor',
+                values='valor_medicao'
+            )
+            print(f"[DEBUG] DataFrame após pivotar tem {df_pivot.shape[0]} linhas e {df_pivot.shape[1]} colunas.")
+            print(f"[DEBUG] Colunas criadas: {list(df_pivot.columns)}")
+            if not df_pivot.empty:
+                # Renomeia colunas para serem mais amigáveis (capitalizadas)
+                df_pivot.columns = [col.strip().capitalize() for col in df_pivot.columns]
+                partes.append(df_pivot.resample('H').mean())
+
+        # 4. Irrigações por hora
+        if not irrigacoes.empty:
+            df_irrigacoes = pd.DataFrame({'irrigou': 1}, index=pd.to_datetime(irrigacoes['data_irrigacao']))
+            partes.append(df_irrigacoes.resample('H').sum())
+
+        if not partes:
+            return pd.DataFrame()
+        horario = pd.concat(partes, axis=1)
+        horario.index.name = 'data_medicao'
+        return horario
+
+    @staticmethod
+    def _preencher(horario: pd.DataFrame) -> pd.DataFrame:
+        """
+        Recorta o quadro horário entre a primeira e a última hora com medições,
+        preenche as lacunas (ffill/bfill) e junta as irrigações de cada hora.
+        """
+        medidas = horario.drop(columns='irrigou', errors='ignore')
+        horas_com_dados = medidas.dropna(how='all').index
+        if not len(horas_com_dados):
             print("[ERRO DEBUG] Pivot falhou ou resultou em DataFrame vazio. Verifique os tipos de sensor no banco.")
             return pd.DataFrame()
 
-        # 4. Reamostragem horária
+        # Reamostragem horária: recria as horas sem leitura dentro do período
         print("[DEBUG] Reamostrando dados para frequência horária...")
-        # Renomeia colunas para serem mais amigáveis (capitalizadas)
-        df_pivot.columns = [col.strip().capitalize() for col in df_pivot.columns]
-        df_resampled = df_pivot.resample('H').mean()
+        df_final = medidas.loc[horas_com_dados[0]:horas_com_dados[-1]].asfreq('H')
         # Preenche valores ausentes para garantir continuidade
-        df_resampled = df_resampled.ffill().bfill()
-        print(f"[DEBUG] DataFrame após reamostragem tem {df_resampled.shape[0]} linhas.")
-
+        df_final = df_final.ffill().bfill()
+        print(f"[DEBUG] DataFrame após reamostragem tem {df_final.shape[0]} linhas.")
 
-        # 5. Processar e juntar dados de irrigação
-        if not df_irrigacoes.empty:
-            df_irrigacoes['data_irrigacao'] = pd.to_datetime(df_irrigacoes['data_irrigacao'])
-            df_irrigacoes.set_index('data_irrigacao', inplace=True)
-            df_irrigacoes_resampled = df_irrigacoes.resample('H').sum().fillna(0)
-            
-            # Juntar dados de medição e irrigação
-            df_final = df_resampled.join(df_irrigacoes_resampled, how='left')
-            df_final['irrigou'] = df_final['irrigou'].fillna(0).astype(int)
+        # Juntar dados de medição e irrigação
+        if 'irrigou' in horario:
+            df_final['irrigou'] = horario['irrigou'].reindex(df_final.index).fillna(0).astype(int)
         else:
-            df_final = df_resampled
             df_final['irrigou'] = 0
 
         print(f"[DEBUG] DataFrame final pronto para feature engineering tem {len(df_final)} linhas.")
+        df_final.index.name = 'data_medicao'
         return df_final.reset_index().rename(columns={'index': 'data_medicao'})
 
     def prepare_features_and_target(self, id_setor: str):
@@ -121,7 +275,16 @@ class IrrigationIntelligence:
         if df.empty or len(df) < 2:
             print(f"Dados insuficientes para o setor {id_setor}.")
             return None, None
+        return self._montar_exemplos(df)
 
+    @staticmethod
+    def _montar_exemplos(df: pd.DataFrame):
+        """
+        X (medições, hora_do_dia e dia_da_semana) e y (irrigou na hora seguinte) de um
+        quadro de _get_data_as_dataframe, indexados pela hora. A última hora sai, pois
+        não tem alvo.
+        """
+        df = df.copy()
         # Criar features baseadas no tempo
         df['hora_do_dia'] = df['data_medicao'].dt.hour
         df['dia_da_semana'] = df['data_medicao'].dt.dayofweek # Segunda=0, Domingo=6
@@ -131,30 +294,46 @@ class IrrigationIntelligence:
         
         # Remover a última linha, pois não temos o alvo para ela
         df.dropna(inplace=True)
+        # X e y indexados pelo horário (a janela de treino vai para o registro do modelo)
+        df.set_index('data_medicao', inplace=True)
 
         # Definir features e target
-        features = [col for col in df.columns if col not in ['data_medicao', 'irrigou', 'target']]
-        self.feature_names = features # Salva os nomes das features
+        features = [col for col in df.columns if col not in ['irrigou', 'target']]
         
         X = df[features]
         y = df['target']
         
         return X, y
 
-    def train_model(self, id_setor: str, test_size=0.2):
+    def train_model(self, id_setor: str, test_size=0.2, n_jobs=None) -> Dict:
         """
-        Treina o modelo de classificação para um setor específico.
+        Treina o modelo de classificação para um setor específico e o registra como nova
+        versão do modelo do setor (self.registro), com as features, a janela de treino e
+        as métricas.
+
+        Args:
+            n_jobs (int): Threads usadas pelo RandomForest (None = 1).
+
+        Returns:
+            Dict: id_setor, status ('treinado' ou 'ignorado'), motivo, acuracia,
+                  amostras, segundos e versao (no registro).
         """
+        inicio = time.perf_counter()
+        resultado = {'id_setor': id_setor, 'status': 'ignorado', 'motivo': None,
+                     'acuracia': None, 'amostras': 0, 'segundos': 0.0, 'versao': None}
         print(f"\n--- Treinando modelo para o Setor: {id_setor} ---")
         X, y = self.prepare_features_and_target(id_setor)
         
         if X is None or y is None or X.empty:
             print("Treinamento cancelado por falta de dados.")
-            return
+            resultado.update(motivo="dados insuficientes", segundos=time.perf_counter() - inicio)
+            return resultado
 
+        resultado['amostras'] = len(X)
         if len(y.unique()) < 2:
             print("Treinamento cancelado: são necessários dados de quando irrigou e quando não irrigou.")
-            return
+            resultado.update(motivo="sem as duas classes (irrigou/não irrigou)", segundos=time.perf_counter() - inicio)
+            return resultado
 
         # Dividir os dados em treino e teste
         X_train, X_test, y_train, y_test = train_test_split(
@@ -162,14 +341,19 @@ class IrrigationIntelligence:
         )
         
         print(f"Tamanho do conjunto de dados: {len(X)} amostras")
-        print(f"Features utilizadas: {self.feature_names}")
+        print(f"Features utilizadas: {list(X.columns)}")
 
-        # Inicializar e treinar o modelo
-        self.model = RandomForestClassifier(n_estimators=100, random_state=42, class_weight='balanced')
-        self.model.fit(X_train, y_train)
+        # Inicializar e treinar o modelo (com os hiperparâmetros escolhidos em tuning.py, se houver)
+        parametros = dict(PARAMETROS_PADRAO)
+        configuracao = self.registro.configuracao(chave_setor(id_setor))
+        if configuracao:
+            parametros.update(configuracao['parametros'])
+            print(f"Hiperparâmetros ajustados do setor: {parametros}")
+        modelo = RandomForestClassifier(random_state=42, n_jobs=n_jobs, **parametros)
+        modelo.fit(X_train, y_train)
 
         # Avaliar o modelo
-        y_pred = self.model.predict(X_test)
+        y_pred = modelo.predict(X_test)
         accuracy = accuracy_score(y_test, y_pred)
         
         print("\n--- Avaliação do Modelo ---")
@@ -177,8 +361,114 @@ class IrrigationIntelligence:
         print("Relatório de Classificação:")
         print(classification_report(y_test, y_pred))
         
-        # Salvar o modelo treinado
-        self.save_model()
+        # Registrar o modelo treinado como nova versão do setor
+        versao = self.registro.registrar(chave_setor(id_setor), modelo, list(X.columns),
+                                         janela=(X.index.min(), X.index.max()),
+                                         metricas={'acuracia': float(accuracy), 'amostras': len(X),
+                                                   'test_size': test_size, 'parametros': parametros})
+        print(f"Modelo do setor '{id_setor}' registrado como versão {versao} em '{self.registro.diretorio}'")
+        resultado.update(status='treinado', acuracia=accuracy, versao=versao, segundos=time.perf_counter() - inicio)
+        return resultado
+
+    # ========== TREINAMENTO DE TODOS OS SETORES ==========
+
+    def setores_com_dados(self) -> List[str]:
+        """
+        Setores com alguma medição e alguma irrigação registradas (consulta só as tabelas
+        de últimos valores). Quem tiver poucas horas é ignorado depois, no treino.
+        """
+        return [setor['id_setor'] for setor in self.db.consultar_setores()
+                if self.db.ultimos.por_setor(setor['id_setor'])
+                and self.db.ultimos.ultima_irrigacao(setor['id_setor'])]
+
+    def train_all(self, setores: Optional[List[str]] = None, processos: Optional[int] = None,
+                  limite_memoria_mb: Optional[int] = None, test_size=0.2) -> List[Dict]:
+        """
+        Treina um modelo por setor em paralelo, em um pool de processos.
+
+        Cada processo abre sua própria conexão com o banco, tem a memória limitada
+        (RLIMIT_AS, em sistemas Unix) e usa n_jobs = núcleos / processos threads, para
+        que os processos juntos não ocupem mais núcleos do que existem. O modelo de cada
+        setor é gravado no registro (self.registro). Uma falha em um setor, inclusive falta de
+        memória ou a queda do processo, fica registrada no resumo sem interromper os demais.
+
+        Args:
+            setores (List[str]): Setores a treinar (padrão: setores_com_dados()).
+            processos (int): Processos do pool (padrão: um por núcleo, até o número de setores).
+            limite_memoria_mb (int): Memória máxima de cada processo (padrão:
+                                     FRACAO_MEMORIA_TREINO da memória total dividida
+                                     entre os processos; 0 = sem limite).
+
+        Returns:
+            List[Dict]: Resultado de cada setor (ver train_model), na ordem de `setores`.
+        """
+        setores = self.setores_com_dados() if setores is None else list(setores)
+        if not setores:
+            print("Nenhum setor com medições e irrigações para treinar.")
+            return []
+        nucleos = os.cpu_count() or 1
+        processos = max(1, min(processos or nucleos, len(setores)))
+        n_jobs = max(1, nucleos // processos)
+        if limite_memoria_mb is None:
+            total = _memoria_total_mb()
+            limite_memoria_mb = int(total * FRACAO_MEMORIA_TREINO / processos) if total else 0
+
+        # Agregados e arquivo em dia antes de abrir os processos, que apenas os leem
+        if self.arquivo is not None:
+            self.arquivo.sincronizar()
+        elif self.usar_agregados:
+            self.db.rollups.atualizar()
+
+        resultados: Dict[str, Dict] = {}
+        inicio = time.perf_counter()
+
+        def registrar(resultado: Dict):
+            resultados[resultado['id_setor']] = resultado
+            print(f"[{len(resultados)}/{len(setores)}] {_descrever_resultado(resultado)}")
+
+        banco = _descrever_banco(self.db)
+        if banco is None:
+            # Banco em memória: não pode ser aberto por outro processo
+            print(f"Treinando {len(setores)} setores em sequência (banco em memória)...")
+            for id_setor in setores:
+                registrar(self._treinar_setor(id_setor, test_size, n_jobs=nucleos))
+        else:
+            print(f"Treinando {len(setores)} setores em {processos} processos "
+                  f"(n_jobs={n_jobs}, memória por processo: "
+                  f"{f'{limite_memoria_mb} MB' if limite_memoria_mb else 'sem limite'})...")
+            config = {
+                'banco': banco, 'model_path': self.model_path, 'usar_agregados': self.usar_agregados,
+                'arquivo': self.arquivo.diretorio if self.arquivo is not None else None,
+                'features': self.feature_store.diretorio if self.feature_store is not None else None,
+                'registro': self.registro.diretorio,
+                'n_jobs': n_jobs, 'limite_memoria_mb': limite_memoria_mb,
+            }
+            interrompidos = _treinar_em_pool(setores, config, processos, test_size, registrar)
+            # Setores que estavam em um processo que caiu: cada um é repetido isolado,
+            # para que só o culpado fique com erro
+            for id_setor in interrompidos:
+                if _treinar_em_pool([id_setor], config, 1, test_size, registrar):
+                    registrar(dict(_resultado_vazio(id_setor), status='erro',
+                                   motivo="processo de treino encerrado inesperadamente"))
+
+        ordenados = [resultados[id_setor] for id_setor in setores]
+        _imprimir_resumo(ordenados, time.perf_counter() - inicio)
+        return ordenados
+
+    def _treinar_setor(self, id_setor: str, test_size, n_jobs) -> Dict:
+        """
+        Treina o setor em uma cópia desta instância (mesmo banco, caches e registro);
+        exceções viram status 'erro'.
+        """
+        treino = copy.copy(self)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                return treino.train_model(id_setor, test_size, n_jobs=n_jobs)
+        except Exception as e:
+            return dict(_resultado_vazio(id_setor), status='erro', motivo=f"{type(e).__name__}: {e}")
+        finally:
+            # Treinando muitos setores, os modelos não ficam todos na memória: voltam do disco na previsão
+            self.registro.descarregar(chave_setor(id_setor))
     
     def predict_action(self, id_setor: str, current_data: dict, prediction_time: datetime):
         """
@@ -188,58 +478,265 @@ class IrrigationIntelligence:
             id_setor (str): O setor para o qual a previsão é feita.
             current_data (dict): Um dicionário com as medições atuais.
                                  Ex: {'Umidade': 55.0, 'Ph': 6.8, 'Fosforo': 30.0}
+                                 Se None, usa as últimas leituras do setor (db.ultimos).
             prediction_time (datetime): O horário para o qual a previsão está sendo feita.
 
         Returns:
             Tuple[str, float]: Uma tupla com a ação sugerida e a probabilidade.
         """
-        if not self.model:
+        if self.modelo_do_setor(id_setor)[0] is None:
             return "Modelo não treinado. Por favor, treine o modelo primeiro.", 0.0
 
-        # Criar features de tempo
-        current_data['hora_do_dia'] = prediction_time.hour
-        current_data['dia_da_semana'] = prediction_time.weekday()
-        
-        # Criar um DataFrame com os dados atuais na ordem correta das features
+        if current_data is None:
+            current_data = self.db.ultimos.vetor_atual(id_setor)
+
+        # Uma linha do caminho em lote (o dict de quem chamou não é alterado)
         try:
-            input_df = pd.DataFrame([current_data], columns=self.feature_names)
+            irrigar, probabilidades = self.predict_batch(pd.DataFrame([current_data]), [id_setor], [prediction_time])
         except Exception as e:
             return f"Erro ao criar DataFrame de entrada: {e}. Verifique as features.", 0.0
 
-        # Fazer a predição
-        prediction = self.model.predict(input_df)[0]
-        probability = self.model.predict_proba(input_df)[0][1] # Probabilidade da classe "1" (irrigar)
-        
-        if prediction == 1:
+        if irrigar[0]:
             action = f"SUGESTÃO: Irrigar o setor {id_setor} na próxima hora."
         else:
             action = f"SUGESTÃO: Não irrigar o setor {id_setor} na próxima hora."
             
-        return action, probability
+        return action, probabilidades[0]
+
+    def modelo_do_setor(self, id_setor: str) -> Tuple[Optional[RandomForestClassifier], Optional[List[str]]]:
+        """
+        Modelo e nomes das features usados nas previsões do setor: a versão ativa do modelo
+        do setor no registro; na falta dela, a do modelo da cultura do setor; por último, o
+        modelo geral de model_path. Os modelos são carregados na primeira vez que forem usados.
+        """
+        encontrado = self.registro.obter(chave_setor(id_setor))
+        if encontrado is None:
+            id_cultura = self._cultura_do_setor(id_setor)
+            if id_cultura is not None:
+                encontrado = self.registro.obter(chave_cultura(id_cultura))
+        if encontrado is not None:
+            return encontrado
+        if self.model is None and not self._modelo_geral_lido:
+            self._modelo_geral_lido = True
+            self.load_model()
+        return self.model, self.feature_names
+
+    def _cultura_do_setor(self, id_setor: str) -> Optional[str]:
+        if id_setor not in self._culturas:
+            self._culturas = {setor['id_setor']: setor.get('id_cultura') for setor in self.db.consultar_setores()}
+            # Setor inexistente: não consulta o banco de novo a cada previsão
+            self._culturas.setdefault(id_setor, None)
+        return self._culturas[id_setor]
+
+    def predict_batch(self, dados, setores=None, horarios=None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Prevê a necessidade de irrigação na próxima hora para muitas linhas
+        (setor, medições, horário) de uma vez.
+
+        As linhas são agrupadas pelo modelo do setor e cada modelo roda um único
+        predict_proba sobre o seu grupo; a decisão vem da própria probabilidade
+        (irrigar quando a classe 1 é a mais provável, como no predict do RandomForest).
+
+        Args:
+            dados: DataFrame com uma coluna por feature de medição (ex.: 'Umidade', 'Ph') e,
+                   opcionalmente, 'id_setor' e 'horario'; ou array NumPy (n, k) com as
+                   features de medição na ordem das features do modelo do setor.
+                   Features ausentes viram NaN.
+            setores: ID do setor de cada linha (padrão: coluna 'id_setor').
+            horarios: Horário de cada previsão (padrão: coluna 'horario'), de onde saem
+                      hora_do_dia e dia_da_semana.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: irrigar (bool) e probabilidade de irrigar (float)
+                                           por linha; linhas de setores sem modelo ficam com
+                                           False e NaN.
+        """
+        tabela = isinstance(dados, pd.DataFrame)
+        setores = np.asarray(dados['id_setor'] if setores is None and tabela else setores, dtype=object)
+        horas = pd.DatetimeIndex(dados['horario'] if horarios is None and tabela else horarios)
+        if not tabela:
+            dados = np.asarray(dados, dtype=np.float64).reshape(len(setores), -1)
+        if not len(setores) == len(horas) == len(dados):
+            raise ValueError(f"Tamanhos diferentes: {len(dados)} linhas, {len(setores)} setores e {len(horas)} horários.")
+        tempo = {'hora_do_dia': horas.hour.to_numpy(), 'dia_da_semana': horas.dayofweek.to_numpy()}
+
+        # Setores agrupados por modelo (o mesmo modelo pode servir a vários setores)
+        codigos, unicos = pd.factorize(setores)
+        grupos: Dict[int, Tuple[RandomForestClassifier, List[str], List[int]]] = {}
+        for codigo, id_setor in enumerate(unicos):
+            modelo, nomes = self.modelo_do_setor(id_setor)
+            if modelo is not None:
+                grupos.setdefault(id(modelo), (modelo, nomes, []))[2].append(codigo)
+
+        irrigar = np.zeros(len(setores), dtype=bool)
+        probabilidades = np.full(len(setores), np.nan)
+        for modelo, nomes, codigos_do_grupo in grupos.values():
+            linhas = np.flatnonzero(np.isin(codigos, codigos_do_grupo))
+            # Colunas do array NumPy: as features de medição, na ordem das do modelo
+            medidas = [nome for nome in nomes if nome not in tempo]
+            matriz = np.empty((len(linhas), len(nomes)))
+            for coluna, nome in enumerate(nomes):
+                if nome in tempo:
+                    matriz[:, coluna] = tempo[nome][linhas]
+                elif tabela:
+                    matriz[:, coluna] = dados[nome].to_numpy(np.float64)[linhas] if nome in dados else np.nan
+                else:
+                    matriz[:, coluna] = dados[linhas, medidas.index(nome)] if nome in medidas else np.nan
+            proba = modelo.predict_proba(pd.DataFrame(matriz, columns=nomes, copy=False))
+            irrigar[linhas] = proba[:, 1] > proba[:, 0]
+            probabilidades[linhas] = proba[:, 1]  # Probabilidade da classe "1" (irrigar)
+        return irrigar, probabilidades
+
+    def lote_atual(self, setores: Optional[List[str]] = None, horario: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        Monta a entrada de predict_batch com as últimas leituras de cada setor
+        (padrão: todos os setores) para o horário informado (padrão: a próxima hora).
+        """
+        setores = [setor['id_setor'] for setor in self.db.consultar_setores()] if setores is None else setores
+        horario = horario or datetime.now() + timedelta(hours=1)
+        linhas = [dict(self.db.ultimos.vetor_atual(id_setor), id_setor=id_setor, horario=horario)
+                  for id_setor in setores]
+        return pd.DataFrame(linhas, columns=None if linhas else ['id_setor', 'horario'])
 
     def save_model(self):
-        """Salva o modelo treinado e os nomes das features em um arquivo."""
+        """Salva o modelo geral e os nomes das features em model_path (florestas no formato mapeável)."""
         if self.model and self.feature_names:
-            # Garante que o diretório 'data/' exista
-            os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
-            
-            # Cria um payload (pacote) com o modelo e as features
-            payload = {'model': self.model, 'features': self.feature_names}
-            joblib.dump(payload, self.model_path)
+            # Grava o modelo com as features e o cabeçalho (model_path + '.json')
+            salvar_modelo(self.model, self.feature_names, self.model_path)
             print(f"Modelo e features salvos com sucesso em '{self.model_path}'")
 
     def load_model(self):
-        """Carrega um modelo treinado e suas features do arquivo."""
+        """Carrega o modelo geral e suas features de model_path (pickle ou formato mapeável)."""
         if os.path.exists(self.model_path):
             try:
-                # Carrega o payload completo
-                payload = joblib.load(self.model_path)
-                self.model = payload['model']
-                self.feature_names = payload['features']
+                self.model, self.feature_names = carregar_modelo(self.model_path)
                 print(f"Modelo e features carregados de '{self.model_path}'")
-            except (KeyError, EOFError) as e:
+            except (KeyError, EOFError, ValueError) as e:
                 print(f"Erro ao carregar o modelo de '{self.model_path}': {e}. O arquivo pode ser de uma versão antiga ou estar corrompido.")
                 self.model = None
                 self.feature_names = None
         else:
-            print("Nenhum modelo pré-treinado encontrado. É necessário treinar um novo modelo.")
\ No newline at end of file
+            print("Nenhum modelo pré-treinado encontrado. É necessário treinar um novo modelo.")
+
+
+# ========== PROCESSOS DE TREINO (train_all) ==========
+
+# Instância usada pelas tarefas de cada processo do pool (criada em _iniciar_processo)
+_INTELIGENCIA_DO_PROCESSO: Optional[IrrigationIntelligence] = None
+
+
+def _memoria_total_mb() -> Optional[int]:
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def _descrever_banco(db) -> Optional[Tuple[str, str]]:
+    """Como reabrir o banco em outro processo: ('shards', pasta), ('arquivo', caminho) ou None (em memória)."""
+    if isinstance(db, ShardedDatabase):
+        return 'shards', db.diretorio
+    if isinstance(db, AgriculturalDatabase) and not db.em_memoria:
+        return 'arquivo', db.db_name
+    return None
+
+
+def _iniciar_processo(config: Dict):
+    """Prepara um processo do pool: limites de memória e threads, conexão e caches próprios."""
+    global _INTELIGENCIA_DO_PROCESSO
+    # O progresso é mostrado pelo processo principal; as mensagens de cada treino ficam de fora
+    sys.stdout = open(os.devnull, 'w')
+    # BLAS/OpenMP com as mesmas threads do RandomForest
+    threadpool_limits(config['n_jobs'])
+    tipo, alvo = config['banco']
+    db = ShardedDatabase(alvo) if tipo == 'shards' else AgriculturalDatabase(db_name=alvo, verboso=False)
+    # O processo principal já sincronizou o arquivo: aqui ele só é lido
+    arquivo = ColumnarArchive(db, config['arquivo'], somente_leitura=True) if config['arquivo'] else None
+    features = FeatureStore(db, config['features']) if config['features'] else None
+    _INTELIGENCIA_DO_PROCESSO = IrrigationIntelligence(db, config['model_path'], config['usar_agregados'],
+                                                       arquivo, features, ModelRegistry(config['registro']))
+    # O limite vem por último: se for pequeno demais, cada setor falha com MemoryError
+    # (registrado no resumo) em vez de derrubar o processo antes de começar
+    if config['limite_memoria_mb'] and resource is not None:
+        limite = config['limite_memoria_mb'] * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limite, limite))
+
+
+def _treinar_no_processo(id_setor: str, test_size, n_jobs) -> Dict:
+    return _INTELIGENCIA_DO_PROCESSO._treinar_setor(id_setor, test_size, n_jobs)
+
+
+def _treinar_em_pool(setores: List[str], config: Dict, processos: int, test_size,
+                     registrar: Callable[[Dict], None]) -> List[str]:
+    """
+    Treina os setores em um pool de `processos` processos, registrando cada resultado
+    assim que fica pronto.
+
+    Returns:
+        List[str]: Setores que não terminaram porque um processo do pool caiu.
+    """
+    interrompidos = []
+    # 'spawn': os processos não herdam as conexões SQLite e threads do processo principal
+    with ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_iniciar_processo, initargs=(config,)) as pool:
+        tarefas = {pool.submit(_treinar_no_processo, id_setor, test_size, config['n_jobs']): id_setor
+                   for id_setor in setores}
+        for tarefa in as_completed(tarefas):
+            try:
+                registrar(tarefa.result())
+            except BrokenProcessPool:
+                interrompidos.append(tarefas[tarefa])
+            except Exception as e:
+                registrar(dict(_resultado_vazio(tarefas[tarefa]), status='erro', motivo=f"{type(e).__name__}: {e}"))
+    return interrompidos
+
+
+def _resultado_vazio(id_setor: str) -> Dict:
+    return {'id_setor': id_setor, 'status': 'erro', 'motivo': None, 'acuracia': None, 'amostras': 0,
+            'segundos': 0.0, 'versao': None}
+
+
+def _descrever_resultado(resultado: Dict) -> str:
+    if resultado['status'] == 'treinado':
+        return (f"Setor {resultado['id_setor']}: acurácia {resultado['acuracia']:.2f}, "
+                f"{resultado['amostras']} amostras, {resultado['segundos']:.1f}s")
+    return f"Setor {resultado['id_setor']}: {resultado['status']} ({resultado['motivo']})"
+
+
+def _imprimir_resumo(resultados: List[Dict], segundos: float):
+    print("\n--- Resumo do Treinamento ---")
+    print(f"{'Setor':<12} {'Status':<10} {'Acurácia':>9} {'Amostras':>9} {'Tempo (s)':>10}")
+    for r in resultados:
+        acuracia = f"{r['acuracia']:.2f}" if r['acuracia'] is not None else "-"
+        print(f"{str(r['id_setor']):<12} {r['status']:<10} {acuracia:>9} {r['amostras']:>9} {r['segundos']:>10.1f}")
+    contagem = {status: sum(r['status'] == status for r in resultados) for status in ('treinado', 'ignorado', 'erro')}
+    print(f"{contagem['treinado']} treinados, {contagem['ignorado']} ignorados, {contagem['erro']} com erro "
+          f"em {segundos:.1f}s.")
+    for r in resultados:
+        if r['status'] != 'treinado':
+            print(f"  - {_descrever_resultado(r)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Treina os modelos de irrigação de todos os setores em paralelo.")
+    parser.add_argument("--db", default="data/agricultural_system.db", help="Banco SQLite")
+    parser.add_argument("--modelo", default="data/irrigation_model.joblib",
+                        help=f"Modelo geral; os modelos por setor vão para o registro na pasta '{DIRETORIO_MODELOS}' ao lado dele")
+    parser.add_argument("--setores", help="IDs separados por vírgula (padrão: todos com dados)")
+    parser.add_argument("--processos", type=int, help="Processos de treino (padrão: um por núcleo)")
+    parser.add_argument("--memoria-mb", type=int, help="Memória máxima por processo em MB (0 = sem limite)")
+    parser.add_argument("--brutas", action="store_true", help="Lê as medições brutas em vez dos agregados horários")
+    parser.add_argument("--sem-cache", action="store_true", help=f"Não usa o cache de features ({DIRETORIO_FEATURES})")
+    args = parser.parse_args()
+
+    db = AgriculturalDatabase(db_name=args.db, verboso=False)
+    features = None if args.sem_cache else FeatureStore(db)
+    inteligencia = IrrigationIntelligence(db, args.modelo, usar_agregados=not args.brutas, feature_store=features)
+    setores = [setor.strip() for setor in args.setores.split(',')] if args.setores else None
+    resultados = inteligencia.train_all(setores, args.processos, args.memoria_mb)
+    db.disconnect()
+    sys.exit(1 if any(r['status'] == 'erro' for r in resultados) else 0)
+
+
+if __name__ == "__main__":
+    main()
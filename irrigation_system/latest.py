@@ -0,0 +1,128 @@
+# latest.py
+
+import sqlite3
+from typing import Dict, Optional
+
+# Recalcula a última linha de cada chave a partir da tabela de origem
+_SQL_RECONSTRUIR = {
+    'TABELA_ULTIMAS_MEDICOES': '''
+        INSERT INTO TABELA_ULTIMAS_MEDICOES (id_sensor, id_medicao, valor_medicao, data_medicao)
+        SELECT k.id_sensor, m.id_medicao, m.valor, datetime(m.instante, 'unixepoch')
+        FROM (
+            SELECT chave_sensor, id_medicao, valor, instante,
+                   ROW_NUMBER() OVER (PARTITION BY chave_sensor ORDER BY instante DESC, id_registro DESC) AS posicao
+            FROM TABELA_MEDICOES_COMPACTA
+            WHERE chave_sensor IS NOT NULL AND instante IS NOT NULL
+        ) m
+        JOIN TABELA_CHAVES_SENSORES k ON k.chave_sensor = m.chave_sensor
+        WHERE posicao = 1
+    ''',
+    'TABELA_ULTIMAS_IRRIGACOES': '''
+        INSERT INTO TABELA_ULTIMAS_IRRIGACOES (id_setor, id_irrigacao, volume_irrigacao, data_irrigacao)
+        SELECT id_setor, id_irrigacao, volume_irrigacao, data_irrigacao
+        FROM (
+            SELECT id_setor, id_irrigacao, volume_irrigacao, data_irrigacao,
+                   ROW_NUMBER() OVER (PARTITION BY id_setor ORDER BY data_irrigacao DESC, rowid DESC) AS posicao
+            FROM TABELA_IRRIGACOES
+            WHERE id_setor IS NOT NULL AND data_irrigacao IS NOT NULL
+        )
+        WHERE posicao = 1
+    ''',
+}
+
+
+class LatestValues:
+    """
+    Consulta a última medição de cada sensor e a última irrigação de cada setor.
+
+    Os valores ficam em TABELA_ULTIMAS_MEDICOES e TABELA_ULTIMAS_IRRIGACOES e são
+    atualizados por gatilhos a cada INSERT (ver migrações 5 e 7), então qualquer caminho
+    de gravação os mantém em dia e as leituras são buscas pela chave primária, sem
+    varrer as medições. Alterações e remoções nas tabelas de origem não são
+    propagadas; nesse caso use reconstruir().
+    """
+
+    def __init__(self, db_manager):
+        """
+        Args:
+            db_manager: Uma instância da classe AgriculturalDatabase.
+        """
+        self.db = db_manager
+
+    def _consultar(self, sql: str, parametros: tuple = ()) -> list:
+        cursor = self.db.connection.cursor()
+        try:
+            cursor.execute(sql, parametros)
+            colunas = [desc[0] for desc in cursor.description]
+            return [dict(zip(colunas, linha)) for linha in cursor.fetchall()]
+        except sqlite3.Error as e:
+            print(f"Erro ao consultar últimos valores: {e}")
+            return []
+
+    def por_sensor(self, id_sensor: str) -> Optional[Dict]:
+        """Última medição do sensor (id_medicao, valor_medicao, data_medicao) ou None."""
+        linhas = self._consultar('''
+            SELECT u.id_sensor, u.id_medicao, u.valor_medicao, u.data_medicao, s.tipo_sensor, s.id_setor
+            FROM TABELA_ULTIMAS_MEDICOES u
+            LEFT JOIN TABELA_SENSORES s ON s.id_sensor = u.id_sensor
+            WHERE u.id_sensor = ?
+        ''', (id_sensor,))
+        return linhas[0] if linhas else None
+
+    def por_setor(self, id_setor: str) -> Dict[str, Dict]:
+        """Última medição de cada sensor do setor, indexada por id_sensor."""
+        linhas = self._consultar('''
+            SELECT u.id_sensor, u.id_medicao, u.valor_medicao, u.data_medicao, s.tipo_sensor, s.id_setor
+            FROM TABELA_SENSORES s
+            JOIN TABELA_ULTIMAS_MEDICOES u ON u.id_sensor = s.id_sensor
+            WHERE s.id_setor = ?
+            ORDER BY u.data_medicao DESC
+        ''', (id_setor,))
+        return {linha['id_sensor']: linha for linha in linhas}
+
+    def ultima_medicao(self) -> Optional[Dict]:
+        """Medição mais recente entre todos os sensores."""
+        linhas = self._consultar('''
+            SELECT id_sensor, id_medicao, valor_medicao, data_medicao
+            FROM TABELA_ULTIMAS_MEDICOES
+            ORDER BY data_medicao DESC
+            LIMIT 1
+        ''')
+        return linhas[0] if linhas else None
+
+    def ultima_irrigacao(self, id_setor: Optional[str] = None) -> Optional[Dict]:
+        """Irrigação mais recente do setor (ou de todos os setores, se omitido)."""
+        sql = "SELECT id_setor, id_irrigacao, volume_irrigacao, data_irrigacao FROM TABELA_ULTIMAS_IRRIGACOES"
+        if id_setor is not None:
+            linhas = self._consultar(sql + " WHERE id_setor = ?", (id_setor,))
+        else:
+            linhas = self._consultar(sql + " ORDER BY data_irrigacao DESC LIMIT 1")
+        return linhas[0] if linhas else None
+
+    def vetor_atual(self, id_setor: str) -> Dict[str, float]:
+        """
+        Valores atuais do setor no formato das features do modelo
+        (tipo_sensor capitalizado, ex.: {'Umidade': 35.2, 'Ph': 6.5}).
+        Com mais de um sensor do mesmo tipo, vale a leitura mais recente.
+        """
+        vetor = {}
+        for linha in self.por_setor(id_setor).values():
+            if linha['tipo_sensor'] and linha['valor_medicao'] is not None:
+                vetor.setdefault(linha['tipo_sensor'].strip().capitalize(), float(linha['valor_medicao']))
+        return vetor
+
+    def reconstruir(self) -> bool:
+        """Recalcula as tabelas de últimos valores a partir das medições e de TABELA_IRRIGACOES."""
+        conexao = self.db.connection
+        cursor = conexao.cursor()
+        try:
+            for tabela, sql in _SQL_RECONSTRUIR.items():
+                cursor.execute(f"DELETE FROM {tabela}")
+                cursor.execute(sql)
+            conexao.commit()
+            print("Últimos valores reconstruídos.")
+            return True
+        except sqlite3.Error as e:
+            conexao.rollback()
+            print(f"Erro ao reconstruir últimos valores: {e}")
+            return False
@@ -0,0 +1,1008 @@
+# memory.py
+
+import os
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .database import (BANCO_EM_MEMORIA, COLUNAS_LOTE, FORMATOS_ITERACAO, TAMANHO_LOTE_PADRAO,
+                       AgriculturalDatabase, Registro)
+from .latest import LatestValues
+
+# Backends aceitos por criar_banco:
+#   'arquivo'        - AgriculturalDatabase no arquivo SQLite (padrão)
+#   'sqlite_memoria' - AgriculturalDatabase(":memory:"), SQLite em memória com cache compartilhado
+#   'memoria'        - MemoryDatabase, Python/NumPy puro, sem SQLite
+BACKENDS = ('arquivo', 'sqlite_memoria', 'memoria')
+# Variável de ambiente que escolhe o backend do dashboard
+VARIAVEL_BACKEND = "IRRIGACAO_BACKEND"
+
+# Colunas de cada tabela na ordem do SELECT * do SQLite; a primeira é a chave primária
+COLUNAS_TABELAS = {
+    'TABELA_CULTURAS': ('id_cultura', 'nome_cultura', 'ph_minimo_ideal', 'ph_maximo_ideal',
+                        'fosforo_minimo_ideal', 'fosforo_maximo_ideal', 'potassio_minimo_ideal',
+                        'potassio_maximo_ideal', 'umidade_minima_ideal', 'umidade_maxima_ideal'),
+    'TABELA_SETORES': ('id_setor', 'area_setor', 'id_cultura'),
+    'TABELA_SENSORES': ('id_sensor', 'tipo_sensor', 'id_setor'),
+    'TABELA_IRRIGACOES': ('id_irrigacao', 'volume_irrigacao', 'data_irrigacao', 'id_setor'),
+    'TABELA_APLICACOES_NUTRIENTES': ('id_aplicacao_nutriente', 'tipo_aplicacao', 'volume_aplicacao',
+                                     'data_aplicacao', 'id_setor'),
+    'TABELA_CORRECOES_PH': ('id_correcao_ph', 'tipo_correcao', 'volume_correcao', 'data_correcao', 'id_setor'),
+}
+COLUNAS_MEDICOES = COLUNAS_LOTE['TABELA_MEDICOES'][0]
+
+# Coluna de data das tabelas de eventos (filtros e ordenação dos iteradores)
+COLUNAS_DATA = {
+    'TABELA_IRRIGACOES': 'data_irrigacao',
+    'TABELA_APLICACOES_NUTRIENTES': 'data_aplicacao',
+    'TABELA_CORRECOES_PH': 'data_correcao',
+}
+
+# Capacidade inicial das colunas de medições (dobra quando enche)
+CAPACIDADE_INICIAL = 1024
+# Código do sensor de uma medição sem id_sensor
+SEM_SENSOR = -1
+
+
+class ErroMemoria(Exception):
+    """Violação de restrição ou comando inválido no backend em memória."""
+
+
+def _para_epoch(data) -> Optional[int]:
+    """Texto/datetime -> segundos desde a época (UTC, como o strftime('%s') do SQLite); None se inválida."""
+    if data is None:
+        return None
+    try:
+        return int(np.datetime64(str(data)).astype('datetime64[s]').astype(np.int64))
+    except ValueError:
+        return None
+
+
+def _para_epochs(datas: List) -> Tuple[np.ndarray, np.ndarray]:
+    """Converte uma lista de datas de uma vez; retorna (epochs, invalidas), com -1 nas inválidas."""
+    try:
+        convertidas = np.array(datas, dtype='datetime64[s]')
+        invalidas = np.isnat(convertidas)
+        return np.where(invalidas, -1, convertidas.astype(np.int64)), invalidas
+    except ValueError:
+        epochs = [_para_epoch(data) for data in datas]
+        invalidas = np.array([epoch is None for epoch in epochs], dtype=bool)
+        return np.array([-1 if epoch is None else epoch for epoch in epochs], dtype=np.int64), invalidas
+
+
+def _para_valor(valor) -> float:
+    """Valor de medição como float (NULL vira NaN)."""
+    if valor is None:
+        return np.nan
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        raise ErroMemoria(f"valor_medicao inválido: {valor!r}")
+
+
+def _para_texto(epochs: np.ndarray) -> List[str]:
+    """Segundos desde a época -> "YYYY-MM-DD HH:MM:SS" (o formato de datetime() do SQLite)."""
+    return [texto.replace('T', ' ') for texto in np.datetime_as_string(epochs.astype('datetime64[s]'))]
+
+
+class _ColunasMedicoes:
+    """
+    Medições em colunas NumPy (instante, valor, código do sensor), com crescimento
+    amortizado. Remoções apenas desligam a linha em `ativa`; os índices de id_medicao
+    e de (sensor, instante) garantem as mesmas unicidades da tabela SQLite.
+    """
+
+    def __init__(self):
+        self.tamanho = 0
+        self.instante = np.empty(CAPACIDADE_INICIAL, dtype=np.int64)
+        self.valor = np.empty(CAPACIDADE_INICIAL, dtype=np.float64)
+        self.sensor = np.empty(CAPACIDADE_INICIAL, dtype=np.int32)
+        self.ativa = np.empty(CAPACIDADE_INICIAL, dtype=bool)
+        self.ids: List[str] = []
+        self.posicao_id: Dict[str, int] = {}
+        self.posicao_chave: Dict[Tuple[int, int], int] = {}
+        self.codigos: Dict[str, int] = {}   # id_sensor -> código
+        self.sensores: List[str] = []       # código -> id_sensor
+
+    def codigo(self, id_sensor: Optional[str]) -> int:
+        """Código inteiro do sensor, criado no primeiro uso (como TABELA_CHAVES_SENSORES)."""
+        if id_sensor is None:
+            return SEM_SENSOR
+        codigo = self.codigos.get(id_sensor)
+        if codigo is None:
+            codigo = self.codigos[id_sensor] = len(self.sensores)
+            self.sensores.append(id_sensor)
+        return codigo
+
+    def _reservar(self, linhas: int):
+        necessario = self.tamanho + linhas
+        if necessario <= len(self.instante):
+            return
+        capacidade = max(necessario, 2 * len(self.instante))
+        for nome in ('instante', 'valor', 'sensor', 'ativa'):
+            antiga = getattr(self, nome)
+            nova = np.empty(capacidade, dtype=antiga.dtype)
+            nova[:self.tamanho] = antiga[:self.tamanho]
+            setattr(self, nome, nova)
+
+    def anexar(self, ids: List[str], valores, instantes, codigos):
+        """Acrescenta linhas já validadas (sem conflito de id nem de sensor e instante)."""
+        inicio, quantidade = self.tamanho, len(ids)
+        self._reservar(quantidade)
+        fim = inicio + quantidade
+        self.instante[inicio:fim] = instantes
+        self.valor[inicio:fim] = valores
+        self.sensor[inicio:fim] = codigos
+        self.ativa[inicio:fim] = True
+        self.ids.extend(ids)
+        self.posicao_id.update(zip(ids, range(inicio, fim)))
+        self.posicao_chave.update(zip(zip(self.sensor[inicio:fim].tolist(), self.instante[inicio:fim].tolist()),
+                                      range(inicio, fim)))
+        self.tamanho = fim
+
+    def conflito(self, id_medicao: str, codigo: int, instante: int, ignorar: Optional[int] = None) -> bool:
+        """Indica se a linha violaria a unicidade de id_medicao ou de (sensor, instante)."""
+        posicao = self.posicao_id.get(id_medicao)
+        if posicao is not None and posicao != ignorar:
+            return True
+        if codigo == SEM_SENSOR:
+            return False
+        posicao = self.posicao_chave.get((codigo, instante))
+        return posicao is not None and posicao != ignorar
+
+    def desligar(self, posicao: int):
+        self.ativa[posicao] = False
+        del self.posicao_id[self.ids[posicao]]
+        self.posicao_chave.pop((int(self.sensor[posicao]), int(self.instante[posicao])), None)
+
+    def religar(self, posicao: int, id_medicao: str, valor: float, instante: int, codigo: int):
+        """Regrava a linha no mesmo lugar (atualização), reindexando as chaves."""
+        self.ids[posicao] = id_medicao
+        self.valor[posicao], self.instante[posicao], self.sensor[posicao] = valor, instante, codigo
+        self.ativa[posicao] = True
+        self.posicao_id[id_medicao] = posicao
+        if codigo != SEM_SENSOR:
+            self.posicao_chave[(codigo, instante)] = posicao
+
+
+class MemoryLatest(LatestValues):
+    """Últimos valores do MemoryDatabase, mantidos a cada inserção como os gatilhos do SQLite."""
+
+    def __init__(self, db_manager):
+        super().__init__(db_manager)
+        self.medicoes: Dict[str, Dict] = {}
+        self.irrigacoes: Dict[str, Dict] = {}
+
+    def registrar_medicao(self, id_sensor: str, id_medicao: str, valor_medicao: float, data_medicao: str):
+        atual = self.medicoes.get(id_sensor)
+        if atual is None or data_medicao >= atual['data_medicao']:
+            self.medicoes[id_sensor] = {'id_sensor': id_sensor, 'id_medicao': id_medicao,
+                                        'valor_medicao': valor_medicao, 'data_medicao': data_medicao}
+
+    def registrar_irrigacao(self, id_setor: Optional[str], id_irrigacao: str, volume_irrigacao: float,
+                            data_irrigacao: Optional[str]):
+        if id_setor is None or data_irrigacao is None:
+            return
+        atual = self.irrigacoes.get(id_setor)
+        if atual is None or data_irrigacao >= atual['data_irrigacao']:
+            self.irrigacoes[id_setor] = {'id_setor': id_setor, 'id_irrigacao': id_irrigacao,
+                                         'volume_irrigacao': volume_irrigacao, 'data_irrigacao': data_irrigacao}
+
+    def _com_sensor(self, linha: Dict) -> Dict:
+        sensor = self.db._tabelas['TABELA_SENSORES'].get(linha['id_sensor'])
+        return dict(linha, tipo_sensor=sensor[1] if sensor else None, id_setor=sensor[2] if sensor else None)
+
+    def por_sensor(self, id_sensor: str) -> Optional[Dict]:
+        linha = self.medicoes.get(id_sensor)
+        return self._com_sensor(linha) if linha else None
+
+    def por_setor(self, id_setor: str) -> Dict[str, Dict]:
+        linhas = [self._com_sensor(self.medicoes[id_sensor])
+                  for id_sensor, sensor in self.db._tabelas['TABELA_SENSORES'].items()
+                  if sensor[2] == id_setor and id_sensor in self.medicoes]
+        linhas.sort(key=lambda linha: linha['data_medicao'], reverse=True)
+        return {linha['id_sensor']: linha for linha in linhas}
+
+    def ultima_medicao(self) -> Optional[Dict]:
+        if not self.medicoes:
+            return None
+        return dict(max(self.medicoes.values(), key=lambda linha: linha['data_medicao']))
+
+    def ultima_irrigacao(self, id_setor: Optional[str] = None) -> Optional[Dict]:
+        if id_setor is not None:
+            linha = self.irrigacoes.get(id_setor)
+            return dict(linha) if linha else None
+        if not self.irrigacoes:
+            return None
+        return dict(max(self.irrigacoes.values(), key=lambda linha: linha['data_irrigacao']))
+
+    def reconstruir(self) -> bool:
+        """Recalcula os últimos valores a partir das medições e irrigações em memória."""
+        self.recalcular()
+        print("Últimos valores reconstruídos.")
+        return True
+
+    def recalcular(self):
+        colunas = self.db._medicoes
+        self.medicoes, self.irrigacoes = {}, {}
+        self.db._registrar_ultimas(np.flatnonzero(colunas.ativa[:colunas.tamanho]))
+        for linha in self.db._tabelas['TABELA_IRRIGACOES'].values():
+            self.registrar_irrigacao(linha[3], linha[0], linha[1], linha[2])
+
+
+class MemoryRollups:
+    """
+    Interface de SensorRollups para o MemoryDatabase. As médias horárias são calculadas
+    sob demanda sobre as colunas NumPy, então nunca ficam defasadas: atualizar() não
+    tem o que fazer e verificar_consistencia() não encontra divergências.
+    """
+
+    def __init__(self, db_manager):
+        self.db = db_manager
+
+    def atualizar(self, linhas_por_transacao: Optional[int] = None) -> int:
+        return 0
+
+    def reconstruir(self) -> int:
+        return int(self.db._medicoes.ativa[:self.db._medicoes.tamanho].sum())
+
+    def verificar_consistencia(self, inicio: Optional[str] = None) -> List[Dict]:
+        return []
+
+    def consultar_horario(self, id_setor: Optional[str] = None, tipo_sensor: Optional[str] = None,
+                          inicio: Optional[str] = None, fim: Optional[str] = None) -> Dict[str, list]:
+        """Mesmo formato de SensorRollups.consultar_horario (dict de listas, ordenado por hora)."""
+        colunas = self.db._medicoes
+        with self.db._lock:
+            posicoes = self.db._posicoes_medicoes(id_setor=id_setor, tipo_sensor=tipo_sensor)
+            posicoes = posicoes[(colunas.sensor[posicoes] != SEM_SENSOR) & ~np.isnan(colunas.valor[posicoes])]
+            instantes, valores, sensores = colunas.instante[posicoes], colunas.valor[posicoes], colunas.sensor[posicoes]
+        horas = instantes - instantes % 3600
+        mascara = np.ones(len(horas), dtype=bool)
+        for limite, incluir in ((inicio, np.greater_equal), (fim, np.less)):
+            if limite is not None:
+                epoch = _para_epoch(limite)
+                mascara &= incluir(horas, epoch) if epoch is not None else False
+        posicoes, instantes, valores, sensores, horas = (
+            posicoes[mascara], instantes[mascara], valores[mascara], sensores[mascara], horas[mascara])
+        if not len(posicoes):
+            return {}
+
+        # Agrupa por (sensor, hora); dentro do grupo a última linha é a de maior instante
+        ordem = np.lexsort((posicoes, instantes, horas, sensores))
+        sensores, horas, valores = sensores[ordem], horas[ordem], valores[ordem]
+        inicios = np.flatnonzero(np.r_[True, (sensores[1:] != sensores[:-1]) | (horas[1:] != horas[:-1])])
+        fins = np.r_[inicios[1:], len(ordem)]
+        quantidades = fins - inicios
+        medias = np.add.reduceat(valores, inicios) / quantidades
+        minimos = np.minimum.reduceat(valores, inicios)
+        maximos = np.maximum.reduceat(valores, inicios)
+        ultimos = valores[fins - 1]
+        grupos_sensores, grupos_horas = sensores[inicios], horas[inicios]
+
+        por_hora = np.argsort(grupos_horas, kind='stable')
+        ids_sensores = [colunas.sensores[codigo] for codigo in grupos_sensores[por_hora].tolist()]
+        cadastro = self.db._tabelas['TABELA_SENSORES']
+        return {
+            'hora': _para_texto(grupos_horas[por_hora]),
+            'id_sensor': ids_sensores,
+            'tipo_sensor': [cadastro[i][1] if i in cadastro else None for i in ids_sensores],
+            'id_setor': [cadastro[i][2] if i in cadastro else None for i in ids_sensores],
+            'valor_medio': medias[por_hora].tolist(),
+            'minimo': minimos[por_hora].tolist(),
+            'maximo': maximos[por_hora].tolist(),
+            'ultimo_valor': ultimos[por_hora].tolist(),
+            'quantidade': quantidades[por_hora].tolist(),
+        }
+
+
+class MemoryDatabase:
+    """
+    Backend em memória, em Python e NumPy, com a mesma interface de CRUD e de consulta
+    de AgriculturalDatabase (inclusive `rollups` e `ultimos`), para testes, benchmarks
+    e para o dashboard/IrrigationIntelligence sem tocar no disco.
+
+    Os cadastros e eventos ficam em dicionários por chave primária; as medições, em
+    colunas NumPy (_ColunasMedicoes). As unicidades e as mensagens seguem as do SQLite.
+    Diferenças: datas de medição inválidas são rejeitadas (no SQLite viram NULL) e
+    valores de medição nulos são guardados como NaN.
+    """
+
+    def __init__(self, agregados_automaticos: bool = True, verboso: bool = True):
+        """
+        Args:
+            agregados_automaticos (bool): Aceito por compatibilidade; os agregados são
+                                          sempre calculados sob demanda.
+            verboso (bool): Se False, omite as mensagens de conexão e de carga.
+        """
+        self.db_name = BANCO_EM_MEMORIA
+        self.agregados_automaticos = agregados_automaticos
+        self.verboso = verboso
+        self._lock = threading.RLock()
+        self._tabelas: Dict[str, Dict[Any, list]] = {tabela: {} for tabela in COLUNAS_TABELAS}
+        self._medicoes = _ColunasMedicoes()
+        # (id_setor, data_irrigacao) de cada irrigação inserida, alterada ou removida, em
+        # ordem: o equivalente a TABELA_ALTERACOES_IRRIGACOES para alteracoes_do_setor
+        self._alteracoes_irrigacoes: List[Tuple[Any, Any]] = []
+        self.rollups = MemoryRollups(self)
+        self.ultimos = MemoryLatest(self)
+        if self.verboso:
+            print("Conectado ao banco de dados em memória (NumPy)")
+
+    def connect(self):
+        """Mantido por compatibilidade: não há conexão a abrir."""
+
+    def disconnect(self):
+        """Mantido por compatibilidade: os dados permanecem até a instância ser descartada."""
+        if self.verboso:
+            print("Desconectado do banco de dados")
+
+    def create_tables(self):
+        """Mantido por compatibilidade: as tabelas existem desde a criação."""
+
+    def carregar_de_arquivo(self, caminho: str) -> bool:
+        """
+        Substitui o conteúdo por uma cópia do banco SQLite `caminho` (aberto somente para
+        leitura). As medições são lidas de uma vez e convertidas em bloco para as colunas
+        NumPy, sem passar pela validação linha a linha das inserções.
+        """
+        try:
+            origem = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True)
+        except sqlite3.Error as e:
+            print(f"Erro ao carregar o banco de '{caminho}': {e}")
+            return False
+        try:
+            tabelas = {}
+            for tabela, colunas in COLUNAS_TABELAS.items():
+                linhas = origem.execute(f"SELECT {', '.join(colunas)} FROM {tabela} ORDER BY rowid").fetchall()
+                tabelas[tabela] = {linha[0]: list(linha) for linha in linhas}
+            try:
+                # Layout compacto (migração 7): o instante já vem em segundos
+                medicoes = origem.execute('''
+                    SELECT m.id_medicao, m.valor, m.instante, k.id_sensor
+                    FROM TABELA_MEDICOES_COMPACTA m
+                    LEFT JOIN TABELA_CHAVES_SENSORES k ON k.chave_sensor = m.chave_sensor
+                    WHERE m.instante IS NOT NULL
+                    ORDER BY m.id_registro
+                ''').fetchall()
+                compacto = True
+            except sqlite3.OperationalError:
+                medicoes = origem.execute(
+                    "SELECT id_medicao, valor_medicao, data_medicao, id_sensor FROM TABELA_MEDICOES ORDER BY rowid"
+                ).fetchall()
+                compacto = False
+        except sqlite3.Error as e:
+            print(f"Erro ao carregar o banco de '{caminho}': {e}")
+            return False
+        finally:
+            origem.close()
+
+        with self._lock:
+            self._tabelas = tabelas
+            self._medicoes = _ColunasMedicoes()
+            self._alteracoes_irrigacoes = [(linha[3], linha[2]) for linha in tabelas['TABELA_IRRIGACOES'].values()]
+            if medicoes:
+                ids, valores, datas, sensores = (list(coluna) for coluna in zip(*medicoes))
+                if compacto:
+                    instantes = np.array(datas, dtype=np.int64)
+                else:
+                    instantes, invalidas = _para_epochs(datas)
+                    validas = np.flatnonzero(~invalidas).tolist()
+                    ids, valores, sensores = ([coluna[i] for i in validas] for coluna in (ids, valores, sensores))
+                    instantes = instantes[validas]
+                codigos = [self._medicoes.codigo(id_sensor) for id_sensor in sensores]
+                self._medicoes.anexar(ids, np.array(valores, dtype=np.float64), instantes, codigos)
+            self.ultimos.recalcular()
+        if self.verboso:
+            print(f"Banco carregado de '{caminho}': {self._medicoes.tamanho} medições.")
+        return True
+
+    # ========== OPERAÇÕES GENÉRICAS ==========
+
+    @staticmethod
+    def _executar(operacao: Callable[[], Any], sucesso: str, erro: str) -> bool:
+        """Executa a operação, imprimindo a mensagem de sucesso ou de erro como no SQLite."""
+        try:
+            operacao()
+            print(sucesso)
+            return True
+        except ErroMemoria as e:
+            print(f"{erro}: {e}")
+            return False
+
+    def _inserir(self, tabela: str, valores: tuple):
+        chave = valores[0]
+        with self._lock:
+            if chave in self._tabelas[tabela]:
+                raise ErroMemoria(f"UNIQUE constraint failed: {tabela}.{COLUNAS_TABELAS[tabela][0]}")
+            self._tabelas[tabela][chave] = list(valores)
+            if tabela == 'TABELA_IRRIGACOES':
+                self._alteracoes_irrigacoes.append((valores[3], valores[2]))
+                self.ultimos.registrar_irrigacao(valores[3], valores[0], valores[1], valores[2])
+
+    def _atualizar(self, tabela: str, chave: Any, campos: Dict[str, Any]):
+        colunas = COLUNAS_TABELAS[tabela]
+        for campo in campos:
+            if campo not in colunas:
+                raise ErroMemoria(f"no such column: {campo}")
+        with self._lock:
+            linhas = self._tabelas[tabela]
+            if chave not in linhas:
+                return
+            antiga = linhas[chave]
+            nova = list(antiga)
+            for campo, valor in campos.items():
+                nova[colunas.index(campo)] = valor
+            if nova[0] != chave:
+                if nova[0] in linhas:
+                    raise ErroMemoria(f"UNIQUE constraint failed: {tabela}.{colunas[0]}")
+                del linhas[chave]
+            linhas[nova[0]] = nova
+            if tabela == 'TABELA_IRRIGACOES':
+                self._alteracoes_irrigacoes.extend([(antiga[3], antiga[2]), (nova[3], nova[2])])
+
+    def _remover(self, tabela: str, chave: Any):
+        with self._lock:
+            removida = self._tabelas[tabela].pop(chave, None)
+            if removida is not None and tabela == 'TABELA_IRRIGACOES':
+                self._alteracoes_irrigacoes.append((removida[3], removida[2]))
+
+    def _linhas(self, tabela: str, extra: Optional[Tuple[str, str, int]] = None) -> List[Dict]:
+        """
+        Linhas da tabela como dicts; `extra` = (coluna, tabela relacionada, posição) acrescenta
+        a coluna de outra tabela pela chave estrangeira (o LEFT JOIN das consultas SQLite).
+        """
+        colunas = COLUNAS_TABELAS[tabela]
+        linhas = [dict(zip(colunas, linha)) for linha in list(self._tabelas[tabela].values())]
+        if extra:
+            coluna, relacionada, posicao = extra
+            estrangeira = colunas[-1]
+            for linha in linhas:
+                alvo = self._tabelas[relacionada].get(linha[estrangeira])
+                linha[coluna] = alvo[posicao] if alvo else None
+        return linhas
+
+    # ========== CRUD PARA CULTURAS ==========
+
+    def inserir_cultura(self, id_cultura: str, nome_cultura: str,
+                        ph_min: float, ph_max: float, fosforo_min: float,
+                        fosforo_max: float, potassio_min: float, potassio_max: float,
+                        umidade_min: float, umidade_max: float) -> bool:
+        """Insere uma nova cultura"""
+        valores = (id_cultura, nome_cultura, ph_min, ph_max, fosforo_min, fosforo_max,
+                   potassio_min, potassio_max, umidade_min, umidade_max)
+        return self._executar(lambda: self._inserir('TABELA_CULTURAS', valores),
+                              f"Cultura {nome_cultura} inserida com sucesso!", "Erro ao inserir cultura")
+
+    def consultar_culturas(self) -> List[Dict]:
+        """Consulta todas as culturas"""
+        return self._linhas('TABELA_CULTURAS')
+
+    def atualizar_cultura(self, id_cultura: str, **kwargs) -> bool:
+        """Atualiza uma cultura existente"""
+        return self._executar(lambda: self._atualizar('TABELA_CULTURAS', id_cultura, kwargs),
+                              f"Cultura {id_cultura} atualizada com sucesso!", "Erro ao atualizar cultura")
+
+    def remover_cultura(self, id_cultura: str) -> bool:
+        """Remove uma cultura"""
+        return self._executar(lambda: self._remover('TABELA_CULTURAS', id_cultura),
+                              f"Cultura {id_cultura} removida com sucesso!", "Erro ao remover cultura")
+
+    # ========== CRUD PARA SETORES ==========
+
+    def inserir_setor(self, id_setor: str, area_setor: float, id_cultura: str) -> bool:
+        """Insere um novo setor"""
+        return self._executar(lambda: self._inserir('TABELA_SETORES', (id_setor, area_setor, id_cultura)),
+                              f"Setor {id_setor} inserido com sucesso!", "Erro ao inserir setor")
+
+    def consultar_setores(self) -> List[Dict]:
+        """Consulta todos os setores (com o nome da cultura)"""
+        return self._linhas('TABELA_SETORES', ('nome_cultura', 'TABELA_CULTURAS', 1))
+
+    def atualizar_setor(self, id_setor: str, **kwargs) -> bool:
+        """Atualiza um setor existente"""
+        return self._executar(lambda: self._atualizar('TABELA_SETORES', id_setor, kwargs),
+                              f"Setor {id_setor} atualizado com sucesso!", "Erro ao atualizar setor")
+
+    def remover_setor(self, id_setor: str) -> bool:
+        """Remove um setor"""
+        return self._executar(lambda: self._remover('TABELA_SETORES', id_setor),
+                              f"Setor {id_setor} removido com sucesso!", "Erro ao remover setor")
+
+    # ========== CRUD PARA SENSORES ==========
+
+    def inserir_sensor(self, id_sensor: str, tipo_sensor: str, id_setor: str) -> bool:
+        """Insere um novo sensor"""
+        return self._executar(lambda: self._inserir('TABELA_SENSORES', (id_sensor, tipo_sensor, id_setor)),
+                              f"Sensor {id_sensor} inserido com sucesso!", "Erro ao inserir sensor")
+
+    def consultar_sensores(self) -> List[Dict]:
+        """Consulta todos os sensores (com a área do setor)"""
+        return self._linhas('TABELA_SENSORES', ('area_setor', 'TABELA_SETORES', 1))
+
+    def atualizar_sensor(self, id_sensor: str, **kwargs) -> bool:
+        """Atualiza um sensor existente"""
+        return self._executar(lambda: self._atualizar('TABELA_SENSORES', id_sensor, kwargs),
+                              f"Sensor {id_sensor} atualizado com sucesso!", "Erro ao atualizar sensor")
+
+    def remover_sensor(self, id_sensor: str) -> bool:
+        """Remove um sensor"""
+        return self._executar(lambda: self._remover('TABELA_SENSORES', id_sensor),
+                              f"Sensor {id_sensor} removido com sucesso!", "Erro ao remover sensor")
+
+    # ========== CRUD PARA MEDICOES ==========
+
+    def inserir_medicao(self, id_medicao: str, valor_medicao: float,
+                        data_medicao: str, id_sensor: str) -> bool:
+        """Insere uma nova medição"""
+        def inserir():
+            valores = (id_medicao, _para_valor(valor_medicao), data_medicao, id_sensor)
+            resultado = self._gravar_medicoes([(0, valores)])
+            if resultado['erros']:
+                raise ErroMemoria(resultado['erros'][0][1])
+            if resultado['duplicados']:
+                raise ErroMemoria("UNIQUE constraint failed: TABELA_MEDICOES_COMPACTA")
+        return self._executar(inserir, f"Medição {id_medicao} inserida com sucesso!", "Erro ao inserir medição")
+
+    def consultar_medicoes(self) -> List[Dict]:
+        """Consulta todas as medições"""
+        return [{nome: linha[nome] for nome in COLUNAS_MEDICOES + ('tipo_sensor', 'id_setor')}
+                for linha in self.iterar_medicoes()]
+
+    def atualizar_medicao(self, id_medicao: str, **kwargs) -> bool:
+        """Atualiza uma medição existente"""
+        def atualizar():
+            for campo in kwargs:
+                if campo not in COLUNAS_MEDICOES:
+                    raise ErroMemoria(f"no such column: {campo}")
+            colunas = self._medicoes
+            with self._lock:
+                posicao = colunas.posicao_id.get(id_medicao)
+                if posicao is None:
+                    return
+                novo_id = kwargs.get('id_medicao', id_medicao)
+                valor = float(colunas.valor[posicao])
+                instante = int(colunas.instante[posicao])
+                codigo = int(colunas.sensor[posicao])
+                if 'valor_medicao' in kwargs:
+                    valor = _para_valor(kwargs['valor_medicao'])
+                if 'data_medicao' in kwargs:
+                    instante = _para_epoch(kwargs['data_medicao'])
+                    if instante is None:
+                        raise ErroMemoria(f"data_medicao inválida: {kwargs['data_medicao']}")
+                if 'id_sensor' in kwargs:
+                    codigo = colunas.codigo(kwargs['id_sensor'])
+                if colunas.conflito(novo_id, codigo, instante, ignorar=posicao):
+                    raise ErroMemoria("UNIQUE constraint failed: TABELA_MEDICOES_COMPACTA")
+                colunas.desligar(posicao)
+                colunas.religar(posicao, novo_id, valor, instante, codigo)
+        return self._executar(atualizar, f"Medição {id_medicao} atualizada com sucesso!", "Erro ao atualizar medição")
+
+    def remover_medicao(self, id_medicao: str) -> bool:
+        """Remove uma medição"""
+        def remover():
+            with self._lock:
+                posicao = self._medicoes.posicao_id.get(id_medicao)
+                if posicao is not None:
+                    self._medicoes.desligar(posicao)
+        return self._executar(remover, f"Medição {id_medicao} removida com sucesso!", "Erro ao remover medição")
+
+    # ========== CRUD PARA APLICACOES NUTRIENTES ==========
+
+    def inserir_aplicacao_nutriente(self, id_aplicacao: str, tipo_aplicacao: str,
+                                    volume_aplicacao: float, data_aplicacao: str,
+                                    id_setor: str) -> bool:
+        """Insere uma nova aplicação de nutriente"""
+        valores = (id_aplicacao, tipo_aplicacao, volume_aplicacao, data_aplicacao, id_setor)
+        return self._executar(lambda: self._inserir('TABELA_APLICACOES_NUTRIENTES', valores),
+                              f"Aplicação de nutriente {id_aplicacao} inserida com sucesso!",
+                              "Erro ao inserir aplicação de nutriente")
+
+    def consultar_aplicacoes_nutrientes(self) -> List[Dict]:
+        """Consulta todas as aplicações de nutrientes"""
+        return self._linhas('TABELA_APLICACOES_NUTRIENTES', ('area_setor', 'TABELA_SETORES', 1))
+
+    def atualizar_aplicacao_nutriente(self, id_aplicacao: str, **kwargs) -> bool:
+        """Atualiza uma aplicação de nutriente existente"""
+        return self._executar(lambda: self._atualizar('TABELA_APLICACOES_NUTRIENTES', id_aplicacao, kwargs),
+                              f"Aplicação de nutriente {id_aplicacao} atualizada com sucesso!",
+                              "Erro ao atualizar aplicação de nutriente")
+
+    def remover_aplicacao_nutriente(self, id_aplicacao: str) -> bool:
+        """Remove uma aplicação de nutriente"""
+        return self._executar(lambda: self._remover('TABELA_APLICACOES_NUTRIENTES', id_aplicacao),
+                              f"Aplicação de nutriente {id_aplicacao} removida com sucesso!",
+                              "Erro ao remover aplicação de nutriente")
+
+    # ========== CRUD PARA CORRECOES PH ==========
+
+    def inserir_correcao_ph(self, id_correcao: str, tipo_correcao: str,
+                            volume_correcao: float, data_correcao: str,
+                            id_setor: str) -> bool:
+        """Insere uma nova correção de pH"""
+        valores = (id_correcao, tipo_correcao, volume_correcao, data_correcao, id_setor)
+        return self._executar(lambda: self._inserir('TABELA_CORRECOES_PH', valores),
+                              f"Correção de pH {id_correcao} inserida com sucesso!", "Erro ao inserir correção de pH")
+
+    def consultar_correcoes_ph(self) -> List[Dict]:
+        """Consulta todas as correções de pH"""
+        return self._linhas('TABELA_CORRECOES_PH', ('area_setor', 'TABELA_SETORES', 1))
+
+    def atualizar_correcao_ph(self, id_correcao: str, **kwargs) -> bool:
+        """Atualiza uma correção de pH existente"""
+        return self._executar(lambda: self._atualizar('TABELA_CORRECOES_PH', id_correcao, kwargs),
+                              f"Correção de pH {id_correcao} atualizada com sucesso!",
+                              "Erro ao atualizar correção de pH")
+
+    def remover_correcao_ph(self, id_correcao: str) -> bool:
+        """Remove uma correção de pH"""
+        return self._executar(lambda: self._remover('TABELA_CORRECOES_PH', id_correcao),
+                              f"Correção de pH {id_correcao} removida com sucesso!", "Erro ao remover correção de pH")
+
+    # ========== CRUD PARA IRRIGACOES ==========
+
+    def inserir_irrigacao(self, id_irrigacao: str, volume_irrigacao: float,
+                          data_irrigacao: str, id_setor: str) -> bool:
+        """Insere uma nova irrigação"""
+        valores = (id_irrigacao, volume_irrigacao, data_irrigacao, id_setor)
+        return self._executar(lambda: self._inserir('TABELA_IRRIGACOES', valores),
+                              f"Irrigação {id_irrigacao} inserida com sucesso!", "Erro ao inserir irrigação")
+
+    def consultar_irrigacoes(self) -> List[Dict]:
+        """Consulta todas as irrigações"""
+        return self._linhas('TABELA_IRRIGACOES', ('area_setor', 'TABELA_SETORES', 1))
+
+    def atualizar_irrigacao(self, id_irrigacao: str, **kwargs) -> bool:
+        """Atualiza uma irrigação existente"""
+        return self._executar(lambda: self._atualizar('TABELA_IRRIGACOES', id_irrigacao, kwargs),
+                              f"Irrigação {id_irrigacao} atualizada com sucesso!", "Erro ao atualizar irrigação")
+
+    def remover_irrigacao(self, id_irrigacao: str) -> bool:
+        """Remove uma irrigação"""
+        return self._executar(lambda: self._remover('TABELA_IRRIGACOES', id_irrigacao),
+                              f"Irrigação {id_irrigacao} removida com sucesso!", "Erro ao remover irrigação")
+
+    # ========== INGESTÃO EM LOTE ==========
+
+    def inserir_medicoes_em_lote(self, medicoes: Iterable[Registro],
+                                 tamanho_lote: int = TAMANHO_LOTE_PADRAO,
+                                 exibir_resumo: bool = True) -> Dict:
+        """Como AgriculturalDatabase.inserir_medicoes_em_lote (repetidas contam em 'duplicados')."""
+        return self._inserir_em_lote('TABELA_MEDICOES', medicoes, tamanho_lote, exibir_resumo)
+
+    def inserir_irrigacoes_em_lote(self, irrigacoes: Iterable[Registro],
+                                   tamanho_lote: int = TAMANHO_LOTE_PADRAO,
+                                   exibir_resumo: bool = True) -> Dict:
+        """Insere muitas irrigações (id_irrigacao, volume_irrigacao, data_irrigacao, id_setor)"""
+        return self._inserir_em_lote('TABELA_IRRIGACOES', irrigacoes, tamanho_lote, exibir_resumo)
+
+    def inserir_aplicacoes_nutrientes_em_lote(self, aplicacoes: Iterable[Registro],
+                                              tamanho_lote: int = TAMANHO_LOTE_PADRAO,
+                                              exibir_resumo: bool = True) -> Dict:
+        """Insere muitas aplicações (id_aplicacao, tipo_aplicacao, volume_aplicacao, data_aplicacao, id_setor)"""
+        return self._inserir_em_lote('TABELA_APLICACOES_NUTRIENTES', aplicacoes, tamanho_lote, exibir_resumo)
+
+    def inserir_correcoes_ph_em_lote(self, correcoes: Iterable[Registro],
+                                     tamanho_lote: int = TAMANHO_LOTE_PADRAO,
+                                     exibir_resumo: bool = True) -> Dict:
+        """Insere muitas correções de pH (id_correcao, tipo_correcao, volume_correcao, data_correcao, id_setor)"""
+        return self._inserir_em_lote('TABELA_CORRECOES_PH', correcoes, tamanho_lote, exibir_resumo)
+
+    def _inserir_em_lote(self, tabela: str, registros: Iterable[Registro],
+                         tamanho_lote: int, exibir_resumo: bool) -> Dict:
+        """Valida os registros como o SQLite e os grava em lotes de `tamanho_lote`."""
+        colunas, numericas = COLUNAS_LOTE[tabela]
+        resultado = {'inseridos': 0, 'duplicados': 0, 'erros': []}
+        if tamanho_lote < 1:
+            tamanho_lote = TAMANHO_LOTE_PADRAO
+
+        lote = []
+        for indice, registro in enumerate(registros):
+            try:
+                lote.append((indice, AgriculturalDatabase._normalizar_registro(registro, colunas, numericas)))
+            except (TypeError, ValueError, KeyError) as e:
+                resultado['erros'].append((indice, f"Registro inválido: {e}"))
+                continue
+            if len(lote) >= tamanho_lote:
+                self._gravar_lote(tabela, lote, resultado)
+                lote = []
+        if lote:
+            self._gravar_lote(tabela, lote, resultado)
+
+        if exibir_resumo:
+            print(f"{tabela}: {resultado['inseridos']} registros inseridos, {resultado['duplicados']} duplicados, "
+                  f"{len(resultado['erros'])} com erro.")
+        return resultado
+
+    def _gravar_lote(self, tabela: str, lote: List[Tuple[int, tuple]], resultado: Dict):
+        if tabela == 'TABELA_MEDICOES':
+            parcial = self._gravar_medicoes(lote)
+            for chave in resultado:
+                resultado[chave] += parcial[chave]
+            return
+        for indice, valores in lote:
+            try:
+                self._inserir(tabela, valores)
+                resultado['inseridos'] += 1
+            except ErroMemoria as e:
+                resultado['erros'].append((indice, str(e)))
+
+    def _gravar_medicoes(self, lote: List[Tuple[int, tuple]]) -> Dict:
+        """
+        Grava um lote de medições (id_medicao, valor_medicao, data_medicao, id_sensor), com o
+        valor já convertido em float: as datas são convertidas em bloco e as repetidas
+        (mesmo id ou mesmo sensor e instante, inclusive dentro do lote) são descartadas e
+        contadas em 'duplicados'.
+        """
+        resultado = {'inseridos': 0, 'duplicados': 0, 'erros': []}
+        instantes, invalidas = _para_epochs([valores[2] for _, valores in lote])
+        colunas = self._medicoes
+        with self._lock:
+            posicao_id, posicao_chave, codigos = colunas.posicao_id, colunas.posicao_chave, colunas.codigos
+            aceitas, vistos = [], set()
+            for (indice, (id_medicao, valor, data, id_sensor)), instante, invalida in zip(
+                    lote, instantes.tolist(), invalidas.tolist()):
+                if invalida:
+                    resultado['erros'].append((indice, f"data_medicao inválida: {data}"))
+                    continue
+                codigo = codigos.get(id_sensor)
+                if codigo is None:
+                    codigo = colunas.codigo(id_sensor)
+                chave = (codigo, instante)
+                if (id_medicao in posicao_id or id_medicao in vistos
+                        or (codigo != SEM_SENSOR and (chave in posicao_chave or chave in vistos))):
+                    resultado['duplicados'] += 1
+                    continue
+                vistos.add(id_medicao)
+                vistos.add(chave)
+                aceitas.append((id_medicao, valor, instante, codigo))
+            if aceitas:
+                ids, valores, instantes_aceitos, codigos_aceitos = zip(*aceitas)
+                inicio = colunas.tamanho
+                colunas.anexar(list(ids), np.array(valores, dtype=np.float64), instantes_aceitos, codigos_aceitos)
+                self._registrar_ultimas(np.arange(inicio, colunas.tamanho))
+        resultado['inseridos'] = len(aceitas)
+        return resultado
+
+    def _registrar_ultimas(self, posicoes: np.ndarray):
+        """Atualiza os últimos valores só com a medição mais recente de cada sensor do lote."""
+        colunas = self._medicoes
+        posicoes = posicoes[colunas.sensor[posicoes] != SEM_SENSOR]
+        if not len(posicoes):
+            return
+        ordem = posicoes[np.lexsort((posicoes, colunas.instante[posicoes], colunas.sensor[posicoes]))]
+        sensores = colunas.sensor[ordem]
+        ultimas = ordem[np.r_[sensores[1:] != sensores[:-1], True]]
+        for posicao, data in zip(ultimas.tolist(), _para_texto(colunas.instante[ultimas])):
+            self.ultimos.registrar_medicao(colunas.sensores[colunas.sensor[posicao]], colunas.ids[posicao],
+                                           float(colunas.valor[posicao]), data)
+
+    # ========== CONSULTAS EM STREAMING ==========
+
+    def _posicoes_medicoes(self, id_sensor: Optional[str] = None, id_setor: Optional[str] = None,
+                           tipo_sensor: Optional[str] = None, inicio: Optional[str] = None,
+                           fim: Optional[str] = None) -> np.ndarray:
+        """Posições das medições ativas que atendem aos filtros (chamar com o lock)."""
+        colunas = self._medicoes
+        mascara = colunas.ativa[:colunas.tamanho].copy()
+        if id_sensor is not None:
+            mascara &= colunas.sensor[:colunas.tamanho] == colunas.codigos.get(id_sensor, -2)
+        if id_setor is not None or tipo_sensor is not None:
+            codigos = [colunas.codigos[id_cadastrado]
+                       for id_cadastrado, (_, tipo, setor) in self._tabelas['TABELA_SENSORES'].items()
+                       if id_cadastrado in colunas.codigos
+                       and (id_setor is None or setor == id_setor)
+                       and (tipo_sensor is None or tipo == tipo_sensor)]
+            mascara &= np.isin(colunas.sensor[:colunas.tamanho], codigos)
+        for limite, incluir in ((inicio, np.greater_equal), (fim, np.less)):
+            if limite is not None:
+                epoch = _para_epoch(limite)
+                # Como no SQLite, uma data de filtro inválida não seleciona nenhuma linha
+                mascara &= incluir(colunas.instante[:colunas.tamanho], epoch) if epoch is not None else False
+        return np.flatnonzero(mascara)
+
+    @staticmethod
+    def _validar_iteracao(formato: str, ordem: Optional[str]):
+        if formato not in FORMATOS_ITERACAO:
+            raise ValueError(f"Formato inválido: {formato}. Use um de {FORMATOS_ITERACAO}.")
+        if ordem and ordem.lower() not in ('asc', 'desc'):
+            raise ValueError(f"Ordem inválida: {ordem}. Use 'asc' ou 'desc'.")
+
+    def iterar_medicoes(self, id_sensor: Optional[str] = None, id_setor: Optional[str] = None,
+                        inicio: Optional[str] = None, fim: Optional[str] = None,
+                        tipo_sensor: Optional[str] = None, ordem: Optional[str] = None,
+                        limite: Optional[int] = None, formato: str = 'dict',
+                        tamanho_lote: int = TAMANHO_LOTE_PADRAO) -> Iterator[Any]:
+        """Mesmos filtros, formatos e colunas (inclusive `instante`) de AgriculturalDatabase.iterar_medicoes."""
+        self._validar_iteracao(formato, ordem)
+        colunas = self._medicoes
+        with self._lock:
+            posicoes = self._posicoes_medicoes(id_sensor, id_setor, tipo_sensor, inicio, fim)
+            if ordem:
+                posicoes = posicoes[np.argsort(colunas.instante[posicoes], kind='stable')]
+                if ordem.lower() == 'desc':
+                    posicoes = posicoes[::-1]
+            if limite is not None:
+                posicoes = posicoes[:max(0, int(limite))]
+            # Cópias tiradas sob o lock: o gerador não vê inserções feitas depois
+            instantes, valores, sensores = colunas.instante[posicoes], colunas.valor[posicoes], colunas.sensor[posicoes]
+            ids = [colunas.ids[posicao] for posicao in posicoes.tolist()]
+            nomes_sensores = list(colunas.sensores)
+        return self._gerar_medicoes(ids, valores, instantes, sensores, nomes_sensores, formato, max(1, tamanho_lote))
+
+    def _gerar_medicoes(self, ids, valores, instantes, sensores, nomes_sensores, formato, tamanho_lote):
+        cadastro = self._tabelas['TABELA_SENSORES']
+        nomes = COLUNAS_MEDICOES + ('tipo_sensor', 'id_setor', 'instante')
+        for inicio in range(0, len(ids), tamanho_lote):
+            fatia = slice(inicio, inicio + tamanho_lote)
+            ids_sensores = [nomes_sensores[codigo] if codigo != SEM_SENSOR else None
+                            for codigo in sensores[fatia].tolist()]
+            cadastrados = [cadastro.get(id_sensor) for id_sensor in ids_sensores]
+            bloco = (ids[fatia], valores[fatia].tolist(), _para_texto(instantes[fatia]), ids_sensores,
+                     [sensor[1] if sensor else None for sensor in cadastrados],
+                     [sensor[2] if sensor else None for sensor in cadastrados],
+                     instantes[fatia].tolist())
+            if formato == 'colunas':
+                yield dict(zip(nomes, (list(coluna) for coluna in bloco)))
+            elif formato == 'tupla':
+                yield from zip(*bloco)
+            else:
+                for linha in zip(*bloco):
+                    yield dict(zip(nomes, linha))
+
+    def _iterar_eventos(self, tabela: str, id_setor: Optional[str], inicio: Optional[str], fim: Optional[str],
+                        ordem: Optional[str], limite: Optional[int], formato: str,
+                        tamanho_lote: int) -> Iterator[Any]:
+        """Iterador das tabelas de eventos por setor, com a área do setor (como no SQLite)."""
+        self._validar_iteracao(formato, ordem)
+        coluna_data = COLUNAS_DATA[tabela]
+        with self._lock:
+            linhas = self._linhas(tabela, ('area_setor', 'TABELA_SETORES', 1))
+        # Comparação de texto, como a do SQLite sobre as datas "YYYY-MM-DD HH:MM:SS"
+        linhas = [linha for linha in linhas
+                  if (id_setor is None or linha['id_setor'] == id_setor)
+                  and (inicio is None or (linha[coluna_data] is not None and linha[coluna_data] >= inicio))
+                  and (fim is None or (linha[coluna_data] is not None and linha[coluna_data] < fim))]
+        if ordem:
+            # NULL vem primeiro no ASC do SQLite
+            linhas.sort(key=lambda linha: (linha[coluna_data] is not None, linha[coluna_data] or ''),
+                        reverse=ordem.lower() == 'desc')
+        if limite is not None:
+            linhas = linhas[:max(0, int(limite))]
+        return self._gerar_linhas(linhas, COLUNAS_TABELAS[tabela] + ('area_setor',), formato, max(1, tamanho_lote))
+
+    @staticmethod
+    def _gerar_linhas(linhas: List[Dict], nomes: Tuple[str, ...], formato: str,
+                      tamanho_lote: int) -> Iterator[Any]:
+        for inicio in range(0, len(linhas), tamanho_lote):
+            bloco = linhas[inicio:inicio + tamanho_lote]
+            if formato == 'dict':
+                yield from bloco
+            elif formato == 'tupla':
+                for linha in bloco:
+                    yield tuple(linha[nome] for nome in nomes)
+            else:
+                yield {nome: [linha[nome] for linha in bloco] for nome in nomes}
+
+    def iterar_irrigacoes(self, id_setor: Optional[str] = None,
+                          inicio: Optional[str] = None, fim: Optional[str] = None,
+                          ordem: Optional[str] = None, limite: Optional[int] = None,
+                          formato: str = 'dict',
+                          tamanho_lote: int = TAMANHO_LOTE_PADRAO) -> Iterator[Any]:
+        """Itera sobre as irrigações, com os mesmos filtros de tempo de iterar_medicoes"""
+        return self._iterar_eventos('TABELA_IRRIGACOES', id_setor, inicio, fim, ordem, limite, formato, tamanho_lote)
+
+    def iterar_aplicacoes_nutrientes(self, id_setor: Optional[str] = None,
+                                     inicio: Optional[str] = None, fim: Optional[str] = None,
+                                     ordem: Optional[str] = None, limite: Optional[int] = None,
+                                     formato: str = 'dict',
+                                     tamanho_lote: int = TAMANHO_LOTE_PADRAO) -> Iterator[Any]:
+        """Itera sobre as aplicações de nutrientes, filtrando por setor e data_aplicacao"""
+        return self._iterar_eventos('TABELA_APLICACOES_NUTRIENTES', id_setor, inicio, fim, ordem, limite,
+                                    formato, tamanho_lote)
+
+    def iterar_correcoes_ph(self, id_setor: Optional[str] = None,
+                            inicio: Optional[str] = None, fim: Optional[str] = None,
+                            ordem: Optional[str] = None, limite: Optional[int] = None,
+                            formato: str = 'dict',
+                            tamanho_lote: int = TAMANHO_LOTE_PADRAO) -> Iterator[Any]:
+        """Itera sobre as correções de pH, filtrando por setor e data_correcao"""
+        return self._iterar_eventos('TABELA_CORRECOES_PH', id_setor, inicio, fim, ordem, limite,
+                                    formato, tamanho_lote)
+
+    def consultar_medicoes_colunas(self, **filtros) -> Dict[str, list]:
+        """Retorna as medições filtradas como um dict de listas (aceita os argumentos de iterar_medicoes)."""
+        filtros['formato'] = 'colunas'
+        colunas: Dict[str, list] = {}
+        for bloco in self.iterar_medicoes(**filtros):
+            for nome, valores in bloco.items():
+                colunas.setdefault(nome, []).extend(valores)
+        return colunas
+
+    # ========== MÉTODOS AUXILIARES ==========
+
+    def alteracoes_do_setor(self, id_setor: str,
+                            marcas: Optional[Dict[str, int]] = None) -> Tuple[Dict[str, int], Optional[str]]:
+        """Como AgriculturalDatabase.alteracoes_do_setor; as marcas são posições de inserção."""
+        colunas = self._medicoes
+        with self._lock:
+            atuais = {'medicoes': colunas.tamanho, 'irrigacoes': len(self._alteracoes_irrigacoes)}
+            if marcas is None:
+                return atuais, None
+            datas = [data for setor, data in self._alteracoes_irrigacoes[marcas.get('irrigacoes', 0):]
+                     if setor == id_setor and data is not None]
+            codigos = [colunas.codigos[id_sensor] for id_sensor, sensor in self._tabelas['TABELA_SENSORES'].items()
+                       if sensor[2] == id_setor and id_sensor in colunas.codigos]
+            novas = slice(marcas.get('medicoes', 0), colunas.tamanho)
+            instantes = colunas.instante[novas][np.isin(colunas.sensor[novas], codigos) & colunas.ativa[novas]]
+        if len(instantes):
+            datas.append(_para_texto(instantes.min(keepdims=True))[0])
+        return atuais, min(datas) if datas else None
+
+    def obter_relatorio_setor(self, id_setor: str) -> Dict:
+        """Obtém um relatório completo de um setor (tuplas na ordem das colunas do SQLite)"""
+        setor = self._tabelas['TABELA_SETORES'].get(id_setor)
+        if not setor:
+            return {}
+        cultura = self._tabelas['TABELA_CULTURAS'].get(setor[2])
+        sensores = [tuple(sensor) for sensor in self._tabelas['TABELA_SENSORES'].values() if sensor[2] == id_setor]
+        medicoes = [(m['id_medicao'], m['valor_medicao'], m['data_medicao'], m['id_sensor'], m['tipo_sensor'])
+                    for m in self.iterar_medicoes(id_setor=id_setor, ordem='desc', limite=10)]
+        irrigacoes = [tuple(linha[nome] for nome in COLUNAS_TABELAS['TABELA_IRRIGACOES'])
+                      for linha in self.iterar_irrigacoes(id_setor=id_setor, ordem='desc', limite=5)]
+        return {
+            'setor': tuple(setor) + (cultura[1] if cultura else None,),
+            'sensores': sensores,
+            'medicoes_recentes': medicoes,
+            'irrigacoes_recentes': irrigacoes,
+        }
+
+    def listar_todas_tabelas(self):
+        """Lista o conteúdo de todas as tabelas"""
+        tabelas = ['TABELA_CULTURAS', 'TABELA_SETORES', 'TABELA_SENSORES', 'TABELA_MEDICOES',
+                   'TABELA_APLICACOES_NUTRIENTES', 'TABELA_CORRECOES_PH', 'TABELA_IRRIGACOES']
+        for tabela in tabelas:
+            print(f"\n=== {tabela} ===")
+            if tabela == 'TABELA_MEDICOES':
+                colunas, registros = COLUNAS_MEDICOES, [linha[:4] for linha in self.iterar_medicoes(formato='tupla')]
+            else:
+                colunas, registros = COLUNAS_TABELAS[tabela], [tuple(linha) for linha in self._tabelas[tabela].values()]
+            if registros:
+                print(f"Colunas: {', '.join(colunas)}")
+                for registro in registros:
+                    print(registro)
+            else:
+                print("Nenhum registro encontrado")
+
+
+def backend_no_ambiente() -> str:
+    """Backend escolhido pela variável de ambiente IRRIGACAO_BACKEND (padrão: 'arquivo')."""
+    return os.environ.get(VARIAVEL_BACKEND, '').strip().lower() or 'arquivo'
+
+
+def criar_banco(backend: Optional[str] = None, db_name: str = "data/agricultural_system.db",
+                semente: Optional[str] = None, **kwargs):
+    """
+    Cria o banco no backend pedido (ver BACKENDS); se None, segue IRRIGACAO_BACKEND.
+
+    Args:
+        db_name (str): Arquivo do backend 'arquivo'.
+        semente (str): Nos backends em memória, banco SQLite copiado para o novo banco
+                       (em uma única operação).
+        **kwargs: Demais argumentos de AgriculturalDatabase (ex.: pooled, verboso); o
+                  MemoryDatabase usa apenas agregados_automaticos e verboso.
+    """
+    backend = backend or backend_no_ambiente()
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend inválido: {backend}. Use um de {BACKENDS}.")
+    if backend == 'arquivo':
+        return AgriculturalDatabase(db_name=db_name, **kwargs)
+    if backend == 'sqlite_memoria':
+        banco = AgriculturalDatabase(db_name=BANCO_EM_MEMORIA, **kwargs)
+    else:
+        banco = MemoryDatabase(**{nome: kwargs[nome] for nome in ('agregados_automaticos', 'verboso') if nome in kwargs})
+    if semente:
+        banco.carregar_de_arquivo(semente)
+    return banco
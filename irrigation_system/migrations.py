@@ -0,0 +1,734 @@
+# migrations.py
+
+import sqlite3
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+# Tabela que registra quais migrações já foram aplicadas ao arquivo
+TABELA_VERSAO = "TABELA_VERSAO_SCHEMA"
+
+
+def _migracao_001_tabelas_base(cursor: sqlite3.Cursor):
+    """Cria as tabelas originais do sistema (idempotente para bancos já existentes)."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS TABELA_SENSORES (
+            id_sensor VARCHAR(10) PRIMARY KEY,
+            tipo_sensor VARCHAR(10),
+            id_setor VARCHAR(10)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS TABELA_SETORES (
+            id_setor VARCHAR(10) PRIMARY KEY,
+            area_setor DECIMAL(9,2),
+            id_cultura VARCHAR(10)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS TABELA_CULTURAS (
+            id_cultura VARCHAR(10) PRIMARY KEY,
+            nome_cultura VARCHAR(50),
+            ph_minimo_ideal DECIMAL(10,5),
+            ph_maximo_ideal DECIMAL(10,5),
+            fosforo_minimo_ideal DECIMAL(10,5),
+            fosforo_maximo_ideal DECIMAL(10,5),
+            potassio_minimo_ideal DECIMAL(10,5),
+            potassio_maximo_ideal DECIMAL(10,5),
+            umidade_minima_ideal DECIMAL(10,5),
+            umidade_maxima_ideal DECIMAL(10,5)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS TABELA_MEDICOES (
+            id_medicao VARCHAR(10) PRIMARY KEY,
+            valor_medicao DECIMAL(10,5),
+            data_medicao DATETIME,
+            id_sensor VARCHAR(10),
+            FOREIGN KEY (id_sensor) REFERENCES TABELA_SENSORES(id_sensor)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS TABELA_APLICACOES_NUTRIENTES (
+            id_aplicacao_nutriente VARCHAR(10) PRIMARY KEY,
+            tipo_aplicacao VARCHAR(50),
+            volume_aplicacao DECIMAL(10,2),
+            data_aplicacao DATETIME,
+            id_setor VARCHAR(10),
+            FOREIGN KEY (id_setor) REFERENCES TABELA_SETORES(id_setor)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS TABELA_CORRECOES_PH (
+            id_correcao_ph VARCHAR(10) PRIMARY KEY,
+            tipo_correcao VARCHAR(50),
+            volume_correcao DECIMAL(10,2),
+            data_correcao DATETIME,
+            id_setor VARCHAR(10),
+            FOREIGN KEY (id_setor) REFERENCES TABELA_SETORES(id_setor)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS TABELA_IRRIGACOES (
+            id_irrigacao VARCHAR(10) PRIMARY KEY,
+            volume_irrigacao DECIMAL(10,2),
+            data_irrigacao DATETIME,
+            id_setor VARCHAR(10),
+            FOREIGN KEY (id_setor) REFERENCES TABELA_SETORES(id_setor)
+        )
+    ''')
+
+
+def _migracao_002_indices_secundarios(cursor: sqlite3.Cursor):
+    """
+    Cria os índices usados pelas consultas por setor/sensor e ordenadas por data.
+    O índice de medições inclui o valor para cobrir a consulta de treinamento sem
+    voltar à tabela.
+    """
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS IDX_MEDICOES_SENSOR_DATA
+        ON TABELA_MEDICOES (id_sensor, data_medicao, valor_medicao)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS IDX_MEDICOES_DATA
+        ON TABELA_MEDICOES (data_medicao)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS IDX_SENSORES_SETOR
+        ON TABELA_SENSORES (id_setor, id_sensor, tipo_sensor)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS IDX_IRRIGACOES_SETOR_DATA
+        ON TABELA_IRRIGACOES (id_setor, data_irrigacao)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS IDX_APLICACOES_SETOR_DATA
+        ON TABELA_APLICACOES_NUTRIENTES (id_setor, data_aplicacao)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS IDX_CORRECOES_SETOR_DATA
+        ON TABELA_CORRECOES_PH (id_setor, data_correcao)
+    ''')
+
+
+def _migracao_003_remover_tabelas_new(cursor: sqlite3.Cursor):
+    """
+    Remove as tabelas TABELA_SENSORES_NEW e TABELA_SETORES_NEW criadas pelas versões
+    antigas de create_tables. Nunca foram usadas; só são removidas se estiverem vazias.
+    """
+    for tabela in ('TABELA_SENSORES_NEW', 'TABELA_SETORES_NEW'):
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (tabela,))
+        if cursor.fetchone() is None:
+            continue
+        cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {tabela})")
+        if not cursor.fetchone()[0]:
+            cursor.execute(f"DROP TABLE {tabela}")
+
+
+def _migracao_004_agregados_medicoes(cursor: sqlite3.Cursor):
+    """
+    Cria as tabelas de agregados por sensor (por hora e por dia) e a tabela de
+    controle que guarda a marca d'água (último rowid de TABELA_MEDICOES já agregado).
+    """
+    for tabela, coluna_periodo in (('TABELA_MEDICOES_HORA', 'hora'), ('TABELA_MEDICOES_DIA', 'dia')):
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {tabela} (
+                id_sensor VARCHAR(10) NOT NULL,
+                {coluna_periodo} DATETIME NOT NULL,
+                quantidade INTEGER NOT NULL,
+                soma REAL NOT NULL,
+                minimo REAL NOT NULL,
+                maximo REAL NOT NULL,
+                ultimo_valor REAL NOT NULL,
+                data_ultimo DATETIME NOT NULL,
+                PRIMARY KEY (id_sensor, {coluna_periodo})
+            ) WITHOUT ROWID
+        ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS TABELA_CONTROLE_AGREGADOS (
+            nome VARCHAR(50) PRIMARY KEY,
+            watermark INTEGER NOT NULL
+        )
+    ''')
+
+
+def _migracao_005_ultimos_valores(cursor: sqlite3.Cursor):
+    """
+    Cria as tabelas com a última medição de cada sensor e a última irrigação de
+    cada setor, mantidas por gatilhos AFTER INSERT (valem para qualquer caminho de
+    inserção, inclusive outros processos), e as preenche com os dados existentes.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS TABELA_ULTIMAS_MEDICOES (
+            id_sensor VARCHAR(10) PRIMARY KEY,
+            id_medicao VARCHAR(10),
+            valor_medicao DECIMAL(10,5),
+            data_medicao DATETIME NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS IDX_ULTIMAS_MEDICOES_DATA
+        ON TABELA_ULTIMAS_MEDICOES (data_medicao)
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS TABELA_ULTIMAS_IRRIGACOES (
+            id_setor VARCHAR(10) PRIMARY KEY,
+            id_irrigacao VARCHAR(10),
+            volume_irrigacao DECIMAL(10,2),
+            data_irrigacao DATETIME NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS IDX_ULTIMAS_IRRIGACOES_DATA
+        ON TABELA_ULTIMAS_IRRIGACOES (data_irrigacao)
+    ''')
+    # Só substitui o valor guardado se a nova linha não for mais antiga (dados atrasados)
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS TRG_MEDICOES_ULTIMA_MEDICAO
+        AFTER INSERT ON TABELA_MEDICOES
+        WHEN NEW.id_sensor IS NOT NULL AND NEW.data_medicao IS NOT NULL
+        BEGIN
+            INSERT INTO TABELA_ULTIMAS_MEDICOES (id_sensor, id_medicao, valor_medicao, data_medicao)
+            VALUES (NEW.id_sensor, NEW.id_medicao, NEW.valor_medicao, NEW.data_medicao)
+            ON CONFLICT(id_sensor) DO UPDATE SET
+                id_medicao = excluded.id_medicao,
+                valor_medicao = excluded.valor_medicao,
+                data_medicao = excluded.data_medicao
+            WHERE excluded.data_medicao >= TABELA_ULTIMAS_MEDICOES.data_medicao;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS TRG_IRRIGACOES_ULTIMA_IRRIGACAO
+        AFTER INSERT ON TABELA_IRRIGACOES
+        WHEN NEW.id_setor IS NOT NULL AND NEW.data_irrigacao IS NOT NULL
+        BEGIN
+            INSERT INTO TABELA_ULTIMAS_IRRIGACOES (id_setor, id_irrigacao, volume_irrigacao, data_irrigacao)
+            VALUES (NEW.id_setor, NEW.id_irrigacao, NEW.volume_irrigacao, NEW.data_irrigacao)
+            ON CONFLICT(id_setor) DO UPDATE SET
+                id_irrigacao = excluded.id_irrigacao,
+                volume_irrigacao = excluded.volume_irrigacao,
+                data_irrigacao = excluded.data_irrigacao
+            WHERE excluded.data_irrigacao >= TABELA_ULTIMAS_IRRIGACOES.data_irrigacao;
+        END
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO TABELA_ULTIMAS_MEDICOES (id_sensor, id_medicao, valor_medicao, data_medicao)
+        SELECT id_sensor, id_medicao, valor_medicao, data_medicao
+        FROM (
+            SELECT id_sensor, id_medicao, valor_medicao, data_medicao,
+                   ROW_NUMBER() OVER (PARTITION BY id_sensor ORDER BY data_medicao DESC, rowid DESC) AS posicao
+            FROM TABELA_MEDICOES
+            WHERE id_sensor IS NOT NULL AND data_medicao IS NOT NULL
+        )
+        WHERE posicao = 1
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO TABELA_ULTIMAS_IRRIGACOES (id_setor, id_irrigacao, volume_irrigacao, data_irrigacao)
+        SELECT id_setor, id_irrigacao, volume_irrigacao, data_irrigacao
+        FROM (
+            SELECT id_setor, id_irrigacao, volume_irrigacao, data_irrigacao,
+                   ROW_NUMBER() OVER (PARTITION BY id_setor ORDER BY data_irrigacao DESC, rowid DESC) AS posicao
+            FROM TABELA_IRRIGACOES
+            WHERE id_setor IS NOT NULL AND data_irrigacao IS NOT NULL
+        )
+        WHERE posicao = 1
+    ''')
+
+
+def _migracao_006_medicao_unica_por_sensor_e_instante(cursor: sqlite3.Cursor):
+    """
+    Torna (id_sensor, data_medicao) a chave natural das medições. As duplicadas já
+    gravadas (reenvios com outro id_medicao) são removidas, mantendo a primeira, e o
+    índice por sensor e data passa a ser UNIQUE. Ele deixa de cobrir valor_medicao,
+    mas manter um segundo índice quase igual custaria mais em cada inserção.
+
+    Se houve remoção, os agregados são zerados (e recalculados ao abrir o banco) e
+    os últimos valores que apontavam para uma linha removida passam a apontar para
+    a linha mantida.
+    """
+    cursor.execute('''
+        DELETE FROM TABELA_MEDICOES
+        WHERE rowid IN (
+            SELECT rowid FROM (
+                SELECT rowid,
+                       ROW_NUMBER() OVER (PARTITION BY id_sensor, data_medicao ORDER BY rowid) AS posicao
+                FROM TABELA_MEDICOES
+                WHERE id_sensor IS NOT NULL AND data_medicao IS NOT NULL
+            )
+            WHERE posicao > 1
+        )
+    ''')
+    removidas = cursor.rowcount
+    cursor.execute("DROP INDEX IF EXISTS IDX_MEDICOES_SENSOR_DATA")
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS IDX_MEDICOES_SENSOR_DATA
+        ON TABELA_MEDICOES (id_sensor, data_medicao)
+    ''')
+    if removidas > 0:
+        cursor.execute("DELETE FROM TABELA_MEDICOES_HORA")
+        cursor.execute("DELETE FROM TABELA_MEDICOES_DIA")
+        cursor.execute("DELETE FROM TABELA_CONTROLE_AGREGADOS WHERE nome = 'medicoes'")
+        cursor.execute('''
+            UPDATE TABELA_ULTIMAS_MEDICOES
+            SET (id_medicao, valor_medicao) = (
+                SELECT m.id_medicao, m.valor_medicao FROM TABELA_MEDICOES m
+                WHERE m.id_sensor = TABELA_ULTIMAS_MEDICOES.id_sensor
+                  AND m.data_medicao = TABELA_ULTIMAS_MEDICOES.data_medicao
+            )
+            WHERE id_medicao NOT IN (SELECT id_medicao FROM TABELA_MEDICOES)
+        ''')
+
+
+def _migracao_007_medicoes_compactas(cursor: sqlite3.Cursor) -> Optional[str]:
+    """
+    Grava as medições em um layout compacto e mantém TABELA_MEDICOES como visão.
+
+    TABELA_MEDICOES_COMPACTA usa uma chave INTEGER (o próprio rowid, preservado na
+    cópia, então as marcas d'água dos agregados e do arquivo continuam valendo),
+    o sensor como inteiro via TABELA_CHAVES_SENSORES, o instante em segundos desde
+    a época (UTC, como strftime('%s')) e o valor em REAL. O id_medicao original é
+    mantido para as operações por ID e a idempotência dos reenvios.
+
+    Antes da cópia, as linhas sem data ou com uma data que o SQLite não interpreta
+    vão para TABELA_MEDICOES_REJEITADAS (com o texto original), em vez de virarem
+    instante NULL, e as repetidas no instante convertido (ex.: "2025-06-20 10:00:00"
+    e "2025-06-20T10:00:00", ou datas que diferem só nas frações de segundo) são
+    removidas, mantendo a primeira, como na migração 6.
+
+    A visão TABELA_MEDICOES expõe as colunas antigas (data_medicao como texto
+    "YYYY-MM-DD HH:MM:SS") e gatilhos INSTEAD OF encaminham INSERT, UPDATE e DELETE
+    à tabela compacta, de modo que o CRUD e as consultas existentes seguem iguais.
+    O espaço da tabela antiga só volta ao sistema de arquivos depois de um VACUUM.
+
+    Returns:
+        Optional[str]: Aviso com o número de medições removidas e rejeitadas (None se
+                       nenhuma foi).
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS TABELA_CHAVES_SENSORES (
+            chave_sensor INTEGER PRIMARY KEY,
+            id_sensor VARCHAR(10) NOT NULL UNIQUE
+        )
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO TABELA_CHAVES_SENSORES (id_sensor)
+        SELECT id_sensor FROM TABELA_SENSORES WHERE id_sensor IS NOT NULL
+        UNION
+        SELECT DISTINCT id_sensor FROM TABELA_MEDICOES WHERE id_sensor IS NOT NULL
+        ORDER BY 1
+    ''')
+    cursor.execute('''
+        CREATE TABLE TABELA_MEDICOES_COMPACTA (
+            id_registro INTEGER PRIMARY KEY,
+            chave_sensor INTEGER REFERENCES TABELA_CHAVES_SENSORES (chave_sensor),
+            instante INTEGER,
+            valor REAL,
+            id_medicao VARCHAR(10) UNIQUE
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS TABELA_MEDICOES_REJEITADAS (
+            id_medicao VARCHAR(10),
+            valor_medicao DECIMAL(10,5),
+            data_medicao TEXT,
+            id_sensor VARCHAR(10),
+            motivo VARCHAR(100)
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO TABELA_MEDICOES_REJEITADAS (id_medicao, valor_medicao, data_medicao, id_sensor, motivo)
+        SELECT id_medicao, valor_medicao, data_medicao, id_sensor,
+               CASE WHEN data_medicao IS NULL THEN 'data_medicao ausente' ELSE 'data_medicao inválida' END
+        FROM TABELA_MEDICOES
+        WHERE strftime('%s', data_medicao) IS NULL
+        ORDER BY rowid
+    ''')
+    rejeitadas = cursor.rowcount
+    cursor.execute("DELETE FROM TABELA_MEDICOES WHERE strftime('%s', data_medicao) IS NULL")
+    cursor.execute('''
+        DELETE FROM TABELA_MEDICOES
+        WHERE rowid IN (
+            SELECT rowid FROM (
+                SELECT rowid,
+                       ROW_NUMBER() OVER (PARTITION BY id_sensor, CAST(strftime('%s', data_medicao) AS INTEGER)
+                                          ORDER BY rowid) AS posicao
+                FROM TABELA_MEDICOES
+                WHERE id_sensor IS NOT NULL
+            )
+            WHERE posicao > 1
+        )
+    ''')
+    removidas = cursor.rowcount
+    cursor.execute('''
+        INSERT INTO TABELA_MEDICOES_COMPACTA (id_registro, chave_sensor, instante, valor, id_medicao)
+        SELECT m.rowid, k.chave_sensor, CAST(strftime('%s', m.data_medicao) AS INTEGER),
+               CAST(m.valor_medicao AS REAL), m.id_medicao
+        FROM TABELA_MEDICOES m
+        LEFT JOIN TABELA_CHAVES_SENSORES k ON k.id_sensor = m.id_sensor
+        ORDER BY m.rowid
+    ''')
+    # Remove também os índices e o gatilho de últimos valores da tabela antiga
+    cursor.execute("DROP TABLE TABELA_MEDICOES")
+    cursor.execute('''
+        CREATE UNIQUE INDEX IDX_MEDICOES_SENSOR_INSTANTE
+        ON TABELA_MEDICOES_COMPACTA (chave_sensor, instante)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IDX_MEDICOES_INSTANTE
+        ON TABELA_MEDICOES_COMPACTA (instante)
+    ''')
+
+    cursor.execute('''
+        CREATE VIEW TABELA_MEDICOES AS
+        SELECT m.id_medicao, m.valor AS valor_medicao,
+               datetime(m.instante, 'unixepoch') AS data_medicao, k.id_sensor
+        FROM TABELA_MEDICOES_COMPACTA m
+        LEFT JOIN TABELA_CHAVES_SENSORES k ON k.chave_sensor = m.chave_sensor
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER TRG_MEDICOES_INSERIR
+        INSTEAD OF INSERT ON TABELA_MEDICOES
+        BEGIN
+            INSERT OR IGNORE INTO TABELA_CHAVES_SENSORES (id_sensor)
+            SELECT NEW.id_sensor WHERE NEW.id_sensor IS NOT NULL;
+            INSERT INTO TABELA_MEDICOES_COMPACTA (chave_sensor, instante, valor, id_medicao)
+            VALUES ((SELECT chave_sensor FROM TABELA_CHAVES_SENSORES WHERE id_sensor = NEW.id_sensor),
+                    CAST(strftime('%s', NEW.data_medicao) AS INTEGER),
+                    CAST(NEW.valor_medicao AS REAL), NEW.id_medicao);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER TRG_MEDICOES_ATUALIZAR
+        INSTEAD OF UPDATE ON TABELA_MEDICOES
+        BEGIN
+            INSERT OR IGNORE INTO TABELA_CHAVES_SENSORES (id_sensor)
+            SELECT NEW.id_sensor WHERE NEW.id_sensor IS NOT NULL;
+            UPDATE TABELA_MEDICOES_COMPACTA
+            SET chave_sensor = (SELECT chave_sensor FROM TABELA_CHAVES_SENSORES WHERE id_sensor = NEW.id_sensor),
+                instante = CAST(strftime('%s', NEW.data_medicao) AS INTEGER),
+                valor = CAST(NEW.valor_medicao AS REAL),
+                id_medicao = NEW.id_medicao
+            WHERE id_medicao = OLD.id_medicao;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER TRG_MEDICOES_REMOVER
+        INSTEAD OF DELETE ON TABELA_MEDICOES
+        BEGIN
+            DELETE FROM TABELA_MEDICOES_COMPACTA WHERE id_medicao = OLD.id_medicao;
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER TRG_MEDICOES_ULTIMA_MEDICAO
+        AFTER INSERT ON TABELA_MEDICOES_COMPACTA
+        WHEN NEW.chave_sensor IS NOT NULL AND NEW.instante IS NOT NULL
+        BEGIN
+            INSERT INTO TABELA_ULTIMAS_MEDICOES (id_sensor, id_medicao, valor_medicao, data_medicao)
+            SELECT id_sensor, NEW.id_medicao, NEW.valor, datetime(NEW.instante, 'unixepoch')
+            FROM TABELA_CHAVES_SENSORES WHERE chave_sensor = NEW.chave_sensor
+            ON CONFLICT(id_sensor) DO UPDATE SET
+                id_medicao = excluded.id_medicao,
+                valor_medicao = excluded.valor_medicao,
+                data_medicao = excluded.data_medicao
+            WHERE excluded.data_medicao >= TABELA_ULTIMAS_MEDICOES.data_medicao;
+        END
+    ''')
+
+    # Últimos valores no texto da visão, o que a comparação do gatilho acima espera
+    cursor.execute('''
+        UPDATE TABELA_ULTIMAS_MEDICOES SET data_medicao = datetime(data_medicao)
+        WHERE datetime(data_medicao) <> data_medicao
+    ''')
+    if removidas or rejeitadas:
+        cursor.execute("DELETE FROM TABELA_MEDICOES_HORA")
+        cursor.execute("DELETE FROM TABELA_MEDICOES_DIA")
+        cursor.execute("DELETE FROM TABELA_CONTROLE_AGREGADOS WHERE nome = 'medicoes'")
+        # Os que apontavam para uma linha removida ou rejeitada passam para a medição
+        # mais recente que ficou do sensor (ou saem, se não sobrou nenhuma válida)
+        cursor.execute('''
+            UPDATE TABELA_ULTIMAS_MEDICOES
+            SET (id_medicao, valor_medicao, data_medicao) = (
+                SELECT m.id_medicao, m.valor, datetime(m.instante, 'unixepoch')
+                FROM TABELA_MEDICOES_COMPACTA m
+                JOIN TABELA_CHAVES_SENSORES k ON k.chave_sensor = m.chave_sensor
+                WHERE k.id_sensor = TABELA_ULTIMAS_MEDICOES.id_sensor
+                ORDER BY m.instante DESC, m.id_registro DESC
+                LIMIT 1
+            )
+            WHERE id_medicao NOT IN (SELECT id_medicao FROM TABELA_MEDICOES_COMPACTA WHERE id_medicao IS NOT NULL)
+              AND id_sensor IN (SELECT k.id_sensor FROM TABELA_CHAVES_SENSORES k
+                                JOIN TABELA_MEDICOES_COMPACTA m ON m.chave_sensor = k.chave_sensor)
+        ''')
+        cursor.execute("DELETE FROM TABELA_ULTIMAS_MEDICOES WHERE datetime(data_medicao) IS NULL")
+        return (f"Migração 7: {removidas} medições repetidas no mesmo sensor e instante removidas; "
+                f"{rejeitadas} com data inválida movidas para TABELA_MEDICOES_REJEITADAS.")
+    return None
+
+
+def _migracao_008_rejeitar_datas_invalidas(cursor: sqlite3.Cursor):
+    """
+    Os gatilhos da visão TABELA_MEDICOES passam a recusar datas que o SQLite não
+    interpreta (e datas ausentes), em vez de gravar instante NULL: uma linha assim
+    nunca colidiria no índice único e cada reenvio seria gravado de novo. Os caminhos
+    em lote validam a data antes (database.normalizar_data).
+    """
+    cursor.execute("DROP TRIGGER IF EXISTS TRG_MEDICOES_INSERIR")
+    cursor.execute("DROP TRIGGER IF EXISTS TRG_MEDICOES_ATUALIZAR")
+    cursor.execute('''
+        CREATE TRIGGER TRG_MEDICOES_INSERIR
+        INSTEAD OF INSERT ON TABELA_MEDICOES
+        BEGIN
+            SELECT RAISE(ABORT, 'data_medicao inválida') WHERE strftime('%s', NEW.data_medicao) IS NULL;
+            INSERT OR IGNORE INTO TABELA_CHAVES_SENSORES (id_sensor)
+            SELECT NEW.id_sensor WHERE NEW.id_sensor IS NOT NULL;
+            INSERT INTO TABELA_MEDICOES_COMPACTA (chave_sensor, instante, valor, id_medicao)
+            VALUES ((SELECT chave_sensor FROM TABELA_CHAVES_SENSORES WHERE id_sensor = NEW.id_sensor),
+                    CAST(strftime('%s', NEW.data_medicao) AS INTEGER),
+                    CAST(NEW.valor_medicao AS REAL), NEW.id_medicao);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER TRG_MEDICOES_ATUALIZAR
+        INSTEAD OF UPDATE ON TABELA_MEDICOES
+        BEGIN
+            SELECT RAISE(ABORT, 'data_medicao inválida') WHERE strftime('%s', NEW.data_medicao) IS NULL;
+            INSERT OR IGNORE INTO TABELA_CHAVES_SENSORES (id_sensor)
+            SELECT NEW.id_sensor WHERE NEW.id_sensor IS NOT NULL;
+            UPDATE TABELA_MEDICOES_COMPACTA
+            SET chave_sensor = (SELECT chave_sensor FROM TABELA_CHAVES_SENSORES WHERE id_sensor = NEW.id_sensor),
+                instante = CAST(strftime('%s', NEW.data_medicao) AS INTEGER),
+                valor = CAST(NEW.valor_medicao AS REAL),
+                id_medicao = NEW.id_medicao
+            WHERE id_medicao = OLD.id_medicao;
+        END
+    ''')
+
+
+def _migracao_009_ids_de_medicao_sem_reuso(cursor: sqlite3.Cursor):
+    """
+    Recria TABELA_MEDICOES_COMPACTA com id_registro AUTOINCREMENT. Sem ele, o SQLite
+    volta a usar o maior id_registro quando a linha que o tinha é removida, e a nova
+    medição fica na faixa que as marcas d'água (agregados, retenção, arquivo e
+    features) já consideram processada. A sequência parte do maior valor entre o
+    último id_registro e a marca d'água dos agregados, que pode estar acima dele se a
+    última medição já tiver sido removida.
+
+    A visão TABELA_MEDICOES, os gatilhos e os índices que dependem da tabela são
+    removidos e recriados com o mesmo SQL; os id_registro existentes são mantidos.
+    """
+    cursor.execute('''
+        SELECT sql FROM sqlite_master
+        WHERE sql IS NOT NULL AND type IN ('index', 'trigger')
+          AND tbl_name IN ('TABELA_MEDICOES_COMPACTA', 'TABELA_MEDICOES')
+        ORDER BY type
+    ''')
+    dependentes = [linha[0] for linha in cursor.fetchall()]
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'view' AND name = 'TABELA_MEDICOES'")
+    visao = cursor.fetchone()[0]
+    cursor.execute('''
+        SELECT MAX(COALESCE((SELECT MAX(id_registro) FROM TABELA_MEDICOES_COMPACTA), 0),
+                   COALESCE((SELECT watermark FROM TABELA_CONTROLE_AGREGADOS WHERE nome = 'medicoes'), 0))
+    ''')
+    sequencia = cursor.fetchone()[0]
+
+    # Remover a visão remove também os gatilhos INSTEAD OF, e remover a tabela, os índices
+    cursor.execute("DROP VIEW TABELA_MEDICOES")
+    cursor.execute('''
+        CREATE TABLE TABELA_MEDICOES_COMPACTA_NOVA (
+            id_registro INTEGER PRIMARY KEY AUTOINCREMENT,
+            chave_sensor INTEGER REFERENCES TABELA_CHAVES_SENSORES (chave_sensor),
+            instante INTEGER,
+            valor REAL,
+            id_medicao VARCHAR(10) UNIQUE
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO TABELA_MEDICOES_COMPACTA_NOVA (id_registro, chave_sensor, instante, valor, id_medicao)
+        SELECT id_registro, chave_sensor, instante, valor, id_medicao
+        FROM TABELA_MEDICOES_COMPACTA
+        ORDER BY id_registro
+    ''')
+    cursor.execute("DROP TABLE TABELA_MEDICOES_COMPACTA")
+    cursor.execute("ALTER TABLE TABELA_MEDICOES_COMPACTA_NOVA RENAME TO TABELA_MEDICOES_COMPACTA")
+    cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'TABELA_MEDICOES_COMPACTA'")
+    cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('TABELA_MEDICOES_COMPACTA', ?)", (sequencia,))
+
+    cursor.execute(visao)
+    for sql in dependentes:
+        cursor.execute(sql)
+
+
+def _migracao_010_agregados_pendentes(cursor: sqlite3.Cursor):
+    """
+    Cria TABELA_AGREGADOS_PENDENTES e os gatilhos que anotam nela o sensor e a hora
+    de cada medição já agregada (id_registro até a marca d'água) que é removida ou
+    alterada; SensorRollups.atualizar() recalcula essas horas. Na alteração entram a
+    hora antiga e a nova. As remoções feitas pela retenção, que apaga de propósito
+    medições já agregadas, são ignoradas enquanto a linha 'retencao' existir em
+    TABELA_CONTROLE_AGREGADOS (ela só existe dentro da transação da retenção).
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS TABELA_AGREGADOS_PENDENTES (
+            chave_sensor INTEGER NOT NULL,
+            hora DATETIME NOT NULL,
+            PRIMARY KEY (chave_sensor, hora)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER TRG_MEDICOES_AGREGADOS_REMOVER
+        AFTER DELETE ON TABELA_MEDICOES_COMPACTA
+        WHEN OLD.chave_sensor IS NOT NULL AND OLD.instante IS NOT NULL
+         AND OLD.id_registro <= COALESCE((SELECT watermark FROM TABELA_CONTROLE_AGREGADOS WHERE nome = 'medicoes'), 0)
+         AND NOT EXISTS (SELECT 1 FROM TABELA_CONTROLE_AGREGADOS WHERE nome = 'retencao')
+        BEGIN
+            INSERT OR IGNORE INTO TABELA_AGREGADOS_PENDENTES (chave_sensor, hora)
+            VALUES (OLD.chave_sensor, strftime('%Y-%m-%d %H:00:00', OLD.instante, 'unixepoch'));
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER TRG_MEDICOES_AGREGADOS_ATUALIZAR
+        AFTER UPDATE OF chave_sensor, instante, valor ON TABELA_MEDICOES_COMPACTA
+        WHEN OLD.id_registro <= COALESCE((SELECT watermark FROM TABELA_CONTROLE_AGREGADOS WHERE nome = 'medicoes'), 0)
+        BEGIN
+            INSERT OR IGNORE INTO TABELA_AGREGADOS_PENDENTES (chave_sensor, hora)
+            SELECT OLD.chave_sensor, strftime('%Y-%m-%d %H:00:00', OLD.instante, 'unixepoch')
+            WHERE OLD.chave_sensor IS NOT NULL AND OLD.instante IS NOT NULL
+            UNION
+            SELECT NEW.chave_sensor, strftime('%Y-%m-%d %H:00:00', NEW.instante, 'unixepoch')
+            WHERE NEW.chave_sensor IS NOT NULL AND NEW.instante IS NOT NULL;
+        END
+    ''')
+
+
+def _migracao_011_alteracoes_irrigacoes(cursor: sqlite3.Cursor):
+    """
+    Cria TABELA_ALTERACOES_IRRIGACOES, um registro com sequência AUTOINCREMENT do
+    setor e da data de cada irrigação inserida, alterada (a data antiga e a nova) ou
+    removida. O rowid de TABELA_IRRIGACOES não serve de marca d'água: é reaproveitado
+    quando a irrigação mais recente é removida, e remoções e alterações não mudam o
+    rowid máximo.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS TABELA_ALTERACOES_IRRIGACOES (
+            sequencia INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_setor VARCHAR(10),
+            data_irrigacao DATETIME
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER TRG_IRRIGACOES_ALTERACAO_INSERIR
+        AFTER INSERT ON TABELA_IRRIGACOES
+        BEGIN
+            INSERT INTO TABELA_ALTERACOES_IRRIGACOES (id_setor, data_irrigacao)
+            VALUES (NEW.id_setor, NEW.data_irrigacao);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER TRG_IRRIGACOES_ALTERACAO_ATUALIZAR
+        AFTER UPDATE OF volume_irrigacao, data_irrigacao, id_setor ON TABELA_IRRIGACOES
+        BEGIN
+            INSERT INTO TABELA_ALTERACOES_IRRIGACOES (id_setor, data_irrigacao)
+            VALUES (OLD.id_setor, OLD.data_irrigacao), (NEW.id_setor, NEW.data_irrigacao);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER TRG_IRRIGACOES_ALTERACAO_REMOVER
+        AFTER DELETE ON TABELA_IRRIGACOES
+        BEGIN
+            INSERT INTO TABELA_ALTERACOES_IRRIGACOES (id_setor, data_irrigacao)
+            VALUES (OLD.id_setor, OLD.data_irrigacao);
+        END
+    ''')
+
+
+# Lista ordenada de migrações: (versão, descrição, função que recebe um cursor e pode
+# devolver um aviso para o usuário)
+MIGRACOES: List[Tuple[int, str, Callable[[sqlite3.Cursor], Optional[str]]]] = [
+    (1, "Tabelas base do sistema", _migracao_001_tabelas_base),
+    (2, "Índices secundários para consultas por setor, sensor e data", _migracao_002_indices_secundarios),
+    (3, "Remoção das tabelas *_NEW não utilizadas", _migracao_003_remover_tabelas_new),
+    (4, "Agregados horários e diários de medições", _migracao_004_agregados_medicoes),
+    (5, "Última medição por sensor e última irrigação por setor", _migracao_005_ultimos_valores),
+    (6, "Medição única por sensor e instante (remove duplicadas)", _migracao_006_medicao_unica_por_sensor_e_instante),
+    (7, "Layout compacto das medições (TABELA_MEDICOES vira visão)", _migracao_007_medicoes_compactas),
+    (8, "Medições com data inválida são recusadas", _migracao_008_rejeitar_datas_invalidas),
+    (9, "IDs de medição sem reuso (AUTOINCREMENT)", _migracao_009_ids_de_medicao_sem_reuso),
+    (10, "Agregados recalculados após remoção ou alteração de medições", _migracao_010_agregados_pendentes),
+    (11, "Registro de alterações das irrigações", _migracao_011_alteracoes_irrigacoes),
+]
+
+VERSAO_MAIS_RECENTE = MIGRACOES[-1][0]
+
+
+def versao_atual(connection: sqlite3.Connection) -> int:
+    """Retorna a versão do esquema registrada no banco (0 se nunca migrado)."""
+    cursor = connection.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (TABELA_VERSAO,))
+    if cursor.fetchone() is None:
+        return 0
+    cursor.execute(f"SELECT MAX(versao) FROM {TABELA_VERSAO}")
+    versao = cursor.fetchone()[0]
+    return versao or 0
+
+
+def aplicar_migracoes(connection: sqlite3.Connection, avisos: Optional[List[str]] = None) -> List[int]:
+    """
+    Aplica, em ordem, as migrações ainda não registradas no banco.
+
+    Cada migração roda em sua própria transação junto com o registro da versão,
+    de modo que uma falha deixa o banco na última versão consistente. Quando o
+    esquema já está atualizado nada é criado nem gravado.
+
+    Vários processos podem abrir um banco antigo ao mesmo tempo (dashboard, CLI,
+    servidor de ingestão, processos do train_all): cada transação começa com BEGIN
+    IMMEDIATE, que reserva a escrita antes de ler, e a versão é conferida de novo lá
+    dentro; uma migração que outro processo já registrou é pulada.
+
+    Args:
+        avisos (list): Se informada, recebe os avisos das migrações aplicadas (ex.:
+                       linhas removidas), que ficam a cargo de quem chamou exibir.
+
+    Returns:
+        List[int]: As versões aplicadas nesta chamada.
+    """
+    atual = versao_atual(connection)
+    if atual >= VERSAO_MAIS_RECENTE:
+        return []
+
+    cursor = connection.cursor()
+    if atual == 0:
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {TABELA_VERSAO} (
+                versao INTEGER PRIMARY KEY,
+                descricao VARCHAR(100),
+                data_aplicacao DATETIME
+            )
+        ''')
+        connection.commit()
+
+    aplicadas = []
+    for versao, descricao, migracao in MIGRACOES:
+        if versao <= atual:
+            continue
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(f"SELECT 1 FROM {TABELA_VERSAO} WHERE versao = ?", (versao,))
+            if cursor.fetchone() is not None:
+                connection.commit()
+                continue
+            aviso = migracao(cursor)
+            cursor.execute(
+                f"INSERT INTO {TABELA_VERSAO} (versao, descricao, data_aplicacao) VALUES (?, ?, ?)",
+                (versao, descricao, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+            connection.commit()
+            aplicadas.append(versao)
+            if aviso and avisos is not None:
+                avisos.append(aviso)
+        except sqlite3.Error:
+            connection.rollback()
+            raise
+
+    # Atualiza as estatísticas do planejador para que os novos índices sejam usados
+    cursor.execute("PRAGMA optimize")
+    return aplicadas
@@ -0,0 +1,303 @@
+# online.py
+
+import argparse
+import os
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import accuracy_score, balanced_accuracy_score, log_loss
+from sklearn.preprocessing import StandardScaler
+
+from .database import AgriculturalDatabase
+from .features import FeatureStore
+from .intelligence import IrrigationIntelligence
+from .registry import chave_setor
+
+# Pasta padrão dos checkpoints (um arquivo por setor)
+DIRETORIO_PADRAO = "data/online"
+# Horas de dados consumidas entre dois checkpoints
+CHECKPOINT_HORAS = 24
+# Horas anteriores à marca relidas para preencher (ffill) as primeiras horas novas
+HORAS_DE_CONTEXTO = 24
+VERSAO_CHECKPOINT = 1
+# Regularização do SGD: com o passo 'optimal', valores menores levam as probabilidades
+# a 0 ou 1 nos dados do sistema (log loss acima de 2 contra ~0,6 com 1e-2)
+ALFA_PADRAO = 1e-2
+# Período das features de tempo, codificadas como seno e cosseno para o modelo linear
+PERIODOS = {'hora_do_dia': 24, 'dia_da_semana': 7}
+
+
+class OnlineIrrigationModel:
+    """
+    Regressão logística treinada por SGD, uma hora de dados por vez (partial_fit).
+
+    As features são as mesmas da floresta (medições, hora_do_dia e dia_da_semana), com
+    as de tempo viradas em seno/cosseno. A padronização usa média e variância correntes
+    (StandardScaler.partial_fit) e os valores ausentes ficam na média. Como irrigar é a
+    classe rara, cada exemplo pesa o inverso da frequência da sua classe até ali (o
+    equivalente incremental de class_weight='balanced').
+
+    Tem a mesma interface de previsão da floresta (predict_proba/predict sobre um
+    DataFrame com as colunas em `features`), então pode ser usado por predict_batch e
+    gravado no ModelRegistry.
+    """
+
+    def __init__(self, features, alpha: float = ALFA_PADRAO):
+        self.feature_names_in_ = np.asarray(list(features), dtype=object)
+        self.classes_ = np.array([0, 1])
+        self.escalador = StandardScaler()
+        # Sem embaralhar: os exemplos são vistos em ordem cronológica
+        self.sgd = SGDClassifier(loss='log_loss', alpha=alpha, shuffle=False, random_state=42)
+        self.contagem = np.zeros(2)
+        self.amostras = 0
+
+    def _expandir(self, X) -> np.ndarray:
+        if hasattr(X, 'columns'):
+            X = X.reindex(columns=list(self.feature_names_in_))
+        X = np.asarray(X, dtype=np.float64)
+        colunas = []
+        for i, nome in enumerate(self.feature_names_in_):
+            if nome in PERIODOS:
+                angulo = 2 * np.pi * X[:, i] / PERIODOS[nome]
+                colunas += [np.sin(angulo), np.cos(angulo)]
+            else:
+                colunas.append(X[:, i])
+        return np.column_stack(colunas)
+
+    def _padronizar(self, Z: np.ndarray) -> np.ndarray:
+        Z = self.escalador.transform(Z)
+        Z[np.isnan(Z)] = 0.0
+        return Z
+
+    def partial_fit(self, X, y) -> "OnlineIrrigationModel":
+        y = (np.asarray(y) > 0).astype(int)
+        if not len(y):
+            return self
+        Z = self._expandir(X)
+        self.escalador.partial_fit(Z)
+        self.contagem += np.bincount(y, minlength=2)
+        self.amostras += len(y)
+        pesos = self.amostras / (2 * np.maximum(self.contagem, 1))
+        self.sgd.partial_fit(self._padronizar(Z), y, classes=self.classes_, sample_weight=pesos[y])
+        return self
+
+    def predict_proba(self, X) -> np.ndarray:
+        return self.sgd.predict_proba(self._padronizar(self._expandir(X)))
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+
+class OnlineLearner:
+    """
+    Mantém o OnlineIrrigationModel de um setor em dia com as medições e irrigações
+    que chegam ao banco.
+
+    A cada atualizar(), só as horas depois da última já aprendida (a marca) são lidas,
+    então o custo é proporcional aos dados novos e não ao histórico. Uma hora só entra
+    quando a hora seguinte (o alvo) já terminou e já tem medições. O modelo e a marca
+    vão para um checkpoint (<diretorio>/<setor>.joblib) a cada CHECKPOINT_HORAS horas
+    aprendidas e no fim da atualização. Dados que chegam atrasados para horas já
+    aprendidas não são revistos.
+    """
+
+    def __init__(self, inteligencia: IrrigationIntelligence, id_setor: str, diretorio: str = DIRETORIO_PADRAO,
+                 checkpoint_horas: int = CHECKPOINT_HORAS):
+        """
+        Args:
+            inteligencia (IrrigationIntelligence): De onde vêm os quadros horários (mesma
+                                                   fonte de dados da floresta).
+            checkpoint_horas (int): Horas aprendidas entre dois checkpoints.
+        """
+        self.inteligencia = inteligencia
+        self.id_setor = id_setor
+        self.diretorio = diretorio
+        self.checkpoint_horas = checkpoint_horas
+        self.modelo: Optional[OnlineIrrigationModel] = None
+        self.primeira_hora: Optional[pd.Timestamp] = None
+        self.ultima_hora: Optional[pd.Timestamp] = None
+        self._carregar_checkpoint()
+
+    def _caminho(self) -> str:
+        seguro = ''.join(c if c.isalnum() or c in '-_' else f"%{ord(c):02x}" for c in str(self.id_setor))
+        return os.path.join(self.diretorio, f"{seguro or '%00'}.joblib")
+
+    def _carregar_checkpoint(self):
+        caminho = self._caminho()
+        if not os.path.exists(caminho):
+            return
+        try:
+            payload = joblib.load(caminho)
+        except (OSError, EOFError, KeyError, ValueError) as e:
+            print(f"Checkpoint do setor '{self.id_setor}' ilegível ({e}); o modelo incremental recomeça do zero.")
+            return
+        if payload.get('versao') == VERSAO_CHECKPOINT:
+            self.modelo, self.primeira_hora, self.ultima_hora = (payload['modelo'], payload['primeira_hora'],
+                                                                 payload['ultima_hora'])
+
+    def salvar_checkpoint(self):
+        """Grava o modelo e a marca (última hora aprendida)."""
+        if self.modelo is None:
+            return
+        os.makedirs(self.diretorio, exist_ok=True)
+        caminho = self._caminho()
+        payload = {'versao': VERSAO_CHECKPOINT, 'id_setor': self.id_setor, 'modelo': self.modelo,
+                   'primeira_hora': self.primeira_hora, 'ultima_hora': self.ultima_hora,
+                   'salvo_em': datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        joblib.dump(payload, caminho + ".tmp")
+        os.replace(caminho + ".tmp", caminho)
+
+    def exemplos_novos(self, agora: Optional[datetime] = None):
+        """
+        (X, y) das horas depois da marca cujo alvo já é conhecido, em ordem cronológica,
+        ou (None, None) se não houver nenhuma.
+        """
+        inicio = None
+        if self.ultima_hora is not None:
+            inicio = (self.ultima_hora - pd.Timedelta(hours=HORAS_DE_CONTEXTO)).strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            quadro = self.inteligencia._preencher(self.inteligencia._frame_horario(self.id_setor, inicio))
+        except MemoryError:
+            raise
+        except Exception as e:
+            print(f"Erro ao ler as horas novas do setor '{self.id_setor}': {e}")
+            return None, None
+        if quadro.empty or len(quadro) < 2:
+            return None, None
+        X, y = IrrigationIntelligence._montar_exemplos(quadro)
+        # A última hora do quadro ainda não tem alvo, e o alvo de uma hora só vale
+        # depois que a hora seguinte terminou
+        limite = min(X.index[-1], pd.Timestamp(agora or datetime.now()).floor('H') - pd.Timedelta(hours=1))
+        manter = X.index < limite
+        if self.ultima_hora is not None:
+            manter &= X.index > self.ultima_hora
+        if not manter.any():
+            return None, None
+        return X[manter], y[manter]
+
+    def atualizar(self, agora: Optional[datetime] = None) -> Dict:
+        """
+        Aprende as horas novas, em blocos de checkpoint_horas, gravando um checkpoint
+        depois de cada bloco.
+
+        Returns:
+            Dict: id_setor, horas (aprendidas agora), checkpoints, ultima_hora, amostras
+                  (total já aprendido) e segundos.
+        """
+        inicio = time.perf_counter()
+        resultado = {'id_setor': self.id_setor, 'horas': 0, 'checkpoints': 0, 'ultima_hora': self.ultima_hora,
+                     'amostras': self.modelo.amostras if self.modelo else 0, 'segundos': 0.0}
+        X, y = self.exemplos_novos(agora)
+        if X is not None:
+            if self.modelo is None:
+                self.modelo = OnlineIrrigationModel(X.columns)
+                self.primeira_hora = X.index[0]
+            for bloco in range(0, len(X), self.checkpoint_horas):
+                self.modelo.partial_fit(X.iloc[bloco:bloco + self.checkpoint_horas],
+                                        y.iloc[bloco:bloco + self.checkpoint_horas])
+                self.ultima_hora = X.index[min(bloco + self.checkpoint_horas, len(X)) - 1]
+                self.salvar_checkpoint()
+                resultado['checkpoints'] += 1
+            resultado.update(horas=len(X), ultima_hora=self.ultima_hora, amostras=self.modelo.amostras)
+        resultado['segundos'] = time.perf_counter() - inicio
+        return resultado
+
+    def registrar(self) -> Optional[int]:
+        """Grava o modelo incremental como nova versão do modelo do setor no registro."""
+        if self.modelo is None:
+            return None
+        return self.inteligencia.registro.registrar(
+            chave_setor(self.id_setor), self.modelo, list(self.modelo.feature_names_in_),
+            janela=(self.primeira_hora, self.ultima_hora), metricas={'tipo': 'online', 'amostras': self.modelo.amostras})
+
+    def comparar_com_floresta(self, fracao_teste: float = 0.2) -> Dict:
+        """
+        Compara, com os mesmos dados, um modelo incremental novo e a floresta de
+        train_model: as duas treinam nas primeiras horas do histórico e são avaliadas
+        nas últimas `fracao_teste` (sem embaralhar, para não treinar com o futuro).
+        O checkpoint do setor não é alterado.
+
+        Returns:
+            Dict: {'online': {...}, 'floresta': {...}} com acuracia, acuracia_balanceada,
+                  log_loss e segundos de treino, mais as horas de treino e de teste.
+        """
+        X, y = self.inteligencia.prepare_features_and_target(self.id_setor)
+        if X is None or len(X) < 10:
+            return {}
+        y = (y > 0).astype(int)
+        corte = int(len(X) * (1 - fracao_teste))
+        X_treino, X_teste, y_treino, y_teste = X.iloc[:corte], X.iloc[corte:], y.iloc[:corte], y.iloc[corte:]
+        if y_treino.nunique() < 2:
+            return {}
+
+        def avaliar(modelo, segundos: float) -> Dict:
+            proba = modelo.predict_proba(X_teste)
+            previsto = modelo.classes_.take(np.argmax(proba, axis=1))
+            return {'acuracia': accuracy_score(y_teste, previsto),
+                    'acuracia_balanceada': balanced_accuracy_score(y_teste, previsto),
+                    'log_loss': log_loss(y_teste, proba, labels=modelo.classes_), 'segundos': segundos}
+
+        inicio = time.perf_counter()
+        online = OnlineIrrigationModel(X.columns)
+        for bloco in range(0, len(X_treino), self.checkpoint_horas):
+            online.partial_fit(X_treino.iloc[bloco:bloco + self.checkpoint_horas],
+                               y_treino.iloc[bloco:bloco + self.checkpoint_horas])
+        resultado = {'online': avaliar(online, time.perf_counter() - inicio)}
+
+        inicio = time.perf_counter()
+        floresta = RandomForestClassifier(n_estimators=100, random_state=42, class_weight='balanced')
+        floresta.fit(X_treino, y_treino)
+        resultado['floresta'] = avaliar(floresta, time.perf_counter() - inicio)
+        resultado.update(horas_treino=len(X_treino), horas_teste=len(X_teste))
+        return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Atualiza o modelo incremental (SGD) de irrigação de um setor.")
+    parser.add_argument("--db", default="data/agricultural_system.db", help="Banco SQLite")
+    parser.add_argument("--setor", required=True, help="ID do setor")
+    parser.add_argument("--modelo", default="data/irrigation_model.joblib",
+                        help="Modelo geral (o registro de modelos fica na pasta ao lado dele)")
+    parser.add_argument("--checkpoints", default=DIRETORIO_PADRAO, help="Pasta dos checkpoints")
+    parser.add_argument("--checkpoint-horas", type=int, default=CHECKPOINT_HORAS,
+                        help="Horas aprendidas entre dois checkpoints")
+    parser.add_argument("--registrar", action="store_true",
+                        help="Grava o modelo atualizado como versão do setor no registro de modelos")
+    parser.add_argument("--comparar", action="store_true",
+                        help="Compara com a floresta nas últimas horas do histórico (sem alterar o checkpoint)")
+    args = parser.parse_args()
+
+    db = AgriculturalDatabase(db_name=args.db, verboso=False)
+    inteligencia = IrrigationIntelligence(db, args.modelo, feature_store=FeatureStore(db))
+    aprendiz = OnlineLearner(inteligencia, args.setor, args.checkpoints, args.checkpoint_horas)
+    resultado = aprendiz.atualizar()
+    print(f"\nSetor {args.setor}: {resultado['horas']} horas novas aprendidas em {resultado['segundos']:.2f}s "
+          f"({resultado['checkpoints']} checkpoints); {resultado['amostras']} horas no total, "
+          f"última hora aprendida: {resultado['ultima_hora']}.")
+    if args.registrar:
+        versao = aprendiz.registrar()
+        if versao is not None:
+            print(f"Modelo incremental registrado como versão {versao} do setor {args.setor}.")
+    if args.comparar:
+        comparacao = aprendiz.comparar_com_floresta()
+        if not comparacao:
+            print("Dados insuficientes para comparar os modelos.")
+        else:
+            print(f"\n--- Comparação ({comparacao['horas_treino']} horas de treino, "
+                  f"{comparacao['horas_teste']} de teste) ---")
+            print(f"{'Modelo':<10} {'Acurácia':>9} {'Balanceada':>11} {'Log loss':>9} {'Treino (s)':>11}")
+            for nome in ('online', 'floresta'):
+                m = comparacao[nome]
+                print(f"{nome:<10} {m['acuracia']:>9.3f} {m['acuracia_balanceada']:>11.3f} "
+                      f"{m['log_loss']:>9.3f} {m['segundos']:>11.2f}")
+    db.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# pool.py
+
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import List
+
+# Tempo (s) que o SQLite espera por um lock antes de devolver "database is locked"
+BUSY_TIMEOUT_PADRAO = 5.0
+# Número de novas tentativas feitas pelo cursor quando o banco continua ocupado
+MAX_TENTATIVAS_PADRAO = 5
+
+
+def _banco_ocupado(erro: sqlite3.OperationalError) -> bool:
+    """Indica se o erro é de lock/ocupado (e portanto pode ser repetido)."""
+    mensagem = str(erro).lower()
+    return "locked" in mensagem or "busy" in mensagem
+
+
+class CursorComRetry(sqlite3.Cursor):
+    """
+    Cursor que repete comandos quando o banco está ocupado por outro escritor.
+
+    Só repete quando o comando abriu a transação (nenhum comando anterior
+    pendente), pois nesse caso desfazer e tentar de novo é seguro.
+    """
+    max_tentativas = MAX_TENTATIVAS_PADRAO
+
+    def execute(self, sql, parameters=()):
+        return self._com_retry(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        # Materializa geradores para que possam ser reenviados em uma nova tentativa
+        if not isinstance(seq_of_parameters, (list, tuple)):
+            seq_of_parameters = list(seq_of_parameters)
+        return self._com_retry(super().executemany, sql, seq_of_parameters)
+
+    def _com_retry(self, comando, sql, parametros):
+        conexao = self.connection
+        tentativa = 0
+        while True:
+            estava_em_transacao = conexao.in_transaction
+            try:
+                return comando(sql, parametros)
+            except sqlite3.OperationalError as e:
+                tentativa += 1
+                if estava_em_transacao or not _banco_ocupado(e) or tentativa > self.max_tentativas:
+                    raise
+                if conexao.in_transaction:
+                    conexao.rollback()
+                # Backoff exponencial com jitter para não sincronizar os escritores
+                time.sleep(min(0.05 * (2 ** tentativa), 1.0) * random.uniform(0.5, 1.5))
+
+
+class ConexaoComRetry(sqlite3.Connection):
+    """Conexão cujos cursores usam CursorComRetry por padrão."""
+
+    def cursor(self, factory=CursorComRetry):
+        return super().cursor(factory)
+
+
+class ConnectionPool:
+    """
+    Pool de conexões SQLite com uma conexão por thread, em modo WAL.
+
+    No modo WAL vários leitores consultam o banco ao mesmo tempo em que um
+    escritor grava, sem "database is locked". Cada thread (por exemplo, cada
+    sessão do Streamlit) recebe sua própria conexão, evitando o
+    compartilhamento de cursores entre threads.
+
+    Com somente_leitura=True o arquivo é aberto como imutável (um snapshot
+    publicado por snapshot.py): sem locks, sem WAL e sem esperar escritores.
+    Quando um novo snapshot substitui o arquivo, cada thread reabre sua conexão
+    na próxima chamada e passa a ler o novo ponto no tempo.
+    """
+
+    def __init__(self, db_name: str, busy_timeout: float = BUSY_TIMEOUT_PADRAO,
+                 fabrica=ConexaoComRetry, instrumentacao=None, somente_leitura: bool = False,
+                 uri: bool = False):
+        self.db_name = db_name
+        self.busy_timeout = busy_timeout
+        self.fabrica = fabrica
+        self.instrumentacao = instrumentacao
+        self.somente_leitura = somente_leitura
+        self.uri = uri  # db_name já é uma URI (ex.: banco em memória compartilhado)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conexoes: List[sqlite3.Connection] = []
+
+    def obter_conexao(self) -> sqlite3.Connection:
+        """Retorna a conexão da thread atual, criando-a na primeira chamada."""
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is not None and self.somente_leitura and self._arquivo_substituido():
+            self._descartar_conexao_da_thread(conexao)
+            conexao = None
+        if conexao is None:
+            conexao = self._abrir_conexao()
+            self._local.conexao = conexao
+        return conexao
+
+    def obter_cursor(self) -> sqlite3.Cursor:
+        """Retorna um cursor reutilizado apenas dentro da thread atual."""
+        conexao = self.obter_conexao()
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            cursor = conexao.cursor()
+            self._local.cursor = cursor
+        return cursor
+
+    def _arquivo_substituido(self) -> bool:
+        """Indica se o arquivo aberto pela thread atual foi trocado por um snapshot mais novo."""
+        try:
+            return os.stat(self.db_name).st_ino != self._local.inode
+        except OSError:
+            return False
+
+    def _descartar_conexao_da_thread(self, conexao: sqlite3.Connection):
+        # Não fecha aqui: cursores ainda abertos pela thread seguem lendo o snapshot
+        # anterior, e a conexão é fechada quando deixa de ser referenciada
+        with self._lock:
+            if conexao in self._conexoes:
+                self._conexoes.remove(conexao)
+        self._local.conexao = None
+        self._local.cursor = None
+
+    def _abrir_conexao(self) -> sqlite3.Connection:
+        if self.somente_leitura:
+            # O inode identifica o snapshot lido; é guardado antes de abrir, então uma
+            # troca no meio do caminho apenas força uma nova abertura na próxima chamada
+            self._local.inode = os.stat(self.db_name).st_ino
+            caminho, uri = f"file:{self.db_name}?mode=ro&immutable=1", True
+        else:
+            caminho, uri = self.db_name, self.uri
+        conexao = sqlite3.connect(
+            caminho,
+            timeout=self.busy_timeout,
+            check_same_thread=False,  # permite que fechar_todas feche conexões de outras threads
+            factory=self.fabrica,
+            uri=uri,
+        )
+        if self.instrumentacao is not None:
+            conexao.instrumentacao = self.instrumentacao
+        if not self.somente_leitura:
+            conexao.execute("PRAGMA journal_mode=WAL")
+            # Em WAL, NORMAL mantém a consistência e evita um fsync por commit
+            conexao.execute("PRAGMA synchronous=NORMAL")
+        with self._lock:
+            self._conexoes.append(conexao)
+        return conexao
+
+    def fechar_todas(self):
+        """Fecha todas as conexões abertas pelo pool."""
+        with self._lock:
+            conexoes, self._conexoes = self._conexoes, []
+        for conexao in conexoes:
+            try:
+                conexao.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+    def __len__(self):
+        return len(self._conexoes)
@@ -0,0 +1,248 @@
+# registry.py
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from .artifacts import carregar_modelo, salvar_modelo
+
+# Pasta padrão dos modelos (uma subpasta por chave)
+DIRETORIO_PADRAO = "data/modelos"
+ARQUIVO_METADADOS = "metadados.json"
+# Hiperparâmetros escolhidos para a chave (ver tuning.py), usados nos próximos treinos
+ARQUIVO_CONFIGURACAO = "configuracao.json"
+# Memória ocupada pelos modelos carregados, estimada pelo tamanho dos artefatos
+LIMITE_MEMORIA_PADRAO_MB = 512
+# Versões mantidas em disco por chave (a ativa nunca é removida)
+VERSOES_MANTIDAS = 5
+
+
+def chave_setor(id_setor: str) -> str:
+    """Chave do modelo de um setor no registro."""
+    return f"setor_{id_setor}"
+
+
+def chave_cultura(id_cultura: str) -> str:
+    """Chave do modelo de uma cultura (usado pelos setores da cultura sem modelo próprio)."""
+    return f"cultura_{id_cultura}"
+
+
+class ModelRegistry:
+    """
+    Registro de modelos versionados por chave (setor ou cultura), carregados sob demanda
+    e mantidos em um cache LRU.
+
+    Cada chave tem uma pasta com um artefato por versão (v0001.joblib, ...; florestas no
+    formato mapeável de artifacts.py) e um metadados.json com a versão ativa e, para cada versão, os nomes das features, a
+    janela de treino, as métricas e a data. Nada é carregado ao abrir o registro: o
+    modelo é lido na primeira previsão e fica no cache até que a memória estimada
+    (tamanho dos artefatos) ou o número de modelos passe do limite, quando os usados há
+    mais tempo são descartados. Versões gravadas por outro processo (ex.: train_all) são
+    percebidas pela data de modificação dos metadados.
+    """
+
+    def __init__(self, diretorio: str = DIRETORIO_PADRAO, limite_memoria_mb: float = LIMITE_MEMORIA_PADRAO_MB,
+                 max_modelos: Optional[int] = None):
+        """
+        Args:
+            diretorio (str): Pasta dos modelos.
+            limite_memoria_mb (float): Memória máxima dos modelos carregados.
+            max_modelos (int): Número máximo de modelos carregados (None = só o limite de memória).
+        """
+        self.diretorio = diretorio
+        self.limite_bytes = int(limite_memoria_mb * 1024 * 1024)
+        self.max_modelos = max_modelos
+        # chave -> {'modelo', 'features', 'versao', 'bytes', 'mtime'}, do menos para o mais recente
+        self._cache: "OrderedDict[str, Dict]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.estatisticas = {'acertos': 0, 'faltas': 0, 'descartes': 0}
+
+    # ---------- Metadados ----------
+
+    def _pasta(self, chave: str) -> str:
+        # Mantém a chave legível, mas sem caracteres que não podem ir em nomes de pasta
+        seguro = ''.join(c if c.isalnum() or c in '-_' else f"%{ord(c):02x}" for c in str(chave))
+        return os.path.join(self.diretorio, seguro or "%00")
+
+    def metadados(self, chave: str) -> Optional[Dict]:
+        """Versão ativa e histórico de versões da chave, ou None se não houver modelo."""
+        caminho = os.path.join(self._pasta(chave), ARQUIVO_METADADOS)
+        if not os.path.exists(caminho):
+            return None
+        with open(caminho, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _gravar_metadados(self, chave: str, metadados: Dict):
+        self._gravar_json(os.path.join(self._pasta(chave), ARQUIVO_METADADOS), metadados)
+
+    @staticmethod
+    def _gravar_json(caminho: str, dados: Dict):
+        temporario = caminho + ".tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(dados, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, caminho)
+
+    def configuracao(self, chave: str) -> Optional[Dict]:
+        """Configuração de treino salva para a chave ('parametros' do modelo e como foi escolhida), ou None."""
+        caminho = os.path.join(self._pasta(chave), ARQUIVO_CONFIGURACAO)
+        if not os.path.exists(caminho):
+            return None
+        with open(caminho, encoding='utf-8') as f:
+            return json.load(f)
+
+    def salvar_configuracao(self, chave: str, configuracao: Dict):
+        """Grava a configuração de treino da chave (substitui a anterior)."""
+        os.makedirs(self._pasta(chave), exist_ok=True)
+        self._gravar_json(os.path.join(self._pasta(chave), ARQUIVO_CONFIGURACAO), dict(configuracao, chave=chave))
+
+    def versao_ativa(self, chave: str) -> Optional[Dict]:
+        """Metadados da versão ativa (features, janela, métricas, criado_em, bytes)."""
+        metadados = self.metadados(chave)
+        if not metadados:
+            return None
+        return next((v for v in metadados['versoes'] if v['versao'] == metadados['ativa']), None)
+
+    def chaves(self) -> List[str]:
+        """Chaves com algum modelo registrado (sem carregar os modelos)."""
+        if not os.path.isdir(self.diretorio):
+            return []
+        chaves = []
+        for nome in sorted(os.listdir(self.diretorio)):
+            caminho = os.path.join(self.diretorio, nome, ARQUIVO_METADADOS)
+            if os.path.exists(caminho):
+                with open(caminho, encoding='utf-8') as f:
+                    chaves.append(json.load(f)['chave'])
+        return chaves
+
+    # ---------- Gravação ----------
+
+    def registrar(self, chave: str, modelo: Any, features: List[str], janela: Optional[Tuple] = None,
+                  metricas: Optional[Dict] = None) -> int:
+        """
+        Grava o modelo como nova versão ativa da chave.
+
+        Args:
+            janela (Tuple): (início, fim) dos dados de treino.
+            metricas (Dict): Ex.: {'acuracia': 0.91, 'amostras': 2160}.
+
+        Returns:
+            int: Número da versão gravada.
+        """
+        pasta = self._pasta(chave)
+        os.makedirs(pasta, exist_ok=True)
+        metadados = self.metadados(chave) or {'chave': chave, 'ativa': None, 'versoes': []}
+        versao = max((v['versao'] for v in metadados['versoes']), default=0) + 1
+        arquivo = f"v{versao:04d}.joblib"
+        caminho = os.path.join(pasta, arquivo)
+        # Mesmo formato do modelo geral (save_model), então o artefato também pode ser lido por load_model
+        formato = salvar_modelo(modelo, features, caminho, chave=chave, versao_modelo=versao)
+        bytes_artefato = os.path.getsize(caminho)
+        metadados['versoes'].append({
+            'versao': versao, 'arquivo': arquivo, 'formato': formato, 'features': list(features),
+            'janela': {'inicio': str(janela[0]), 'fim': str(janela[1])} if janela else None,
+            'metricas': metricas or {}, 'criado_em': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'bytes': bytes_artefato,
+        })
+        metadados['ativa'] = versao
+        self._podar(pasta, metadados)
+        self._gravar_metadados(chave, metadados)
+        # O modelo recém-treinado já está na memória: entra no cache sem ser relido
+        with self._lock:
+            self._guardar(chave, modelo, list(features), versao, bytes_artefato, self._mtime(chave))
+        return versao
+
+    @staticmethod
+    def _podar(pasta: str, metadados: Dict):
+        """Remove os artefatos das versões mais antigas, mantendo VERSOES_MANTIDAS e a ativa."""
+        manter = {v['versao'] for v in metadados['versoes'][-VERSOES_MANTIDAS:]} | {metadados['ativa']}
+        for versao in [v for v in metadados['versoes'] if v['versao'] not in manter]:
+            for caminho in (os.path.join(pasta, versao['arquivo']), os.path.join(pasta, versao['arquivo'] + ".json")):
+                if os.path.exists(caminho):
+                    os.remove(caminho)
+            metadados['versoes'].remove(versao)
+
+    def ativar(self, chave: str, versao: int) -> bool:
+        """Volta (ou avança) a chave para uma versão ainda mantida em disco."""
+        metadados = self.metadados(chave)
+        if not metadados or versao not in {v['versao'] for v in metadados['versoes']}:
+            print(f"Versão {versao} do modelo '{chave}' não encontrada.")
+            return False
+        metadados['ativa'] = versao
+        self._gravar_metadados(chave, metadados)
+        self.descarregar(chave)
+        return True
+
+    # ---------- Carga e cache ----------
+
+    def _mtime(self, chave: str) -> Optional[int]:
+        try:
+            return os.stat(os.path.join(self._pasta(chave), ARQUIVO_METADADOS)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def obter(self, chave: str) -> Optional[Tuple[Any, List[str]]]:
+        """
+        (modelo, features) da versão ativa da chave, ou None se não houver modelo.
+        Carrega o artefato na primeira vez; depois serve do cache.
+        """
+        mtime = self._mtime(chave)
+        with self._lock:
+            entrada = self._cache.get(chave)
+            if entrada is not None and entrada['mtime'] == mtime:
+                self._cache.move_to_end(chave)
+                self.estatisticas['acertos'] += 1
+                return entrada['modelo'], entrada['features']
+            if entrada is not None:
+                self._remover(chave)
+        if mtime is None:
+            return None
+
+        metadados = self.metadados(chave)
+        ativa = next((v for v in metadados['versoes'] if v['versao'] == metadados['ativa']), None)
+        if ativa is None:
+            return None
+        try:
+            # Florestas ficam mapeadas: processos que usam o mesmo modelo dividem as páginas
+            modelo, features = carregar_modelo(os.path.join(self._pasta(chave), ativa['arquivo']))
+        except (OSError, EOFError, KeyError, ValueError) as e:
+            print(f"Erro ao carregar a versão {ativa['versao']} do modelo '{chave}': {e}")
+            return None
+        with self._lock:
+            self.estatisticas['faltas'] += 1
+            self._guardar(chave, modelo, features, ativa['versao'], ativa['bytes'], mtime)
+        return modelo, features
+
+    def _guardar(self, chave: str, modelo: Any, features: List[str], versao: int, bytes_modelo: int,
+                 mtime: Optional[int]):
+        if chave in self._cache:
+            self._remover(chave)
+        self._cache[chave] = {'modelo': modelo, 'features': features, 'versao': versao,
+                              'bytes': bytes_modelo, 'mtime': mtime}
+        self._bytes += bytes_modelo
+        # Descarta os usados há mais tempo, nunca o que acabou de entrar
+        while len(self._cache) > 1 and (self._bytes > self.limite_bytes or
+                                        (self.max_modelos is not None and len(self._cache) > self.max_modelos)):
+            self._remover(next(iter(self._cache)))
+            self.estatisticas['descartes'] += 1
+
+    def _remover(self, chave: str):
+        self._bytes -= self._cache.pop(chave)['bytes']
+
+    def descarregar(self, chave: Optional[str] = None):
+        """Tira do cache o modelo da chave (ou todos); continuam no disco."""
+        with self._lock:
+            for atual in ([chave] if chave is not None else list(self._cache)):
+                if atual in self._cache:
+                    self._remover(atual)
+
+    def memoria_em_uso(self) -> Dict:
+        """Modelos carregados, memória estimada e contadores do cache."""
+        with self._lock:
+            return dict(self.estatisticas, carregados=len(self._cache), bytes=self._bytes,
+                        limite_bytes=self.limite_bytes)
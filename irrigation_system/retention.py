@@ -0,0 +1,304 @@
+# retention.py
+
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from .rollups import REMOCAO_DA_RETENCAO
+
+# Política aplicada a tipos de sensor sem política própria
+POLITICA_PADRAO = '*'
+
+# Por tipo de sensor (em minúsculas):
+#   dias_brutos   - dias de medições brutas mantidos em TABELA_MEDICOES_COMPACTA
+#   dias_horarios - dias de agregados horários mantidos (None = para sempre);
+#                   os agregados diários nunca são removidos
+POLITICAS_PADRAO = {
+    POLITICA_PADRAO: {'dias_brutos': 30, 'dias_horarios': 365},
+}
+
+# Linhas removidas por transação: mantém cada lock de escrita curto
+LINHAS_POR_LOTE = 5000
+# Pausa (s) entre lotes para dar vez a outros escritores
+PAUSA_ENTRE_LOTES = 0.05
+# Páginas liberadas por passo de PRAGMA incremental_vacuum
+PAGINAS_POR_PASSO_VACUUM = 1000
+
+# Tabelas cujo espaço é contabilizado na estimativa de bytes das medições
+OBJETOS_MEDICOES = ('TABELA_MEDICOES_COMPACTA', 'sqlite_autoindex_TABELA_MEDICOES_COMPACTA_1',
+                    'IDX_MEDICOES_SENSOR_INSTANTE', 'IDX_MEDICOES_INSTANTE')
+
+
+class RetentionManager:
+    """
+    Aplica políticas de retenção às medições brutas.
+
+    As medições mais antigas que o limite da política só são removidas depois de
+    incluídas nos agregados horários/diários (SensorRollups), que passam a ser o
+    histórico compactado desses períodos. Além de estar abaixo da marca d'água, o
+    dia da medição precisa estar coberto em TABELA_MEDICOES_DIA (o agregado conta
+    pelo menos as medições brutas que restam); os dias que não estão são mantidos e
+    contados em 'linhas_mantidas'. O limite é arredondado para o início do dia, de
+    modo que cada dia é removido por inteiro. A remoção é feita em lotes pequenos,
+    cada um em sua própria transação, e o espaço é devolvido ao sistema com
+    PRAGMA incremental_vacuum quando o banco usa auto_vacuum incremental.
+    """
+
+    def __init__(self, db_manager, politicas: Optional[Dict[str, Dict]] = None, arquivo=None):
+        """
+        Args:
+            db_manager: Uma instância da classe AgriculturalDatabase.
+            politicas (dict): Políticas por tipo de sensor (ver POLITICAS_PADRAO).
+            arquivo (ColumnarArchive): Se informado, as medições brutas também só são
+                                       removidas depois de copiadas para o arquivo colunar.
+        """
+        self.db = db_manager
+        self.arquivo = arquivo
+        self.politicas = {POLITICA_PADRAO: dict(POLITICAS_PADRAO[POLITICA_PADRAO])}
+        for tipo, politica in (politicas or {}).items():
+            self.politicas[tipo.lower()] = politica
+
+    def executar(self, dry_run: bool = False, agora: Optional[datetime] = None,
+                 linhas_por_lote: int = LINHAS_POR_LOTE,
+                 pausa_entre_lotes: float = PAUSA_ENTRE_LOTES) -> List[Dict]:
+        """
+        Aplica todas as políticas.
+
+        Args:
+            dry_run (bool): Se True, apenas calcula quantas linhas e bytes cada
+                            política removeria, sem alterar o banco.
+            agora (datetime): Referência para os limites (padrão: datetime.now()).
+
+        Returns:
+            List[Dict]: Um relatório por política (tipo, sensores, linhas brutas,
+                        linhas mantidas por não estarem nos agregados, linhas
+                        horárias e bytes estimados).
+        """
+        agora = agora or datetime.now()
+        # Nada é apagado antes de estar nos agregados (também na simulação, para que
+        # o relatório reflita o que seria removido)
+        self.db.rollups.atualizar()
+        watermark = self.db.rollups.obter_watermark()
+        if self.arquivo is not None:
+            self.arquivo.sincronizar()
+            watermark = min(watermark, self.arquivo.obter_watermark())
+        bytes_por_linha = self._estimar_bytes_por_linha()
+
+        relatorio = []
+        for tipo, sensores in self._sensores_por_politica().items():
+            politica = self.politicas[tipo]
+            limite_bruto = (agora - timedelta(days=politica['dias_brutos'])).strftime("%Y-%m-%d 00:00:00")
+            dias_horarios = politica.get('dias_horarios')
+            limite_horario = ((agora - timedelta(days=dias_horarios)).strftime("%Y-%m-%d %H:00:00")
+                              if dias_horarios is not None else None)
+
+            linhas_brutas = linhas_mantidas = linhas_horarias = 0
+            for id_sensor in sensores:
+                descobertos = self._dias_sem_agregado(id_sensor, limite_bruto, watermark)
+                if descobertos:
+                    linhas_mantidas += self._contar_brutas(id_sensor, limite_bruto, watermark) - \
+                        self._contar_brutas(id_sensor, limite_bruto, watermark, descobertos)
+                if dry_run:
+                    linhas_brutas += self._contar_brutas(id_sensor, limite_bruto, watermark, descobertos)
+                    if limite_horario:
+                        linhas_horarias += self._contar_horarias(id_sensor, limite_horario)
+                else:
+                    filtro, parametros = self._filtro_brutas(id_sensor, limite_bruto, watermark, descobertos)
+                    linhas_brutas += self._remover_em_lotes(
+                        "DELETE FROM TABELA_MEDICOES_COMPACTA WHERE id_registro IN ("
+                        f" SELECT id_registro FROM TABELA_MEDICOES_COMPACTA WHERE {filtro} LIMIT ?)",
+                        parametros, linhas_por_lote, pausa_entre_lotes, manter_agregados=True)
+                    if limite_horario:
+                        linhas_horarias += self._remover_em_lotes(
+                            "DELETE FROM TABELA_MEDICOES_HORA WHERE (id_sensor, hora) IN ("
+                            " SELECT id_sensor, hora FROM TABELA_MEDICOES_HORA"
+                            " WHERE id_sensor = ? AND hora < ? LIMIT ?)",
+                            (id_sensor, limite_horario), linhas_por_lote, pausa_entre_lotes)
+
+            relatorio.append({
+                'tipo_sensor': tipo,
+                'sensores': len(sensores),
+                'limite_bruto': limite_bruto,
+                'linhas_brutas': linhas_brutas,
+                'linhas_mantidas': linhas_mantidas,
+                'linhas_horarias': linhas_horarias,
+                'bytes_estimados': int(linhas_brutas * bytes_por_linha),
+            })
+
+        if not dry_run:
+            self.recuperar_espaco()
+        return relatorio
+
+    def _sensores_por_politica(self) -> Dict[str, List[str]]:
+        """Agrupa os sensores com medições agregadas pela política que se aplica a eles."""
+        cursor = self.db.connection.cursor()
+        cursor.execute('''
+            SELECT d.id_sensor, LOWER(s.tipo_sensor)
+            FROM (SELECT DISTINCT id_sensor FROM TABELA_MEDICOES_DIA) d
+            LEFT JOIN TABELA_SENSORES s ON s.id_sensor = d.id_sensor
+        ''')
+        grupos: Dict[str, List[str]] = {}
+        for id_sensor, tipo in cursor.fetchall():
+            politica = tipo if tipo in self.politicas else POLITICA_PADRAO
+            grupos.setdefault(politica, []).append(id_sensor)
+        return grupos
+
+    def _dias_sem_agregado(self, id_sensor: str, limite: str, watermark: int) -> List[str]:
+        """
+        Dias ("YYYY-MM-DD") antes do limite com mais medições brutas (com valor) abaixo
+        da marca d'água do que o agregado diário conta: há medições que nunca foram
+        agregadas (ex.: gravadas com um id_registro reaproveitado, antes da migração 9).
+        """
+        cursor = self.db.connection.cursor()
+        cursor.execute('''
+            SELECT b.dia
+            FROM (
+                SELECT strftime('%Y-%m-%d', instante, 'unixepoch') AS dia, COUNT(valor) AS quantidade
+                FROM TABELA_MEDICOES_COMPACTA
+                WHERE chave_sensor = (SELECT chave_sensor FROM TABELA_CHAVES_SENSORES WHERE id_sensor = ?)
+                  AND instante < CAST(strftime('%s', ?) AS INTEGER) AND id_registro <= ?
+                GROUP BY 1
+            ) b
+            LEFT JOIN TABELA_MEDICOES_DIA d ON d.id_sensor = ? AND d.dia = b.dia
+            WHERE b.quantidade > COALESCE(d.quantidade, 0)
+        ''', (id_sensor, limite, watermark, id_sensor))
+        return [linha[0] for linha in cursor.fetchall()]
+
+    @staticmethod
+    def _filtro_brutas(id_sensor: str, limite: str, watermark: int,
+                       excluir_dias: Optional[List[str]] = None) -> Tuple[str, tuple]:
+        """WHERE (e parâmetros) das medições brutas do sensor que a política pode remover."""
+        filtro = ("chave_sensor = (SELECT chave_sensor FROM TABELA_CHAVES_SENSORES WHERE id_sensor = ?)"
+                  " AND instante < CAST(strftime('%s', ?) AS INTEGER) AND id_registro <= ?")
+        parametros = (id_sensor, limite, watermark)
+        if excluir_dias:
+            filtro += (" AND strftime('%Y-%m-%d', instante, 'unixepoch') NOT IN "
+                       f"({', '.join('?' * len(excluir_dias))})")
+            parametros += tuple(excluir_dias)
+        return filtro, parametros
+
+    def _contar_brutas(self, id_sensor: str, limite: str, watermark: int,
+                       excluir_dias: Optional[List[str]] = None) -> int:
+        filtro, parametros = self._filtro_brutas(id_sensor, limite, watermark, excluir_dias)
+        cursor = self.db.connection.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM TABELA_MEDICOES_COMPACTA WHERE {filtro}", parametros)
+        return cursor.fetchone()[0]
+
+    def _contar_horarias(self, id_sensor: str, limite: str) -> int:
+        cursor = self.db.connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM TABELA_MEDICOES_HORA WHERE id_sensor = ? AND hora < ?",
+                       (id_sensor, limite))
+        return cursor.fetchone()[0]
+
+    def _remover_em_lotes(self, sql: str, parametros: tuple, linhas_por_lote: int,
+                          pausa_entre_lotes: float, manter_agregados: bool = False) -> int:
+        """
+        Executa o DELETE com LIMIT repetidamente, uma transação curta por lote.
+
+        Com manter_agregados, as medições removidas não são anotadas para recálculo
+        (ver rollups.REMOCAO_DA_RETENCAO): os agregados são o histórico delas.
+        """
+        conexao = self.db.connection
+        cursor = conexao.cursor()
+        removidas = 0
+        while True:
+            try:
+                if manter_agregados:
+                    cursor.execute("INSERT INTO TABELA_CONTROLE_AGREGADOS (nome, watermark) VALUES (?, 0)",
+                                   (REMOCAO_DA_RETENCAO,))
+                cursor.execute(sql, parametros + (linhas_por_lote,))
+                afetadas = cursor.rowcount
+                if manter_agregados:
+                    cursor.execute("DELETE FROM TABELA_CONTROLE_AGREGADOS WHERE nome = ?", (REMOCAO_DA_RETENCAO,))
+                conexao.commit()
+            except sqlite3.Error as e:
+                conexao.rollback()
+                print(f"Erro ao aplicar retenção: {e}")
+                break
+            removidas += afetadas
+            if afetadas < linhas_por_lote:
+                break
+            time.sleep(pausa_entre_lotes)
+        return removidas
+
+    def _estimar_bytes_por_linha(self) -> float:
+        """Bytes médios por medição (tabela + índices), via dbstat quando disponível."""
+        cursor = self.db.connection.cursor()
+        try:
+            cursor.execute("SELECT COUNT(*) FROM TABELA_MEDICOES_COMPACTA")
+            total = cursor.fetchone()[0]
+            if not total:
+                return 0.0
+            marcadores = ', '.join('?' * len(OBJETOS_MEDICOES))
+            cursor.execute(f"SELECT SUM(pgsize) FROM dbstat WHERE name IN ({marcadores})", OBJETOS_MEDICOES)
+            return (cursor.fetchone()[0] or 0) / total
+        except sqlite3.Error:
+            # SQLite compilado sem dbstat: estima pelo tamanho dos campos (tabela + 3 índices)
+            cursor.execute('''
+                SELECT AVG(length(id_medicao) + 24)
+                FROM (SELECT id_medicao FROM TABELA_MEDICOES_COMPACTA LIMIT 10000)
+            ''')
+            return (cursor.fetchone()[0] or 0) * 3
+
+    def ativar_vacuum_incremental(self) -> bool:
+        """
+        Converte o banco para auto_vacuum incremental (operação única, com VACUUM completo).
+
+        Os agregados (e o arquivo colunar, se houver) são atualizados antes e as
+        marcas d'água reposicionadas no rowid máximo depois. Com a chave INTEGER de
+        TABELA_MEDICOES_COMPACTA o VACUUM não renumera as medições; o
+        reposicionamento fica apenas como garantia.
+        """
+        conexao = self.db.connection
+        cursor = conexao.cursor()
+        cursor.execute("PRAGMA auto_vacuum")
+        if cursor.fetchone()[0] == 2:
+            return True
+        try:
+            self.db.rollups.atualizar()
+            if self.arquivo is not None:
+                self.arquivo.sincronizar()
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conexao.commit()
+            cursor.execute("VACUUM")
+            cursor.execute("SELECT COALESCE(MAX(id_registro), 0) FROM TABELA_MEDICOES_COMPACTA")
+            novo_maximo = cursor.fetchone()[0]
+            self.db.rollups.definir_watermark(novo_maximo)
+            if self.arquivo is not None:
+                self.arquivo.definir_watermark(novo_maximo)
+            print("Vacuum incremental ativado.")
+            return True
+        except sqlite3.Error as e:
+            print(f"Erro ao ativar vacuum incremental: {e}")
+            return False
+
+    def recuperar_espaco(self, paginas_por_passo: int = PAGINAS_POR_PASSO_VACUUM) -> int:
+        """
+        Devolve as páginas livres ao sistema de arquivos em passos curtos.
+
+        Returns:
+            int: Número de páginas liberadas (0 se o banco não usa auto_vacuum incremental).
+        """
+        conexao = self.db.connection
+        cursor = conexao.cursor()
+        cursor.execute("PRAGMA auto_vacuum")
+        if cursor.fetchone()[0] != 2:
+            return 0
+        liberadas = 0
+        while True:
+            cursor.execute("PRAGMA freelist_count")
+            livres = cursor.fetchone()[0]
+            if not livres:
+                break
+            passo = min(livres, paginas_por_passo)
+            cursor.execute(f"PRAGMA incremental_vacuum({passo})")
+            cursor.fetchall()
+            conexao.commit()
+            liberadas += passo
+        cursor.execute("PRAGMA journal_mode")
+        if liberadas and cursor.fetchone()[0] == 'wal':
+            # Em WAL o arquivo principal só diminui quando o checkpoint é concluído
+            cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            cursor.fetchall()
+        return liberadas
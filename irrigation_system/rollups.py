@@ -0,0 +1,298 @@
+# rollups.py
+
+import sqlite3
+from typing import Dict, List, Optional
+
+# Linhas brutas de TABELA_MEDICOES_COMPACTA processadas por transação durante a atualização
+LINHAS_POR_TRANSACAO = 100_000
+
+# Nome da marca d'água em TABELA_CONTROLE_AGREGADOS
+WATERMARK_MEDICOES = "medicoes"
+# Linha de TABELA_CONTROLE_AGREGADOS que, enquanto existe (só dentro da transação da
+# retenção), faz os gatilhos da migração 10 não anotarem as remoções como pendentes
+REMOCAO_DA_RETENCAO = "retencao"
+
+# Tabela de destino -> (coluna do período, formato strftime que trunca o instante da medição)
+PERIODOS = {
+    'TABELA_MEDICOES_HORA': ('hora', '%Y-%m-%d %H:00:00'),
+    'TABELA_MEDICOES_DIA': ('dia', '%Y-%m-%d'),
+}
+
+
+class SensorRollups:
+    """
+    Mantém agregados por sensor e por hora/dia (quantidade, soma, mínimo, máximo e
+    último valor) a partir das medições (TABELA_MEDICOES_COMPACTA).
+
+    A atualização é incremental: processa apenas as linhas com rowid acima da marca
+    d'água gravada em TABELA_CONTROLE_AGREGADOS e combina os novos valores com os
+    agregados existentes (inclusive para horas que recebem dados atrasados).
+    Remoções e alterações de medições já agregadas são anotadas por gatilhos em
+    TABELA_AGREGADOS_PENDENTES; essas horas são recalculadas a partir das medições
+    brutas e os dias delas, a partir dos agregados horários do dia.
+    """
+
+    def __init__(self, db_manager):
+        """
+        Args:
+            db_manager: Uma instância da classe AgriculturalDatabase.
+        """
+        self.db = db_manager
+
+    def obter_watermark(self) -> int:
+        """Retorna o último rowid de TABELA_MEDICOES_COMPACTA já incluído nos agregados."""
+        cursor = self.db.connection.cursor()
+        cursor.execute("SELECT watermark FROM TABELA_CONTROLE_AGREGADOS WHERE nome = ?", (WATERMARK_MEDICOES,))
+        linha = cursor.fetchone()
+        return linha[0] if linha else 0
+
+    def atualizar(self, linhas_por_transacao: int = LINHAS_POR_TRANSACAO) -> int:
+        """
+        Recalcula as horas pendentes e agrega as medições inseridas desde a última execução.
+
+        Cada faixa de rowids é agregada e gravada junto com a nova marca d'água na
+        mesma transação, então uma interrupção nunca conta linhas duas vezes.
+
+        Returns:
+            int: Número de linhas brutas processadas (sem contar as horas recalculadas).
+        """
+        conexao = self.db.connection
+        cursor = conexao.cursor()
+        try:
+            watermark = self.obter_watermark()
+            self._recalcular_pendentes(cursor, watermark)
+            conexao.commit()
+            cursor.execute("SELECT MAX(id_registro) FROM TABELA_MEDICOES_COMPACTA")
+            maximo = cursor.fetchone()[0] or 0
+            processadas = 0
+            while watermark < maximo:
+                limite = min(watermark + linhas_por_transacao, maximo)
+                for tabela in PERIODOS:
+                    self._agregar_faixa(cursor, tabela, watermark, limite)
+                self._gravar_watermark(cursor, limite)
+                conexao.commit()
+                processadas += limite - watermark
+                watermark = limite
+            return processadas
+        except sqlite3.Error as e:
+            conexao.rollback()
+            print(f"Erro ao atualizar agregados de medições: {e}")
+            return 0
+
+    def definir_watermark(self, watermark: int):
+        """
+        Reposiciona a marca d'água sem reagregar. Usado depois de operações que
+        renumeram os rowids (ex.: VACUUM) quando todas as linhas já estavam agregadas.
+        """
+        conexao = self.db.connection
+        self._gravar_watermark(conexao.cursor(), watermark)
+        conexao.commit()
+
+    @staticmethod
+    def _gravar_watermark(cursor: sqlite3.Cursor, watermark: int):
+        cursor.execute('''
+            INSERT INTO TABELA_CONTROLE_AGREGADOS (nome, watermark) VALUES (?, ?)
+            ON CONFLICT(nome) DO UPDATE SET watermark = excluded.watermark
+        ''', (WATERMARK_MEDICOES, watermark))
+
+    @staticmethod
+    def _recalcular_pendentes(cursor: sqlite3.Cursor, watermark: int):
+        """Refaz os agregados das horas (e dos dias) anotados em TABELA_AGREGADOS_PENDENTES."""
+        cursor.execute('''
+            SELECT p.chave_sensor, k.id_sensor, p.hora
+            FROM TABELA_AGREGADOS_PENDENTES p
+            JOIN TABELA_CHAVES_SENSORES k ON k.chave_sensor = p.chave_sensor
+        ''')
+        pendentes = cursor.fetchall()
+        for chave_sensor, id_sensor, hora in pendentes:
+            cursor.execute("DELETE FROM TABELA_MEDICOES_HORA WHERE id_sensor = ? AND hora = ?", (id_sensor, hora))
+            cursor.execute('''
+                INSERT INTO TABELA_MEDICOES_HORA
+                    (id_sensor, hora, quantidade, soma, minimo, maximo, ultimo_valor, data_ultimo)
+                SELECT ?, ?, COUNT(*), SUM(valor), MIN(valor), MAX(valor),
+                       MAX(CASE WHEN posicao = 1 THEN valor END), datetime(MAX(instante), 'unixepoch')
+                FROM (
+                    SELECT chave_sensor, valor, instante,
+                           ROW_NUMBER() OVER (ORDER BY instante DESC, id_registro DESC) AS posicao
+                    FROM TABELA_MEDICOES_COMPACTA
+                    WHERE chave_sensor = ? AND valor IS NOT NULL AND id_registro <= ?
+                      AND instante >= CAST(strftime('%s', ?) AS INTEGER)
+                      AND instante < CAST(strftime('%s', ?) AS INTEGER) + 3600
+                )
+                GROUP BY chave_sensor
+            ''', (id_sensor, hora, chave_sensor, watermark, hora, hora))
+        for id_sensor, dia in sorted({(id_sensor, hora[:10]) for _, id_sensor, hora in pendentes}):
+            cursor.execute("DELETE FROM TABELA_MEDICOES_DIA WHERE id_sensor = ? AND dia = ?", (id_sensor, dia))
+            cursor.execute('''
+                INSERT INTO TABELA_MEDICOES_DIA
+                    (id_sensor, dia, quantidade, soma, minimo, maximo, ultimo_valor, data_ultimo)
+                SELECT ?, ?, SUM(quantidade), SUM(soma), MIN(minimo), MAX(maximo),
+                       MAX(CASE WHEN posicao = 1 THEN ultimo_valor END), MAX(data_ultimo)
+                FROM (
+                    SELECT substr(hora, 1, 10) AS dia, quantidade, soma, minimo, maximo, ultimo_valor,
+                           data_ultimo, ROW_NUMBER() OVER (ORDER BY data_ultimo DESC) AS posicao
+                    FROM TABELA_MEDICOES_HORA
+                    WHERE id_sensor = ? AND hora >= ? AND hora < date(?, '+1 day')
+                )
+                GROUP BY dia
+            ''', (id_sensor, dia, id_sensor, dia, dia))
+        cursor.executemany("DELETE FROM TABELA_AGREGADOS_PENDENTES WHERE chave_sensor = ? AND hora = ?",
+                           [(chave_sensor, hora) for chave_sensor, _, hora in pendentes])
+
+    @staticmethod
+    def _agregar_faixa(cursor: sqlite3.Cursor, tabela: str, de_rowid: int, ate_rowid: int):
+        """Agrega as medições com rowid em (de_rowid, ate_rowid] e combina com os agregados existentes."""
+        coluna, formato = PERIODOS[tabela]
+        cursor.execute(f'''
+            INSERT INTO {tabela}
+                (id_sensor, {coluna}, quantidade, soma, minimo, maximo, ultimo_valor, data_ultimo)
+            SELECT k.id_sensor, periodo, COUNT(*), SUM(valor), MIN(valor), MAX(valor),
+                   MAX(CASE WHEN posicao = 1 THEN valor END), datetime(MAX(instante), 'unixepoch')
+            FROM (
+                SELECT chave_sensor, periodo, valor, instante,
+                       ROW_NUMBER() OVER (PARTITION BY chave_sensor, periodo
+                                          ORDER BY instante DESC, id_registro DESC) AS posicao
+                FROM (
+                    SELECT id_registro, chave_sensor, instante, valor,
+                           strftime('{formato}', instante, 'unixepoch') AS periodo
+                    FROM TABELA_MEDICOES_COMPACTA
+                    WHERE id_registro > ? AND id_registro <= ?
+                )
+                WHERE periodo IS NOT NULL AND valor IS NOT NULL AND chave_sensor IS NOT NULL
+            ) m
+            JOIN TABELA_CHAVES_SENSORES k ON k.chave_sensor = m.chave_sensor
+            WHERE 1
+            GROUP BY k.id_sensor, periodo
+            ON CONFLICT(id_sensor, {coluna}) DO UPDATE SET
+                quantidade = quantidade + excluded.quantidade,
+                soma = soma + excluded.soma,
+                minimo = MIN(minimo, excluded.minimo),
+                maximo = MAX(maximo, excluded.maximo),
+                ultimo_valor = CASE WHEN excluded.data_ultimo >= data_ultimo
+                                    THEN excluded.ultimo_valor ELSE ultimo_valor END,
+                data_ultimo = MAX(data_ultimo, excluded.data_ultimo)
+        ''', (de_rowid, ate_rowid))
+
+    def reconstruir(self) -> int:
+        """Apaga todos os agregados e os recalcula a partir das medições brutas."""
+        conexao = self.db.connection
+        cursor = conexao.cursor()
+        try:
+            for tabela in PERIODOS:
+                cursor.execute(f"DELETE FROM {tabela}")
+            cursor.execute("DELETE FROM TABELA_AGREGADOS_PENDENTES")
+            cursor.execute("DELETE FROM TABELA_CONTROLE_AGREGADOS WHERE nome = ?", (WATERMARK_MEDICOES,))
+            conexao.commit()
+        except sqlite3.Error as e:
+            conexao.rollback()
+            print(f"Erro ao limpar agregados de medições: {e}")
+            return 0
+        processadas = self.atualizar()
+        print(f"Agregados reconstruídos a partir de {processadas} medições.")
+        return processadas
+
+    def verificar_consistencia(self, inicio: Optional[str] = None) -> List[Dict]:
+        """
+        Compara os agregados horários com os valores recalculados a partir das
+        medições brutas já cobertas pela marca d'água, e os diários com a soma dos horários.
+
+        Args:
+            inicio (str): Considera apenas períodos a partir desta data (útil quando
+                          medições antigas foram removidas pela retenção).
+
+        Returns:
+            List[Dict]: Uma entrada por divergência encontrada (lista vazia = consistente).
+        """
+        cursor = self.db.connection.cursor()
+        watermark = self.obter_watermark()
+        divergencias = []
+        try:
+            # Horário x bruto (nos dois sentidos, simulando um FULL OUTER JOIN)
+            cursor.execute('''
+                WITH bruto AS (
+                    SELECT k.id_sensor, strftime('%Y-%m-%d %H:00:00', m.instante, 'unixepoch') AS hora,
+                           COUNT(*) AS quantidade, SUM(m.valor) AS soma,
+                           MIN(m.valor) AS minimo, MAX(m.valor) AS maximo
+                    FROM TABELA_MEDICOES_COMPACTA m
+                    JOIN TABELA_CHAVES_SENSORES k ON k.chave_sensor = m.chave_sensor
+                    WHERE m.id_registro <= ? AND m.valor IS NOT NULL
+                    GROUP BY 1, 2
+                    HAVING hora IS NOT NULL AND (? IS NULL OR hora >= ?)
+                ),
+                agregado AS (
+                    SELECT id_sensor, hora, quantidade, soma, minimo, maximo
+                    FROM TABELA_MEDICOES_HORA
+                    WHERE ? IS NULL OR hora >= ?
+                )
+                SELECT b.id_sensor, b.hora, b.quantidade, a.quantidade, b.soma, a.soma,
+                       b.minimo, a.minimo, b.maximo, a.maximo
+                FROM bruto b LEFT JOIN agregado a ON a.id_sensor = b.id_sensor AND a.hora = b.hora
+                WHERE a.quantidade IS NULL OR a.quantidade != b.quantidade
+                   OR ABS(a.soma - b.soma) > 1e-6 * MAX(1.0, ABS(b.soma))
+                   OR a.minimo != b.minimo OR a.maximo != b.maximo
+                UNION ALL
+                SELECT a.id_sensor, a.hora, NULL, a.quantidade, NULL, a.soma, NULL, a.minimo, NULL, a.maximo
+                FROM agregado a LEFT JOIN bruto b ON a.id_sensor = b.id_sensor AND a.hora = b.hora
+                WHERE b.id_sensor IS NULL
+            ''', (watermark, inicio, inicio, inicio, inicio))
+            for linha in cursor.fetchall():
+                divergencias.append({
+                    'tabela': 'TABELA_MEDICOES_HORA', 'id_sensor': linha[0], 'periodo': linha[1],
+                    'quantidade_bruta': linha[2], 'quantidade_agregada': linha[3],
+                    'soma_bruta': linha[4], 'soma_agregada': linha[5],
+                })
+
+            # Diário x soma dos horários
+            cursor.execute('''
+                SELECT d.id_sensor, d.dia, h.quantidade, d.quantidade, h.soma, d.soma
+                FROM TABELA_MEDICOES_DIA d
+                LEFT JOIN (
+                    SELECT id_sensor, substr(hora, 1, 10) AS dia,
+                           SUM(quantidade) AS quantidade, SUM(soma) AS soma
+                    FROM TABELA_MEDICOES_HORA
+                    GROUP BY 1, 2
+                ) h ON h.id_sensor = d.id_sensor AND h.dia = d.dia
+                WHERE (? IS NULL OR d.dia >= substr(?, 1, 10))
+                  AND (h.quantidade IS NULL OR h.quantidade != d.quantidade
+                       OR ABS(h.soma - d.soma) > 1e-6 * MAX(1.0, ABS(d.soma)))
+            ''', (inicio, inicio))
+            for linha in cursor.fetchall():
+                divergencias.append({
+                    'tabela': 'TABELA_MEDICOES_DIA', 'id_sensor': linha[0], 'periodo': linha[1],
+                    'quantidade_bruta': linha[2], 'quantidade_agregada': linha[3],
+                    'soma_bruta': linha[4], 'soma_agregada': linha[5],
+                })
+        except sqlite3.Error as e:
+            print(f"Erro ao verificar consistência dos agregados: {e}")
+        return divergencias
+
+    def consultar_horario(self, id_setor: Optional[str] = None, tipo_sensor: Optional[str] = None,
+                          inicio: Optional[str] = None, fim: Optional[str] = None) -> Dict[str, list]:
+        """
+        Retorna as médias horárias por sensor como um dict de listas
+        (hora, id_sensor, tipo_sensor, id_setor, valor_medio, minimo, maximo, ultimo_valor,
+        quantidade).
+        """
+        filtros = [('s.id_setor = ?', id_setor), ('s.tipo_sensor = ?', tipo_sensor),
+                   ('h.hora >= ?', inicio), ('h.hora < ?', fim)]
+        condicoes = [condicao for condicao, valor in filtros if valor is not None]
+        parametros = [valor for _, valor in filtros if valor is not None]
+        sql = '''
+            SELECT h.hora, h.id_sensor, s.tipo_sensor, s.id_setor,
+                   h.soma / h.quantidade AS valor_medio, h.minimo, h.maximo, h.ultimo_valor,
+                   h.quantidade
+            FROM TABELA_MEDICOES_HORA h
+            JOIN TABELA_SENSORES s ON h.id_sensor = s.id_sensor
+        '''
+        if condicoes:
+            sql += " WHERE " + " AND ".join(condicoes)
+        sql += " ORDER BY h.hora"
+        cursor = self.db.connection.cursor()
+        try:
+            cursor.execute(sql, parametros)
+            colunas = [desc[0] for desc in cursor.description]
+            linhas = cursor.fetchall()
+            return {nome: list(valores) for nome, valores in zip(colunas, zip(*linhas))} if linhas else {}
+        except sqlite3.Error as e:
+            print(f"Erro ao consultar agregados horários: {e}")
+            return {}
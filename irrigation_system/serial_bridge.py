@@ -0,0 +1,251 @@
+# serial_bridge.py
+
+import argparse
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Dict, IO, Optional
+
+from .database import AgriculturalDatabase
+
+# Intervalo entre leituras do controlador (UPDATE_INTERVAL em irrigation_controller.ino)
+INTERVALO_LEITURAS = 2.0
+BAUDRATE_PADRAO = 115200
+VOLUME_IRRIGACAO_PADRAO = 500.0   # litros registrados por acionamento do relé
+TAMANHO_LOTE_PADRAO = 5000
+INTERVALO_FLUSH_PADRAO = 5.0      # segundos máximos entre gravações no modo contínuo
+
+# Linha emitida por printSerialData, por exemplo:
+#   Fósforo: PRESENTE | Potássio: AUSENTE | pH: 6.5 | Umidade: 35.2% (BAIXA) | Nutrientes: OK -> IRRIGAÇÃO ATIVADA ✓
+# O casamento é feito direto sobre os bytes lidos (sem decodificar a linha).
+_REGEX_LEITURA = re.compile(
+    "Fósforo: (PRESENTE|AUSENTE) \\| Potássio: (PRESENTE|AUSENTE) \\| "
+    "pH: (-?[0-9.]+) \\| Umidade: (-?[0-9.]+)%.*?-> IRRIGAÇÃO (ATIVADA|DESATIVADA)".encode('utf-8')
+)
+# Prefixo opcional de data/hora (logs capturados com carimbo de tempo)
+_REGEX_INSTANTE = re.compile(rb"^\s*(\d{4}-\d\d-\d\d[ T]\d\d:\d\d:\d\d)")
+_MARCA_ERRO_DHT = b"Erro na leitura do sensor DHT22"
+_PRESENTE = b"PRESENTE"
+_ATIVADA = b"ATIVADA"
+
+# Campo da linha -> tipo_sensor cadastrado em TABELA_SENSORES
+CAMPOS_SENSORES = ('fosforo', 'potassio', 'ph', 'umidade')
+
+
+class SerialBridge:
+    """
+    Converte a saída serial do controlador (printSerialData) em medições e irrigações.
+
+    Cada linha reconhecida gera uma medição por sensor mapeado (fósforo e potássio
+    como 1.0/0.0) e, quando o relé passa de desligado para ligado, uma irrigação no
+    setor configurado. Os registros são acumulados e gravados em lotes com a API de
+    inserção em lote do AgriculturalDatabase. Os IDs são derivados do sensor e do
+    instante da leitura, então repetir o replay de um mesmo log não duplica dados
+    (em logs sem carimbo de tempo, desde que o `inicio` informado seja o mesmo).
+    """
+
+    def __init__(self, db_manager, id_setor: str, sensores: Optional[Dict[str, str]] = None,
+                 volume_irrigacao: float = VOLUME_IRRIGACAO_PADRAO,
+                 tamanho_lote: int = TAMANHO_LOTE_PADRAO):
+        """
+        Args:
+            db_manager: Uma instância da classe AgriculturalDatabase.
+            id_setor (str): Setor atendido pelo controlador.
+            sensores (dict): Campo ('fosforo', 'potassio', 'ph', 'umidade') -> id_sensor.
+                             Se omitido, usa os sensores do setor pelo tipo_sensor.
+            volume_irrigacao (float): Volume (L) registrado a cada acionamento do relé.
+        """
+        self.db = db_manager
+        self.id_setor = id_setor
+        self.volume_irrigacao = volume_irrigacao
+        self.tamanho_lote = tamanho_lote
+        self.sensores = sensores if sensores is not None else self._sensores_do_setor(id_setor)
+        # Ordem fixa dos grupos do regex: fósforo, potássio, pH, umidade
+        self._mapeamento = tuple(self.sensores.get(campo) for campo in CAMPOS_SENSORES)
+
+        self._medicoes = []
+        self._irrigacoes = []
+        self._rele_ligado = False
+        self._erro_dht = False
+        self.estatisticas = {'linhas': 0, 'leituras': 0, 'medicoes': 0, 'irrigacoes': 0,
+                             'duplicados': 0, 'erros': 0}
+
+    def _sensores_do_setor(self, id_setor: str) -> Dict[str, str]:
+        sensores = {}
+        for sensor in self.db.consultar_sensores():
+            tipo = (sensor['tipo_sensor'] or '').lower()
+            if sensor['id_setor'] == id_setor and tipo in CAMPOS_SENSORES:
+                sensores.setdefault(tipo, sensor['id_sensor'])
+        return sensores
+
+    # ---------- Interpretação ----------
+
+    def processar_linha(self, linha: bytes, instante: Optional[datetime] = None) -> bool:
+        """
+        Interpreta uma linha da serial e enfileira os registros correspondentes.
+
+        Args:
+            linha (bytes): Linha bruta, como lida do dispositivo ou do log.
+            instante (datetime): Momento da leitura, usado quando a linha não traz
+                                 carimbo de tempo (padrão: agora).
+
+        Returns:
+            bool: True se a linha era uma leitura do controlador.
+        """
+        self.estatisticas['linhas'] += 1
+        encontrado = _REGEX_LEITURA.search(linha)
+        if encontrado is None:
+            if _MARCA_ERRO_DHT in linha:
+                # A próxima linha traz umidade 0.0 como valor padrão, não uma leitura
+                self._erro_dht = True
+            return False
+
+        carimbo = _REGEX_INSTANTE.match(linha)
+        if carimbo is not None:
+            data = carimbo.group(1).decode('ascii').replace('T', ' ')
+        else:
+            data = (instante or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+        sufixo = data.replace('-', '').replace(' ', '').replace(':', '')
+
+        fosforo, potassio, ph, umidade, rele = encontrado.groups()
+        valores = (1.0 if fosforo == _PRESENTE else 0.0,
+                   1.0 if potassio == _PRESENTE else 0.0,
+                   float(ph),
+                   None if self._erro_dht else float(umidade))
+        self._erro_dht = False
+        for id_sensor, valor in zip(self._mapeamento, valores):
+            if id_sensor is not None and valor is not None:
+                self._medicoes.append((f"SER_{id_sensor}_{sufixo}", valor, data, id_sensor))
+
+        ligado = rele == _ATIVADA
+        if ligado and not self._rele_ligado:
+            self._irrigacoes.append((f"SER_IRR_{self.id_setor}_{sufixo}", self.volume_irrigacao,
+                                     data, self.id_setor))
+        self._rele_ligado = ligado
+
+        self.estatisticas['leituras'] += 1
+        if len(self._medicoes) >= self.tamanho_lote:
+            self.descarregar()
+        return True
+
+    def descarregar(self):
+        """Grava as medições e irrigações pendentes (uma transação por lote)."""
+        for pendentes, inserir, chave in ((self._medicoes, self.db.inserir_medicoes_em_lote, 'medicoes'),
+                                          (self._irrigacoes, self.db.inserir_irrigacoes_em_lote, 'irrigacoes')):
+            if not pendentes:
+                continue
+            resultado = inserir(pendentes, tamanho_lote=self.tamanho_lote, exibir_resumo=False)
+            self.estatisticas[chave] += resultado['inseridos']
+            self.estatisticas['duplicados'] += resultado['duplicados']
+            self.estatisticas['erros'] += len(resultado['erros'])
+            pendentes.clear()
+
+    # ---------- Fontes ----------
+
+    def replay(self, caminho: str, inicio: Optional[datetime] = None,
+               intervalo: float = INTERVALO_LEITURAS) -> Dict:
+        """
+        Importa um log capturado da serial o mais rápido possível (backfill).
+
+        Linhas sem carimbo de tempo recebem instantes sintéticos a partir de
+        `inicio`, espaçados de `intervalo` segundos (o período do controlador). Como
+        os IDs vêm desses instantes, `inicio` é obrigatório para essas linhas: com a
+        hora atual, cada replay do mesmo log gravaria as leituras de novo.
+
+        Returns:
+            Dict: Estatísticas da importação.
+
+        Raises:
+            ValueError: O log tem leituras sem carimbo de tempo e `inicio` não foi
+                        informado (o que já foi lido até ali é gravado).
+        """
+        instante = inicio
+        passo = timedelta(seconds=intervalo)
+        with open(caminho, 'rb', buffering=1024 * 1024) as arquivo:
+            for numero, linha in enumerate(arquivo, start=1):
+                if instante is None and _REGEX_INSTANTE.match(linha) is None and _REGEX_LEITURA.search(linha):
+                    self.descarregar()
+                    raise ValueError(f"a linha {numero} de '{caminho}' não tem carimbo de tempo; "
+                                     f"informe a data/hora da primeira leitura do log (inicio)")
+                if self.processar_linha(linha, instante) and instante is not None:
+                    instante += passo
+        self.descarregar()
+        return dict(self.estatisticas)
+
+    def acompanhar(self, origem: str, baudrate: int = BAUDRATE_PADRAO,
+                   intervalo_flush: float = INTERVALO_FLUSH_PADRAO):
+        """
+        Lê continuamente de uma porta serial, pty ou arquivo de log (como `tail -f`)
+        até Ctrl+C, gravando os registros pendentes a cada `intervalo_flush` segundos.
+        """
+        fonte = self._abrir_fonte(origem, baudrate)
+        ultimo_flush = time.monotonic()
+        print(f"Lendo dados do controlador em {origem} (Ctrl+C para encerrar)...")
+        try:
+            while True:
+                linha = fonte.readline()
+                if linha:
+                    self.processar_linha(linha)
+                else:
+                    # Fim do arquivo (log) ou timeout da serial: aguarda mais dados
+                    time.sleep(0.2)
+                if time.monotonic() - ultimo_flush >= intervalo_flush:
+                    self.descarregar()
+                    ultimo_flush = time.monotonic()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.descarregar()
+            fonte.close()
+        return dict(self.estatisticas)
+
+    @staticmethod
+    def _abrir_fonte(origem: str, baudrate: int) -> IO[bytes]:
+        if origem.startswith(('/dev/tty', 'COM')):
+            try:
+                import serial  # pyserial, necessário apenas para portas seriais reais
+            except ImportError:
+                print("pyserial não instalado; lendo o dispositivo como arquivo.")
+            else:
+                return serial.Serial(origem, baudrate, timeout=1)
+        # pty ou log: leitura bufferizada do próprio arquivo
+        return open(origem, 'rb')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa a saída serial do controlador de irrigação.")
+    parser.add_argument("origem", help="Porta serial (/dev/ttyUSB0, COM3), pty ou arquivo de log")
+    parser.add_argument("--setor", required=True, help="ID do setor atendido pelo controlador")
+    parser.add_argument("--db", default="data/agricultural_system.db")
+    parser.add_argument("--sensor", action="append", default=[], metavar="CAMPO=ID",
+                        help="Mapeia um campo (fosforo, potassio, ph, umidade) para um id_sensor")
+    parser.add_argument("--volume", type=float, default=VOLUME_IRRIGACAO_PADRAO,
+                        help="Litros registrados por acionamento do relé")
+    parser.add_argument("--replay", action="store_true", help="Importa um log capturado e encerra")
+    parser.add_argument("--inicio", help="Data/hora da primeira leitura do log (YYYY-MM-DD HH:MM:SS); "
+                                         "obrigatória se o log não tiver carimbo de tempo")
+    parser.add_argument("--baudrate", type=int, default=BAUDRATE_PADRAO)
+    args = parser.parse_args()
+
+    sensores = dict(item.split('=', 1) for item in args.sensor) or None
+    db = AgriculturalDatabase(db_name=args.db)
+    try:
+        ponte = SerialBridge(db, args.setor, sensores=sensores, volume_irrigacao=args.volume)
+        if args.replay:
+            try:
+                inicio = datetime.fromisoformat(args.inicio) if args.inicio else None
+                estatisticas = ponte.replay(args.origem, inicio=inicio)
+            except ValueError as e:
+                print(f"Erro ao importar log: {e}")
+                return
+        else:
+            estatisticas = ponte.acompanhar(args.origem, baudrate=args.baudrate)
+        print(f"{estatisticas['leituras']} leituras de {estatisticas['linhas']} linhas: "
+              f"{estatisticas['medicoes']} medições e {estatisticas['irrigacoes']} irrigações gravadas "
+              f"({estatisticas['duplicados']} já existentes, {estatisticas['erros']} rejeitadas).")
+    finally:
+        db.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,638 @@
+# sharding.py
+
+import argparse
+import heapq
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .database import COLUNAS_LOTE, FORMATOS_ITERACAO, TAMANHO_LOTE_PADRAO, AgriculturalDatabase
+
+DIRETORIO_PADRAO = "data/shards"
+ARQUIVO_CATALOGO = "catalogo.db"
+
+# Iterador -> coluna de data usada para intercalar as linhas ordenadas de vários shards
+COLUNAS_DATA_ITERACAO = {
+    'iterar_medicoes': 'data_medicao',
+    'iterar_irrigacoes': 'data_irrigacao',
+    'iterar_aplicacoes_nutrientes': 'data_aplicacao',
+    'iterar_correcoes_ph': 'data_correcao',
+}
+
+
+class ShardCatalog:
+    """
+    Catálogo (um pequeno arquivo SQLite) com os shards e a qual shard pertence cada
+    setor e cada sensor. O roteador mantém uma cópia em memória e só volta ao
+    arquivo quando não encontra uma chave (ex.: setor criado por outro processo).
+    """
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        with self._conectar() as conexao:
+            conexao.execute("CREATE TABLE IF NOT EXISTS TABELA_SHARDS (nome VARCHAR(50) PRIMARY KEY, caminho TEXT NOT NULL)")
+            conexao.execute("CREATE TABLE IF NOT EXISTS TABELA_SETORES_SHARD (id_setor VARCHAR(10) PRIMARY KEY, shard VARCHAR(50) NOT NULL)")
+            conexao.execute("CREATE TABLE IF NOT EXISTS TABELA_SENSORES_SHARD (id_sensor VARCHAR(10) PRIMARY KEY, shard VARCHAR(50) NOT NULL)")
+        self.recarregar()
+
+    def _conectar(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.caminho, timeout=30)
+
+    def recarregar(self):
+        with self._conectar() as conexao:
+            self.shards = dict(conexao.execute("SELECT nome, caminho FROM TABELA_SHARDS ORDER BY nome"))
+            self.setores = dict(conexao.execute("SELECT id_setor, shard FROM TABELA_SETORES_SHARD"))
+            self.sensores = dict(conexao.execute("SELECT id_sensor, shard FROM TABELA_SENSORES_SHARD"))
+
+    def _gravar(self, sql: str, parametros: Iterable[tuple], mapa: Optional[Dict] = None):
+        parametros = list(parametros)
+        with self._lock, self._conectar() as conexao:
+            conexao.executemany(sql, parametros)
+        if mapa is not None:
+            mapa.update(parametros)
+
+    def registrar_shard(self, nome: str, caminho: str):
+        self._gravar("INSERT OR REPLACE INTO TABELA_SHARDS (nome, caminho) VALUES (?, ?)", [(nome, caminho)], self.shards)
+
+    def registrar_setores(self, pares: Iterable[Tuple[str, str]]):
+        self._gravar("INSERT OR REPLACE INTO TABELA_SETORES_SHARD (id_setor, shard) VALUES (?, ?)", pares, self.setores)
+
+    def registrar_sensores(self, pares: Iterable[Tuple[str, str]]):
+        self._gravar("INSERT OR REPLACE INTO TABELA_SENSORES_SHARD (id_sensor, shard) VALUES (?, ?)", pares, self.sensores)
+
+    def remover(self, tabela: str, coluna: str, chave: str):
+        with self._lock, self._conectar() as conexao:
+            conexao.execute(f"DELETE FROM {tabela} WHERE {coluna} = ?", (chave,))
+        (self.setores if tabela == 'TABELA_SETORES_SHARD' else self.sensores).pop(chave, None)
+
+
+class ShardedDatabase:
+    """
+    Roteador sobre vários AgriculturalDatabase, um arquivo SQLite por fazenda (shard).
+
+    Operações de um setor ou sensor vão direto ao shard dono da chave, de modo que
+    fazendas diferentes gravam em paralelo sem disputar o mesmo lock. Leituras
+    gerais (consultar_setores, totais do dashboard, últimos valores) são
+    distribuídas a todos os shards em paralelo e os resultados são combinados.
+    As culturas são dados de referência e ficam replicadas em todos os shards.
+    Cada shard usa o modo pooled (uma conexão por thread) para permitir as
+    consultas paralelas.
+    """
+
+    def __init__(self, diretorio: str = DIRETORIO_PADRAO, fazenda_padrao: Optional[str] = None,
+                 **opcoes_banco):
+        """
+        Args:
+            diretorio (str): Pasta com o catálogo e os arquivos dos shards.
+            fazenda_padrao (str): Shard usado por inserir_setor quando a fazenda não
+                                  é informada (padrão: o único shard, se houver só um).
+            **opcoes_banco: Repassados a cada AgriculturalDatabase (ex.: instrumentar).
+        """
+        self.diretorio = diretorio
+        os.makedirs(diretorio, exist_ok=True)
+        self.catalogo = ShardCatalog(os.path.join(diretorio, ARQUIVO_CATALOGO))
+        self.fazenda_padrao = fazenda_padrao
+        self._opcoes_banco = dict(opcoes_banco, pooled=True)
+        self.shards: Dict[str, AgriculturalDatabase] = {}
+        for nome, caminho in self.catalogo.shards.items():
+            self.shards[nome] = AgriculturalDatabase(db_name=caminho, **self._opcoes_banco)
+        self._executor = ThreadPoolExecutor(max_workers=max(4, len(self.shards)),
+                                            thread_name_prefix="shard")
+        self.rollups = _RollupsDistribuidos(self)
+        self.ultimos = _UltimosDistribuidos(self)
+
+    # ---------- Shards ----------
+
+    def adicionar_fazenda(self, nome: str, caminho: Optional[str] = None) -> AgriculturalDatabase:
+        """Cria (ou abre) o shard de uma fazenda, replicando as culturas existentes."""
+        if nome in self.shards:
+            return self.shards[nome]
+        caminho = caminho or os.path.join(self.diretorio, f"{nome}.db")
+        banco = AgriculturalDatabase(db_name=caminho, **self._opcoes_banco)
+        culturas = self.consultar_culturas()
+        if culturas:
+            colunas = list(culturas[0])
+            conexao = banco.connection
+            conexao.cursor().executemany(
+                f"INSERT OR IGNORE INTO TABELA_CULTURAS ({', '.join(colunas)}) VALUES ({', '.join('?' * len(colunas))})",
+                [tuple(cultura[coluna] for coluna in colunas) for cultura in culturas])
+            conexao.commit()
+        self.catalogo.registrar_shard(nome, caminho)
+        self.shards[nome] = banco
+        return banco
+
+    def shard_do_setor(self, id_setor: str) -> Optional[AgriculturalDatabase]:
+        return self._shard('setores', id_setor)
+
+    def shard_do_sensor(self, id_sensor: str) -> Optional[AgriculturalDatabase]:
+        return self._shard('sensores', id_sensor)
+
+    def _shard(self, tipo: str, chave: str) -> Optional[AgriculturalDatabase]:
+        nome = getattr(self.catalogo, tipo).get(chave)
+        if nome is None:
+            # Pode ter sido criado por outro processo
+            self.catalogo.recarregar()
+            nome = getattr(self.catalogo, tipo).get(chave)
+        return self._abrir_shard(nome)
+
+    def _abrir_shard(self, nome: Optional[str]) -> Optional[AgriculturalDatabase]:
+        if nome is not None and nome not in self.shards and nome in self.catalogo.shards:
+            self.shards[nome] = AgriculturalDatabase(db_name=self.catalogo.shards[nome], **self._opcoes_banco)
+        return self.shards.get(nome)
+
+    def distribuir(self, funcao: Callable[[AgriculturalDatabase], Any]) -> List[Any]:
+        """Executa funcao(shard) em todos os shards em paralelo, na ordem dos nomes."""
+        return list(self._executor.map(funcao, [self.shards[nome] for nome in sorted(self.shards)]))
+
+    def disconnect(self):
+        for banco in self.shards.values():
+            banco.disconnect()
+        self._executor.shutdown(wait=True)
+
+    # ---------- Culturas (replicadas) ----------
+
+    def inserir_cultura(self, *args, **kwargs) -> bool:
+        return all(self.distribuir(lambda banco: banco.inserir_cultura(*args, **kwargs)))
+
+    def consultar_culturas(self) -> List[Dict]:
+        return self.shards[min(self.shards)].consultar_culturas() if self.shards else []
+
+    def atualizar_cultura(self, id_cultura: str, **kwargs) -> bool:
+        return all(self.distribuir(lambda banco: banco.atualizar_cultura(id_cultura, **kwargs)))
+
+    def remover_cultura(self, id_cultura: str) -> bool:
+        return all(self.distribuir(lambda banco: banco.remover_cultura(id_cultura)))
+
+    # ---------- Setores e sensores ----------
+
+    def inserir_setor(self, id_setor: str, area_setor: float, id_cultura: str,
+                      fazenda: Optional[str] = None) -> bool:
+        fazenda = fazenda or self.fazenda_padrao or (next(iter(self.shards)) if len(self.shards) == 1 else None)
+        if fazenda not in self.shards:
+            print(f"Erro ao inserir setor: informe a fazenda (shards disponíveis: {', '.join(sorted(self.shards))}).")
+            return False
+        if not self.shards[fazenda].inserir_setor(id_setor, area_setor, id_cultura):
+            return False
+        self.catalogo.registrar_setores([(id_setor, fazenda)])
+        return True
+
+    def inserir_sensor(self, id_sensor: str, tipo_sensor: str, id_setor: str) -> bool:
+        banco = self.shard_do_setor(id_setor)
+        if banco is None:
+            print(f"Erro ao inserir sensor: setor {id_setor} não pertence a nenhum shard.")
+            return False
+        if not banco.inserir_sensor(id_sensor, tipo_sensor, id_setor):
+            return False
+        self.catalogo.registrar_sensores([(id_sensor, self.catalogo.setores[id_setor])])
+        return True
+
+    def consultar_setores(self) -> List[Dict]:
+        return [setor for parte in self.distribuir(lambda banco: banco.consultar_setores()) for setor in parte]
+
+    def consultar_sensores(self) -> List[Dict]:
+        return [sensor for parte in self.distribuir(lambda banco: banco.consultar_sensores()) for sensor in parte]
+
+    def atualizar_setor(self, id_setor: str, **kwargs) -> bool:
+        banco = self.shard_do_setor(id_setor)
+        return banco.atualizar_setor(id_setor, **kwargs) if banco else False
+
+    def remover_setor(self, id_setor: str) -> bool:
+        banco = self.shard_do_setor(id_setor)
+        if banco is None or not banco.remover_setor(id_setor):
+            return False
+        self.catalogo.remover('TABELA_SETORES_SHARD', 'id_setor', id_setor)
+        return True
+
+    def atualizar_sensor(self, id_sensor: str, **kwargs) -> bool:
+        banco = self.shard_do_sensor(id_sensor)
+        return banco.atualizar_sensor(id_sensor, **kwargs) if banco else False
+
+    def remover_sensor(self, id_sensor: str) -> bool:
+        banco = self.shard_do_sensor(id_sensor)
+        if banco is None or not banco.remover_sensor(id_sensor):
+            return False
+        self.catalogo.remover('TABELA_SENSORES_SHARD', 'id_sensor', id_sensor)
+        return True
+
+    # ---------- Medições e eventos dos setores ----------
+
+    def inserir_medicao(self, id_medicao: str, valor_medicao: float, data_medicao: str, id_sensor: str) -> bool:
+        banco = self.shard_do_sensor(id_sensor)
+        if banco is None:
+            print(f"Erro ao inserir medição: sensor {id_sensor} não pertence a nenhum shard.")
+            return False
+        return banco.inserir_medicao(id_medicao, valor_medicao, data_medicao, id_sensor)
+
+    def _inserir_no_setor(self, metodo: str, *args) -> bool:
+        banco = self.shard_do_setor(args[-1])
+        if banco is None:
+            print(f"Erro: setor {args[-1]} não pertence a nenhum shard.")
+            return False
+        return getattr(banco, metodo)(*args)
+
+    def inserir_irrigacao(self, id_irrigacao, volume_irrigacao, data_irrigacao, id_setor) -> bool:
+        return self._inserir_no_setor('inserir_irrigacao', id_irrigacao, volume_irrigacao, data_irrigacao, id_setor)
+
+    def inserir_aplicacao_nutriente(self, id_aplicacao, tipo_aplicacao, volume_aplicacao,
+                                    data_aplicacao, id_setor) -> bool:
+        return self._inserir_no_setor('inserir_aplicacao_nutriente', id_aplicacao, tipo_aplicacao,
+                                      volume_aplicacao, data_aplicacao, id_setor)
+
+    def inserir_correcao_ph(self, id_correcao, tipo_correcao, volume_correcao, data_correcao, id_setor) -> bool:
+        return self._inserir_no_setor('inserir_correcao_ph', id_correcao, tipo_correcao,
+                                      volume_correcao, data_correcao, id_setor)
+
+    def consultar_medicoes(self) -> List[Dict]:
+        return [linha for parte in self.distribuir(lambda banco: banco.consultar_medicoes()) for linha in parte]
+
+    def consultar_irrigacoes(self) -> List[Dict]:
+        return [linha for parte in self.distribuir(lambda banco: banco.consultar_irrigacoes()) for linha in parte]
+
+    def consultar_aplicacoes_nutrientes(self) -> List[Dict]:
+        return [linha for parte in self.distribuir(lambda banco: banco.consultar_aplicacoes_nutrientes())
+                for linha in parte]
+
+    def consultar_correcoes_ph(self) -> List[Dict]:
+        return [linha for parte in self.distribuir(lambda banco: banco.consultar_correcoes_ph()) for linha in parte]
+
+    def _shard_do_registro(self, tabela: str, coluna: str, id_registro: str) -> Optional[AgriculturalDatabase]:
+        """Localiza (em paralelo) o shard que contém o registro com a chave informada."""
+        def contem(banco):
+            cursor = banco.connection.cursor()
+            cursor.execute(f"SELECT 1 FROM {tabela} WHERE {coluna} = ?", (id_registro,))
+            return cursor.fetchone() is not None
+        for nome, encontrado in zip(sorted(self.shards), self.distribuir(contem)):
+            if encontrado:
+                return self.shards[nome]
+        return None
+
+    def atualizar_medicao(self, id_medicao: str, **kwargs) -> bool:
+        banco = self._shard_do_registro('TABELA_MEDICOES', 'id_medicao', id_medicao)
+        return banco.atualizar_medicao(id_medicao, **kwargs) if banco else False
+
+    def remover_medicao(self, id_medicao: str) -> bool:
+        banco = self._shard_do_registro('TABELA_MEDICOES', 'id_medicao', id_medicao)
+        return banco.remover_medicao(id_medicao) if banco else False
+
+    def atualizar_irrigacao(self, id_irrigacao: str, **kwargs) -> bool:
+        banco = self._shard_do_registro('TABELA_IRRIGACOES', 'id_irrigacao', id_irrigacao)
+        return banco.atualizar_irrigacao(id_irrigacao, **kwargs) if banco else False
+
+    def remover_irrigacao(self, id_irrigacao: str) -> bool:
+        banco = self._shard_do_registro('TABELA_IRRIGACOES', 'id_irrigacao', id_irrigacao)
+        return banco.remover_irrigacao(id_irrigacao) if banco else False
+
+    # ---------- Inserção em lote ----------
+
+    def _inserir_em_lote(self, tabela: str, metodo: str, registros: Iterable, tamanho_lote: int,
+                         exibir_resumo: bool) -> Dict:
+        """
+        Separa os registros pelo shard da chave (último campo: id_sensor ou id_setor) e
+        grava cada grupo em paralelo com o método de lote do shard. Os índices dos
+        erros se referem à posição do registro na entrada.
+        """
+        colunas, _ = COLUNAS_LOTE[tabela]
+        chave = colunas[-1]
+        tipo = 'sensores' if chave == 'id_sensor' else 'setores'
+        mapa = getattr(self.catalogo, tipo)
+        resultado = {'inseridos': 0, 'duplicados': 0, 'erros': []}
+        grupos: Dict[str, Tuple[List[int], list]] = {}
+        desconhecidas = []
+        for indice, registro in enumerate(registros):
+            try:
+                valor = registro[chave] if isinstance(registro, dict) else registro[-1]
+            except (KeyError, IndexError, TypeError) as e:
+                resultado['erros'].append((indice, f"Registro inválido: {e}"))
+                continue
+            nome = mapa.get(valor)
+            if nome is None:
+                desconhecidas.append((indice, registro, valor))
+                continue
+            indices, linhas = grupos.setdefault(nome, ([], []))
+            indices.append(indice)
+            linhas.append(registro)
+        if desconhecidas:
+            self.catalogo.recarregar()
+            mapa = getattr(self.catalogo, tipo)
+            for indice, registro, valor in desconhecidas:
+                nome = mapa.get(valor)
+                if nome is None:
+                    resultado['erros'].append((indice, f"{chave} {valor} não pertence a nenhum shard"))
+                    continue
+                indices, linhas = grupos.setdefault(nome, ([], []))
+                indices.append(indice)
+                linhas.append(registro)
+
+        nomes = [nome for nome in grupos if self._abrir_shard(nome) is not None]
+        parciais = self._executor.map(
+            lambda nome: getattr(self.shards[nome], metodo)(grupos[nome][1], tamanho_lote=tamanho_lote,
+                                                             exibir_resumo=False),
+            nomes)
+        for nome, parcial in zip(nomes, parciais):
+            indices = grupos[nome][0]
+            resultado['inseridos'] += parcial['inseridos']
+            resultado['duplicados'] += parcial['duplicados']
+            resultado['erros'].extend((indices[local], mensagem) for local, mensagem in parcial['erros'])
+        resultado['erros'].sort()
+        if exibir_resumo:
+            print(f"{tabela}: {resultado['inseridos']} registros inseridos em {len(nomes)} shards, "
+                  f"{resultado['duplicados']} duplicados, {len(resultado['erros'])} com erro.")
+        return resultado
+
+    def inserir_medicoes_em_lote(self, medicoes: Iterable, tamanho_lote: int = TAMANHO_LOTE_PADRAO,
+                                 exibir_resumo: bool = True) -> Dict:
+        return self._inserir_em_lote('TABELA_MEDICOES', 'inserir_medicoes_em_lote',
+                                     medicoes, tamanho_lote, exibir_resumo)
+
+    def inserir_irrigacoes_em_lote(self, irrigacoes: Iterable, tamanho_lote: int = TAMANHO_LOTE_PADRAO,
+                                   exibir_resumo: bool = True) -> Dict:
+        return self._inserir_em_lote('TABELA_IRRIGACOES', 'inserir_irrigacoes_em_lote',
+                                     irrigacoes, tamanho_lote, exibir_resumo)
+
+    def inserir_aplicacoes_nutrientes_em_lote(self, aplicacoes: Iterable, tamanho_lote: int = TAMANHO_LOTE_PADRAO,
+                                              exibir_resumo: bool = True) -> Dict:
+        return self._inserir_em_lote('TABELA_APLICACOES_NUTRIENTES', 'inserir_aplicacoes_nutrientes_em_lote',
+                                     aplicacoes, tamanho_lote, exibir_resumo)
+
+    def inserir_correcoes_ph_em_lote(self, correcoes: Iterable, tamanho_lote: int = TAMANHO_LOTE_PADRAO,
+                                     exibir_resumo: bool = True) -> Dict:
+        return self._inserir_em_lote('TABELA_CORRECOES_PH', 'inserir_correcoes_ph_em_lote',
+                                     correcoes, tamanho_lote, exibir_resumo)
+
+    # ---------- Consultas em streaming ----------
+
+    def _iterar(self, metodo: str, banco_roteado: Optional[AgriculturalDatabase], roteado: bool,
+                filtros: Dict[str, Any], ordem: Optional[str], limite: Optional[int], formato: str,
+                tamanho_lote: int) -> Iterator[Any]:
+        if formato not in FORMATOS_ITERACAO:
+            raise ValueError(f"Formato inválido: {formato}. Use um de {FORMATOS_ITERACAO}.")
+        if roteado:
+            if banco_roteado is None:
+                return iter(())
+            return getattr(banco_roteado, metodo)(ordem=ordem, limite=limite, formato=formato,
+                                                  tamanho_lote=tamanho_lote, **filtros)
+        return self._intercalar(metodo, filtros, ordem, limite, formato, tamanho_lote)
+
+    def _intercalar(self, metodo: str, filtros: Dict[str, Any], ordem: Optional[str], limite: Optional[int],
+                    formato: str, tamanho_lote: int) -> Iterator[Any]:
+        """Combina os iteradores de todos os shards, mantendo a ordem por data quando pedida."""
+        iteradores = [getattr(self.shards[nome], metodo)(ordem=ordem, limite=limite, formato='dict',
+                                                          tamanho_lote=tamanho_lote, **filtros)
+                      for nome in sorted(self.shards)]
+        if ordem:
+            coluna = COLUNAS_DATA_ITERACAO[metodo]
+            linhas = heapq.merge(*iteradores, key=lambda linha: linha[coluna] or '',
+                                 reverse=ordem.lower() == 'desc')
+        else:
+            linhas = (linha for iterador in iteradores for linha in iterador)
+        if limite is not None:
+            linhas = islice(linhas, int(limite))
+        if formato == 'dict':
+            yield from linhas
+        elif formato == 'tupla':
+            for linha in linhas:
+                yield tuple(linha.values())
+        else:
+            while True:
+                bloco = list(islice(linhas, tamanho_lote))
+                if not bloco:
+                    break
+                yield {coluna: [linha[coluna] for linha in bloco] for coluna in bloco[0]}
+
+    def iterar_medicoes(self, id_sensor: Optional[str] = None, id_setor: Optional[str] = None,
+                        inicio: Optional[str] = None, fim: Optional[str] = None,
+                        tipo_sensor: Optional[str] = None, ordem: Optional[str] = None,
+                        limite: Optional[int] = None, formato: str = 'dict',
+                        tamanho_lote: int = TAMANHO_LOTE_PADRAO) -> Iterator[Any]:
+        """Como AgriculturalDatabase.iterar_medicoes; sem sensor/setor, intercala todos os shards."""
+        filtros = dict(id_sensor=id_sensor, id_setor=id_setor, inicio=inicio, fim=fim, tipo_sensor=tipo_sensor)
+        if id_sensor is not None:
+            return self._iterar('iterar_medicoes', self.shard_do_sensor(id_sensor), True,
+                                filtros, ordem, limite, formato, tamanho_lote)
+        return self._iterar('iterar_medicoes', self.shard_do_setor(id_setor) if id_setor else None,
+                            id_setor is not None, filtros, ordem, limite, formato, tamanho_lote)
+
+    def _iterar_setor(self, metodo: str, id_setor, inicio, fim, ordem, limite, formato, tamanho_lote):
+        filtros = dict(id_setor=id_setor, inicio=inicio, fim=fim)
+        return self._iterar(metodo, self.shard_do_setor(id_setor) if id_setor else None,
+                            id_setor is not None, filtros, ordem, limite, formato, tamanho_lote)
+
+    def iterar_irrigacoes(self, id_setor: Optional[str] = None, inicio: Optional[str] = None,
+                          fim: Optional[str] = None, ordem: Optional[str] = None,
+                          limite: Optional[int] = None, formato: str = 'dict',
+                          tamanho_lote: int = TAMANHO_LOTE_PADRAO) -> Iterator[Any]:
+        return self._iterar_setor('iterar_irrigacoes', id_setor, inicio, fim, ordem, limite, formato, tamanho_lote)
+
+    def iterar_aplicacoes_nutrientes(self, id_setor: Optional[str] = None, inicio: Optional[str] = None,
+                                     fim: Optional[str] = None, ordem: Optional[str] = None,
+                                     limite: Optional[int] = None, formato: str = 'dict',
+                                     tamanho_lote: int = TAMANHO_LOTE_PADRAO) -> Iterator[Any]:
+        return self._iterar_setor('iterar_aplicacoes_nutrientes', id_setor, inicio, fim, ordem, limite,
+                                  formato, tamanho_lote)
+
+    def iterar_correcoes_ph(self, id_setor: Optional[str] = None, inicio: Optional[str] = None,
+                            fim: Optional[str] = None, ordem: Optional[str] = None,
+                            limite: Optional[int] = None, formato: str = 'dict',
+                            tamanho_lote: int = TAMANHO_LOTE_PADRAO) -> Iterator[Any]:
+        return self._iterar_setor('iterar_correcoes_ph', id_setor, inicio, fim, ordem, limite,
+                                  formato, tamanho_lote)
+
+    def alteracoes_do_setor(self, id_setor: str,
+                            marcas: Optional[Dict[str, int]] = None) -> Tuple[Dict[str, int], Optional[str]]:
+        """Como AgriculturalDatabase.alteracoes_do_setor, no shard dono do setor."""
+        banco = self.shard_do_setor(id_setor)
+        return banco.alteracoes_do_setor(id_setor, marcas) if banco else ({}, None)
+
+    # ---------- Relatórios ----------
+
+    def obter_relatorio_setor(self, id_setor: str) -> Dict:
+        banco = self.shard_do_setor(id_setor)
+        return banco.obter_relatorio_setor(id_setor) if banco else {}
+
+    def totais_por_fazenda(self) -> List[Dict]:
+        """Setores, sensores, medições e última medição de cada shard (consultados em paralelo)."""
+        def totais(banco):
+            cursor = banco.connection.cursor()
+            cursor.execute('''
+                SELECT (SELECT COUNT(*) FROM TABELA_SETORES), (SELECT COUNT(*) FROM TABELA_SENSORES),
+                       (SELECT COUNT(*) FROM TABELA_MEDICOES_COMPACTA), (SELECT MAX(data_medicao) FROM TABELA_ULTIMAS_MEDICOES)
+            ''')
+            return cursor.fetchone()
+        return [{'fazenda': nome, 'setores': setores, 'sensores': sensores, 'medicoes': medicoes,
+                 'ultima_medicao': ultima}
+                for nome, (setores, sensores, medicoes, ultima) in zip(sorted(self.shards), self.distribuir(totais))]
+
+
+class _RollupsDistribuidos:
+    """Interface de SensorRollups aplicada a todos os shards."""
+
+    def __init__(self, roteador: ShardedDatabase):
+        self.roteador = roteador
+
+    def atualizar(self) -> int:
+        return sum(self.roteador.distribuir(lambda banco: banco.rollups.atualizar()))
+
+    def reconstruir(self) -> int:
+        return sum(self.roteador.distribuir(lambda banco: banco.rollups.reconstruir()))
+
+    def verificar_consistencia(self, inicio: Optional[str] = None) -> List[Dict]:
+        partes = self.roteador.distribuir(lambda banco: banco.rollups.verificar_consistencia(inicio))
+        return [divergencia for parte in partes for divergencia in parte]
+
+    def consultar_horario(self, id_setor: Optional[str] = None, tipo_sensor: Optional[str] = None,
+                          inicio: Optional[str] = None, fim: Optional[str] = None) -> Dict[str, list]:
+        if id_setor is not None:
+            banco = self.roteador.shard_do_setor(id_setor)
+            return banco.rollups.consultar_horario(id_setor, tipo_sensor, inicio, fim) if banco else {}
+        partes = [parte for parte in self.roteador.distribuir(
+            lambda banco: banco.rollups.consultar_horario(None, tipo_sensor, inicio, fim)) if parte]
+        if not partes:
+            return {}
+        # Junta as colunas e reordena por hora, como na consulta de um único banco
+        colunas = {nome: [valor for parte in partes for valor in parte[nome]] for nome in partes[0]}
+        ordem = sorted(range(len(colunas['hora'])), key=colunas['hora'].__getitem__)
+        return {nome: [valores[i] for i in ordem] for nome, valores in colunas.items()}
+
+
+class _UltimosDistribuidos:
+    """Interface de LatestValues aplicada a todos os shards."""
+
+    def __init__(self, roteador: ShardedDatabase):
+        self.roteador = roteador
+
+    def por_sensor(self, id_sensor: str) -> Optional[Dict]:
+        banco = self.roteador.shard_do_sensor(id_sensor)
+        return banco.ultimos.por_sensor(id_sensor) if banco else None
+
+    def por_setor(self, id_setor: str) -> Dict[str, Dict]:
+        banco = self.roteador.shard_do_setor(id_setor)
+        return banco.ultimos.por_setor(id_setor) if banco else {}
+
+    def vetor_atual(self, id_setor: str) -> Dict[str, float]:
+        banco = self.roteador.shard_do_setor(id_setor)
+        return banco.ultimos.vetor_atual(id_setor) if banco else {}
+
+    def ultima_medicao(self) -> Optional[Dict]:
+        linhas = [linha for linha in self.roteador.distribuir(lambda banco: banco.ultimos.ultima_medicao()) if linha]
+        return max(linhas, key=lambda linha: linha['data_medicao'], default=None)
+
+    def ultima_irrigacao(self, id_setor: Optional[str] = None) -> Optional[Dict]:
+        if id_setor is not None:
+            banco = self.roteador.shard_do_setor(id_setor)
+            return banco.ultimos.ultima_irrigacao(id_setor) if banco else None
+        linhas = [linha for linha in self.roteador.distribuir(lambda banco: banco.ultimos.ultima_irrigacao()) if linha]
+        return max(linhas, key=lambda linha: linha['data_irrigacao'], default=None)
+
+    def reconstruir(self) -> bool:
+        return all(self.roteador.distribuir(lambda banco: banco.ultimos.reconstruir()))
+
+
+# ---------- Divisão de um banco existente ----------
+
+def dividir_banco(origem: str, diretorio: str = DIRETORIO_PADRAO,
+                  mapa: Optional[Dict[str, str]] = None) -> Dict[str, Dict[str, int]]:
+    """
+    Copia um banco de arquivo único para shards por fazenda.
+
+    Args:
+        origem (str): Banco existente (não é alterado).
+        diretorio (str): Pasta de destino do catálogo e dos shards.
+        mapa (dict): id_setor -> nome da fazenda. Setores fora do mapa ganham um
+                     shard próprio ("setor_<id>").
+
+    Returns:
+        Dict: Linhas copiadas por tabela em cada shard.
+    """
+    fonte = sqlite3.connect(f"file:{origem}?mode=ro", uri=True)
+    setores = [linha[0] for linha in fonte.execute("SELECT id_setor FROM TABELA_SETORES ORDER BY id_setor")]
+    fonte.close()
+    mapa = dict(mapa or {})
+    for id_setor in setores:
+        mapa.setdefault(id_setor, f"setor_{id_setor}")
+
+    fazendas: Dict[str, List[str]] = {}
+    for id_setor, fazenda in mapa.items():
+        fazendas.setdefault(fazenda, []).append(id_setor)
+
+    os.makedirs(diretorio, exist_ok=True)
+    catalogo = ShardCatalog(os.path.join(diretorio, ARQUIVO_CATALOGO))
+    copias = {}
+    for fazenda, ids in sorted(fazendas.items()):
+        caminho = os.path.join(diretorio, f"{fazenda}.db")
+        banco = AgriculturalDatabase(db_name=caminho, agregados_automaticos=False)
+        conexao = banco.connection
+        setores_json = json.dumps(ids)
+        sensores_do_shard = "SELECT id_sensor FROM origem.TABELA_SENSORES WHERE id_setor IN (SELECT value FROM json_each(?))"
+        comandos = [
+            ('TABELA_CULTURAS', "SELECT * FROM origem.TABELA_CULTURAS", ()),
+            ('TABELA_SETORES', "SELECT * FROM origem.TABELA_SETORES WHERE id_setor IN (SELECT value FROM json_each(?))",
+             (setores_json,)),
+            ('TABELA_SENSORES', "SELECT * FROM origem.TABELA_SENSORES WHERE id_setor IN (SELECT value FROM json_each(?))",
+             (setores_json,)),
+            ('TABELA_CHAVES_SENSORES (id_sensor)', "SELECT id_sensor FROM main.TABELA_SENSORES", ()),
+            # Lê pela visão de compatibilidade (a origem pode estar no layout antigo ou no
+            # compacto) e grava direto na tabela compacta, já com as chaves do shard
+            ('TABELA_MEDICOES_COMPACTA (chave_sensor, instante, valor, id_medicao)',
+             f"SELECT k.chave_sensor, CAST(strftime('%s', o.data_medicao) AS INTEGER), o.valor_medicao, o.id_medicao "
+             f"FROM origem.TABELA_MEDICOES o JOIN main.TABELA_CHAVES_SENSORES k ON k.id_sensor = o.id_sensor "
+             f"WHERE o.id_sensor IN ({sensores_do_shard}) ORDER BY o.data_medicao, o.id_medicao",
+             (setores_json,)),
+        ] + [
+            (tabela, f"SELECT * FROM origem.{tabela} WHERE id_setor IN (SELECT value FROM json_each(?)) ORDER BY rowid",
+             (setores_json,))
+            for tabela in ('TABELA_IRRIGACOES', 'TABELA_APLICACOES_NUTRIENTES', 'TABELA_CORRECOES_PH')
+        ]
+        cursor = conexao.cursor()
+        cursor.execute("ATTACH DATABASE ? AS origem", (f"file:{origem}?mode=ro",))
+        try:
+            copias[fazenda] = {}
+            for tabela, consulta, parametros in comandos:
+                cursor.execute(f"INSERT OR IGNORE INTO main.{tabela} {consulta}", parametros)
+                copias[fazenda][tabela.split()[0]] = cursor.rowcount
+            conexao.commit()
+            cursor.execute("SELECT id_sensor FROM TABELA_SENSORES")
+            sensores = [(id_sensor, fazenda) for (id_sensor,) in cursor.fetchall()]
+        except sqlite3.Error as e:
+            conexao.rollback()
+            print(f"Erro ao copiar dados para o shard {fazenda}: {e}")
+            raise
+        finally:
+            cursor.execute("DETACH DATABASE origem")
+        banco.rollups.atualizar()
+        banco.disconnect()
+        catalogo.registrar_shard(fazenda, caminho)
+        catalogo.registrar_setores((id_setor, fazenda) for id_setor in ids)
+        catalogo.registrar_sensores(sensores)
+        print(f"Shard '{fazenda}': " + ", ".join(f"{tabela} {linhas}" for tabela, linhas in copias[fazenda].items()))
+    return copias
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ferramentas do modo com shards por fazenda.")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+    dividir = subcomandos.add_parser("dividir", help="Divide um banco de arquivo único em shards")
+    dividir.add_argument("--origem", default="data/agricultural_system.db")
+    dividir.add_argument("--destino", default=DIRETORIO_PADRAO)
+    dividir.add_argument("--mapa", default="", help="Setores por fazenda: 01=fazenda_a,02=fazenda_a,03=fazenda_b")
+    listar = subcomandos.add_parser("listar", help="Mostra os totais de cada shard")
+    listar.add_argument("--destino", default=DIRETORIO_PADRAO)
+    args = parser.parse_args()
+
+    if args.comando == "dividir":
+        mapa = dict(par.split('=', 1) for par in args.mapa.split(',') if par)
+        dividir_banco(args.origem, args.destino, mapa)
+    else:
+        roteador = ShardedDatabase(args.destino)
+        for totais in roteador.totais_por_fazenda():
+            print(f"{totais['fazenda']}: {totais['setores']} setores, {totais['sensores']} sensores, "
+                  f"{totais['medicoes']} medições (última: {totais['ultima_medicao']})")
+        roteador.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# snapshot.py
+
+import argparse
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Optional
+
+# Snapshot lido pelo dashboard (ver dashboard.load_db_service)
+ARQUIVO_SNAPSHOT_PADRAO = "data/agricultural_system.snapshot.db"
+# Segundos entre publicações
+INTERVALO_PADRAO = 60.0
+# Páginas copiadas por passo da API de backup: cada passo segura a leitura do banco
+# principal só por um instante
+PAGINAS_POR_PASSO = 256
+# Pausa (s) entre passos, deixando a vez para os escritores
+PAUSA_ENTRE_PASSOS = 0.005
+# A cópia recomeça do zero quando outra conexão grava no banco durante o backup;
+# depois deste número de recomeços ela é feita em um único passo
+MAX_RECOMECOS = 3
+
+
+class _CopiaRecomecada(Exception):
+    """Interrompe uma cópia incremental que recomeçou vezes demais."""
+
+
+class SnapshotPublisher:
+    """
+    Publica periodicamente uma cópia consistente do banco principal para leitura.
+
+    A cópia usa a API de backup online do SQLite (sqlite3.Connection.backup), algumas
+    páginas por passo, em um arquivo temporário que só substitui o snapshot publicado
+    (os.replace, atômico) quando está completo. Leitores abertos em modo imutável
+    (AgriculturalDatabase(..., somente_leitura=True)) nunca disputam locks com a
+    ingestão e sempre enxergam um único ponto no tempo.
+    """
+
+    def __init__(self, db_name: str = "data/agricultural_system.db",
+                 destino: str = ARQUIVO_SNAPSHOT_PADRAO, intervalo: float = INTERVALO_PADRAO,
+                 paginas_por_passo: int = PAGINAS_POR_PASSO,
+                 pausa_entre_passos: float = PAUSA_ENTRE_PASSOS):
+        """
+        Args:
+            db_name (str): Banco principal (em uso pela ingestão).
+            destino (str): Arquivo do snapshot publicado.
+            intervalo (float): Segundos entre publicações em executar().
+            paginas_por_passo (int): Páginas copiadas por passo do backup.
+            pausa_entre_passos (float): Segundos de pausa entre os passos.
+        """
+        self.db_name = db_name
+        self.destino = destino
+        self.intervalo = intervalo
+        self.paginas_por_passo = paginas_por_passo
+        self.pausa_entre_passos = pausa_entre_passos
+
+    def publicar(self) -> bool:
+        """
+        Copia o banco principal e publica a cópia como o snapshot atual.
+
+        Returns:
+            bool: True se um novo snapshot foi publicado.
+        """
+        pasta = os.path.dirname(self.destino)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        parcial = self.destino + ".parcial"
+        if os.path.exists(parcial):
+            os.remove(parcial)
+        inicio = time.perf_counter()
+        origem = None
+        try:
+            origem = sqlite3.connect(f"file:{self.db_name}?mode=ro", uri=True)
+            copia = sqlite3.connect(parcial)
+            try:
+                paginas = self._copiar(origem, copia)
+                # O snapshot é um arquivo único, sem -wal, para poder ser aberto como imutável
+                copia.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                copia.close()
+            os.replace(parcial, self.destino)
+        except sqlite3.Error as e:
+            print(f"Erro ao publicar o snapshot: {e}")
+            if os.path.exists(parcial):
+                os.remove(parcial)
+            return False
+        finally:
+            if origem is not None:
+                origem.close()
+        print(f"Snapshot publicado em '{self.destino}': {paginas} páginas "
+              f"em {time.perf_counter() - inicio:.2f}s.")
+        return True
+
+    def _copiar(self, origem: sqlite3.Connection, copia: sqlite3.Connection) -> int:
+        """Executa o backup incremental; recai para um passo único se recomeçar demais."""
+        estado = {'restantes': None, 'recomecos': 0, 'total': 0}
+
+        def progresso(status, restantes, total):
+            # As páginas restantes só aumentam quando o backup recomeçou do início
+            if estado['restantes'] is not None and restantes > estado['restantes']:
+                estado['recomecos'] += 1
+                if estado['recomecos'] > MAX_RECOMECOS:
+                    raise _CopiaRecomecada()
+            estado['restantes'], estado['total'] = restantes, total
+
+        try:
+            origem.backup(copia, pages=self.paginas_por_passo, progress=progresso,
+                          sleep=self.pausa_entre_passos)
+        except _CopiaRecomecada:
+            # Em WAL a leitura não bloqueia os escritores, então um passo único é seguro
+            print(f"Backup recomeçou {estado['recomecos']} vezes; copiando em um único passo.")
+            origem.backup(copia, pages=-1)
+            estado['total'] = copia.execute("PRAGMA page_count").fetchone()[0]
+        return estado['total']
+
+    def executar(self, ciclos: Optional[int] = None):
+        """Publica um snapshot a cada `intervalo` segundos (indefinidamente se ciclos=None)."""
+        publicados = 0
+        while ciclos is None or publicados < ciclos:
+            inicio = time.monotonic()
+            self.publicar()
+            publicados += 1
+            if ciclos is None or publicados < ciclos:
+                time.sleep(max(0.0, self.intervalo - (time.monotonic() - inicio)))
+
+
+def data_do_snapshot(caminho: str = ARQUIVO_SNAPSHOT_PADRAO) -> Optional[datetime]:
+    """Momento em que o snapshot foi publicado (None se não existir)."""
+    if not os.path.exists(caminho):
+        return None
+    return datetime.fromtimestamp(os.path.getmtime(caminho))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publica snapshots somente leitura do banco para o dashboard.")
+    parser.add_argument("--origem", default="data/agricultural_system.db", help="Banco principal")
+    parser.add_argument("--destino", default=ARQUIVO_SNAPSHOT_PADRAO, help="Arquivo do snapshot")
+    parser.add_argument("--intervalo", type=float, default=INTERVALO_PADRAO, help="Segundos entre publicações")
+    parser.add_argument("--paginas", type=int, default=PAGINAS_POR_PASSO, help="Páginas copiadas por passo")
+    parser.add_argument("--uma-vez", action="store_true", help="Publica um único snapshot e termina")
+    args = parser.parse_args()
+
+    publicador = SnapshotPublisher(args.origem, args.destino, args.intervalo, args.paginas)
+    try:
+        publicador.executar(ciclos=1 if args.uma_vez else None)
+    except KeyboardInterrupt:
+        print("Publicação de snapshots encerrada.")
+
+
+if __name__ == "__main__":
+    main()
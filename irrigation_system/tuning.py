@@ -0,0 +1,344 @@
+# tuning.py
+
+import argparse
+import itertools
+import math
+import multiprocessing
+import os
+import time
+import warnings
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, balanced_accuracy_score
+from sklearn.model_selection import TimeSeriesSplit
+from threadpoolctl import threadpool_limits
+
+from .database import AgriculturalDatabase
+from .engine import MotorFloresta, compilar
+from .features import FeatureStore
+from .intelligence import IrrigationIntelligence
+from .registry import chave_setor
+
+# Valores testados de cada hiperparâmetro da floresta
+GRADE_PADRAO = {
+    'n_estimators': [25, 50, 100, 200],
+    'max_depth': [None, 8, 16],
+    'min_samples_leaf': [1, 5, 20],
+    'class_weight': ['balanced', None],
+}
+# Dobras do walk-forward: cada uma treina com todas as horas anteriores ao seu bloco de teste
+DOBRAS_PADRAO = 3
+# A cada dobra, cerca de 1/FATOR_PODA dos candidatos segue para a próxima (por camada de Pareto)
+FATOR_PODA = 2
+# Tempo máximo da busca (segundos); o que estiver em andamento no fim ainda termina
+ORCAMENTO_PADRAO = 300
+# A escolha fica com o candidato mais rápido entre os que ficam a esta distância do melhor
+TOLERANCIA_PADRAO = 0.01
+# Chamadas de uma linha usadas para medir a latência de previsão
+REPETICOES_LATENCIA = 20
+METRICAS = ('acuracia_balanceada', 'acuracia')
+
+# Dados e dobras de cada processo do pool (recebidos uma vez, em _iniciar_processo)
+_DADOS_DO_PROCESSO: Optional[Tuple] = None
+
+
+def candidatos_da_grade(grade: Dict[str, List]) -> List[Dict]:
+    """Todas as combinações da grade, como dicionários de parâmetros do RandomForestClassifier."""
+    nomes = list(grade)
+    return [dict(zip(nomes, valores)) for valores in itertools.product(*(grade[nome] for nome in nomes))]
+
+
+def _domina(a: Tuple[float, float, float], b: Tuple[float, float, float]) -> bool:
+    return a[0] >= b[0] and a[1] <= b[1] and a[2] <= b[2] and a != b
+
+
+def camadas_de_pareto(pontos: List[Tuple[float, float, float]]) -> List[int]:
+    """
+    Camada de Pareto de cada ponto (métrica, latência, tamanho): 0 para os que nenhum
+    outro domina (métrica maior ou igual, latência e tamanho menores ou iguais), 1 para
+    os dominados só por pontos da camada 0, e assim por diante.
+    """
+    camadas = [0] * len(pontos)
+    restantes = set(range(len(pontos)))
+    camada = 0
+    while restantes:
+        fronteira = {i for i in restantes if not any(_domina(pontos[j], pontos[i]) for j in restantes)}
+        for i in fronteira:
+            camadas[i] = camada
+        restantes -= fronteira
+        camada += 1
+    return camadas
+
+
+def _avaliar(X: pd.DataFrame, y: pd.Series, dobras, parametros: Dict, dobra: int) -> Dict:
+    """
+    Treina o candidato no trecho de treino da dobra e mede, no trecho de teste, as
+    acurácias; mede também a latência de uma previsão de uma linha e o tamanho da
+    floresta no formato servido pelo registro (engine.compilar).
+    """
+    treino, teste = dobras[dobra]
+    inicio = time.perf_counter()
+    modelo = RandomForestClassifier(random_state=42, n_jobs=1, **parametros)
+    modelo.fit(X.iloc[treino], y.iloc[treino])
+    segundos = time.perf_counter() - inicio
+    with warnings.catch_warnings():
+        # Dobras de teste com uma só classe avisam na acurácia balanceada
+        warnings.simplefilter('ignore')
+        previsto = modelo.predict(X.iloc[teste])
+        resultado = {'acuracia': accuracy_score(y.iloc[teste], previsto),
+                     'acuracia_balanceada': balanced_accuracy_score(y.iloc[teste], previsto)}
+    compilado = compilar(modelo)
+    motor = MotorFloresta(compilado, list(X.columns))
+    linha = X.iloc[teste[:1]].to_numpy()
+    tempos = []
+    for _ in range(REPETICOES_LATENCIA):
+        inicio_previsao = time.perf_counter()
+        motor.predict_proba(linha)
+        tempos.append(time.perf_counter() - inicio_previsao)
+    resultado.update(segundos=segundos, latencia_ms=float(np.median(tempos)) * 1000,
+                     bytes=int(sum(array.nbytes for array in compilado.values())))
+    return resultado
+
+
+def _iniciar_processo(X, y, dobras):
+    global _DADOS_DO_PROCESSO
+    # Um núcleo por processo: o paralelismo vem dos candidatos
+    threadpool_limits(1)
+    _DADOS_DO_PROCESSO = (X, y, dobras)
+
+
+def _avaliar_no_processo(parametros: Dict, dobra: int) -> Dict:
+    return _avaliar(*_DADOS_DO_PROCESSO, parametros, dobra)
+
+
+class HyperparameterSearch:
+    """
+    Busca dos hiperparâmetros da floresta de um setor com validação walk-forward.
+
+    As horas ficam em ordem: cada dobra treina com todo o histórico anterior ao seu
+    bloco de teste (TimeSeriesSplit, com uma hora de intervalo para o alvo da última
+    hora de treino não cair no teste), então nenhum candidato é avaliado com dados do
+    futuro. Os candidatos rodam em paralelo, um por processo. Depois de cada dobra,
+    cerca de 1/FATOR_PODA deles segue para a próxima, escolhidos por camada de Pareto
+    entre a média da métrica até ali, a latência e o tamanho (a fronteira nunca é podada;
+    dentro de uma camada, vence a métrica), então as florestas pequenas e rápidas chegam
+    ao relatório e à escolha final ao lado das mais precisas. Quando o orçamento de tempo
+    acaba, as avaliações que ainda não começaram são canceladas e o relatório usa as
+    dobras já concluídas.
+    """
+
+    def __init__(self, inteligencia: IrrigationIntelligence, grade: Optional[Dict[str, List]] = None,
+                 dobras: int = DOBRAS_PADRAO, orcamento: float = ORCAMENTO_PADRAO, processos: Optional[int] = None,
+                 metrica: str = 'acuracia_balanceada', tolerancia: float = TOLERANCIA_PADRAO):
+        """
+        Args:
+            inteligencia (IrrigationIntelligence): De onde vêm os dados (prepare_features_and_target)
+                                                   e onde a configuração escolhida é salva (registro).
+            orcamento (float): Tempo máximo da busca em segundos.
+            processos (int): Processos de avaliação (padrão: um por núcleo).
+            metrica (str): 'acuracia_balanceada' ou 'acuracia'.
+            tolerancia (float): Perda de métrica aceita em troca de um modelo mais rápido.
+        """
+        if metrica not in METRICAS:
+            raise ValueError(f"Métrica '{metrica}' inválida; use uma de {METRICAS}.")
+        self.inteligencia = inteligencia
+        self.grade = grade or GRADE_PADRAO
+        self.dobras = dobras
+        self.orcamento = orcamento
+        self.processos = processos or os.cpu_count() or 1
+        self.metrica = metrica
+        self.tolerancia = tolerancia
+
+    def buscar(self, id_setor: str, salvar: bool = True) -> Dict:
+        """
+        Roda a busca para o setor e, com salvar=True, grava a configuração escolhida
+        (usada pelos próximos train_model do setor).
+
+        Returns:
+            Dict: id_setor, candidatos (parâmetros, dobras concluídas, médias das métricas,
+                  latencia_ms, bytes, pareto), escolhido, podados, interrompida e segundos;
+                  vazio se não houver dados suficientes.
+        """
+        inicio = time.perf_counter()
+        X, y = self.inteligencia.prepare_features_and_target(id_setor)
+        if X is None or len(X) < (self.dobras + 1) * 2 or y.nunique() < 2:
+            print(f"Dados insuficientes para ajustar o setor {id_setor}.")
+            return {}
+        dobras = list(TimeSeriesSplit(n_splits=self.dobras, gap=1).split(X))
+        candidatos = [{'parametros': parametros, 'dobras': []} for parametros in candidatos_da_grade(self.grade)]
+        print(f"Setor {id_setor}: {len(candidatos)} candidatos, {self.dobras} dobras walk-forward sobre "
+              f"{len(X)} horas, {self.processos} processos, orçamento de {self.orcamento:.0f}s.")
+
+        prazo = time.monotonic() + self.orcamento
+        vivos = list(range(len(candidatos)))
+        podados = 0
+        interrompida = False
+        pool = None
+        if self.processos > 1:
+            # 'spawn': os processos não herdam as conexões SQLite do processo principal
+            pool = ProcessPoolExecutor(max_workers=self.processos, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=_iniciar_processo, initargs=(X, y, dobras))
+        try:
+            for dobra in range(self.dobras):
+                interrompida = not self._rodar_dobra(candidatos, vivos, dobra, X, y, dobras, pool, prazo)
+                concluidos = [i for i in vivos if len(candidatos[i]['dobras']) == dobra + 1]
+                if interrompida or dobra == self.dobras - 1:
+                    break
+                pontos = [self._ponto(candidatos[i]) for i in concluidos]
+                camadas = camadas_de_pareto(pontos)
+                manter = max(1, math.ceil(len(concluidos) / FATOR_PODA), camadas.count(0))
+                ordem = sorted(range(len(concluidos)), key=lambda k: (camadas[k], -pontos[k][0]))
+                podados += len(vivos) - manter
+                vivos = [concluidos[k] for k in ordem[:manter]]
+                print(f"Dobra {dobra + 1}/{self.dobras}: {len(concluidos)} avaliados, {manter} seguem.")
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+        resultado = self._relatorio(id_setor, candidatos, X)
+        resultado.update(podados=podados, interrompida=interrompida, segundos=time.perf_counter() - inicio)
+        if salvar and resultado['escolhido']:
+            escolhido = resultado['escolhido']
+            self.inteligencia.registro.salvar_configuracao(chave_setor(id_setor), {
+                'parametros': escolhido['parametros'], 'metrica': self.metrica,
+                'pontuacao': escolhido[self.metrica], 'latencia_ms': escolhido['latencia_ms'],
+                'bytes': escolhido['bytes'], 'dobras': escolhido['n_dobras'],
+                'janela': {'inicio': str(X.index[0]), 'fim': str(X.index[-1])},
+                'avaliado_em': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            })
+        return resultado
+
+    def _rodar_dobra(self, candidatos, vivos, dobra, X, y, dobras, pool, prazo) -> bool:
+        """Avalia os candidatos vivos na dobra; False se o orçamento acabou antes do fim."""
+        if pool is None:
+            for i in vivos:
+                if time.monotonic() >= prazo:
+                    return False
+                candidatos[i]['dobras'].append(_avaliar(X, y, dobras, candidatos[i]['parametros'], dobra))
+            return True
+
+        tarefas = {pool.submit(_avaliar_no_processo, candidatos[i]['parametros'], dobra): i for i in vivos}
+        pendentes = set(tarefas)
+        while pendentes:
+            prontas, pendentes = wait(pendentes, timeout=max(0.0, prazo - time.monotonic()),
+                                      return_when=FIRST_COMPLETED)
+            for tarefa in prontas:
+                candidatos[tarefas[tarefa]]['dobras'].append(tarefa.result())
+            if not prontas and pendentes:
+                # Orçamento esgotado: cancela o que não começou e espera o que já está rodando
+                for tarefa in pendentes:
+                    tarefa.cancel()
+                for tarefa in wait(pendentes).done:
+                    if not tarefa.cancelled():
+                        candidatos[tarefas[tarefa]]['dobras'].append(tarefa.result())
+                return False
+        return True
+
+    @staticmethod
+    def _media(candidato: Dict, campo: str) -> float:
+        return float(np.mean([dobra[campo] for dobra in candidato['dobras']]))
+
+    def _ponto(self, candidato: Dict) -> Tuple[float, float, float]:
+        """(média da métrica, latência, tamanho); as medidas de custo vêm da última dobra avaliada."""
+        ultima = candidato['dobras'][-1]
+        return self._media(candidato, self.metrica), ultima['latencia_ms'], ultima['bytes']
+
+    def _relatorio(self, id_setor: str, candidatos: List[Dict], X: pd.DataFrame) -> Dict:
+        """
+        Resume os candidatos que chegaram mais longe (mesmo número de dobras) e marca a
+        fronteira de Pareto entre a métrica, a latência e o tamanho.
+        """
+        maximo = max((len(c['dobras']) for c in candidatos), default=0)
+        linhas = []
+        for candidato in candidatos:
+            if not maximo or len(candidato['dobras']) != maximo:
+                continue
+            ultima = candidato['dobras'][-1]
+            linhas.append(dict(
+                {campo: self._media(candidato, campo) for campo in METRICAS + ('segundos',)},
+                parametros=candidato['parametros'], n_dobras=maximo,
+                desvio=float(np.std([d[self.metrica] for d in candidato['dobras']])),
+                # Medidas da última dobra, a de maior histórico de treino
+                latencia_ms=ultima['latencia_ms'], bytes=ultima['bytes']))
+        camadas = camadas_de_pareto([(linha[self.metrica], linha['latencia_ms'], linha['bytes']) for linha in linhas])
+        for linha, camada in zip(linhas, camadas):
+            linha['pareto'] = camada == 0
+        linhas.sort(key=lambda linha: linha[self.metrica], reverse=True)
+
+        escolhido = None
+        if linhas:
+            melhor = linhas[0][self.metrica]
+            proximos = [linha for linha in linhas if linha[self.metrica] >= melhor - self.tolerancia]
+            escolhido = min(proximos, key=lambda linha: (linha['latencia_ms'], linha['bytes']))
+        return {'id_setor': id_setor, 'candidatos': linhas, 'escolhido': escolhido}
+
+
+def _descrever_parametros(parametros: Dict) -> str:
+    return (f"árvores={parametros['n_estimators']}, prof={parametros['max_depth']}, "
+            f"folha={parametros['min_samples_leaf']}, pesos={parametros['class_weight']}")
+
+
+def imprimir_relatorio(resultado: Dict, metrica: str = 'acuracia_balanceada', limite: int = 15):
+    """Tabela dos melhores candidatos (* = fronteira de Pareto) e a configuração escolhida."""
+    if not resultado:
+        return
+    print(f"\n--- Busca de hiperparâmetros do setor {resultado['id_setor']} ---")
+    if resultado['interrompida']:
+        print("Orçamento de tempo esgotado: o relatório usa as dobras concluídas.")
+    candidatos = resultado['candidatos']
+    print(f"{len(candidatos)} candidatos com {candidatos[0]['n_dobras'] if candidatos else 0} dobras, "
+          f"{resultado['podados']} podados, {resultado['segundos']:.1f}s.")
+    print(f"  {'Parâmetros':<52} {metrica:>19} {'Acurácia':>9} {'Latência (ms)':>14} "
+          f"{'Tamanho (KB)':>13} {'Treino (s)':>11}")
+    for linha in candidatos[:limite]:
+        marca = '*' if linha['pareto'] else ' '
+        print(f"{marca} {_descrever_parametros(linha['parametros']):<52} "
+              f"{linha[metrica]:>12.3f} ±{linha['desvio']:.3f} {linha['acuracia']:>9.3f} "
+              f"{linha['latencia_ms']:>14.2f} {linha['bytes'] / 1024:>13.0f} {linha['segundos']:>11.2f}")
+    fora = [linha for linha in candidatos[limite:] if linha['pareto']]
+    for linha in fora:
+        print(f"* {_descrever_parametros(linha['parametros']):<52} {linha[metrica]:>12.3f} ±{linha['desvio']:.3f} "
+              f"{linha['acuracia']:>9.3f} {linha['latencia_ms']:>14.2f} {linha['bytes'] / 1024:>13.0f} "
+              f"{linha['segundos']:>11.2f}")
+    escolhido = resultado['escolhido']
+    if escolhido:
+        print(f"\nEscolhido: {_descrever_parametros(escolhido['parametros'])} "
+              f"({metrica} {escolhido[metrica]:.3f}, {escolhido['latencia_ms']:.2f} ms, "
+              f"{escolhido['bytes'] / 1024:.0f} KB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Busca walk-forward dos hiperparâmetros da floresta de irrigação de cada setor.")
+    parser.add_argument("--db", default="data/agricultural_system.db", help="Banco SQLite")
+    parser.add_argument("--modelo", default="data/irrigation_model.joblib",
+                        help="Modelo geral (o registro de modelos, onde a configuração é salva, fica ao lado dele)")
+    parser.add_argument("--setores", required=True, help="IDs separados por vírgula")
+    parser.add_argument("--dobras", type=int, default=DOBRAS_PADRAO, help="Dobras do walk-forward")
+    parser.add_argument("--orcamento", type=float, default=ORCAMENTO_PADRAO, help="Tempo máximo por setor (s)")
+    parser.add_argument("--processos", type=int, help="Processos de avaliação (padrão: um por núcleo)")
+    parser.add_argument("--metrica", choices=METRICAS, default='acuracia_balanceada')
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA_PADRAO,
+                        help="Perda de métrica aceita em troca de um modelo mais rápido")
+    parser.add_argument("--nao-salvar", action="store_true", help="Só mostra o relatório")
+    args = parser.parse_args()
+
+    db = AgriculturalDatabase(db_name=args.db, verboso=False)
+    inteligencia = IrrigationIntelligence(db, args.modelo, feature_store=FeatureStore(db))
+    busca = HyperparameterSearch(inteligencia, dobras=args.dobras, orcamento=args.orcamento,
+                                 processos=args.processos, metrica=args.metrica, tolerancia=args.tolerancia)
+    for id_setor in (setor.strip() for setor in args.setores.split(',')):
+        resultado = busca.buscar(id_setor, salvar=not args.nao_salvar)
+        imprimir_relatorio(resultado, args.metrica)
+        if resultado.get('escolhido') and not args.nao_salvar:
+            print(f"Configuração salva; o próximo treino do setor {id_setor} a usa.")
+    db.disconnect()
+
+
+if __name__ == "__main__":
+    main()
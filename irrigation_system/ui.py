@@ -6,12 +6,21 @@ from datetime import datetime, timedelta
 # Importações relativas dentro do mesmo pacote
 from .database import AgriculturalDatabase
 from .intelligence import IrrigationIntelligence
+from .online import OnlineLearner
+from .tuning import ORCAMENTO_PADRAO, HyperparameterSearch, imprimir_relatorio
+from .retention import RetentionManager
+from .archive import ColumnarArchive
+from .features import FeatureStore
+from .serial_bridge import SerialBridge
+from .bulk import TABELAS, BulkTransfer
 
 
 def gerar_dados_historicos(db, id_setor, id_sensor_umidade, id_sensor_ph, id_sensor_fosforo, dias=30):
     """Gera dados históricos simulados para treinamento."""
     print(f"\nGerando dados históricos para o setor {id_setor}...")
     data_inicial = datetime.now() - timedelta(days=dias)
+    medicoes = []
+    irrigacoes = []
     
     for dia in range(dias):
         for hora in range(24):
@@ -22,12 +31,16 @@ def gerar_dados_historicos(db, id_setor, id_sensor_umidade, id_sensor_ph, id_sen
             ph = random.uniform(6.0, 7.5)
             fosforo = random.uniform(15, 45)
             
-            db.inserir_medicao(f"MED_U_{dia}_{hora}", umidade, str_data, id_sensor_umidade)
-            db.inserir_medicao(f"MED_P_{dia}_{hora}", ph, str_data, id_sensor_ph)
-            db.inserir_medicao(f"MED_F_{dia}_{hora}", fosforo, str_data, id_sensor_fosforo)
+            medicoes.append((f"MED_U_{dia}_{hora}", umidade, str_data, id_sensor_umidade))
+            medicoes.append((f"MED_P_{dia}_{hora}", ph, str_data, id_sensor_ph))
+            medicoes.append((f"MED_F_{dia}_{hora}", fosforo, str_data, id_sensor_fosforo))
 
             if umidade < 55 and 5 <= hora <= 8:
-                db.inserir_irrigacao(f"IRR_{dia}_{hora}", random.uniform(450.0, 550.0), str_data, id_setor)
+                irrigacoes.append((f"IRR_{dia}_{hora}", random.uniform(450.0, 550.0), str_data, id_setor))
+
+    # Grava tudo em lotes (uma transação por lote) em vez de um commit por linha
+    db.inserir_medicoes_em_lote(medicoes)
+    db.inserir_irrigacoes_em_lote(irrigacoes)
     print("Geração de dados históricos concluída!")
 
 
@@ -41,7 +54,11 @@ class MenuInterativo:
         model_path = "data/irrigation_model.joblib"
 
         self.db = AgriculturalDatabase(db_name=db_path)
-        self.intelligence = IrrigationIntelligence(db_manager=self.db, model_path=model_path)
+        # Quadros de treino por setor (data/features), atualizados de forma incremental
+        self.features = FeatureStore(self.db)
+        self.intelligence = IrrigationIntelligence(db_manager=self.db, model_path=model_path,
+                                                   feature_store=self.features)
+        self.arquivo = None  # arquivo colunar (data/arquivo), aberto na primeira sincronização
     
     def mostrar_menu_principal(self):
         """Mostra o menu principal"""
@@ -58,6 +75,7 @@ class MenuInterativo:
         print("8. Relatórios")
         print("9. Inteligência Preditiva")
         print("10. Listar todas as tabelas")
+        print("11. Manutenção do Banco de Dados")
         print("0. Sair")
         print("="*50)
 
@@ -200,10 +218,10 @@ class MenuInterativo:
 
     def listar_medicoes(self):
         print("\n--- Lista de Medições Recentes ---")
-        medicoes = self.db.consultar_medicoes()
+        # Mostra as últimas 10 medições, buscando apenas essas linhas no banco
+        medicoes = list(self.db.iterar_medicoes(ordem='desc', limite=10))
         if not medicoes: print("Nenhuma medição encontrada.")
-        # Mostra as últimas 10 medições
-        for m in sorted(medicoes, key=lambda i: i['data_medicao'], reverse=True)[:10]:
+        for m in medicoes:
             print(f"ID: {m['id_medicao']}, Sensor: {m['id_sensor']} ({m['tipo_sensor']}), Valor: {m['valor_medicao']}, Data: {m['data_medicao']}")
             
     def remover_medicao_interativo(self):
@@ -237,10 +255,11 @@ class MenuInterativo:
     
     def listar_irrigacoes(self):
         print("\n--- Histórico de Irrigações ---")
-        irrigacoes = self.db.consultar_irrigacoes()
-        if not irrigacoes: print("Nenhuma irrigação registrada.")
-        for i in sorted(irrigacoes, key=lambda item: item['data_irrigacao'], reverse=True):
+        encontrou = False
+        for i in self.db.iterar_irrigacoes(ordem='desc'):
+            encontrou = True
             print(f"ID: {i['id_irrigacao']}, Setor: {i['id_setor']}, Volume: {i['volume_irrigacao']}L, Data: {i['data_irrigacao']}")
+        if not encontrou: print("Nenhuma irrigação registrada.")
 
     # ========== MENU NUTRIENTES E PH ==========
     def menu_aplicacoes_nutrientes(self):
@@ -283,6 +302,10 @@ class MenuInterativo:
             print("1. Treinar/Retreinar modelo de irrigação")
             print("2. Obter sugestão de irrigação")
             print("3. Gerar dados históricos de exemplo")
+            print("4. Treinar todos os setores (em paralelo)")
+            print("5. Listar modelos registrados")
+            print("6. Atualizar modelo incremental (online) de um setor")
+            print("7. Ajustar hiperparâmetros do modelo de um setor")
             print("0. Voltar")
             opcao = input("Escolha uma opção: ").strip()
             if opcao == "1":
@@ -295,24 +318,33 @@ class MenuInterativo:
                 id_sensor_ph = input("Digite o ID do sensor de 'ph': ").strip()
                 id_sensor_fosforo = input("Digite o ID do sensor de 'fosforo': ").strip()
                 gerar_dados_historicos(self.db, id_setor, id_sensor_umidade, id_sensor_ph, id_sensor_fosforo)
+            elif opcao == "4":
+                processos = input("Número de processos (Enter = um por núcleo): ").strip()
+                self.intelligence.train_all(processos=int(processos) if processos.isdigit() else None)
+            elif opcao == "5": self.listar_modelos()
+            elif opcao == "6": self.atualizar_modelo_online()
+            elif opcao == "7": self.ajustar_hiperparametros()
             elif opcao == "0": break
             else: print("Opção inválida!")
 
     def obter_sugestao_irrigacao(self):
         print("\n--- Obter Sugestão de Irrigação ---")
-        if not self.intelligence.model:
-            print("ERRO: O modelo ainda não foi treinado. Use a opção 'Treinar modelo' primeiro.")
-            return
-
         try:
             id_setor = input("Digite o ID do setor para a previsão: ").strip()
-            print("Por favor, insira os valores atuais dos sensores:")
+            modelo, feature_names = self.intelligence.modelo_do_setor(id_setor)
+            if modelo is None:
+                print("ERRO: O modelo ainda não foi treinado. Use a opção 'Treinar modelo' primeiro.")
+                return
+            print("Por favor, insira os valores atuais dos sensores (Enter = última leitura):")
             
+            ultimas_leituras = self.db.ultimos.vetor_atual(id_setor)
             current_data = {}
-            for feature in self.intelligence.feature_names:
+            for feature in feature_names:
                 if feature.lower() not in ['hora_do_dia', 'dia_da_semana']:
-                    value = float(input(f"  - Valor para {feature}: "))
-                    current_data[feature] = value
+                    atual = ultimas_leituras.get(feature)
+                    sufixo = f" [{atual:.2f}]" if atual is not None else ""
+                    entrada = input(f"  - Valor para {feature}{sufixo}: ").strip()
+                    current_data[feature] = float(entrada) if entrada or atual is None else atual
             
             prediction_time = datetime.now() + timedelta(hours=1)
             
@@ -325,7 +357,180 @@ class MenuInterativo:
             print("Erro: Valor numérico inválido inserido ou dados de entrada incorretos.")
         except Exception as e:
             print(f"Ocorreu um erro: {e}")
-    
+
+    def atualizar_modelo_online(self):
+        print("\n--- Modelo Incremental (Online) ---")
+        id_setor = input("Digite o ID do setor: ").strip()
+        aprendiz = OnlineLearner(self.intelligence, id_setor)
+        resultado = aprendiz.atualizar()
+        print(f"{resultado['horas']} horas novas aprendidas em {resultado['segundos']:.2f}s; "
+              f"{resultado['amostras']} horas no total (última: {resultado['ultima_hora']}).")
+        if aprendiz.modelo is None:
+            return
+        if input("Usar este modelo nas previsões do setor? (s/N): ").strip().lower() == 's':
+            print(f"Registrado como versão {aprendiz.registrar()} do modelo do setor.")
+        if input("Comparar com a floresta nas últimas horas do histórico? (s/N): ").strip().lower() == 's':
+            comparacao = aprendiz.comparar_com_floresta()
+            for nome in ('online', 'floresta'):
+                if nome in comparacao:
+                    m = comparacao[nome]
+                    print(f"{nome}: acurácia {m['acuracia']:.3f}, balanceada {m['acuracia_balanceada']:.3f}, "
+                          f"log loss {m['log_loss']:.3f}, treino {m['segundos']:.2f}s")
+
+    def ajustar_hiperparametros(self):
+        print("\n--- Ajuste de Hiperparâmetros ---")
+        id_setor = input("Digite o ID do setor: ").strip()
+        orcamento = input(f"Tempo máximo em segundos (Enter = {ORCAMENTO_PADRAO}): ").strip()
+        busca = HyperparameterSearch(self.intelligence,
+                                     orcamento=float(orcamento) if orcamento.isdigit() else ORCAMENTO_PADRAO)
+        imprimir_relatorio(busca.buscar(id_setor))
+
+    def listar_modelos(self):
+        print("\n--- Modelos Registrados ---")
+        registro = self.intelligence.registro
+        chaves = registro.chaves()
+        if not chaves:
+            print("Nenhum modelo registrado. Use a opção 'Treinar modelo' primeiro.")
+            return
+        for chave in chaves:
+            ativa = registro.versao_ativa(chave)
+            if ativa is None:
+                continue
+            metricas = ativa['metricas']
+            acuracia = f"{metricas['acuracia']:.2f}" if 'acuracia' in metricas else "-"
+            janela = f"{ativa['janela']['inicio']} a {ativa['janela']['fim']}" if ativa['janela'] else "-"
+            print(f"{chave}: versão {ativa['versao']} de {ativa['criado_em']}, acurácia {acuracia}, "
+                  f"{metricas.get('amostras', '-')} amostras, janela {janela}")
+        uso = registro.memoria_em_uso()
+        print(f"Em memória: {uso['carregados']} modelos ({uso['bytes'] / 1024 / 1024:.1f} de "
+              f"{uso['limite_bytes'] / 1024 / 1024:.0f} MB).")
+
+    # ========== MENU MANUTENÇÃO ==========
+    def menu_manutencao(self):
+        while True:
+            print("\n=== MANUTENÇÃO DO BANCO DE DADOS ===")
+            print("1. Atualizar agregados horários/diários")
+            print("2. Reconstruir agregados a partir das medições")
+            print("3. Verificar consistência dos agregados")
+            print("4. Simular retenção de medições antigas")
+            print("5. Aplicar retenção de medições antigas")
+            print("6. Ativar vacuum incremental")
+            print("7. Sincronizar arquivo colunar de medições")
+            print("8. Importar log da serial do controlador")
+            print("9. Reconstruir últimos valores por sensor/setor")
+            print("10. Relatório de desempenho das consultas")
+            print("11. Importar tabela de arquivo CSV/NDJSON")
+            print("12. Exportar tabela para arquivo CSV/NDJSON")
+            print("13. Descartar features de treino em cache")
+            print("0. Voltar")
+            opcao = input("Escolha uma opção: ").strip()
+            if opcao == "1":
+                processadas = self.db.rollups.atualizar()
+                print(f"{processadas} novas medições agregadas.")
+            elif opcao == "2":
+                if input("Recalcular todos os agregados? (s/N): ").lower() == 's':
+                    self.db.rollups.reconstruir()
+                    # Os quadros de treino foram montados com os agregados antigos
+                    self.features.invalidar()
+            elif opcao == "3": self.verificar_agregados()
+            elif opcao == "4": self.aplicar_retencao(dry_run=True)
+            elif opcao == "5":
+                if input("Remover as medições brutas fora do período de retenção? (s/N): ").lower() == 's':
+                    self.aplicar_retencao(dry_run=False)
+            elif opcao == "6": RetentionManager(self.db, arquivo=self.arquivo).ativar_vacuum_incremental()
+            elif opcao == "7": self.sincronizar_arquivo()
+            elif opcao == "8": self.importar_log_serial()
+            elif opcao == "9": self.db.ultimos.reconstruir()
+            elif opcao == "10": self.relatorio_consultas()
+            elif opcao == "11": self.importar_arquivo()
+            elif opcao == "12": self.exportar_arquivo()
+            elif opcao == "13":
+                self.features.invalidar()
+                print("Features descartadas; serão recalculadas no próximo treino.")
+            elif opcao == "0": break
+            else: print("Opção inválida!")
+
+    def verificar_agregados(self):
+        print("\n--- Verificação de Consistência dos Agregados ---")
+        divergencias = self.db.rollups.verificar_consistencia()
+        if not divergencias:
+            print("Agregados consistentes com as medições brutas.")
+            return
+        print(f"{len(divergencias)} divergências encontradas (mostrando até 10):")
+        for d in divergencias[:10]:
+            print(f"  - {d['tabela']} | Sensor {d['id_sensor']} | {d['periodo']}: "
+                  f"quantidade {d['quantidade_bruta']} x {d['quantidade_agregada']}, "
+                  f"soma {d['soma_bruta']} x {d['soma_agregada']}")
+        print("Use a opção 'Reconstruir agregados' para corrigir.")
+
+    def aplicar_retencao(self, dry_run: bool):
+        titulo = "Simulação de Retenção" if dry_run else "Retenção de Medições"
+        print(f"\n--- {titulo} ---")
+        relatorio = RetentionManager(self.db, arquivo=self.arquivo).executar(dry_run=dry_run)
+        if not relatorio: print("Nenhuma medição agregada encontrada.")
+        for r in relatorio:
+            print(f"Política '{r['tipo_sensor']}' ({r['sensores']} sensores, antes de {r['limite_bruto']}): "
+                  f"{r['linhas_brutas']} medições brutas (~{r['bytes_estimados'] / 1024:.1f} KB), "
+                  f"{r['linhas_horarias']} agregados horários")
+            if r['linhas_mantidas']:
+                print(f"  {r['linhas_mantidas']} medições antigas mantidas por não estarem nos agregados "
+                      f"(use 'Reconstruir agregados').")
+
+    def sincronizar_arquivo(self):
+        print("\n--- Sincronização do Arquivo Colunar ---")
+        if self.arquivo is None:
+            self.arquivo = ColumnarArchive(self.db)
+            # A partir daqui o treinamento lê as séries do arquivo em memmap
+            self.intelligence.arquivo = self.arquivo
+        arquivadas = self.arquivo.sincronizar()
+        print(f"{arquivadas} medições copiadas para '{self.arquivo.diretorio}' "
+              f"({len(self.arquivo.sensores())} sensores).")
+
+    def relatorio_consultas(self):
+        print("\n--- Desempenho das Consultas ---")
+        if self.db.instrumentacao is None:
+            print("Instrumentação desligada. Inicie com IRRIGACAO_INSTRUMENTAR=1 para medir as consultas.")
+            return
+        print(self.db.instrumentacao.relatorio())
+        print(f"Consultas acima de {self.db.instrumentacao.limite_lenta * 1000:.0f} ms são gravadas em "
+              f"'{self.db.instrumentacao.arquivo_lentas}'.")
+
+    def importar_log_serial(self):
+        print("\n--- Importação de Log da Serial ---")
+        caminho = input("Arquivo de log capturado: ").strip()
+        id_setor = input("ID do setor do controlador: ").strip()
+        inicio = input("Data/hora da primeira leitura (YYYY-MM-DD HH:MM:SS; vazio se o log tiver carimbo de tempo): ").strip()
+        try:
+            inicio = datetime.fromisoformat(inicio) if inicio else None
+            estatisticas = SerialBridge(self.db, id_setor).replay(caminho, inicio=inicio)
+        except (OSError, ValueError) as e:
+            print(f"Erro ao importar log: {e}")
+            return
+        print(f"{estatisticas['leituras']} leituras: {estatisticas['medicoes']} medições e "
+              f"{estatisticas['irrigacoes']} irrigações gravadas ({estatisticas['duplicados']} já existentes, "
+              f"{estatisticas['erros']} rejeitadas).")
+
+    def importar_arquivo(self):
+        print("\n--- Importação em Massa ---")
+        tabela = input(f"Tabela ({', '.join(TABELAS)}): ").strip()
+        caminho = input("Arquivo (.csv ou .ndjson, opcionalmente .gz): ").strip()
+        try:
+            resultado = BulkTransfer(self.db).importar(tabela, caminho)
+        except ValueError as e:
+            print(f"Erro: {e}")
+            return
+        for numero, mensagem in resultado['erros'][:10]:
+            print(f"  linha {numero}: {mensagem}")
+
+    def exportar_arquivo(self):
+        print("\n--- Exportação em Massa ---")
+        tabela = input(f"Tabela ({', '.join(TABELAS)}): ").strip()
+        caminho = input("Arquivo de destino (.csv ou .ndjson, opcionalmente .gz): ").strip()
+        try:
+            BulkTransfer(self.db).exportar(tabela, caminho)
+        except ValueError as e:
+            print(f"Erro: {e}")
+
     # ========== MÉTODO PRINCIPAL DE EXECUÇÃO ==========
     def executar(self):
         while True:
@@ -342,6 +547,7 @@ class MenuInterativo:
             elif opcao == "8": self.menu_relatorios()
             elif opcao == "9": self.menu_inteligencia()
             elif opcao == "10": self.db.listar_todas_tabelas()
+            elif opcao == "11": self.menu_manutencao()
             elif opcao == "0":
                 print("Encerrando sistema...")
                 self.db.disconnect()
@@ -0,0 +1,33 @@
+import pytest
+
+from irrigation_system.archive import ColumnarArchive, para_epoch
+from irrigation_system.database import AgriculturalDatabase
+
+
+@pytest.fixture
+def db(tmp_path):
+    banco = AgriculturalDatabase(str(tmp_path / "agro.db"), agregados_automaticos=False, verboso=False)
+    banco.inserir_sensor('S1', 'umidade', '01')
+    banco.inserir_medicao('A', 40.0, '2025-06-20 10:00:00', 'S1')
+    banco.inserir_medicao('B', 41.0, '2025-06-20 11:00:00', 'S1')
+    yield banco
+    banco.disconnect()
+
+
+def test_medicao_nova_nao_recebe_id_ja_arquivado(db, tmp_path):
+    diretorio = str(tmp_path / "arquivo")
+    assert ColumnarArchive(db, diretorio).sincronizar() == 2
+
+    # Banco migrado depois de perder a última medição arquivada: a sequência ficou
+    # abaixo da marca d'água do arquivo, que a migração não conhece
+    db.remover_medicao('B')
+    db.connection.execute("UPDATE sqlite_sequence SET seq = 1 WHERE name = 'TABELA_MEDICOES_COMPACTA'")
+    db.connection.commit()
+
+    arquivo = ColumnarArchive(db, diretorio)
+    db.inserir_medicao('C', 42.0, '2025-06-20 12:00:00', 'S1')
+    assert arquivo.sincronizar() == 1
+    timestamps, valores = arquivo.ler_serie('S1')
+    assert timestamps.tolist() == [para_epoch('2025-06-20 10:00:00'), para_epoch('2025-06-20 11:00:00'),
+                                   para_epoch('2025-06-20 12:00:00')]
+    assert valores.tolist() == [40.0, 41.0, 42.0]
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from irrigation_system.engine import MotorFloresta, carregar, compilar, salvar
+
+FEATURES = ['Umidade', 'Ph', 'hora_do_dia', 'dia_da_semana']
+
+
+@pytest.fixture(scope='module')
+def floresta():
+    gerador = np.random.default_rng(7)
+    X = np.column_stack([gerador.uniform(10, 90, 600), gerador.uniform(4, 9, 600),
+                         gerador.integers(0, 24, 600), gerador.integers(0, 7, 600)])
+    y = ((X[:, 0] < 40) ^ (gerador.random(600) < 0.1)).astype(int)
+    # Valores ausentes no treino: as árvores aprendem para que lado eles vão
+    X[gerador.random(X.shape) < 0.05] = np.nan
+    modelo = RandomForestClassifier(n_estimators=25, min_samples_leaf=2, random_state=0).fit(X, y)
+    teste = np.column_stack([gerador.uniform(0, 100, 5000), gerador.uniform(3, 10, 5000),
+                             gerador.integers(0, 24, 5000), gerador.integers(0, 7, 5000)])
+    teste[gerador.random(teste.shape) < 0.05] = np.nan
+    return modelo, teste
+
+
+def test_predict_proba_igual_ao_random_forest(floresta):
+    modelo, teste = floresta
+    motor = MotorFloresta(compilar(modelo), FEATURES)
+    # Bit a bit, inclusive com valores ausentes e mais linhas do que um bloco
+    assert np.array_equal(motor.predict_proba(teste), modelo.predict_proba(teste))
+    assert np.array_equal(motor.predict(teste), modelo.predict(teste))
+
+
+def test_floresta_gravada_e_mapeada_da_o_mesmo_resultado(floresta, tmp_path):
+    modelo, teste = floresta
+    salvar(compilar(modelo), FEATURES, str(tmp_path / "floresta"))
+    motor = carregar(str(tmp_path / "floresta"))
+    assert list(motor.feature_names_in_) == FEATURES
+    assert np.array_equal(motor.predict_proba(teste[:100]), modelo.predict_proba(teste[:100]))
@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+
+from irrigation_system.database import AgriculturalDatabase
+from irrigation_system.features import FeatureStore
+
+
+@pytest.fixture
+def db(tmp_path):
+    banco = AgriculturalDatabase(str(tmp_path / "agro.db"), agregados_automaticos=False, verboso=False)
+    banco.inserir_sensor('S1', 'umidade', '01')
+    banco.inserir_medicao('A', 40.0, '2025-06-20 10:00:00', 'S1')
+    banco.inserir_irrigacao('I1', 5.0, '2025-06-20 09:00:00', '01')
+    yield banco
+    banco.disconnect()
+
+
+@pytest.fixture
+def loja(db, tmp_path):
+    chamadas = []
+
+    def construir(id_setor, inicio=None):
+        chamadas.append(inicio)
+        hora = pd.Timestamp(inicio or '2025-06-20 09:00:00')
+        return pd.DataFrame({'umidade': [40.0], 'irrigou': [0]},
+                            index=pd.DatetimeIndex([hora], name='data_medicao'))
+
+    store = FeatureStore(db, str(tmp_path / "features"))
+    return lambda: store.obter('01', 'brutas', construir), chamadas
+
+
+def test_irrigacao_removida_e_substituida_e_detectada(db, loja):
+    obter, chamadas = loja
+    db.inserir_irrigacao('I2', 5.0, '2025-06-20 12:00:00', '01')
+    obter()
+    obter()
+    assert chamadas == [None]
+
+    # Antes, I3 recebia o rowid de I2 e o setor parecia em dia
+    db.remover_irrigacao('I2')
+    db.inserir_irrigacao('I3', 5.0, '2025-06-20 14:00:00', '01')
+    obter()
+    assert chamadas == [None, '2025-06-20 12:00:00']
+
+
+def test_medicao_inserida_depois_de_remover_a_ultima_e_detectada(db, loja):
+    obter, chamadas = loja
+    db.inserir_medicao('B', 41.0, '2025-06-20 11:00:00', 'S1')
+    obter()
+    db.remover_medicao('B')
+    db.inserir_medicao('C', 42.0, '2025-06-20 13:00:00', 'S1')
+    obter()
+    assert chamadas == [None, '2025-06-20 13:00:00']
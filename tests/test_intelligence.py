@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+
+from irrigation_system.intelligence import IrrigationIntelligence
+from irrigation_system.memory import MemoryDatabase
+
+FEATURES = ['Ph', 'Umidade', 'hora_do_dia', 'dia_da_semana']
+
+
+def test_predict_batch_igual_a_predict_action_linha_a_linha(tmp_path):
+    gerador = np.random.default_rng(3)
+    X = pd.DataFrame({'Ph': gerador.uniform(4, 9, 400), 'Umidade': gerador.uniform(10, 90, 400),
+                      'hora_do_dia': gerador.integers(0, 24, 400), 'dia_da_semana': gerador.integers(0, 7, 400)})
+    y = (X['Umidade'] < 45).astype(int)
+    modelo = RandomForestClassifier(n_estimators=15, random_state=0).fit(X, y)
+
+    caminho = str(tmp_path / "modelo.joblib")
+    treino = IrrigationIntelligence(MemoryDatabase(verboso=False), model_path=caminho)
+    treino.model, treino.feature_names = modelo, FEATURES
+    treino.save_model()
+    inteligencia = IrrigationIntelligence(MemoryDatabase(verboso=False), model_path=caminho)
+
+    inicio = datetime(2025, 6, 20, 6, 0, 0)
+    horarios = [inicio + timedelta(hours=7 * i) for i in range(30)]
+    # Entrada sem uma feature em algumas linhas, em outra ordem de colunas
+    dados = pd.DataFrame({'Umidade': gerador.uniform(10, 90, 30), 'Ph': gerador.uniform(4, 9, 30)})
+    dados.loc[::5, 'Ph'] = np.nan
+    irrigar, probabilidades = inteligencia.predict_batch(dados, ['01'] * 30, horarios)
+
+    for i, horario in enumerate(horarios):
+        registro = {nome: valor for nome, valor in dados.iloc[i].items() if not pd.isna(valor)}
+        acao, probabilidade = inteligencia.predict_action('01', registro, horario)
+        assert probabilidade == probabilidades[i]
+        assert acao.startswith("SUGESTÃO: Irrigar") == irrigar[i]
+
+    esperado = modelo.predict_proba(pd.DataFrame({
+        'Ph': dados['Ph'], 'Umidade': dados['Umidade'],
+        'hora_do_dia': [h.hour for h in horarios], 'dia_da_semana': [h.weekday() for h in horarios]}))
+    assert np.array_equal(probabilidades, esperado[:, 1])
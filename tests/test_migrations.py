@@ -0,0 +1,98 @@
+import sqlite3
+import threading
+from unittest import mock
+
+from irrigation_system import migrations
+from irrigation_system.database import AgriculturalDatabase
+
+
+def _banco_na_versao(caminho, versao):
+    """Cria um banco com as migrações só até `versao`, como um arquivo antigo."""
+    conexao = sqlite3.connect(caminho)
+    with mock.patch.object(migrations, 'MIGRACOES', migrations.MIGRACOES[:versao]), \
+            mock.patch.object(migrations, 'VERSAO_MAIS_RECENTE', versao):
+        migrations.aplicar_migracoes(conexao)
+    return conexao
+
+
+def test_migracao_7_com_datas_em_formatos_misturados(tmp_path, capsys):
+    caminho = str(tmp_path / "antigo.db")
+    conexao = _banco_na_versao(caminho, 6)
+    conexao.executemany("INSERT INTO TABELA_SENSORES (id_sensor, tipo_sensor, id_setor) VALUES (?, ?, ?)",
+                        [('S1', 'umidade', '01'), ('S2', 'ph', '01')])
+    conexao.executemany(
+        "INSERT INTO TABELA_MEDICOES (id_medicao, valor_medicao, data_medicao, id_sensor) VALUES (?, ?, ?, ?)",
+        [('M1', 40.0, '2025-06-20 10:00:00', 'S1'),
+         ('M2', 41.0, '2025-06-20T10:00:00', 'S1'),
+         ('M3', 42.0, '2025-06-20 10:00:00.500', 'S1'),
+         ('M4', 43.0, '2025-06-20 11:00:00', 'S1'),
+         ('M5', 6.5, '20/06/2025 10:00', 'S2'),
+         ('M6', 6.6, None, 'S2'),
+         ('M7', 6.7, '2025-06-20T09:00:00', 'S2')])
+    conexao.commit()
+    conexao.close()
+
+    db = AgriculturalDatabase(caminho, verboso=False)
+    # O aviso da migração só é exibido com verboso=True
+    assert capsys.readouterr().out == ''
+    try:
+        assert migrations.versao_atual(db.connection) == migrations.VERSAO_MAIS_RECENTE
+        medicoes = {linha[0]: linha[1] for linha in db.connection.execute(
+            "SELECT id_medicao, data_medicao FROM TABELA_MEDICOES")}
+        # A primeira de cada instante fica; as datas inválidas não viram instante NULL
+        assert medicoes == {'M1': '2025-06-20 10:00:00', 'M4': '2025-06-20 11:00:00',
+                            'M7': '2025-06-20 09:00:00'}
+        rejeitadas = db.connection.execute(
+            "SELECT id_medicao, data_medicao, motivo FROM TABELA_MEDICOES_REJEITADAS ORDER BY id_medicao").fetchall()
+        assert rejeitadas == [('M5', '20/06/2025 10:00', 'data_medicao inválida'),
+                              ('M6', None, 'data_medicao ausente')]
+        ultimas = dict(db.connection.execute("SELECT id_sensor, id_medicao FROM TABELA_ULTIMAS_MEDICOES"))
+        assert ultimas == {'S1': 'M4', 'S2': 'M7'}
+        # As tabelas novas estão disponíveis para as consultas e os lotes
+        assert len(list(db.iterar_medicoes(id_sensor='S1'))) == 2
+        resultado = db.inserir_medicoes_em_lote([('M8', 44.0, '2025-06-20 12:00:00', 'S1')], exibir_resumo=False)
+        assert resultado['inseridos'] == 1
+    finally:
+        db.disconnect()
+
+
+def test_processos_abrindo_o_mesmo_banco_antigo_ao_mesmo_tempo(tmp_path):
+    caminho = str(tmp_path / "antigo.db")
+    _banco_na_versao(caminho, 1).close()
+    largada = threading.Barrier(4)
+    aplicadas, erros = [], []
+
+    def abrir():
+        conexao = sqlite3.connect(caminho, timeout=30)
+        try:
+            largada.wait()
+            aplicadas.extend(migrations.aplicar_migracoes(conexao))
+        except sqlite3.Error as e:
+            erros.append(e)
+        finally:
+            conexao.close()
+
+    threads = [threading.Thread(target=abrir) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert erros == []
+    # Cada versão foi aplicada por um único processo
+    assert sorted(aplicadas) == [versao for versao, _, _ in migrations.MIGRACOES[1:]]
+    conexao = sqlite3.connect(caminho)
+    assert migrations.versao_atual(conexao) == migrations.VERSAO_MAIS_RECENTE
+    conexao.close()
+
+
+def test_aviso_da_migracao_7_volta_para_quem_chamou(tmp_path):
+    conexao = _banco_na_versao(str(tmp_path / "antigo.db"), 6)
+    conexao.execute("INSERT INTO TABELA_MEDICOES (id_medicao, valor_medicao, data_medicao, id_sensor) "
+                    "VALUES ('M1', 40.0, 'ontem', 'S1')")
+    conexao.commit()
+    avisos = []
+    migrations.aplicar_migracoes(conexao, avisos)
+    conexao.close()
+    assert avisos == ["Migração 7: 0 medições repetidas no mesmo sensor e instante removidas; "
+                      "1 com data inválida movidas para TABELA_MEDICOES_REJEITADAS."]
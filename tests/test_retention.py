@@ -0,0 +1,56 @@
+from datetime import datetime
+
+import pytest
+
+from irrigation_system.database import AgriculturalDatabase
+from irrigation_system.retention import RetentionManager
+
+AGORA = datetime(2025, 7, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def db(tmp_path):
+    banco = AgriculturalDatabase(str(tmp_path / "agro.db"), agregados_automaticos=False, verboso=False)
+    banco.inserir_sensor('S1', 'umidade', '01')
+    banco.inserir_medicao('A', 40.0, '2025-05-20 10:00:00', 'S1')
+    banco.inserir_medicao('B', 41.0, '2025-05-21 10:00:00', 'S1')
+    banco.inserir_medicao('C', 42.0, '2025-06-20 10:00:00', 'S1')
+    banco.rollups.atualizar()
+    yield banco
+    banco.disconnect()
+
+
+def _ids(db):
+    return sorted(linha[0] for linha in db.connection.execute("SELECT id_medicao FROM TABELA_MEDICOES_COMPACTA"))
+
+
+def test_medicao_abaixo_da_marca_dagua_sem_agregado_nao_e_removida(db):
+    # Medição gravada com um id_registro já coberto pela marca d'água, como as que
+    # reaproveitavam o id de uma removida antes da migração 9: nunca foi agregada
+    db.rollups.definir_watermark(100)
+    db.connection.execute('''
+        INSERT INTO TABELA_MEDICOES_COMPACTA (id_registro, chave_sensor, instante, valor, id_medicao)
+        SELECT 50, chave_sensor, CAST(strftime('%s', '2025-05-21 12:00:00') AS INTEGER), 43.0, 'D'
+        FROM TABELA_CHAVES_SENSORES WHERE id_sensor = 'S1'
+    ''')
+    db.connection.commit()
+    retencao = RetentionManager(db)
+
+    simulacao = retencao.executar(dry_run=True, agora=AGORA, pausa_entre_lotes=0)
+    assert [(r['linhas_brutas'], r['linhas_mantidas']) for r in simulacao] == [(1, 2)]
+    assert _ids(db) == ['A', 'B', 'C', 'D']
+
+    relatorio = retencao.executar(agora=AGORA, pausa_entre_lotes=0)
+    assert [(r['linhas_brutas'], r['linhas_mantidas']) for r in relatorio] == [(1, 2)]
+    # Só o dia 20/05, inteiro nos agregados, sai; o dia de D fica até ser reagregado
+    assert _ids(db) == ['B', 'C', 'D']
+
+
+def test_remocao_da_retencao_mantem_os_agregados(db):
+    RetentionManager(db).executar(agora=AGORA, pausa_entre_lotes=0)
+    assert _ids(db) == ['C']
+    # Os agregados viram o histórico dos dias removidos: nada fica pendente
+    assert db.connection.execute("SELECT COUNT(*) FROM TABELA_AGREGADOS_PENDENTES").fetchone()[0] == 0
+    db.rollups.atualizar()
+    dias = dict(db.connection.execute("SELECT dia, quantidade FROM TABELA_MEDICOES_DIA WHERE id_sensor = 'S1'"))
+    assert dias == {'2025-05-20': 1, '2025-05-21': 1, '2025-06-20': 1}
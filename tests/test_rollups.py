@@ -0,0 +1,52 @@
+import pytest
+
+from irrigation_system.database import AgriculturalDatabase
+
+
+@pytest.fixture
+def db(tmp_path):
+    banco = AgriculturalDatabase(str(tmp_path / "agro.db"), agregados_automaticos=False, verboso=False)
+    banco.inserir_sensor('S1', 'umidade', '01')
+    yield banco
+    banco.disconnect()
+
+
+def _horas(db):
+    return dict(db.connection.execute("SELECT hora, quantidade FROM TABELA_MEDICOES_HORA WHERE id_sensor = 'S1'"))
+
+
+def test_medicao_inserida_depois_de_remover_a_ultima_e_agregada(db):
+    db.inserir_medicao('A', 40.0, '2025-06-20 10:00:00', 'S1')
+    db.inserir_medicao('B', 41.0, '2025-06-20 10:30:00', 'S1')
+    db.rollups.atualizar()
+    assert db.rollups.obter_watermark() == 2
+
+    db.remover_medicao('B')
+    db.inserir_medicao('C', 42.0, '2025-06-20 11:00:00', 'S1')
+    id_registro = db.connection.execute(
+        "SELECT id_registro FROM TABELA_MEDICOES_COMPACTA WHERE id_medicao = 'C'").fetchone()[0]
+    # O id de B não é reaproveitado: C fica acima da marca d'água
+    assert id_registro > 2
+
+    assert db.rollups.atualizar() >= 1
+    assert _horas(db) == {'2025-06-20 10:00:00': 1, '2025-06-20 11:00:00': 1}
+    assert db.rollups.verificar_consistencia() == []
+
+
+def test_alteracao_e_remocao_recalculam_as_horas_e_os_dias(db):
+    db.inserir_medicao('A', 40.0, '2025-06-20 10:00:00', 'S1')
+    db.inserir_medicao('B', 10.0, '2025-06-20 10:30:00', 'S1')
+    db.inserir_medicao('C', 42.0, '2025-06-20 11:00:00', 'S1')
+    db.rollups.atualizar()
+
+    db.atualizar_medicao('B', valor_medicao=50.0, data_medicao='2025-06-20 12:15:00')
+    db.remover_medicao('C')
+    db.rollups.atualizar()
+
+    assert _horas(db) == {'2025-06-20 10:00:00': 1, '2025-06-20 12:00:00': 1}
+    dia = db.connection.execute(
+        "SELECT quantidade, soma, minimo, maximo, ultimo_valor FROM TABELA_MEDICOES_DIA WHERE id_sensor = 'S1'"
+    ).fetchall()
+    assert dia == [(2, 90.0, 40.0, 50.0, 50.0)]
+    assert db.rollups.verificar_consistencia() == []
+    assert db.connection.execute("SELECT COUNT(*) FROM TABELA_AGREGADOS_PENDENTES").fetchone()[0] == 0
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from irrigation_system.database import AgriculturalDatabase
+from irrigation_system.serial_bridge import SerialBridge
+
+SEPARADOR = b"-" * 40 + b"\r\n"
+# Saída de printSerialData (Serial.println termina as linhas com \r\n)
+LOG = [
+    "Sistema de Irrigação Inteligente Iniciado\r\n".encode('utf-8'),
+    SEPARADOR,
+    "Fósforo: PRESENTE | Potássio: AUSENTE | pH: 6.5 | Umidade: 35.2% (BAIXA) | "
+    "Nutrientes: OK -> IRRIGAÇÃO ATIVADA ✓\r\n".encode('utf-8'),
+    SEPARADOR,
+    "Fósforo: PRESENTE | Potássio: PRESENTE | pH: 6.4 | Umidade: 38.0% (BAIXA) | "
+    "Nutrientes: OK -> IRRIGAÇÃO ATIVADA ✓\r\n".encode('utf-8'),
+    SEPARADOR,
+    b"Erro na leitura do sensor DHT22\r\n",
+    "Fósforo: AUSENTE | Potássio: AUSENTE | pH: 7.0 | Umidade: 0.0% (BAIXA) | "
+    "Nutrientes: INSUFICIENTES -> IRRIGAÇÃO DESATIVADA - nutrientes insuficientes \r\n".encode('utf-8'),
+    SEPARADOR,
+    "2025-06-20 10:00:08 Fósforo: AUSENTE | Potássio: PRESENTE | pH: 6.8 | Umidade: 45.1% (ADEQUADA) | "
+    "Nutrientes: OK -> IRRIGAÇÃO DESATIVADA - umidade alta \r\n".encode('utf-8'),
+    SEPARADOR,
+]
+SENSORES = {'fosforo': 'S_P', 'potassio': 'S_K', 'ph': 'S_PH', 'umidade': 'S_U'}
+
+
+@pytest.fixture
+def db(tmp_path):
+    banco = AgriculturalDatabase(str(tmp_path / "agro.db"), agregados_automaticos=False, verboso=False)
+    for tipo, id_sensor in SENSORES.items():
+        banco.inserir_sensor(id_sensor, tipo, '01')
+    yield banco
+    banco.disconnect()
+
+
+def test_processar_linha_com_saida_real_do_controlador(db):
+    ponte = SerialBridge(db, '01', sensores=SENSORES)
+    inicio = datetime(2025, 6, 20, 10, 0, 0)
+    reconhecidas = []
+    for linha in LOG:
+        reconhecidas.append(ponte.processar_linha(linha, inicio + timedelta(seconds=2 * sum(reconhecidas))))
+    assert reconhecidas == [False, False, True, False, True, False, False, True, False, True, False]
+
+    ponte.descarregar()
+    assert ponte.estatisticas == {'linhas': 11, 'leituras': 4, 'medicoes': 15, 'irrigacoes': 1,
+                                  'duplicados': 0, 'erros': 0}
+    medicoes = {(m['id_sensor'], m['data_medicao']): m['valor_medicao'] for m in db.consultar_medicoes()}
+    assert medicoes[('S_P', '2025-06-20 10:00:00')] == 1.0
+    assert medicoes[('S_K', '2025-06-20 10:00:00')] == 0.0
+    assert medicoes[('S_PH', '2025-06-20 10:00:00')] == 6.5
+    assert medicoes[('S_U', '2025-06-20 10:00:00')] == 35.2
+    # Depois do erro do DHT22 a umidade 0.0 é descartada, o resto da leitura não
+    assert ('S_U', '2025-06-20 10:00:04') not in medicoes
+    assert medicoes[('S_PH', '2025-06-20 10:00:04')] == 7.0
+    # O carimbo de tempo da linha tem precedência sobre o instante informado
+    assert medicoes[('S_U', '2025-06-20 10:00:08')] == 45.1
+
+    # Só a passagem do relé de desligado para ligado vira irrigação
+    irrigacoes = db.consultar_irrigacoes()
+    assert [(i['id_irrigacao'], i['data_irrigacao']) for i in irrigacoes] == \
+        [('SER_IRR_01_20250620100000', '2025-06-20 10:00:00')]